@@ -1,15 +1,21 @@
 import customtkinter as ctk
-from tkinter import messagebox, simpledialog
+from tkinter import messagebox, simpledialog, filedialog
 import subprocess
 import os
 import datetime
+import threading
 from utils.db_utils import connect_db, get_current_user
+from utils.history_retention import TOTAL_PLAYS_SQL, get_history_watermark
+from utils.audio_utils import format_file_size
+from utils.change_events import ChangeListener
+from config import DASHBOARD_PLAYS_REFRESH_SECONDS
+from utils.pagination import users_pager, songs_pager, history_pager, USER_SORTS, SONG_SORTS
 
 # ------------------- Admin Functions -------------------
 def get_system_stats():
     """Get system statistics for the dashboard"""
     try:
-        connection = connect_db()
+        connection = connect_db(read_only=True)
         if not connection:
             return {
                 "total_users": 0,
@@ -32,8 +38,8 @@ def get_system_stats():
         cursor.execute("SELECT COUNT(*) FROM Playlists")
         total_playlists = cursor.fetchone()[0]
         
-        # Approximate downloads (listening history entries)
-        cursor.execute("SELECT COUNT(*) FROM Listening_History")
+        # Approximate downloads (listening history entries, including rolled-up days)
+        cursor.execute(TOTAL_PLAYS_SQL, (get_history_watermark(connection),))
         total_downloads = cursor.fetchone()[0]
         
         return {
@@ -59,7 +65,7 @@ def get_system_stats():
 def get_recent_activities(limit=4):
     """Get recent system activities"""
     try:
-        connection = connect_db()
+        connection = connect_db(read_only=True)
         if not connection:
             return []
             
@@ -176,21 +182,311 @@ def get_recent_activities(limit=4):
             connection.close()
 
 # ------------------- Navigation Functions -------------------
+def open_paged_list(title, make_pager, format_row, sorts=None, search_placeholder=None, row_action=None):
+    """Open a window that pages through a listing
+
+    make_pager(sort, prefix) returns a KeysetPager, format_row(row) the text
+    shown for a row, and row_action an optional (button text, command(row)).
+    """
+    list_window = ctk.CTkToplevel(root)
+    list_window.title(f"Online Music System - {title}")
+    list_window.geometry("760x600")
+    list_window.configure(fg_color="#131B2E")
+
+    header = ctk.CTkFrame(list_window, fg_color="#131B2E")
+    header.pack(fill="x", padx=20, pady=(20, 0))
+    ctk.CTkLabel(header, text=title, font=("Arial", 20, "bold"), text_color="white").pack(side="left")
+
+    search_entry = None
+    if search_placeholder:
+        search_entry = ctk.CTkEntry(list_window, placeholder_text=search_placeholder, height=32)
+        search_entry.pack(fill="x", padx=20, pady=(10, 0))
+
+    rows_frame = ctk.CTkScrollableFrame(list_window, fg_color="#131B2E")
+    rows_frame.pack(fill="both", expand=True, padx=10, pady=10)
+
+    footer = ctk.CTkFrame(list_window, fg_color="#131B2E")
+    footer.pack(fill="x", padx=20, pady=(0, 15))
+
+    state = {"pager": None, "pending": None}
+
+    def show_rows():
+        pager = state["pager"]
+        for widget in rows_frame.winfo_children():
+            widget.destroy()
+        if not pager.rows:
+            ctk.CTkLabel(rows_frame, text="Nothing found", font=("Arial", 14), text_color="#A0A0A0").pack(pady=30)
+
+        for row in pager.rows:
+            row_frame = ctk.CTkFrame(rows_frame, fg_color="#1A1A2E", corner_radius=8, height=36)
+            row_frame.pack(fill="x", pady=3)
+            row_frame.pack_propagate(False)
+            ctk.CTkLabel(row_frame, text=format_row(row), font=("Arial", 12),
+                         text_color="white", anchor="w").pack(side="left", padx=10)
+            if row_action:
+                ctk.CTkButton(row_frame, text=row_action[0], font=("Arial", 12),
+                              fg_color="#1E293B", hover_color="#2A3749", width=80, height=26,
+                              command=lambda r=row: row_action[1](r)).pack(side="right", padx=10)
+
+        page_label.configure(text=f"Page {pager.page_number}")
+        prev_button.configure(state="normal" if pager.page_number > 1 else "disabled")
+        next_button.configure(state="normal" if pager.has_next else "disabled")
+
+    def reload(*_):
+        state["pending"] = None
+        sort = sort_selector.get() if sort_selector else None
+        prefix = search_entry.get().strip() if search_entry else ""
+        state["pager"] = make_pager(sort, prefix)
+        state["pager"].first_page()
+        show_rows()
+
+    def on_search_key(_event):
+        # Wait for a pause in typing before querying
+        if state["pending"]:
+            list_window.after_cancel(state["pending"])
+        state["pending"] = list_window.after(250, reload)
+
+    def turn_page(step):
+        if step > 0:
+            state["pager"].next_page()
+        else:
+            state["pager"].previous_page()
+        show_rows()
+
+    sort_selector = None
+    if sorts:
+        sort_selector = ctk.CTkSegmentedButton(header, values=list(sorts), command=reload)
+        sort_selector.set(next(iter(sorts)))
+        sort_selector.pack(side="right")
+    if search_entry:
+        search_entry.bind("<KeyRelease>", on_search_key)
+
+    prev_button = ctk.CTkButton(footer, text="◀ Prev", font=("Arial", 12, "bold"), width=90,
+                                fg_color="#1E293B", hover_color="#2A3749", command=lambda: turn_page(-1))
+    prev_button.pack(side="left")
+    next_button = ctk.CTkButton(footer, text="Next ▶", font=("Arial", 12, "bold"), width=90,
+                                fg_color="#1E293B", hover_color="#2A3749", command=lambda: turn_page(1))
+    next_button.pack(side="right")
+    page_label = ctk.CTkLabel(footer, text="", font=("Arial", 12), text_color="#A0A0A0")
+    page_label.pack()
+
+    reload()
+
+def open_user_history(user):
+    """Open a user's listening history, newest first"""
+    name = f"{user['first_name']} {user['last_name']}"
+    open_paged_list(
+        f"History - {name} 🕒",
+        lambda sort, prefix: history_pager(user['user_id']),
+        lambda play: f"{str(play['played_at'])[:16]}  •  {play['artist_name'] or 'Unknown'} - {play['title']}"
+    )
+
 def open_manage_users():
     """Open the manage users page"""
-    messagebox.showinfo("Info", "User management functionality will be implemented soon.")
+    open_paged_list(
+        "Manage Users 👥",
+        users_pager,
+        lambda user: (f"{user['first_name']} {user['last_name']}  •  {user['email']}  •  "
+                      f"joined {str(user['created_at'])[:10]}"),
+        sorts=USER_SORTS,
+        search_placeholder="Email starts with...",
+        row_action=("History", open_user_history)
+    )
 
 def open_manage_songs():
     """Open the manage songs page"""
-    messagebox.showinfo("Info", "Song management functionality will be implemented soon.")
+    open_paged_list(
+        "Manage Songs 🎵",
+        songs_pager,
+        lambda song: (f"{song['title']} - {song['artist_name'] or 'Unknown'}  •  {song['genre_name'] or 'No genre'}  •  "
+                      f"{format_file_size(song['file_size'])} ({song['file_type']})  •  {str(song['upload_date'])[:10]}"),
+        sorts=SONG_SORTS,
+        search_placeholder="Title starts with..."
+    )
 
 def open_manage_playlists():
     """Open the manage playlists page"""
     messagebox.showinfo("Info", "Playlist management functionality will be implemented soon.")
 
+def draw_bar_chart(parent, title, values, labels=None, color="#2563EB", width=680, height=150):
+    """Draw a titled bar chart of values on a canvas"""
+    title_label = ctk.CTkLabel(parent, text=title, font=("Arial", 14, "bold"), text_color="white")
+    title_label.pack(anchor="w", padx=10, pady=(15, 5))
+
+    canvas = ctk.CTkCanvas(parent, width=width, height=height, bg="#1A1A2E", highlightthickness=0)
+    canvas.pack(anchor="w", padx=10)
+
+    values = [float(value) for value in values]
+    peak = max(values) if values and max(values) > 0 else 1
+    bar_width = (width - 20) / max(len(values), 1)
+    for i, value in enumerate(values):
+        x = 10 + i * bar_width
+        bar_height = (height - 30) * value / peak
+        canvas.create_rectangle(x + 1, height - 20 - bar_height, x + max(bar_width - 1, 2), height - 20,
+                                fill=color, outline="")
+        if labels and labels[i]:
+            canvas.create_text(x + bar_width / 2, height - 10, text=labels[i], fill="#A0A0A0", font=("Arial", 8))
+    canvas.create_text(width - 10, 10, text=f"max {peak:,.0f}", fill="#A0A0A0", font=("Arial", 9), anchor="ne")
+
+def draw_top_list(parent, title, rows):
+    """Show a ranked list of (label, plays) rows"""
+    title_label = ctk.CTkLabel(parent, text=title, font=("Arial", 14, "bold"), text_color="white")
+    title_label.pack(anchor="w", padx=10, pady=(15, 5))
+    if not rows:
+        ctk.CTkLabel(parent, text="No plays in this period", font=("Arial", 12), text_color="#A0A0A0").pack(anchor="w", padx=20)
+    for rank, (label, plays) in enumerate(rows, start=1):
+        row_label = ctk.CTkLabel(parent, text=f"{rank:>2}. {label}  ({plays:,} plays)",
+                                 font=("Arial", 12), text_color="#A0A0A0")
+        row_label.pack(anchor="w", padx=20)
+
+def show_report(report_frame, days):
+    """Render the report for the last days days from the rollups as they are"""
+    # Imported here: reports need numpy, which the dashboard does not
+    from utils.reports import build_report, PLAYS_PER_USER_BINS
+
+    for widget in report_frame.winfo_children():
+        widget.destroy()
+
+    report = build_report(days)
+    if not report:
+        ctk.CTkLabel(report_frame, text="Could not build the report.", font=("Arial", 14), text_color="#A0A0A0").pack(pady=30)
+        return
+
+    storage = report["storage_bytes"]
+    summary = (f"{report['total_plays']:,} plays  •  {report['active_users']:,} active users  •  "
+               f"{report['uploads']:,} uploads  •  {format_file_size(int(storage[-1]) if len(storage) else 0)} stored  "
+               f"(built in {report['elapsed_ms']:.0f} ms)")
+    ctk.CTkLabel(report_frame, text=summary, font=("Arial", 13), text_color="#B146EC").pack(anchor="w", padx=10, pady=(10, 0))
+
+    # Label every 7th day, or every 30th for long periods
+    step = 7 if days <= 90 else 30
+    day_labels = [
+        (report["start"] + datetime.timedelta(days=i)).strftime("%d %b") if i % step == 0 else ""
+        for i in range(days)
+    ]
+
+    draw_bar_chart(report_frame, "Plays per day", report["plays_per_day"], day_labels)
+    draw_bar_chart(report_frame, "Plays by hour of day", report["plays_by_hour"],
+                   [str(hour) if hour % 3 == 0 else "" for hour in range(24)], color="#16A34A")
+    draw_bar_chart(report_frame, "Active users per day", report["active_users_per_day"], day_labels, color="#FACC15")
+    draw_bar_chart(report_frame, "Users by plays in period", report["plays_per_user_histogram"],
+                   [f"{edge}+" for edge in PLAYS_PER_USER_BINS], color="#DC2626")
+    draw_bar_chart(report_frame, "Uploads per day", report["uploads_per_day"], day_labels, color="#2563EB")
+    draw_bar_chart(report_frame, "Storage growth (bytes)", report["storage_bytes"], day_labels, color="#B146EC")
+
+    draw_top_list(report_frame, "Top songs", [(f"{title} - {artist}", plays) for title, artist, plays in report["top_songs"]])
+    draw_top_list(report_frame, "Top artists", report["top_artists"])
+    draw_top_list(report_frame, "Top genres", report["top_genres"])
+
 def open_reports():
     """Open the reports and analytics page"""
-    messagebox.showinfo("Info", "Reports functionality will be implemented soon.")
+    reports_window = ctk.CTkToplevel(root)
+    reports_window.title("Online Music System - Reports & Analytics")
+    reports_window.geometry("760x600")
+    reports_window.configure(fg_color="#131B2E")
+
+    # Period selector
+    header = ctk.CTkFrame(reports_window, fg_color="#131B2E")
+    header.pack(fill="x", padx=20, pady=(20, 0))
+    ctk.CTkLabel(header, text="Reports & Analytics 📈", font=("Arial", 20, "bold"), text_color="white").pack(side="left")
+
+    report_frame = ctk.CTkScrollableFrame(reports_window, fg_color="#131B2E")
+    report_frame.pack(fill="both", expand=True, padx=10, pady=10)
+
+    periods = {"7 days": 7, "30 days": 30, "90 days": 90, "1 year": 365}
+    period_selector = ctk.CTkSegmentedButton(
+        header, values=list(periods),
+        command=lambda period: show_report(report_frame, periods[period])
+    )
+    period_selector.set("30 days")
+    period_selector.pack(side="right")
+
+    show_report(report_frame, 30)
+
+    # Bring the rollups up to date in the background, then redraw; the
+    # refresh thread only touches this dict and the UI polls it
+    from utils.reports import refresh_rollups
+    status = {"done": False}
+
+    def run():
+        refresh_rollups()
+        status["done"] = True
+
+    def poll():
+        if not reports_window.winfo_exists():
+            return
+        if not status["done"]:
+            reports_window.after(200, poll)
+            return
+        show_report(report_frame, periods[period_selector.get()])
+
+    threading.Thread(target=run, daemon=True).start()
+    poll()
+
+def open_export_dialog():
+    """Export listening history or catalog data to a CSV or Parquet file"""
+    from utils.export import DATASETS, available_formats, export_dataset, format_progress
+
+    export_window = ctk.CTkToplevel(root)
+    export_window.title("Online Music System - Export Data")
+    export_window.geometry("460x260")
+    export_window.configure(fg_color="#131B2E")
+
+    ctk.CTkLabel(export_window, text="Export Data 📤", font=("Arial", 20, "bold"),
+                 text_color="white").pack(pady=(20, 15))
+
+    options_frame = ctk.CTkFrame(export_window, fg_color="#131B2E")
+    options_frame.pack()
+    dataset_menu = ctk.CTkOptionMenu(options_frame, values=list(DATASETS))
+    dataset_menu.pack(side="left", padx=10)
+    format_menu = ctk.CTkOptionMenu(options_frame, values=list(available_formats()))
+    format_menu.pack(side="left", padx=10)
+
+    status_label = ctk.CTkLabel(export_window, text="", font=("Arial", 12), text_color="#A0A0A0")
+
+    def start_export():
+        dataset, file_format = dataset_menu.get(), format_menu.get()
+        path = filedialog.asksaveasfilename(
+            parent=export_window,
+            title="Export to",
+            initialfile=f"{dataset}_{datetime.date.today():%Y%m%d}.{file_format}",
+            defaultextension=f".{file_format}"
+        )
+        if not path:  # User cancelled
+            return
+
+        # The export thread only touches this dict; the UI polls it
+        status = {"progress": None, "result": None, "done": False}
+
+        def run():
+            status["result"] = export_dataset(dataset, path, file_format,
+                                              on_progress=lambda p: status.update(progress=p))
+            status["done"] = True
+
+        def poll():
+            if status["progress"]:
+                status_label.configure(text=format_progress(status["progress"]))
+            if not status["done"]:
+                export_window.after(200, poll)
+                return
+
+            export_button.configure(state="normal")
+            if status["result"] is None:
+                messagebox.showerror("Export Failed", f"Could not export {dataset}.", parent=export_window)
+            else:
+                status_label.configure(text=format_progress(status["result"]))
+                messagebox.showinfo("Export Complete", f"Exported {status['result']['rows']:,} rows to:\n{path}",
+                                    parent=export_window)
+
+        export_button.configure(state="disabled")
+        status_label.configure(text="Starting export...")
+        threading.Thread(target=run, daemon=True).start()
+        poll()
+
+    export_button = ctk.CTkButton(export_window, text="Export", font=("Arial", 14, "bold"),
+                                  fg_color="#2563EB", hover_color="#1D4ED8", command=start_export)
+    export_button.pack(pady=20)
+    status_label.pack()
 
 def open_login_page():
     """Logout and open the login page"""
@@ -249,6 +545,23 @@ def refresh_dashboard():
             time_label = ctk.CTkLabel(activity_item, text=time, font=("Arial", 12), text_color="#B146EC")
             time_label.pack(side="right", padx=10)
 
+# A dashboard refresh is scheduled for plays
+plays_refresh_pending = False
+
+def on_dashboard_changed(events):
+    """Change events: refresh now for new songs or users, once per DASHBOARD_PLAYS_REFRESH_SECONDS for plays"""
+    global plays_refresh_pending
+    if any(event["event_type"] != "song.played" for event in events):
+        refresh_dashboard()
+    elif not plays_refresh_pending:
+        plays_refresh_pending = True
+        root.after(DASHBOARD_PLAYS_REFRESH_SECONDS * 1000, refresh_after_plays)
+
+def refresh_after_plays():
+    global plays_refresh_pending
+    plays_refresh_pending = False
+    refresh_dashboard()
+
 # ------------------- Main Application -------------------
 if __name__ == "__main__":
     try:
@@ -423,6 +736,13 @@ if __name__ == "__main__":
                                           command=open_manage_playlists)
         manage_playlists_action.pack(side="left", padx=10, expand=True)
 
+        export_action = ctk.CTkButton(buttons_frame, text="📤 Export Data", 
+                                    font=("Arial", 14, "bold"), 
+                                    fg_color="#B146EC", hover_color="#9333EA", 
+                                    text_color="white", height=50, corner_radius=8,
+                                    command=open_export_dialog)
+        export_action.pack(side="left", padx=10, expand=True)
+
         # ---------------- Recent Activity Section ----------------
         activity_frame = ctk.CTkFrame(content_frame, fg_color="#131B2E")
         activity_frame.pack(fill="both", expand=True, padx=20, pady=(20, 20))
@@ -462,6 +782,12 @@ if __name__ == "__main__":
                 time_label = ctk.CTkLabel(activity_item, text=time, font=("Arial", 12), text_color="#B146EC")
                 time_label.pack(side="right", padx=10)
 
+        # Update the stats and recent activity as changes are committed
+        changes = ChangeListener()
+        changes.subscribe(("song.uploaded", "song.played", "users.imported", "history.imported"),
+                          on_dashboard_changed)
+        changes.dispatch_every(root)
+
         # ---------------- Run Application ----------------
         root.mainloop()
         
@@ -0,0 +1,332 @@
+"""
+Online Music System
+Benchmarks for the data layer and other hot paths
+
+Usage: python benchmark.py <benchmark> [options]
+"""
+import argparse
+import io
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+import numpy as np
+import utils.db_utils as db_utils
+from utils.db_utils import connect_db, get_user, prepared_cursor
+from utils.audio_utils import get_song_data
+from utils.change_events import PUBLISH_QUERY
+from utils.song_upload import read_uploaded_chunks
+from utils.query_metrics import format_summary, reset_metrics
+from utils.reports import build_report, refresh_rollups
+from utils.audio_features import extract_in_pool, FEATURE_NAMES
+from utils import ann_index
+from utils.trending import TrendingState, EVENT_BATCH_SIZE
+
+# ------------------- Helpers -------------------
+def time_calls(function, iterations):
+    """Call a function repeatedly and return calls per second"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    elapsed = time.perf_counter() - start
+    return iterations / elapsed if elapsed else float("inf")
+
+def first_id(query):
+    """Get the first ID returned by a query, or None"""
+    connection = connect_db()
+    if not connection:
+        return None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(query)
+        row = cursor.fetchone()
+        cursor.close()
+        return row[0] if row else None
+    finally:
+        connection.close()
+
+# Runs a page with its main loop replaced by "draw the first frame, report
+# the time, exit", so a page's whole startup can be timed like a navigation
+FIRST_FRAME_PROBE = """
+import os, runpy, sys, time, tkinter
+def first_frame(widget, *args, **kwargs):
+    widget.update()
+    print(f"first frame at {time.time()}", file=sys.stderr, flush=True)
+    os._exit(0)
+tkinter.Misc.mainloop = first_frame
+sys.argv = sys.argv[1:]
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+STARTUP_PAGES = ["player/home.py", "player/download.py", "player/recommend.py", "admin/admin_panel.py"]
+
+def parse_importtime(output):
+    """Cumulative microseconds of each top-level import in -X importtime output"""
+    imports = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        # Nested imports are indented further than the single leading space
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            imports[name.strip()] = imports.get(name.strip(), 0) + int(cumulative)
+    return imports
+
+def run_page_startup(page, root_dir):
+    """Start a page once; returns (ms to first frame or None, {import: us}, error text)"""
+    start = time.time()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", FIRST_FRAME_PROBE, page],
+                            cwd=root_dir, capture_output=True, text=True, timeout=120)
+    imports = parse_importtime(result.stderr)
+    other = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+    for line in other:
+        if line.startswith("first frame at "):
+            return (float(line.split()[-1]) - start) * 1000, imports, ""
+    return None, imports, other[-1] if other else f"exit code {result.returncode}"
+
+# ------------------- Benchmarks -------------------
+def bench_hot_queries(args):
+    """Compare text and prepared execution of the hot queries"""
+    song_id = args.song_id or first_id("SELECT song_id FROM Songs ORDER BY song_id LIMIT 1")
+    user_id = args.user_id or first_id("SELECT user_id FROM Users ORDER BY user_id LIMIT 1")
+    if song_id is None or user_id is None:
+        print("Need at least one user and one song in the database.")
+        return
+
+    # The statements of record_listening_history, keeping the IDs written so
+    # only this run's rows are removed afterwards (other sessions' plays stay)
+    # and without adding the song to the user's song set
+    written = {"Listening_History": [], "Change_Events": []}
+    history_query = "INSERT INTO Listening_History (user_id, song_id) VALUES (%s, %s)"
+
+    def record_play():
+        connection = connect_db()
+        try:
+            cursor = prepared_cursor(connection, history_query)
+            cursor.execute(history_query, (user_id, song_id))
+            written["Listening_History"].append(cursor.lastrowid)
+            cursor.close()
+            cursor = connection.cursor()
+            cursor.execute(PUBLISH_QUERY, ("song.played", song_id, user_id))
+            written["Change_Events"].append(cursor.lastrowid)
+            cursor.close()
+            connection.commit()
+        finally:
+            connection.close()
+
+    workloads = [
+        ("get_song_data", lambda: get_song_data(song_id)),
+        ("get_user", lambda: get_user(user_id)),
+        ("record_listening_history", record_play)
+    ]
+
+    results = {}
+    for mode, prepared in (("text", False), ("prepared", True)):
+        db_utils.USE_PREPARED_STATEMENTS = prepared
+        reset_metrics()
+        for name, workload in workloads:
+            workload()  # warm up the pool and statement cache
+            results[(mode, name)] = time_calls(workload, args.iterations)
+        print(f"\n[{mode}] query metrics")
+        print(format_summary(limit=5))
+
+    print(f"\n{'query':<26} {'text ops/s':>12} {'prepared ops/s':>15} {'speedup':>8}")
+    for name, _ in workloads:
+        text_rate = results[("text", name)]
+        prepared_rate = results[("prepared", name)]
+        print(f"{name:<26} {text_rate:>12.1f} {prepared_rate:>15.1f} {prepared_rate / text_rate:>7.2f}x")
+
+    # Remove the rows written by the benchmark
+    connection = connect_db()
+    if connection:
+        cursor = connection.cursor()
+        for table, id_column in (("Listening_History", "history_id"), ("Change_Events", "event_id")):
+            cursor.executemany(f"DELETE FROM {table} WHERE {id_column} = %s",
+                               [(row_id,) for row_id in written[table]])
+        connection.commit()
+        cursor.close()
+        connection.close()
+
+def bench_reports(args):
+    """Time report builds over increasing windows"""
+    start = time.perf_counter()
+    refreshed = refresh_rollups()
+    print(f"Rollup refresh: {refreshed} in {time.perf_counter() - start:.2f}s")
+
+    print(f"\n{'window':>8} {'ms/report':>10} {'plays':>10}")
+    for days in args.days:
+        report = build_report(days)
+        if report is None:
+            print("Could not build report.")
+            return
+        timings = [build_report(days)["elapsed_ms"] for _ in range(args.iterations)]
+        print(f"{days:>7}d {sum(timings) / len(timings):>10.1f} {report['total_plays']:>10}")
+
+def synthetic_song(seconds, bpm, pitch, seed, rate=44100):
+    """A 16-bit stereo WAV of a two-partial tone over a noise beat"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    tone = np.sin(2 * np.pi * pitch * t) + 0.5 * np.sin(4 * np.pi * pitch * t)
+    beat = (np.mod(t, 60 / bpm) < 0.05) * rng.normal(0, 1, len(t))
+    pcm = (np.clip(0.3 * tone + 0.5 * beat, -1, 1) * 32000).astype("<i2")
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(np.repeat(pcm, 2).tobytes())
+    return buffer.getvalue()
+
+def bench_features(args):
+    """Audio feature extraction throughput by worker count"""
+    if args.from_db:
+        connection = connect_db(read_only=True)
+        if not connection:
+            return
+        cursor = connection.cursor()
+        cursor.execute("SELECT song_id, file_data, file_type FROM Songs ORDER BY song_id LIMIT %s", (args.songs,))
+        payloads = [(song_id, bytes(data) or b"".join(read_uploaded_chunks(connection, song_id)), file_type)
+                    for song_id, data, file_type in cursor.fetchall()]
+        cursor.close()
+        connection.close()
+    else:
+        payloads = [(i, synthetic_song(args.seconds, 80 + i % 100, 110 * (1 + i % 8), i), "wav")
+                    for i in range(args.songs)]
+    if not payloads:
+        print("No songs to analyse.")
+        return
+
+    print(f"{len(payloads)} songs, {sum(len(p[1]) for p in payloads) / (1024 * 1024):.0f} MB of audio")
+    print(f"\n{'workers':>8} {'songs/s':>9} {'songs/s/core':>13} {'failed':>7}")
+    for workers in args.workers:
+        start = time.perf_counter()
+        failed = sum(vector is None for _, vector, _ in extract_in_pool(payloads, workers))
+        rate = len(payloads) / (time.perf_counter() - start)
+        print(f"{workers:>8} {rate:>9.2f} {rate / workers:>13.2f} {failed:>7}")
+
+def bench_ann(args):
+    """Similar-song index build, insert and query speed, and recall against exact search"""
+    # Clustered synthetic vectors: songs resemble a few others, as real features do
+    rng = np.random.default_rng(0)
+    dim = len(FEATURE_NAMES)
+    centers = rng.standard_normal((max(1, args.songs // 1000), dim)).astype(np.float32)
+    def songs(count):
+        return (centers[rng.integers(len(centers), size=count)]
+                + 0.5 * rng.standard_normal((count, dim)).astype(np.float32))
+
+    path = tempfile.mkdtemp(prefix="ann_bench_")
+    try:
+        start = time.perf_counter()
+        ann_index.build_index(np.arange(args.songs), songs(args.songs), path)
+        print(f"Built {args.songs:,} songs in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        for song_id in range(args.songs, args.songs + args.inserts):
+            ann_index.add_songs([song_id], songs(1), path)
+        elapsed = time.perf_counter() - start
+        print(f"Inserted {args.inserts} songs one at a time: {elapsed * 1000 / max(args.inserts, 1):.2f} ms/song")
+
+        index = ann_index.load_index(path)
+        print(ann_index.format_recall(ann_index.measure_recall(index, args.queries, args.k), args.k))
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def bench_trending(args):
+    """Trending sketch update rate on a synthetic play stream"""
+    rng = np.random.default_rng(0)
+    song_ids = rng.zipf(1.2, size=args.events) % args.songs
+    timestamps = time.time() - 7 * 86400 + np.sort(rng.uniform(0, 7 * 86400, size=args.events))
+
+    state = TrendingState(now=timestamps[0])
+    start = time.perf_counter()
+    for offset in range(0, args.events, EVENT_BATCH_SIZE):
+        state.add_events(song_ids[offset:offset + EVENT_BATCH_SIZE], timestamps[offset:offset + EVENT_BATCH_SIZE])
+    elapsed = time.perf_counter() - start
+
+    sketch_bytes = sum(sketch.counts.nbytes for sketch in state.sketches.values())
+    print(f"{args.events:,} plays in {elapsed:.2f}s: {args.events / elapsed:,.0f} plays/s "
+          f"({sketch_bytes / 1024:.0f} KB of sketches)")
+
+def bench_startup(args):
+    """Import time and time to first frame of each page, in a fresh process as on navigation"""
+    root_dir = os.path.dirname(os.path.abspath(__file__))
+    user_file = os.path.join(root_dir, "current_user.txt")
+    saved_user = None
+    if args.user_id:
+        # Pages start as whoever is logged in
+        if os.path.exists(user_file):
+            with open(user_file) as f:
+                saved_user = f.read()
+        with open(user_file, "w") as f:
+            f.write(str(args.user_id))
+
+    try:
+        for page in args.pages:
+            frames, totals = [], []
+            for _ in range(args.repeat):
+                frame_ms, imports, error = run_page_startup(page, root_dir)
+                totals.append(sum(imports.values()) / 1000)
+                if frame_ms is not None:
+                    frames.append(frame_ms)
+
+            first_frame = f"first frame {statistics.median(frames):.0f} ms" if frames else f"no frame ({error})"
+            print(f"{page}: {first_frame}, imports {statistics.median(totals):.0f} ms")
+            for name, microseconds in sorted(imports.items(), key=lambda item: -item[1])[:args.top]:
+                print(f"    {microseconds / 1000:>7.1f} ms  {name}")
+    finally:
+        if args.user_id:
+            if saved_user is None:
+                os.remove(user_file)
+            else:
+                with open(user_file, "w") as f:
+                    f.write(saved_user)
+
+# ------------------- Main Entry Point -------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Online Music System benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    hot_queries = subparsers.add_parser("queries", help="text vs prepared hot queries")
+    hot_queries.add_argument("--iterations", type=int, default=500)
+    hot_queries.add_argument("--song-id", type=int)
+    hot_queries.add_argument("--user-id", type=int)
+    hot_queries.set_defaults(run=bench_hot_queries)
+
+    reports = subparsers.add_parser("reports", help="admin report build time")
+    reports.add_argument("--iterations", type=int, default=5)
+    reports.add_argument("--days", type=int, nargs="+", default=[7, 30, 90, 365])
+    reports.set_defaults(run=bench_reports)
+
+    features = subparsers.add_parser("features", help="audio feature extraction songs/s per core")
+    features.add_argument("--workers", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}))
+    features.add_argument("--songs", type=int, default=32)
+    features.add_argument("--seconds", type=int, default=60, help="length of synthetic songs")
+    features.add_argument("--from-db", action="store_true", help="analyse stored songs instead of synthetic ones")
+    features.set_defaults(run=bench_features)
+
+    ann = subparsers.add_parser("ann", help="similar-song index speed and recall")
+    ann.add_argument("--songs", type=int, default=1000000)
+    ann.add_argument("--inserts", type=int, default=1000)
+    ann.add_argument("--queries", type=int, default=200)
+    ann.add_argument("-k", type=int, default=10)
+    ann.set_defaults(run=bench_ann)
+
+    trending = subparsers.add_parser("trending", help="trending sketch plays/s")
+    trending.add_argument("--events", type=int, default=2000000)
+    trending.add_argument("--songs", type=int, default=1000000)
+    trending.set_defaults(run=bench_trending)
+
+    startup = subparsers.add_parser("startup", help="page import time and time to first frame")
+    startup.add_argument("--pages", nargs="+", default=STARTUP_PAGES)
+    startup.add_argument("--repeat", type=int, default=3)
+    startup.add_argument("--top", type=int, default=8, help="slowest imports to list per page")
+    startup.add_argument("--user-id", type=int, help="log in as this user for the run")
+    startup.set_defaults(run=bench_startup)
+
+    args = parser.parse_args()
+    args.run(args)
@@ -6,7 +6,138 @@ DB_CONFIG = {
     "database": "online_music_system"
 }
 
+# Database backend: "mysql" for a MySQL server, "sqlite" for an embedded
+# single-file database (kiosk-style single-machine installs)
+DB_BACKEND = "mysql"
+SQLITE_PATH = "online_music_system.db"
+
+# Read replicas for read-only helpers: a list of settings dicts like DB_CONFIG
+# (missing keys default to DB_CONFIG), e.g. [{"host": "localhost", "port": 3307}]
+DB_REPLICAS = []
+REPLICA_MAX_LAG_SECONDS = 5
+REPLICA_LAG_CHECK_INTERVAL = 10
+
+# MySQL connection pool and server-side prepared statements for hot queries
+DB_POOL_SIZE = 5
+USE_PREPARED_STATEMENTS = True
+STATEMENT_CACHE_SIZE = 32
+
 # Application settings
 APP_NAME = "Online Music System"
 TEMP_DIR = "temp"
-UPLOAD_DIR = "assets/uploads"
\ No newline at end of file
+UPLOAD_DIR = "assets/uploads"
+
+# Catalog cache lifetimes in seconds (stale entries are served while refreshing)
+CATALOG_CACHE_TTL = 300
+SONG_LIST_CACHE_TTL = 60
+CACHE_STALE_TTL = 3600
+
+# Per-user favorite and played song IDs, shared by page processes (utils/song_sets.py)
+SONG_SETS_DIR = "temp/song_sets"
+
+# Rows fetched per page by the artist/genre pickers
+PICKER_PAGE_SIZE = 50
+
+# Rows per page in paged listings (admin users/songs, listening history)
+LIST_PAGE_SIZE = 50
+
+# Batch downloads
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Song uploads are sent in chunks of this size (keep well below the server's max_allowed_packet)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Unfinished uploads started this many days ago are deleted with their chunks
+UPLOAD_ABANDONED_DAYS = 7
+
+# Local HTTP audio streaming service (python stream_server.py); clients use it
+# instead of reading BLOBs from the database when STREAM_SERVER_URL is set
+STREAM_SERVER_HOST = "127.0.0.1"
+STREAM_SERVER_PORT = 8765
+STREAM_SERVER_URL = None  # e.g. "http://127.0.0.1:8765"
+STREAM_CACHE_DIR = "temp/stream_cache"
+STREAM_CACHE_MAX_BYTES = 2 * 1024 ** 3  # Least recently sent songs are evicted beyond this
+STREAM_BLOCK_SIZE = 256 * 1024
+
+# Local catalog mirror (SQLite) for offline and low-latency browsing
+CATALOG_MIRROR_ENABLED = True
+CATALOG_MIRROR_PATH = "temp/catalog_mirror.db"
+CATALOG_MIRROR_RECONCILE_INTERVAL = 3600
+
+# Seek index: one byte offset per step of playback time (MP3 and FLAC)
+SEEK_INDEX_STEP_MS = 500
+
+# Listening history retention: raw plays older than this are rolled up into
+# daily aggregates; MySQL keeps raw plays in monthly partitions
+HISTORY_RETENTION_DAYS = 90
+HISTORY_PARTITION_MONTHS_AHEAD = 2
+
+# Reports: history/song IDs aggregated per refresh transaction
+REPORT_REFRESH_BATCH = 100000
+
+# Smart playlists (python -m utils.smart_playlists --refresh, e.g. every few
+# minutes): default and largest song counts, playlists read per batch and the
+# pause between batches; owners with more new plays than INCREMENTAL_MAX get
+# a full recompute instead of a per-song update
+SMART_PLAYLIST_SIZE = 50
+SMART_PLAYLIST_MAX_SIZE = 500
+SMART_PLAYLIST_REFRESH_BATCH = 500
+SMART_PLAYLIST_REFRESH_PAUSE = 0.1
+SMART_PLAYLIST_INCREMENTAL_MAX = 500
+
+# Exports: rows fetched and written per batch
+EXPORT_BATCH_SIZE = 10000
+
+# Bulk import (python -m utils.bulk_import): rows are validated in batches
+# by IMPORT_WORKERS processes (None = one per core, 0 = in-process) and
+# committed every IMPORT_COMMIT_ROWS rows
+IMPORT_BATCH_SIZE = 5000
+IMPORT_COMMIT_ROWS = 50000
+IMPORT_WORKERS = None
+
+# Audio features: songs are analysed at this sample rate over a window of
+# this many seconds from the middle of the song; None workers = one per core
+FEATURE_SAMPLE_RATE = 22050
+FEATURE_ANALYSIS_SECONDS = 30
+FEATURE_WORKERS = None
+
+# Similar-song index: random-projection LSH over the feature vectors with
+# ANN_TABLES hash tables of ANN_BITS bits; queries also probe the buckets
+# of the ANN_PROBES least certain bits in each table
+ANN_INDEX_DIR = "temp/ann_index"
+ANN_TABLES = 8
+ANN_BITS = 14
+ANN_PROBES = 4
+
+# Trending charts: exponentially decayed play counts with these time
+# constants, kept in count-min sketches (fixed memory) with a top-k list of
+# candidate songs per window; state is shared by all pages through a file
+TRENDING_WINDOWS = {"1h": 3600, "24h": 86400, "7d": 604800}
+TRENDING_SKETCH_WIDTH = 4096
+TRENDING_SKETCH_DEPTH = 4
+TRENDING_TOP_K = 100
+TRENDING_STATE_FILE = "temp/trending_state.pickle"
+TRENDING_REFRESH_SECONDS = 30
+
+# Playback daemon (python playback_daemon.py, started on demand): owns the
+# audio device and play queue so music keeps playing across pages; pages
+# and the CLI control it over this Unix socket. None plays in each page
+PLAYBACK_SOCKET = "temp/playback.sock"
+PLAYBACK_TIMEOUT = 10  # Seconds to wait for a reply (play loads the song)
+PLAYBACK_TICK_SECONDS = 0.5  # How often the daemon checks for a finished song
+PLAYBACK_MEMORY_CACHE_BYTES = 256 * 1024 * 1024  # Recently played songs' audio kept in memory for replays and seeks
+
+# Query instrumentation
+QUERY_METRICS_ENABLED = True
+SLOW_QUERY_MS = 200
+SLOW_QUERY_LOG = "logs/slow_queries.log"
+QUERY_METRICS_FILE = "logs/query_metrics.json"
+QUERY_METRICS_PROM_FILE = "logs/query_metrics.prom"
+
+# Change events: write paths add a row to Change_Events in the same
+# transaction, and open pages poll it by event_id to drop cached data and
+# redraw only what changed
+CHANGE_POLL_SECONDS = 2
+CHANGE_GAP_SECONDS = 10  # How long a skipped event_id may still appear (a transaction committing late)
+CHANGE_EVENT_RETENTION_DAYS = 7
+DASHBOARD_PLAYS_REFRESH_SECONDS = 30  # Plays alone refresh the admin dashboard at most this often
@@ -3,7 +3,6 @@ Online Music System
 Main entry point for the application
 """
 import os
-import mysql.connector
 import tkinter as tk
 from tkinter import messagebox
 import subprocess
@@ -11,22 +10,12 @@ import customtkinter as ctk
 import hashlib
 import random
 import time
-from utils.db_utils import connect_db, hash_password
+from config import DB_CONFIG, DB_BACKEND
+from utils.db_utils import connect_db, connect_db_server, hash_password, DB_ERRORS
+from utils.db_schema import create_tables
+from utils.history_retention import partition_listening_history
 
 # ------------------- Database Setup Functions -------------------
-def connect_db_server():
-    """Connect to MySQL server without specifying a database"""
-    try:
-        connection = mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="new_password"
-        )
-        return connection
-    except mysql.connector.Error as err:
-        print(f"Error connecting to MySQL server: {err}")
-        return None
-
 def create_database():
     """Create the database and tables"""
     try:
@@ -37,130 +26,16 @@ def create_database():
             
         cursor = connection.cursor()
         
-        # Create database
-        print("Creating database...")
-        cursor.execute("CREATE DATABASE IF NOT EXISTS online_music_system")
-        cursor.execute("USE online_music_system")
-        
-        # Create Users table
-        print("Creating Users table...")
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Users (
-            user_id INT AUTO_INCREMENT PRIMARY KEY,
-            first_name VARCHAR(50) NOT NULL,
-            last_name VARCHAR(50) NOT NULL,
-            email VARCHAR(100) NOT NULL UNIQUE,
-            password VARCHAR(64) NOT NULL,
-            is_admin BOOLEAN DEFAULT FALSE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """)
-        
-        # Create Artists table
-        print("Creating Artists table...")
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Artists (
-            artist_id INT AUTO_INCREMENT PRIMARY KEY,
-            name VARCHAR(100) NOT NULL,
-            bio TEXT,
-            image_url VARCHAR(255)
-        )
-        """)
-        
-        # Create Albums table
-        print("Creating Albums table...")
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Albums (
-            album_id INT AUTO_INCREMENT PRIMARY KEY,
-            title VARCHAR(100) NOT NULL,
-            artist_id INT,
-            release_year INT,
-            cover_art MEDIUMBLOB,
-            FOREIGN KEY (artist_id) REFERENCES Artists(artist_id) ON DELETE SET NULL
-        )
-        """)
-        
-        # Create Genres table
-        print("Creating Genres table...")
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Genres (
-            genre_id INT AUTO_INCREMENT PRIMARY KEY,
-            name VARCHAR(50) NOT NULL UNIQUE
-        )
-        """)
-        
-        # Create Songs table
-        print("Creating Songs table...")
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Songs (
-            song_id INT AUTO_INCREMENT PRIMARY KEY,
-            title VARCHAR(100) NOT NULL,
-            artist_id INT,
-            album_id INT,
-            genre_id INT,
-            duration INT,
-            file_data LONGBLOB NOT NULL,
-            file_type VARCHAR(10) NOT NULL,
-            file_size INT NOT NULL,
-            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (artist_id) REFERENCES Artists(artist_id) ON DELETE SET NULL,
-            FOREIGN KEY (album_id) REFERENCES Albums(album_id) ON DELETE SET NULL,
-            FOREIGN KEY (genre_id) REFERENCES Genres(genre_id) ON DELETE SET NULL
-        )
-        """)
-        
-        # Create Playlists table
-        print("Creating Playlists table...")
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Playlists (
-            playlist_id INT AUTO_INCREMENT PRIMARY KEY,
-            user_id INT NOT NULL,
-            name VARCHAR(100) NOT NULL,
-            description TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
-        )
-        """)
-        
-        # Create Playlist_Songs junction table
-        print("Creating Playlist_Songs table...")
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Playlist_Songs (
-            playlist_id INT NOT NULL,
-            song_id INT NOT NULL,
-            position INT NOT NULL,
-            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            PRIMARY KEY (playlist_id, song_id),
-            FOREIGN KEY (playlist_id) REFERENCES Playlists(playlist_id) ON DELETE CASCADE,
-            FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
-        )
-        """)
-        
-        # Create User_Favorites table
-        print("Creating User_Favorites table...")
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS User_Favorites (
-            user_id INT NOT NULL,
-            song_id INT NOT NULL,
-            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            PRIMARY KEY (user_id, song_id),
-            FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE,
-            FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
-        )
-        """)
-        
-        # Create Listening_History table
-        print("Creating Listening_History table...")
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Listening_History (
-            history_id INT AUTO_INCREMENT PRIMARY KEY,
-            user_id INT NOT NULL,
-            song_id INT NOT NULL,
-            played_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE,
-            FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
-        )
-        """)
+        # Create database (the SQLite database is the file itself)
+        if DB_BACKEND != "sqlite":
+            print("Creating database...")
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_CONFIG['database']}")
+            cursor.execute(f"USE {DB_CONFIG['database']}")
+        
+        # Create tables and indexes
+        create_tables(cursor, DB_BACKEND)
+        if DB_BACKEND != "sqlite":
+            partition_listening_history(cursor)
         
         connection.commit()
         cursor.close()
@@ -169,7 +44,7 @@ def create_database():
         print("Database and tables created successfully!")
         return True
         
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         print(f"Error creating database: {err}")
         return False
 
@@ -203,13 +78,12 @@ def add_default_users():
             ("Bob", "Williams", "bob@example.com", hash_password("password123"), False)
         ]
         
-        # Insert users
+        # Insert users in one batch
         print("Adding default users...")
-        for first_name, last_name, email, password, is_admin in default_users:
-            cursor.execute(
-                "INSERT INTO Users (first_name, last_name, email, password, is_admin) VALUES (%s, %s, %s, %s, %s)",
-                (first_name, last_name, email, password, is_admin)
-            )
+        cursor.executemany(
+            "INSERT INTO Users (first_name, last_name, email, password, is_admin) VALUES (%s, %s, %s, %s, %s)",
+            default_users
+        )
         
         connection.commit()
         print(f"Added {len(default_users)} default users successfully!")
@@ -218,7 +92,7 @@ def add_default_users():
         connection.close()
         return True
         
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         print(f"Error adding default users: {err}")
         return False
 
@@ -249,10 +123,9 @@ def add_default_genres():
             "Disco", "Techno", "House", "Ambient", "Indie"
         ]
         
-        # Insert genres
+        # Insert genres in one batch
         print("Adding default genres...")
-        for genre in default_genres:
-            cursor.execute("INSERT INTO Genres (name) VALUES (%s)", (genre,))
+        cursor.executemany("INSERT INTO Genres (name) VALUES (%s)", [(genre,) for genre in default_genres])
         
         connection.commit()
         print(f"Added {len(default_genres)} default genres successfully!")
@@ -261,7 +134,7 @@ def add_default_genres():
         connection.close()
         return True
         
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         print(f"Error adding default genres: {err}")
         return False
 
@@ -298,13 +171,9 @@ def add_default_artists():
             ("Justin Bieber", "Justin Drew Bieber is a Canadian singer. He was discovered by American record executive Scooter Braun.")
         ]
         
-        # Insert artists
+        # Insert artists in one batch
         print("Adding default artists...")
-        for name, bio in default_artists:
-            cursor.execute(
-                "INSERT INTO Artists (name, bio) VALUES (%s, %s)",
-                (name, bio)
-            )
+        cursor.executemany("INSERT INTO Artists (name, bio) VALUES (%s, %s)", default_artists)
         
         connection.commit()
         print(f"Added {len(default_artists)} default artists successfully!")
@@ -313,7 +182,7 @@ def add_default_artists():
         connection.close()
         return True
         
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         print(f"Error adding default artists: {err}")
         return False
 
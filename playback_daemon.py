@@ -0,0 +1,125 @@
+"""
+Online Music System
+Headless playback daemon
+
+Owns the audio device, the current song and the play queue, so music keeps
+playing while pages are opened and closed. Pages (through
+utils.playback.get_player) and the CLI (python -m utils.playback_client)
+control it over a Unix socket at PLAYBACK_SOCKET, one JSON object per line:
+    {"command": "play", "song_id": 12, "user_id": 3}
+    -> {"ok": true, "status": {"id": 12, "title": ..., "position": 0.0, "queue": []}}
+    -> {"ok": false, "error": "Song 12 not found"}
+
+Commands: status, play, pause, resume, toggle, stop, seek, enqueue,
+clear_queue, next, shutdown. Queued songs start when the current one ends.
+
+Started on demand by the client; run it directly to see its log.
+"""
+import json
+import os
+import socket
+import socketserver
+import threading
+from config import PLAYBACK_SOCKET, PLAYBACK_TICK_SECONDS
+from utils.playback import LocalPlayer, PlaybackError
+
+# No UI: database errors are logged, never shown in a dialog
+player = LocalPlayer(quiet=True)
+
+COMMANDS = {
+    "status": lambda request: player.status(),
+    "play": lambda request: player.play(int(request["song_id"]), request.get("user_id")),
+    "pause": lambda request: player.pause(),
+    "resume": lambda request: player.resume(),
+    "toggle": lambda request: player.toggle(),
+    "stop": lambda request: player.stop(),
+    "seek": lambda request: player.seek(float(request["seconds"]), bool(request.get("relative"))),
+    "enqueue": lambda request: player.enqueue(request["song_ids"], request.get("user_id")),
+    "clear_queue": lambda request: player.clear_queue(),
+    "next": lambda request: player.next(),
+}
+
+def handle_command(request):
+    """Run one command and build its reply"""
+    command = request.get("command")
+    if command not in COMMANDS:
+        return {"ok": False, "error": f"Unknown command: {command}"}
+    try:
+        return {"ok": True, "status": COMMANDS[command](request)}
+    except (KeyError, TypeError, ValueError) as e:
+        return {"ok": False, "error": f"Bad arguments for {command}: {e}"}
+    except PlaybackError as e:
+        return {"ok": False, "error": str(e)}
+
+class PlaybackRequestHandler(socketserver.StreamRequestHandler):
+    """Answers the commands of one client connection until it closes"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                reply = {"ok": False, "error": "Invalid JSON"}
+            else:
+                if request.get("command") == "shutdown":
+                    self.write_reply({"ok": True, "status": player.stop()})
+                    # shutdown() waits for serve_forever, which runs this handler's caller
+                    threading.Thread(target=self.server.shutdown).start()
+                    return
+                reply = handle_command(request)
+            self.write_reply(reply)
+
+    def write_reply(self, reply):
+        self.wfile.write(json.dumps(reply, default=str).encode() + b"\n")
+        self.wfile.flush()
+
+class PlaybackServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def advance_queue(stopped):
+    """Start queued songs as the current ones finish"""
+    while not stopped.wait(PLAYBACK_TICK_SECONDS):
+        try:
+            player.tick()
+        except Exception as e:
+            print(f"Error advancing the queue: {e}")
+
+def remove_stale_socket(path):
+    """Delete a socket left by a daemon that exited; False if one is still listening"""
+    if not os.path.exists(path):
+        return True
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+        return False
+    except OSError:
+        os.remove(path)
+        return True
+    finally:
+        probe.close()
+
+def run_daemon(path=PLAYBACK_SOCKET):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if not remove_stale_socket(path):
+        print(f"A playback daemon is already listening on {path}")
+        return
+
+    server = PlaybackServer(path, PlaybackRequestHandler)
+    # Only this user's processes may control playback
+    os.chmod(path, 0o600)
+    stopped = threading.Event()
+    threading.Thread(target=advance_queue, args=(stopped,), daemon=True).start()
+    print(f"Playback daemon listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopped.set()
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+        print("Playback daemon stopped")
+
+if __name__ == "__main__":
+    run_daemon()
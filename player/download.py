@@ -3,16 +3,20 @@ from tkinter import filedialog, messagebox, simpledialog
 import os
 import shutil
 import subprocess
-from pygame import mixer
-from PIL import Image, ImageTk
+import threading
 
 # Import from our utils
 from utils.db_utils import connect_db, get_current_user
-from utils.audio_utils import (upload_song_to_db, play_song_from_db, 
-                              format_file_size, record_listening_history)
-
-# Initialize mixer for music playback
-mixer.init()
+from utils.audio_utils import get_song_data, format_file_size, safe_filename
+from utils.song_upload import upload_song_chunked, format_progress
+from utils.playback import get_player, PlaybackError
+from utils.batch_download import download_songs
+from utils.cache import cached
+from utils.change_events import ChangeListener
+from utils.history_retention import SONG_PLAYS_SQL, USER_SONG_PLAYS_SQL, get_history_watermark
+from utils.catalog_utils import search_artists, search_genres, upsert_artist
+from utils import catalog_mirror
+from config import SONG_LIST_CACHE_TTL, CACHE_STALE_TTL, PICKER_PAGE_SIZE, CATALOG_MIRROR_ENABLED
 
 # Current song information
 current_song = {
@@ -23,6 +27,9 @@ current_song = {
     "paused": False
 }
 
+# Plays through the playback daemon, so music continues on other pages
+player = get_player()
+
 # Keep track of selected song
 selected_song = {
     "id": None,
@@ -32,28 +39,37 @@ selected_song = {
 
 # ------------------- Song Management Functions -------------------
 def get_popular_songs(limit=8):
+    """Get most popular songs (cached), or the mirror's newest songs when offline"""
+    songs = cached(f"songs:popular:{limit}", lambda: load_popular_songs(limit),
+                   SONG_LIST_CACHE_TTL, CACHE_STALE_TTL)
+    if not songs and CATALOG_MIRROR_ENABLED:
+        songs = catalog_mirror.get_newest_songs(limit)
+        for song in songs:
+            song['file_size_formatted'] = format_file_size(song['file_size'])
+    return songs
+
+def load_popular_songs(limit=8):
     """Get most popular songs from the database"""
     try:
-        connection = connect_db()
+        connection = connect_db(read_only=True)
         if not connection:
             return []
             
         cursor = connection.cursor(dictionary=True)
         
-        # Get songs with most plays in listening history
-        query = """
-        SELECT s.song_id, s.title, a.name as artist_name, COUNT(lh.history_id) as play_count, 
+        # Get songs with most plays (recent plays plus daily rollups)
+        query = f"""
+        SELECT s.song_id, s.title, a.name as artist_name, COALESCE(p.plays, 0) as play_count, 
                g.name as genre_name, s.file_size, s.file_type
         FROM Songs s
         JOIN Artists a ON s.artist_id = a.artist_id
         LEFT JOIN Genres g ON s.genre_id = g.genre_id
-        LEFT JOIN Listening_History lh ON s.song_id = lh.song_id
-        GROUP BY s.song_id
+        LEFT JOIN ({SONG_PLAYS_SQL}) p ON s.song_id = p.song_id
         ORDER BY play_count DESC
         LIMIT %s
         """
         
-        cursor.execute(query, (limit,))
+        cursor.execute(query, (get_history_watermark(connection), limit))
         songs = cursor.fetchall()
         
         # If no songs with play history, get newest songs
@@ -92,27 +108,26 @@ def get_user_favorite_songs(limit=8):
         if not user:
             return []
             
-        connection = connect_db()
+        connection = connect_db(read_only=True)
         if not connection:
             return []
             
         cursor = connection.cursor(dictionary=True)
         
-        # Get songs the user has listened to most
-        query = """
-        SELECT s.song_id, s.title, a.name as artist_name, COUNT(lh.history_id) as play_count,
+        # Get songs the user has listened to most (recent plays plus daily rollups)
+        query = f"""
+        SELECT s.song_id, s.title, a.name as artist_name, p.plays as play_count,
                g.name as genre_name, s.file_size, s.file_type
-        FROM Listening_History lh
-        JOIN Songs s ON lh.song_id = s.song_id
+        FROM ({USER_SONG_PLAYS_SQL}) p
+        JOIN Songs s ON p.song_id = s.song_id
         JOIN Artists a ON s.artist_id = a.artist_id
         LEFT JOIN Genres g ON s.genre_id = g.genre_id
-        WHERE lh.user_id = %s
-        GROUP BY s.song_id
         ORDER BY play_count DESC
         LIMIT %s
         """
         
-        cursor.execute(query, (user['user_id'], limit))
+        watermark = get_history_watermark(connection)
+        cursor.execute(query, (user['user_id'], watermark, user['user_id'], limit))
         songs = cursor.fetchall()
         
         # Format file sizes to human-readable format
@@ -129,50 +144,6 @@ def get_user_favorite_songs(limit=8):
             cursor.close()
             connection.close()
 
-def get_artists():
-    """Get list of artists from the database"""
-    try:
-        connection = connect_db()
-        if not connection:
-            return []
-            
-        cursor = connection.cursor(dictionary=True)
-        
-        query = "SELECT artist_id, name FROM Artists ORDER BY name"
-        cursor.execute(query)
-        
-        return cursor.fetchall()
-        
-    except Exception as e:
-        print(f"Error fetching artists: {e}")
-        return []
-    finally:
-        if 'connection' in locals() and connection and connection.is_connected():
-            cursor.close()
-            connection.close()
-
-def get_genres():
-    """Get list of genres from the database"""
-    try:
-        connection = connect_db()
-        if not connection:
-            return []
-            
-        cursor = connection.cursor(dictionary=True)
-        
-        query = "SELECT genre_id, name FROM Genres ORDER BY name"
-        cursor.execute(query)
-        
-        return cursor.fetchall()
-        
-    except Exception as e:
-        print(f"Error fetching genres: {e}")
-        return []
-    finally:
-        if 'connection' in locals() and connection and connection.is_connected():
-            cursor.close()
-            connection.close()
-
 def download_song(song_id):
     """Download a song to local storage"""
     try:
@@ -183,9 +154,7 @@ def download_song(song_id):
             return False
         
         # Format the filename
-        filename = f"{song_data['artist']} - {song_data['title']}.{song_data['type']}"
-        # Replace invalid filename characters
-        filename = filename.replace('/', '_').replace('\\', '_').replace(':', '_').replace('*', '_').replace('?', '_').replace('"', '_').replace('<', '_').replace('>', '_').replace('|', '_')
+        filename = safe_filename(song_data['artist'], song_data['title'], song_data['type'])
         
         # Ask user for download location
         downloads_dir = os.path.join(os.path.expanduser("~"), "Downloads")
@@ -211,7 +180,71 @@ def download_song(song_id):
         messagebox.showerror("Error", f"Could not download song: {e}")
         return False
 
+def download_all_in_tab():
+    """Download every song in the current tab to a folder, in parallel"""
+    songs = get_user_favorite_songs() if tabs.get() == "Your Favorites" else get_popular_songs()
+    if not songs:
+        messagebox.showwarning("Warning", "There are no songs to download")
+        return
+    
+    # Ask user for download folder
+    downloads_dir = os.path.join(os.path.expanduser("~"), "Downloads")
+    dest_dir = filedialog.askdirectory(initialdir=downloads_dir, title="Download songs to")
+    if not dest_dir:  # User cancelled
+        return
+    
+    # Worker threads only touch this dict; the UI polls it
+    status = {"progress": None, "results": None}
+    
+    def run():
+        status["results"] = download_songs(songs, dest_dir,
+                                           on_progress=lambda p: status.update(progress=p))
+    
+    def poll():
+        progress = status["progress"]
+        if progress:
+            batch_status_label.configure(
+                text=f"{progress['files_done']}/{progress['files_total']} songs • "
+                     f"{format_file_size(progress['bytes_done'])} of {format_file_size(progress['bytes_total'])} • "
+                     f"{format_file_size(progress['bytes_per_second'])}/s"
+            )
+        
+        if status["results"] is None:
+            root.after(200, poll)
+            return
+        
+        results = status["results"]
+        failed = [r for r in results if r["status"] == "failed"]
+        batch_download_button.configure(state="normal")
+        if failed:
+            messagebox.showwarning("Download Finished",
+                                   f"{len(failed)} of {len(results)} songs failed. Run the download again to resume them.")
+        else:
+            messagebox.showinfo("Download Complete", f"{len(results)} songs downloaded to:\n{dest_dir}")
+    
+    batch_download_button.configure(state="disabled")
+    threading.Thread(target=run, daemon=True).start()
+    poll()
+
 # ------------------- Music Player Functions -------------------
+def update_player_controls():
+    """Show the current song on the now playing label and play button"""
+    if current_song["id"] is None:
+        now_playing_label.configure(text="Now Playing: No song playing")
+    else:
+        now_playing_label.configure(text=f"Now Playing: {current_song['title']} - {current_song['artist']}")
+    play_btn.configure(text="⏸️" if current_song["playing"] else "▶️")
+
+def load_player_status():
+    """Pick up the song already playing (it keeps playing across pages)"""
+    global current_song
+    try:
+        current_song = player.status()
+    except PlaybackError as e:
+        print(f"Error getting playback status: {e}")
+        return
+    update_player_controls()
+
 def play_song(song_id):
     """Play a song from its binary data in the database"""
     global current_song
@@ -221,21 +254,15 @@ def play_song(song_id):
     if not user:
         return False
     
-    # Use our utility function to play the song
-    song_info = play_song_from_db(song_id, mixer, 
-                                now_playing_label if 'now_playing_label' in globals() else None,
-                                play_btn if 'play_btn' in globals() else None)
-    
-    if song_info:
-        # Update current song info
-        current_song = song_info
-        
-        # Record in listening history
-        record_listening_history(user['user_id'], song_id)
-        
-        return True
+    # The player records the play in the user's listening history
+    try:
+        current_song = player.play(song_id, user['user_id'])
+    except PlaybackError as e:
+        messagebox.showerror("Error", str(e))
+        return False
     
-    return False
+    update_player_controls()
+    return True
 
 def toggle_play_pause():
     """Toggle between play and pause states"""
@@ -244,27 +271,149 @@ def toggle_play_pause():
     if current_song["id"] is None:
         # No song loaded - do nothing
         return
-    elif current_song["paused"]:
-        # Resume paused song
-        mixer.music.unpause()
-        current_song["paused"] = False
-        current_song["playing"] = True
-        play_btn.configure(text="⏸️")
-    elif current_song["playing"]:
-        # Pause playing song
-        mixer.music.pause()
-        current_song["paused"] = True
-        current_song["playing"] = False
-        play_btn.configure(text="▶️")
+    
+    try:
+        current_song = player.toggle()
+    except PlaybackError as e:
+        messagebox.showerror("Error", str(e))
+        return
+    update_player_controls()
 
 def play_next_song():
-    """Placeholder for playing next song"""
-    messagebox.showinfo("Info", "Next song feature will be implemented with playlists")
+    """Play the next song in the play queue"""
+    global current_song
+    try:
+        if not player.status()["queue"]:
+            messagebox.showinfo("Info", "No songs in the play queue")
+            return
+        current_song = player.next()
+    except PlaybackError as e:
+        messagebox.showerror("Error", str(e))
+        return
+    update_player_controls()
 
 def play_previous_song():
     """Placeholder for playing previous song"""
     messagebox.showinfo("Info", "Previous song feature will be implemented with playlists")
 
+# ------------------- Catalog Picker -------------------
+def add_artist():
+    """Ask for an artist name and upsert it, returning (artist_id, name)"""
+    artist_name = simpledialog.askstring("New Artist", "Enter artist name:")
+    if not artist_name or not artist_name.strip():
+        return None
+    
+    artist_name = artist_name.strip()
+    artist_id = upsert_artist(artist_name)
+    if artist_id is None:
+        messagebox.showerror("Error", f"Could not add artist: {artist_name}")
+        return None
+    return artist_id, artist_name
+
+def open_catalog_picker(title, search, id_key, add_label=None, add_new=None, none_label=None):
+    """Show a searchable picker that fetches matching rows a page at a time
+    
+    Returns the selected ID, or None if the dialog was closed or none_label was picked.
+    """
+    picker = ctk.CTkToplevel(root)
+    picker.title(title)
+    picker.geometry("300x450")
+    picker.transient(root)
+    picker.grab_set()
+    
+    # Center the dialog
+    picker.update_idletasks()
+    width = picker.winfo_width()
+    height = picker.winfo_height()
+    x = (picker.winfo_screenwidth() // 2) - (width // 2)
+    y = (picker.winfo_screenheight() // 2) - (height // 2)
+    picker.geometry(f"{width}x{height}+{x}+{y}")
+    
+    # Label
+    ctk.CTkLabel(picker, text=title, font=("Arial", 16, "bold")).pack(pady=10)
+    
+    # Search box
+    search_var = ctk.StringVar()
+    ctk.CTkEntry(picker, textvariable=search_var, placeholder_text="Type to search...",
+                 width=250).pack(padx=10)
+    
+    # Option for no selection
+    selected_var = ctk.StringVar(value="0" if none_label else "")
+    if none_label:
+        ctk.CTkRadioButton(picker, text=none_label, variable=selected_var, value="0").pack(anchor="w", padx=20, pady=(10, 0))
+    
+    # Scrollable frame for the current results
+    results_frame = ctk.CTkScrollableFrame(picker, width=250, height=220)
+    results_frame.pack(pady=10, padx=10, fill="both", expand=True)
+    
+    state = {"prefix": "", "last_name": None, "pending": None}
+    
+    def show_page(reset):
+        """Fetch the next page of matches (or the first page after typing)"""
+        if reset:
+            for widget in results_frame.winfo_children():
+                widget.destroy()
+            state["last_name"] = None
+        
+        rows = search(state["prefix"], after_name=state["last_name"])
+        for row in rows:
+            ctk.CTkRadioButton(results_frame, text=row["name"], variable=selected_var,
+                               value=str(row[id_key])).pack(anchor="w", pady=5)
+        
+        if rows:
+            state["last_name"] = rows[-1]["name"]
+            # Select the first match by default
+            if reset and not selected_var.get():
+                selected_var.set(str(rows[0][id_key]))
+        
+        more_button.configure(state="normal" if len(rows) == PICKER_PAGE_SIZE else "disabled")
+    
+    def on_search_changed(*args):
+        """Debounce typing so only the final prefix is queried"""
+        if state["pending"]:
+            picker.after_cancel(state["pending"])
+        
+        def run_search():
+            state["pending"] = None
+            state["prefix"] = search_var.get().strip()
+            show_page(True)
+        
+        state["pending"] = picker.after(250, run_search)
+    
+    more_button = ctk.CTkButton(picker, text="Load more", command=lambda: show_page(False))
+    more_button.pack(pady=(0, 5))
+    
+    # Button to add a new entry
+    if add_new:
+        def add_entry():
+            added = add_new()
+            if added:
+                new_id, name = added
+                ctk.CTkRadioButton(results_frame, text=name, variable=selected_var,
+                                   value=str(new_id)).pack(anchor="w", pady=5)
+                selected_var.set(str(new_id))
+        
+        ctk.CTkButton(picker, text=add_label, command=add_entry).pack(pady=5)
+    
+    # Confirm button
+    result = {"id": None}
+    
+    def confirm():
+        if not selected_var.get():
+            messagebox.showwarning("Warning", "Please make a selection")
+            return
+        result["id"] = int(selected_var.get()) if selected_var.get() != "0" else None
+        picker.destroy()
+    
+    ctk.CTkButton(picker, text="Confirm", command=confirm).pack(pady=10)
+    
+    search_var.trace_add("write", on_search_changed)
+    show_page(True)
+    
+    # Wait for dialog to close
+    root.wait_window(picker)
+    return result["id"]
+
 # ------------------- Upload Function -------------------
 def handle_upload_song():
     """Handle the upload song process"""
@@ -285,170 +434,60 @@ def handle_upload_song():
     if not title:  # User cancelled
         return
     
-    # Get artists from database
-    artists = get_artists()
-    if not artists:
-        messagebox.showerror("Error", "No artists found in database")
-        
-        # Ask if user wants to add a new artist
-        artist_name = simpledialog.askstring("New Artist", "Enter artist name:")
-        if not artist_name:  # User cancelled
-            return
-            
-        # Add new artist to database
-        connection = connect_db()
-        if not connection:
-            return
-            
-        try:
-            cursor = connection.cursor()
-            cursor.execute("INSERT INTO Artists (name) VALUES (%s)", (artist_name,))
-            connection.commit()
-            artist_id = cursor.lastrowid
-            cursor.close()
-            connection.close()
-        except Exception as e:
-            messagebox.showerror("Error", f"Could not add artist: {e}")
-            return
-    else:
-        # Create a dialog to select artist
-        artist_select = ctk.CTkToplevel(root)
-        artist_select.title("Select Artist")
-        artist_select.geometry("300x400")
-        artist_select.transient(root)
-        artist_select.grab_set()
-        
-        # Center the dialog
-        artist_select.update_idletasks()
-        width = artist_select.winfo_width()
-        height = artist_select.winfo_height()
-        x = (artist_select.winfo_screenwidth() // 2) - (width // 2)
-        y = (artist_select.winfo_screenheight() // 2) - (height // 2)
-        artist_select.geometry(f"{width}x{height}+{x}+{y}")
-        
-        # Label
-        ctk.CTkLabel(artist_select, text="Select Artist", font=("Arial", 16, "bold")).pack(pady=10)
-        
-        # Create a scrollable frame for artists
-        artists_frame = ctk.CTkScrollableFrame(artist_select, width=250, height=250)
-        artists_frame.pack(pady=10, padx=10, fill="both", expand=True)
-        
-        # Artist variable
-        artist_var = ctk.StringVar()
-        
-        # Add radio buttons for each artist
-        for artist in artists:
-            ctk.CTkRadioButton(artists_frame, text=artist["name"], variable=artist_var, value=str(artist["artist_id"])).pack(anchor="w", pady=5)
-        
-        # Select first artist by default
-        if artists:
-            artist_var.set(str(artists[0]["artist_id"]))
-        
-        # Button to add a new artist
-        def add_new_artist():
-            artist_name = simpledialog.askstring("New Artist", "Enter artist name:")
-            if artist_name:
-                connection = connect_db()
-                if connection:
-                    try:
-                        cursor = connection.cursor()
-                        cursor.execute("INSERT INTO Artists (name) VALUES (%s)", (artist_name,))
-                        connection.commit()
-                        new_id = cursor.lastrowid
-                        cursor.close()
-                        connection.close()
-                        
-                        # Add to list and select it
-                        ctk.CTkRadioButton(artists_frame, text=artist_name, variable=artist_var, value=str(new_id)).pack(anchor="w", pady=5)
-                        artist_var.set(str(new_id))
-                    except Exception as e:
-                        messagebox.showerror("Error", f"Could not add artist: {e}")
-        
-        ctk.CTkButton(artist_select, text="+ Add New Artist", command=add_new_artist).pack(pady=5)
-        
-        # Confirm button
-        def confirm_artist():
-            nonlocal artist_id
-            if artist_var.get():
-                artist_id = int(artist_var.get())
-                artist_select.destroy()
-            else:
-                messagebox.showwarning("Warning", "Please select an artist")
-        
-        # Variable to store selected artist ID
-        artist_id = None
-        
-        ctk.CTkButton(artist_select, text="Confirm", command=confirm_artist).pack(pady=10)
-        
-        # Wait for dialog to close
-        root.wait_window(artist_select)
-        
-        # If no artist selected, cancel upload
-        if artist_id is None:
-            return
-    
-    # Get genres from database
-    genres = get_genres()
-    
-    # Create a dialog to select genre
-    genre_select = ctk.CTkToplevel(root)
-    genre_select.title("Select Genre")
-    genre_select.geometry("300x400")
-    genre_select.transient(root)
-    genre_select.grab_set()
-    
-    # Center the dialog
-    genre_select.update_idletasks()
-    width = genre_select.winfo_width()
-    height = genre_select.winfo_height()
-    x = (genre_select.winfo_screenwidth() // 2) - (width // 2)
-    y = (genre_select.winfo_screenheight() // 2) - (height // 2)
-    genre_select.geometry(f"{width}x{height}+{x}+{y}")
-    
-    # Label
-    ctk.CTkLabel(genre_select, text="Select Genre", font=("Arial", 16, "bold")).pack(pady=10)
-    
-    # Create a scrollable frame for genres
-    genres_frame = ctk.CTkScrollableFrame(genre_select, width=250, height=250)
-    genres_frame.pack(pady=10, padx=10, fill="both", expand=True)
-    
-    # Genre variable
-    genre_var = ctk.StringVar()
-    
-    # Add radio buttons for each genre
-    for genre in genres:
-        ctk.CTkRadioButton(genres_frame, text=genre["name"], variable=genre_var, value=str(genre["genre_id"])).pack(anchor="w", pady=5)
-    
-    # Option for no genre
-    ctk.CTkRadioButton(genres_frame, text="No Genre", variable=genre_var, value="0").pack(anchor="w", pady=5)
-    
-    # Select first genre by default
-    if genres:
-        genre_var.set(str(genres[0]["genre_id"]))
-    else:
-        genre_var.set("0")  # No genre
-    
-    # Confirm button
-    def confirm_genre():
-        nonlocal genre_id
-        genre_id = int(genre_var.get()) if genre_var.get() != "0" else None
-        genre_select.destroy()
+    # Pick an artist (prefix search, new artists are upserted by name)
+    artist_id = open_catalog_picker("Select Artist", search_artists, "artist_id",
+                                    add_label="+ Add New Artist", add_new=add_artist)
     
-    # Variable to store selected genre ID
-    genre_id = None
+    # If no artist selected, cancel upload
+    if artist_id is None:
+        return
     
-    ctk.CTkButton(genre_select, text="Confirm", command=confirm_genre).pack(pady=10)
+    # Pick a genre (optional)
+    genre_id = open_catalog_picker("Select Genre", search_genres, "genre_id",
+                                   none_label="No Genre")
     
-    # Wait for dialog to close
-    root.wait_window(genre_select)
+    # Upload in chunks on a worker thread; meanwhile the upload button cancels it
+    # (uploading the same file again resumes where it stopped)
+    cancel_event = threading.Event()
+    status = {"progress": None, "result": None}
     
-    # Upload the song
-    song_id = upload_song_to_db(file_path, title, artist_id, genre_id)
+    def run():
+        status["result"] = upload_song_chunked(file_path, title, artist_id, genre_id,
+                                               on_progress=lambda p: status.update(progress=p),
+                                               cancel_event=cancel_event)
     
-    if song_id:
+    def poll():
+        if status["progress"]:
+            batch_status_label.configure(text=f"Uploading '{title}': {format_progress(status['progress'])}")
+        
+        result = status["result"]
+        if result is None:
+            root.after(200, poll)
+            return
+        
+        upload_button.configure(text="⬆️ Upload New Song", command=handle_upload_song)
+        if result["status"] == "cancelled":
+            batch_status_label.configure(text=f"Upload of '{title}' cancelled. Upload the file again to resume.")
+            return
+        if result["status"] == "failed":
+            batch_status_label.configure(text="")
+            messagebox.showerror("Database Error", f"Failed to upload song: {result.get('error')}")
+            return
+        
+        batch_status_label.configure(text=f"Uploaded '{title}' at {format_file_size(result['bytes_per_second'])}/s")
         messagebox.showinfo("Success", f"Song '{title}' uploaded successfully!")
+        if CATALOG_MIRROR_ENABLED:
+            catalog_mirror.sync_catalog_async()
+        # Analyse the new song so it can be recommended before anyone plays it
+        # (imported here: feature extraction needs numpy, which the page does not)
+        from utils.audio_features import extract_song_features_async
+        extract_song_features_async(result["song_id"])
         # Refresh the song list
         refresh_song_list()
+    
+    upload_button.configure(text="✖ Cancel Upload", command=cancel_event.set)
+    threading.Thread(target=run, daemon=True).start()
+    poll()
 
 def select_song_for_download(song_id, title, artist, song_frame):
     """Select a song for download"""
@@ -675,8 +714,11 @@ def open_login_page():
     """Logout and open the login page"""
     try:
         # Stop any playing music
-        if mixer.music.get_busy():
-            mixer.music.stop()
+        if current_song["id"] is not None:
+            try:
+                player.stop()
+            except PlaybackError as e:
+                print(f"Error stopping playback: {e}")
             
         # Remove current user file
         if os.path.exists("current_user.txt"):
@@ -692,6 +734,7 @@ def init_download_page():
     """Initialize and run the download page"""
     global root, favorite_songs_frame, title_label, subtitle_label, button_frame, tabs
     global favorite_tab, popular_tab, song_frames, now_playing_label, play_btn
+    global upload_button, batch_download_button, batch_status_label
     
     # Get current user info
     user = get_current_user()
@@ -700,6 +743,10 @@ def init_download_page():
         open_login_page()
         return
 
+    # Bring the local catalog mirror up to date in the background
+    if CATALOG_MIRROR_ENABLED:
+        catalog_mirror.sync_catalog_async(user['user_id'])
+
     # --------------- Initialize App ---------------
     ctk.set_appearance_mode("dark")  # Dark mode
     ctk.set_default_color_theme("blue")  # Default theme
@@ -850,6 +897,25 @@ def init_download_page():
                                  command=handle_upload_song)
     upload_button.pack(side="left", padx=10)
 
+    # Download all button
+    batch_download_button = ctk.CTkButton(button_frame, text="⬇️ Download All", font=("Arial", 14, "bold"), 
+                                         fg_color="#16A34A", hover_color="#15803D", 
+                                         corner_radius=5, height=40, width=210,
+                                         command=download_all_in_tab)
+    batch_download_button.pack(side="left", padx=10)
+    
+    # Batch download and upload progress
+    batch_status_label = ctk.CTkLabel(button_frame, text="", font=("Arial", 12), text_color="#A0A0A0")
+    batch_status_label.pack(side="bottom", pady=(10, 0))
+
+    # Redraw the tabs when songs are uploaded elsewhere or this user plays one
+    changes = ChangeListener()
+    changes.subscribe(("song.uploaded", "song.played", "history.imported"),
+                      lambda events: refresh_song_list(), user['user_id'])
+    changes.dispatch_every(root)
+
+    load_player_status()
+
     # --------------- Run Application ---------------
     root.mainloop()
 
@@ -2,17 +2,17 @@ import customtkinter as ctk
 from tkinter import messagebox
 import subprocess
 import os
-from PIL import Image, ImageTk
-from pygame import mixer
 import threading
 import time
 
 # Import from our utils
 from utils.db_utils import connect_db, get_current_user
-from utils.audio_utils import play_song_from_db, record_listening_history
-
-# Initialize mixer for music playback
-mixer.init()
+from utils.playback import get_player, PlaybackError
+from utils.cache import cached
+from utils.change_events import ChangeListener
+from utils.history_retention import SONG_PLAYS_SQL, get_history_watermark
+from utils import catalog_mirror
+from config import SONG_LIST_CACHE_TTL, CACHE_STALE_TTL, CATALOG_MIRROR_ENABLED, TRENDING_WINDOWS
 
 # Current song information
 current_song = {
@@ -23,28 +23,38 @@ current_song = {
     "paused": False
 }
 
+# Plays through the playback daemon, so music continues on other pages
+player = get_player()
+
 # ------------------- Song Management Functions -------------------
 def get_featured_songs(limit=3):
+    """Get featured songs (cached), or the mirror's newest songs when offline"""
+    songs = cached(f"songs:featured:{limit}", lambda: load_featured_songs(limit),
+                   SONG_LIST_CACHE_TTL, CACHE_STALE_TTL)
+    if not songs and CATALOG_MIRROR_ENABLED:
+        songs = catalog_mirror.get_newest_songs(limit)
+    return songs
+
+def load_featured_songs(limit=3):
     """Get featured songs from the database"""
     try:
-        connection = connect_db()
+        connection = connect_db(read_only=True)
         if not connection:
             return []
             
         cursor = connection.cursor(dictionary=True)
         
-        # Get songs with most plays in listening history
-        query = """
-        SELECT s.song_id, s.title, a.name as artist_name, COUNT(lh.history_id) as play_count 
+        # Get songs with most plays (recent plays plus daily rollups)
+        query = f"""
+        SELECT s.song_id, s.title, a.name as artist_name, COALESCE(p.plays, 0) as play_count 
         FROM Songs s
         JOIN Artists a ON s.artist_id = a.artist_id
-        LEFT JOIN Listening_History lh ON s.song_id = lh.song_id
-        GROUP BY s.song_id
+        LEFT JOIN ({SONG_PLAYS_SQL}) p ON s.song_id = p.song_id
         ORDER BY play_count DESC
         LIMIT %s
         """
         
-        cursor.execute(query, (limit,))
+        cursor.execute(query, (get_history_watermark(connection), limit))
         songs = cursor.fetchall()
         
         # If no songs with play history, get newest songs
@@ -69,7 +79,57 @@ def get_featured_songs(limit=3):
             cursor.close()
             connection.close()
 
+def show_featured_songs():
+    """Fill the featured section with the most played songs"""
+    for widget in songs_frame.winfo_children():
+        widget.destroy()
+
+    # Get featured songs from database
+    featured_songs = get_featured_songs(3)
+
+    # If database has no songs yet, use sample data
+    if not featured_songs:
+        featured_songs = [
+            {"song_id": 1, "title": "Blinding\nLights", "artist_name": "The\nWeeknd"},
+            {"song_id": 2, "title": "Levitating", "artist_name": "Dua Lipa"},
+            {"song_id": 3, "title": "Shape of\nYou", "artist_name": "Ed\nSheeran"}
+        ]
+
+    # Create song cards for each featured song
+    for song in featured_songs:
+        song_card = create_song_card(
+            songs_frame,
+            song["song_id"],
+            song["title"],
+            song["artist_name"]
+        )
+        song_card.pack(side="left", padx=10)
+
+def on_songs_changed(events):
+    """Change events: the song lists were invalidated, redraw the featured songs"""
+    # The trending charts follow plays, not uploads
+    if not trending_window.winfo_ismapped():
+        show_featured_songs()
+
 # ------------------- Music Player Functions -------------------
+def update_player_controls():
+    """Show the current song on the now playing label and play button"""
+    if current_song["id"] is None:
+        now_playing_label.configure(text="Now Playing: No song playing")
+    else:
+        now_playing_label.configure(text=f"Now Playing: {current_song['title']} - {current_song['artist']}")
+    play_btn.configure(text="⏸️" if current_song["playing"] else "▶️")
+
+def load_player_status():
+    """Pick up the song already playing (it keeps playing across pages)"""
+    global current_song
+    try:
+        current_song = player.status()
+    except PlaybackError as e:
+        print(f"Error getting playback status: {e}")
+        return
+    update_player_controls()
+
 def play_song(song_id):
     """Play a song from its binary data in the database"""
     global current_song
@@ -79,21 +139,15 @@ def play_song(song_id):
     if not user:
         return False
     
-    # Use our utility function to play the song
-    song_info = play_song_from_db(song_id, mixer, 
-                               now_playing_label if 'now_playing_label' in globals() else None,
-                               play_btn if 'play_btn' in globals() else None)
-    
-    if song_info:
-        # Update current song info
-        current_song = song_info
-        
-        # Record in listening history
-        record_listening_history(user['user_id'], song_id)
-        
-        return True
+    # The player records the play in the user's listening history
+    try:
+        current_song = player.play(song_id, user['user_id'])
+    except PlaybackError as e:
+        messagebox.showerror("Error", str(e))
+        return False
     
-    return False
+    update_player_controls()
+    return True
 
 def toggle_play_pause():
     """Toggle between play and pause states"""
@@ -104,29 +158,73 @@ def toggle_play_pause():
         featured_songs = get_featured_songs(1)
         if featured_songs:
             play_song(featured_songs[0]['song_id'])
-    elif current_song["paused"]:
-        # Resume paused song
-        mixer.music.unpause()
-        current_song["paused"] = False
-        current_song["playing"] = True
-        play_btn.configure(text="⏸️")
-    elif current_song["playing"]:
-        # Pause playing song
-        mixer.music.pause()
-        current_song["paused"] = True
-        current_song["playing"] = False
-        play_btn.configure(text="▶️")
+        return
+    
+    try:
+        current_song = player.toggle()
+    except PlaybackError as e:
+        messagebox.showerror("Error", str(e))
+        return
+    update_player_controls()
+
+def seek_relative(seconds):
+    """Skip forward or back within the current song"""
+    global current_song
+    if current_song["id"] is None:
+        return
+    try:
+        current_song = player.seek(seconds, relative=True)
+    except PlaybackError as e:
+        print(f"Error seeking: {e}")
+        return
+    update_player_controls()
 
 def play_next_song():
-    """Play the next song in the playlist"""
-    # This is a placeholder that would be implemented with your playlist functionality
-    messagebox.showinfo("Info", "Next song feature will be implemented with playlists")
+    """Play the next song in the play queue"""
+    global current_song
+    try:
+        if not player.status()["queue"]:
+            messagebox.showinfo("Info", "No songs in the play queue")
+            return
+        current_song = player.next()
+    except PlaybackError as e:
+        messagebox.showerror("Error", str(e))
+        return
+    update_player_controls()
 
 def play_previous_song():
     """Play the previous song in the playlist"""
     # This is a placeholder that would be implemented with your playlist functionality
     messagebox.showinfo("Info", "Previous song feature will be implemented with playlists")
 
+# ------------------- Trending -------------------
+def show_trending(window="24h"):
+    """Show the songs trending over a window in the featured section"""
+    trending_window.set(window)
+    if not trending_window.winfo_ismapped():
+        trending_window.pack(anchor="w", pady=(0, 15), before=songs_frame)
+    featured_title.configure(text=f"🔥 Trending • last {window}")
+
+    for widget in songs_frame.winfo_children():
+        widget.destroy()
+
+    # Imported here: the trending charts need numpy, which the first frame does not
+    from utils.trending import get_trending_songs
+    songs = get_trending_songs(window, 3)
+    if not songs:
+        ctk.CTkLabel(songs_frame, text="No plays in this period yet.",
+                     font=("Arial", 14), text_color="#A0A0A0").pack(anchor="w")
+        return
+    for song in songs:
+        create_song_card(songs_frame, song["song_id"], song["title"], song["artist_name"]).pack(side="left", padx=10)
+
+def refresh_trending_in_background():
+    """Count new plays for the trending charts on a background thread"""
+    def run():
+        from utils.trending import refresh_trending
+        refresh_trending()
+    threading.Thread(target=run, daemon=True).start()
+
 # ------------------- Navigation Functions -------------------
 def open_search_page():
     """Open the search page"""
@@ -164,8 +262,11 @@ def open_login_page():
     """Logout and open the login page"""
     try:
         # Stop any playing music
-        if mixer.music.get_busy():
-            mixer.music.stop()
+        if current_song["id"] is not None:
+            try:
+                player.stop()
+            except PlaybackError as e:
+                print(f"Error stopping playback: {e}")
             
         # Remove current user file
         if os.path.exists("current_user.txt"):
@@ -216,6 +317,10 @@ if __name__ == "__main__":
             open_login_page()
             exit()
 
+        # Bring the local catalog mirror up to date in the background
+        if CATALOG_MIRROR_ENABLED:
+            catalog_mirror.sync_catalog_async(user['user_id'])
+
         # ---------------- Initialize App ----------------
         ctk.set_appearance_mode("dark")  # Dark mode
         ctk.set_default_color_theme("blue")  # Default theme
@@ -225,6 +330,9 @@ if __name__ == "__main__":
         root.geometry("1000x600")  # Adjusted to match the image proportions
         root.resizable(False, False)
 
+        # Count new plays for the trending charts once the page is up
+        root.after(1000, refresh_trending_in_background)
+
         # ---------------- Main Frame ----------------
         main_frame = ctk.CTkFrame(root, fg_color="#1E1E2E", corner_radius=15)
         main_frame.pack(fill="both", expand=True, padx=10, pady=10)
@@ -299,6 +407,10 @@ if __name__ == "__main__":
                                width=40, height=40, command=play_next_song)
         next_btn.pack(side="left", padx=10)
 
+        # Arrow keys skip 10 seconds back or forward in the current song
+        root.bind("<Left>", lambda e: seek_relative(-10))
+        root.bind("<Right>", lambda e: seek_relative(10))
+
         # ---------------- Main Content ----------------
         content_frame = ctk.CTkFrame(main_frame, fg_color="#131B2E", corner_radius=10)
         content_frame.pack(side="right", fill="both", expand=True, padx=10, pady=10)
@@ -336,10 +448,11 @@ if __name__ == "__main__":
         button_frame = ctk.CTkFrame(hero_frame, fg_color="#131B2E")
         button_frame.pack(anchor="w")
 
-        # Trending button (just scrolls to featured songs for now)
+        # Trending button (shows trending songs in the featured section)
         trending_btn = ctk.CTkButton(button_frame, text="🔥 Trending", font=("Arial", 14, "bold"), 
                                    fg_color="#2563EB", hover_color="#1D4ED8", 
-                                   corner_radius=8, height=40, width=150)
+                                   corner_radius=8, height=40, width=150,
+                                   command=show_trending)
         trending_btn.pack(side="left", padx=(0, 10))
 
         # Playlists button
@@ -365,30 +478,22 @@ if __name__ == "__main__":
                                     font=("Arial", 18, "bold"), text_color="#B146EC")
         featured_title.pack(anchor="w", pady=(0, 20))
 
+        # Trending period selector, shown once Trending is clicked
+        trending_window = ctk.CTkSegmentedButton(featured_frame, values=list(TRENDING_WINDOWS),
+                                                 command=show_trending)
+
         # Song cards container
         songs_frame = ctk.CTkFrame(featured_frame, fg_color="#131B2E")
         songs_frame.pack(fill="x")
 
-        # Get featured songs from database
-        featured_songs = get_featured_songs(3)
-        
-        # If database has no songs yet, use sample data
-        if not featured_songs:
-            featured_songs = [
-                {"song_id": 1, "title": "Blinding\nLights", "artist_name": "The\nWeeknd"},
-                {"song_id": 2, "title": "Levitating", "artist_name": "Dua Lipa"},
-                {"song_id": 3, "title": "Shape of\nYou", "artist_name": "Ed\nSheeran"}
-            ]
-        
-        # Create song cards for each featured song
-        for song in featured_songs:
-            song_card = create_song_card(
-                songs_frame, 
-                song["song_id"], 
-                song["title"], 
-                song["artist_name"]
-            )
-            song_card.pack(side="left", padx=10)
+        show_featured_songs()
+
+        # Redraw the featured songs when songs are uploaded or imported elsewhere
+        changes = ChangeListener()
+        changes.subscribe(("song.uploaded", "history.imported"), on_songs_changed)
+        changes.dispatch_every(root)
+
+        load_player_status()
 
         # ---------------- Run Application ----------------
         root.mainloop()
@@ -0,0 +1,368 @@
+import customtkinter as ctk
+from tkinter import messagebox
+import subprocess
+import os
+
+# Import from our utils
+from utils.db_utils import connect_db, get_current_user
+from utils.audio_utils import format_file_size
+from utils.playback import get_player, PlaybackError
+from utils.audio_features import songs_like, similar_songs
+from utils.song_sets import get_song_sets
+from utils import catalog_mirror
+from config import CATALOG_MIRROR_ENABLED
+
+# Current song information
+current_song = {
+    "id": None,
+    "title": "No song playing",
+    "artist": "",
+    "playing": False,
+    "paused": False
+}
+
+# Plays through the playback daemon, so music continues on other pages
+player = get_player()
+
+# Number of recent plays and favorites that make up a user's taste
+SEED_SONGS = 20
+
+# ------------------- Recommendation Functions -------------------
+def get_songs_by_id(song_ids):
+    """Get song details for a list of song IDs, in the same order"""
+    if not song_ids:
+        return []
+    try:
+        connection = connect_db(read_only=True)
+        if not connection:
+            return []
+
+        cursor = connection.cursor(dictionary=True)
+        placeholders = ", ".join(["%s"] * len(song_ids))
+        query = f"""
+        SELECT s.song_id, s.title, a.name as artist_name, g.name as genre_name,
+               s.file_size, s.file_type
+        FROM Songs s
+        JOIN Artists a ON s.artist_id = a.artist_id
+        LEFT JOIN Genres g ON s.genre_id = g.genre_id
+        WHERE s.song_id IN ({placeholders})
+        """
+        cursor.execute(query, tuple(song_ids))
+        songs = {song['song_id']: song for song in cursor.fetchall()}
+        return [songs[song_id] for song_id in song_ids if song_id in songs]
+
+    except Exception as e:
+        print(f"Error getting songs: {e}")
+        return []
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def get_seed_songs(user_id, limit=SEED_SONGS):
+    """IDs of the user's most recently played and favorite songs"""
+    try:
+        connection = connect_db(read_only=True)
+        if not connection:
+            return []
+
+        cursor = connection.cursor()
+        cursor.execute(
+            """
+            SELECT song_id FROM Listening_History
+            WHERE user_id = %s
+            GROUP BY song_id
+            ORDER BY MAX(played_at) DESC
+            LIMIT %s
+            """,
+            (user_id, limit)
+        )
+        seeds = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT song_id FROM User_Favorites WHERE user_id = %s ORDER BY added_at DESC LIMIT %s",
+            (user_id, limit)
+        )
+        seeds += [row[0] for row in cursor.fetchall() if row[0] not in seeds]
+        return seeds
+
+    except Exception as e:
+        print(f"Error getting seed songs: {e}")
+        return []
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def with_similarity(matches):
+    """Song details for [(song_id, similarity)] matches, with a match percentage"""
+    songs = get_songs_by_id([song_id for song_id, _ in matches])
+    similarity = dict(matches)
+    for song in songs:
+        # Cosine similarity -1..1 shown as 0..100%
+        song['match'] = round((similarity[song['song_id']] + 1) * 50)
+    return songs
+
+def get_recommendations(user_id, limit=10):
+    """Songs that sound like what the user has been listening to
+
+    Based on audio content rather than play counts, so new uploads are
+    included. Songs the user has not played yet come first. Falls back to
+    the newest songs for users with no plays yet.
+    """
+    seeds = get_seed_songs(user_id)
+    matches = []
+    if seeds:
+        matches = songs_like(seeds, limit, exclude=get_song_sets(user_id).played)
+        if len(matches) < limit:
+            chosen = {song_id for song_id, _ in matches}
+            matches += [match for match in songs_like(seeds, limit) if match[0] not in chosen][:limit - len(matches)]
+    songs = with_similarity(matches)
+    if not songs and CATALOG_MIRROR_ENABLED:
+        songs = catalog_mirror.get_newest_songs(limit)
+    return songs
+
+def get_sounds_like(song_id, limit=10):
+    """Songs that sound like one song"""
+    return with_similarity(similar_songs(song_id, limit))
+
+# ------------------- Music Player Functions -------------------
+def update_player_controls():
+    """Show the current song on the now playing label and play button"""
+    if current_song["id"] is None:
+        now_playing_label.configure(text="Now Playing: No song playing")
+    else:
+        now_playing_label.configure(text=f"Now Playing: {current_song['title']} - {current_song['artist']}")
+    play_btn.configure(text="⏸️" if current_song["playing"] else "▶️")
+
+def load_player_status():
+    """Pick up the song already playing (it keeps playing across pages)"""
+    global current_song
+    try:
+        current_song = player.status()
+    except PlaybackError as e:
+        print(f"Error getting playback status: {e}")
+        return
+    update_player_controls()
+
+def play_song(song_id):
+    """Play a song from its binary data in the database"""
+    global current_song
+
+    # Get current user for history tracking
+    user = get_current_user()
+    if not user:
+        return False
+
+    # The player records the play in the user's listening history
+    try:
+        current_song = player.play(song_id, user['user_id'])
+    except PlaybackError as e:
+        messagebox.showerror("Error", str(e))
+        return False
+    update_player_controls()
+    return True
+
+def toggle_play_pause():
+    """Toggle between play and pause states"""
+    global current_song
+    if current_song["id"] is None:
+        return
+    try:
+        current_song = player.toggle()
+    except PlaybackError as e:
+        messagebox.showerror("Error", str(e))
+        return
+    update_player_controls()
+
+def toggle_favorite(song, button):
+    """Add a song to or remove it from the user's favorites"""
+    favorite = song_sets.toggle_favorite(song['song_id'])
+    if favorite is None:
+        messagebox.showerror("Error", "Could not update your favorites")
+        return
+    button.configure(text="♥" if favorite else "♡")
+    if CATALOG_MIRROR_ENABLED:
+        catalog_mirror.sync_catalog_async(user['user_id'])
+
+# ------------------- Song List -------------------
+def show_songs(title, songs, empty_text, show_back=False):
+    """Replace the song list with a titled list of songs"""
+    list_title.configure(text=title)
+    if show_back:
+        back_btn.pack(side="right")
+    else:
+        back_btn.pack_forget()
+
+    for widget in songs_list.winfo_children():
+        widget.destroy()
+
+    if not songs:
+        ctk.CTkLabel(songs_list, text=empty_text, font=("Arial", 14),
+                     text_color="#A0A0A0").pack(pady=30)
+        return
+
+    for song in song_sets.mark_songs(songs):
+        song_frame = ctk.CTkFrame(songs_list, fg_color="#1A1A2E", corner_radius=10, height=50)
+        song_frame.pack(fill="x", pady=5, ipady=5)
+        song_frame.pack_propagate(False)
+
+        song_label = ctk.CTkLabel(song_frame, text=f"🎵 {song['artist_name']} - {song['title']}",
+                                  font=("Arial", 14), text_color="white", anchor="w")
+        song_label.pack(side="left", padx=20)
+
+        details = f"{format_file_size(song['file_size'])} ({song['file_type']})"
+        if 'match' in song:
+            details = f"{song['match']}% match • {details}"
+        if song['played']:
+            details = f"✓ Played • {details}"
+        ctk.CTkLabel(song_frame, text=details, font=("Arial", 12),
+                     text_color="#A0A0A0").pack(side="right", padx=(0, 20))
+
+        sounds_like_btn = ctk.CTkButton(song_frame, text="≈ Sounds like", font=("Arial", 12),
+                                        fg_color="#1E293B", hover_color="#2A3749", width=100, height=30,
+                                        command=lambda s=song: show_sounds_like(s))
+        sounds_like_btn.pack(side="right", padx=5)
+
+        song_play_btn = ctk.CTkButton(song_frame, text="▶️", font=("Arial", 14),
+                                      fg_color="#1E293B", hover_color="#2A3749", width=30, height=30,
+                                      command=lambda sid=song['song_id']: play_song(sid))
+        song_play_btn.pack(side="right", padx=5)
+
+        favorite_btn = ctk.CTkButton(song_frame, text="♥" if song['favorite'] else "♡", font=("Arial", 14),
+                                     fg_color="#1E293B", hover_color="#2A3749", width=30, height=30)
+        favorite_btn.configure(command=lambda s=song, b=favorite_btn: toggle_favorite(s, b))
+        favorite_btn.pack(side="right", padx=5)
+
+def show_recommendations():
+    """List songs recommended for the current user"""
+    show_songs("🎧 Recommended For You", get_recommendations(user['user_id']),
+               "No recommendations yet. Play a few songs first!")
+
+def show_sounds_like(song):
+    """List songs that sound like the given song"""
+    show_songs(f"≈ Sounds like {song['title']}", get_sounds_like(song['song_id']),
+               "This song has not been analysed yet.", show_back=True)
+
+# ------------------- Navigation Functions -------------------
+def open_page(script, name):
+    """Open another page and close this one"""
+    try:
+        subprocess.Popen(["python", script])
+        root.destroy()
+    except Exception as e:
+        messagebox.showerror("Error", f"Unable to open {name} page: {e}")
+
+def open_login_page():
+    """Logout and open the login page"""
+    try:
+        if current_song["id"] is not None:
+            try:
+                player.stop()
+            except PlaybackError as e:
+                print(f"Error stopping playback: {e}")
+
+        if os.path.exists("current_user.txt"):
+            os.remove("current_user.txt")
+
+        subprocess.Popen(["python", "login.py"])
+        root.destroy()
+    except Exception as e:
+        messagebox.showerror("Error", f"Unable to logout: {e}")
+
+# ------------------- Main Application -------------------
+if __name__ == "__main__":
+    try:
+        user = get_current_user()
+        if not user:
+            subprocess.Popen(["python", "login.py"])
+            exit()
+
+        # Favorites and played songs, for marking up and filtering song lists
+        song_sets = get_song_sets(user['user_id'])
+
+        # ---------------- Initialize App ----------------
+        ctk.set_appearance_mode("dark")
+        ctk.set_default_color_theme("blue")
+
+        root = ctk.CTk()
+        root.title("Online Music System - Recommendations")
+        root.geometry("1000x600")
+        root.resizable(False, False)
+
+        main_frame = ctk.CTkFrame(root, fg_color="#1E1E2E", corner_radius=15)
+        main_frame.pack(fill="both", expand=True, padx=10, pady=10)
+
+        # ---------------- Sidebar Navigation ----------------
+        sidebar = ctk.CTkFrame(main_frame, width=250, height=580, fg_color="#111827", corner_radius=10)
+        sidebar.pack(side="left", fill="y", padx=(10, 0), pady=10)
+
+        title_label = ctk.CTkLabel(sidebar, text="Online Music\nSystem", font=("Arial", 20, "bold"), text_color="white")
+        title_label.pack(pady=(25, 30))
+
+        nav_items = [
+            ("🏠 Home", lambda: open_page("player/home.py", "home")),
+            ("🔍 Search", lambda: open_page("player/search.py", "search")),
+            ("🎵 Playlist", lambda: open_page("player/playlist.py", "playlist")),
+            ("⬇️ Download", lambda: open_page("player/download.py", "download")),
+            ("🎧 Recommend Songs", None),
+            ("🚪 Logout", open_login_page),
+        ]
+        for text, command in nav_items:
+            nav_btn = ctk.CTkButton(sidebar, text=text, font=("Arial", 14),
+                                    fg_color="#111827", hover_color="#1E293B",
+                                    text_color="white" if command is None else "#A0A0A0",
+                                    anchor="w", corner_radius=0, height=40, command=command)
+            nav_btn.pack(fill="x", pady=5, padx=10)
+
+        # Now playing label
+        now_playing_frame = ctk.CTkFrame(sidebar, fg_color="#111827", height=40)
+        now_playing_frame.pack(side="bottom", fill="x", pady=(0, 10), padx=10)
+
+        now_playing_label = ctk.CTkLabel(now_playing_frame, text="Now Playing: No song playing",
+                                         font=("Arial", 12), text_color="#A0A0A0", wraplength=220)
+        now_playing_label.pack(pady=5)
+
+        player_frame = ctk.CTkFrame(sidebar, fg_color="#111827", height=50)
+        player_frame.pack(side="bottom", fill="x", pady=10, padx=10)
+
+        play_btn = ctk.CTkButton(player_frame, text="▶️", font=("Arial", 18),
+                                 fg_color="#111827", hover_color="#1E293B",
+                                 width=40, height=40, command=toggle_play_pause)
+        play_btn.pack(pady=5)
+
+        # ---------------- Main Content ----------------
+        content_frame = ctk.CTkFrame(main_frame, fg_color="#131B2E", corner_radius=10)
+        content_frame.pack(side="right", fill="both", expand=True, padx=10, pady=10)
+
+        header_frame = ctk.CTkFrame(content_frame, fg_color="#131B2E", height=40)
+        header_frame.pack(fill="x", padx=20, pady=(20, 0))
+
+        ctk.CTkLabel(header_frame, text="Recommendations", font=("Arial", 18, "bold"),
+                     text_color="white").pack(side="left")
+        ctk.CTkLabel(header_frame, text=f"Hello, {user['first_name']} {user['last_name']}!",
+                     font=("Arial", 14), text_color="#A0A0A0").pack(side="right")
+
+        list_header = ctk.CTkFrame(content_frame, fg_color="#131B2E")
+        list_header.pack(fill="x", padx=20, pady=(30, 10))
+
+        list_title = ctk.CTkLabel(list_header, text="", font=("Arial", 18, "bold"), text_color="#B146EC")
+        list_title.pack(side="left")
+
+        back_btn = ctk.CTkButton(list_header, text="← Back", font=("Arial", 12, "bold"),
+                                 fg_color="#1E293B", hover_color="#2A3749", width=80,
+                                 command=show_recommendations)
+
+        songs_list = ctk.CTkScrollableFrame(content_frame, fg_color="#131B2E")
+        songs_list.pack(fill="both", expand=True, padx=20, pady=(0, 20))
+
+        show_recommendations()
+        load_player_status()
+
+        # ---------------- Run Application ----------------
+        root.mainloop()
+
+    except Exception as e:
+        import traceback
+        print(f"Error in recommend.py: {e}")
+        traceback.print_exc()
+        messagebox.showerror("Error", f"An error occurred: {e}")
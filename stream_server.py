@@ -0,0 +1,333 @@
+"""
+Online Music System
+Local HTTP audio streaming service
+
+Serves song audio from the Songs table so clients need no database
+credentials:
+    GET/HEAD /songs/<id>        audio, with Range, ETag and If-None-Match support
+    GET      /songs/<id>/info   song metadata as JSON
+
+Songs are materialized into STREAM_CACHE_DIR on first request and then
+sent from disk with zero-copy sendfile. The least recently sent songs are
+evicted once the cache grows past STREAM_CACHE_MAX_BYTES. Requests that
+need the database while it is down get a 503.
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import (STREAM_SERVER_HOST, STREAM_SERVER_PORT, STREAM_CACHE_DIR,
+                    STREAM_CACHE_MAX_BYTES, DOWNLOAD_CHUNK_SIZE)
+from utils.db_utils import connect_db, DB_ERRORS
+from utils.audio_utils import fetch_song_info, read_song_chunks_from_db
+
+CONTENT_TYPES = {
+    "mp3": "audio/mpeg",
+    "flac": "audio/flac",
+    "wav": "audio/wav",
+    "wave": "audio/wav",
+    "ogg": "audio/ogg"
+}
+
+_SONG_PATH_RE = re.compile(r"^/songs/(\d+)(/info)?/?$")
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Partial copies not written to for this long were left by a crashed server
+STALE_PART_SECONDS = 600
+
+# Songs currently being copied into the disk cache
+_materializing = set()
+_materializing_lock = threading.Lock()
+
+# ------------------- Database -------------------
+def load_song_info(song_id):
+    """Song metadata, or None if there is no such song
+
+    Raises IOError if the database cannot be reached; the server has no UI,
+    so connection errors are only logged.
+    """
+    connection = connect_db(read_only=True, quiet=True)
+    if not connection:
+        raise IOError("Database unavailable")
+    try:
+        return fetch_song_info(connection, song_id)
+    except DB_ERRORS as e:
+        raise IOError(f"Error getting song info: {e}")
+    finally:
+        connection.close()
+
+# ------------------- Disk Cache -------------------
+def song_etag(info):
+    """Strong ETag for a song (songs are immutable once uploaded)"""
+    uploaded = info["upload_date"].strftime("%Y%m%d%H%M%S") if info.get("upload_date") else "0"
+    return f'"{info["song_id"]}-{info["file_size"]}-{uploaded}"'
+
+def cache_path(info):
+    """Disk cache location for a song's audio"""
+    etag = song_etag(info).strip('"')
+    return os.path.join(STREAM_CACHE_DIR, f"{etag}.{info['file_type']}")
+
+def materialize_song(info):
+    """Copy a song from the database into the disk cache"""
+    path = cache_path(info)
+    with _materializing_lock:
+        if info["song_id"] in _materializing or os.path.exists(path):
+            return
+        _materializing.add(info["song_id"])
+
+    try:
+        os.makedirs(STREAM_CACHE_DIR, exist_ok=True)
+        part_path = f"{path}.{threading.get_ident()}.part"
+        with open(part_path, "wb") as f:
+            for chunk in read_song_chunks_from_db(info["song_id"], quiet=True):
+                f.write(chunk)
+
+        if os.path.getsize(part_path) == info["file_size"]:
+            os.replace(part_path, path)
+        else:
+            print(f"Song {info['song_id']} size mismatch, not caching")
+            os.remove(part_path)
+    except Exception as e:
+        print(f"Error caching song {info['song_id']}: {e}")
+    finally:
+        with _materializing_lock:
+            _materializing.discard(info["song_id"])
+    prune_cache()
+
+def prune_cache(max_bytes=STREAM_CACHE_MAX_BYTES):
+    """Delete stale partial copies and evict the least recently sent songs beyond max_bytes"""
+    now = time.time()
+    songs = []
+    try:
+        with os.scandir(STREAM_CACHE_DIR) as entries:
+            for entry in entries:
+                stat = entry.stat()
+                if entry.name.endswith(".part"):
+                    if now - stat.st_mtime > STALE_PART_SECONDS:
+                        os.remove(entry.path)
+                else:
+                    songs.append((stat.st_atime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        return
+    except OSError as e:
+        print(f"Error pruning stream cache: {e}")
+        return
+
+    total = sum(size for _, size, _ in songs)
+    for _, size, path in sorted(songs):
+        if total <= max_bytes:
+            break
+        try:
+            # A song being sent keeps streaming from its open file
+            os.remove(path)
+            total -= size
+        except OSError as e:
+            print(f"Error evicting {path} from stream cache: {e}")
+
+def parse_range(header, size):
+    """Parse a single-range Range header into (start, end), None or 'invalid'"""
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        # Multiple or non-byte ranges: serve the whole song
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return "invalid"
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return "invalid"
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return "invalid"
+    return start, end
+
+# ------------------- Request Handler -------------------
+class SongStreamHandler(BaseHTTPRequestHandler):
+    """Serves song audio and metadata"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self.handle_song(send_body=False)
+
+    def do_GET(self):
+        self.handle_song(send_body=True)
+
+    def send_error_response(self, code, message, headers=None):
+        body = message.encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def handle_song(self, send_body):
+        match = _SONG_PATH_RE.match(self.path.split("?", 1)[0])
+        if not match:
+            self.send_error_response(404, "Not found")
+            return
+
+        try:
+            info = load_song_info(int(match.group(1)))
+        except IOError as e:
+            print(e)
+            self.send_error_response(503, "Database unavailable", {"Retry-After": "5"})
+            return
+        if not info:
+            self.send_error_response(404, "Song not found")
+            return
+
+        etag = song_etag(info)
+        if match.group(2):
+            self.send_info(info, etag, send_body)
+            return
+
+        # Client already has this version
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        size = info["file_size"]
+        byte_range = parse_range(self.headers.get("Range"), size)
+
+        # If-Range: only honour the range if the client's copy is current
+        if_range = self.headers.get("If-Range")
+        if if_range and if_range.strip() != etag:
+            byte_range = None
+
+        if byte_range == "invalid":
+            self.send_error_response(416, "Range not satisfiable", {"Content-Range": f"bytes */{size}"})
+            return
+
+        start, end = byte_range or (0, size - 1)
+        length = end - start + 1 if size else 0
+
+        body = None
+        if send_body and length:
+            try:
+                body = self.open_audio(info, start, length)
+            except (DB_ERRORS + (IOError,)) as e:
+                print(f"Error reading song {info['song_id']}: {e}")
+                self.send_error_response(503, "Database unavailable", {"Retry-After": "5"})
+                return
+
+        self.send_response(206 if byte_range else 200)
+        self.send_header("Content-Type", CONTENT_TYPES.get(info["file_type"], "application/octet-stream"))
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        if byte_range:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        if body is not None:
+            self.send_audio(body, start, length)
+
+    def send_info(self, info, etag, send_body):
+        payload = {
+            "song_id": info["song_id"],
+            "title": info["title"],
+            "artist_name": info["artist_name"],
+            "file_type": info["file_type"],
+            "file_size": info["file_size"],
+            "etag": etag
+        }
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def open_audio(self, info, start, length):
+        """The song's cached file, or its chunks from the database starting at start
+
+        The first chunk is read here, before any response is sent, so an
+        unavailable database can still be answered with a 503.
+        """
+        path = cache_path(info)
+        try:
+            f = open(path, "rb")
+            # Eviction goes by access time, which the mount may not update
+            os.utime(f.fileno(), (time.time(), os.stat(f.fileno()).st_mtime))
+            return f
+        except FileNotFoundError:
+            pass
+
+        # Cache miss: answer from the database right away and fill the cache in the background
+        threading.Thread(target=materialize_song, args=(info,), daemon=True).start()
+
+        chunks = read_song_chunks_from_db(info["song_id"], start, min(DOWNLOAD_CHUNK_SIZE, length), quiet=True)
+        first = next(chunks, b"")
+
+        def body():
+            try:
+                yield first
+                yield from chunks
+            finally:
+                chunks.close()
+        return body()
+
+    def send_audio(self, body, start, length):
+        """Send length bytes from start of an open_audio() result, then close it"""
+        self.wfile.flush()
+        try:
+            if hasattr(body, "fileno"):
+                # Zero-copy from the page cache to the socket
+                self.connection.sendfile(body, start, length)
+                return
+
+            remaining = length
+            for chunk in body:
+                chunk = chunk[:remaining]
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+                if remaining <= 0:
+                    break
+        finally:
+            body.close()
+
+    def log_message(self, format, *args):
+        # Keep the console quiet for the many Range requests a player makes
+        pass
+
+def run_server(host=STREAM_SERVER_HOST, port=STREAM_SERVER_PORT):
+    """Run the streaming service until interrupted"""
+    server = ThreadingHTTPServer((host, port), SongStreamHandler)
+    server.daemon_threads = True
+    # Leftovers of a previous run
+    prune_cache()
+    print(f"Streaming songs on http://{host}:{port}/songs/<id>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+# ------------------- Main Entry Point -------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Online Music System streaming service")
+    parser.add_argument("--host", default=STREAM_SERVER_HOST)
+    parser.add_argument("--port", type=int, default=STREAM_SERVER_PORT)
+    args = parser.parse_args()
+
+    run_server(args.host, args.port)
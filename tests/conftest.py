@@ -0,0 +1,62 @@
+"""
+Test setup: every test runs against a fresh SQLite database in a temporary
+directory, with the shared cache and song set files kept there too.
+"""
+import os
+import shutil
+import tempfile
+import pytest
+import config
+
+_TEST_DIR = tempfile.mkdtemp(prefix="music_tests_")
+
+# Set before any utils module copies these from config
+config.DB_BACKEND = "sqlite"
+config.SQLITE_PATH = os.path.join(_TEST_DIR, "test.db")
+config.QUERY_METRICS_ENABLED = False
+config.TEMP_DIR = os.path.join(_TEST_DIR, "temp")
+config.SONG_SETS_DIR = os.path.join(_TEST_DIR, "song_sets")
+
+from utils.db_utils import connect_db
+from utils.db_schema import create_tables
+
+@pytest.fixture
+def db():
+    """A connection to an empty database with all tables"""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(config.SQLITE_PATH + suffix):
+            os.remove(config.SQLITE_PATH + suffix)
+    # Song sets of users from earlier tests would describe this database's users
+    shutil.rmtree(config.SONG_SETS_DIR, ignore_errors=True)
+    connection = connect_db()
+    cursor = connection.cursor()
+    create_tables(cursor, "sqlite", log=lambda message: None)
+    connection.commit()
+    cursor.close()
+    yield connection
+    connection.close()
+
+def add_songs(connection, count, artist="Artist"):
+    """Insert count songs by one artist; returns their IDs"""
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO Artists (name) VALUES (%s)", (artist,))
+    artist_id = cursor.lastrowid
+    song_ids = []
+    for i in range(count):
+        cursor.execute(
+            "INSERT INTO Songs (title, artist_id, file_data, file_type, file_size) VALUES (%s, %s, %s, %s, %s)",
+            (f"Song {i}", artist_id, b"", "mp3", 0)
+        )
+        song_ids.append(cursor.lastrowid)
+    connection.commit()
+    cursor.close()
+    return song_ids
+
+def add_user(connection, email="user@example.com"):
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO Users (first_name, last_name, email, password) VALUES (%s, %s, %s, %s)",
+                   ("Test", "User", email, "x"))
+    connection.commit()
+    user_id = cursor.lastrowid
+    cursor.close()
+    return user_id
@@ -0,0 +1,24 @@
+import numpy as np
+from utils import ann_index
+
+def test_build_add_and_search(tmp_path, monkeypatch):
+    path = str(tmp_path / "index")
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, 16)).astype(np.float32)
+    ann_index.build_index(list(range(1, 201)), vectors, path=path, tables=4, bits=6, seed=1)
+
+    index = ann_index.load_index(path)
+    assert index.count == 200
+    # A near-copy of song 8 is its closest neighbour
+    assert ann_index.add_songs([500], vectors[7:8] + 0.01, path=path)
+    index = ann_index.load_index(path)
+    assert index.count == 201
+    assert index.songs_like([8], k=1)[0][0] == 500
+    assert index.songs_like([8, 500], k=3, exclude=[9])[0][0] not in (8, 9, 500)
+
+    # Through the hash buckets rather than a scan
+    monkeypatch.setattr(ann_index, "EXACT_SEARCH_MAX_ROWS", 0)
+    assert index.songs_like([8], k=1)[0][0] == 500
+
+def test_missing_index(tmp_path):
+    assert ann_index.load_index(str(tmp_path / "none")) is None
@@ -0,0 +1,43 @@
+import io
+import sys
+import wave
+import numpy as np
+from conftest import add_songs
+from utils import audio_features
+
+def _wav_bytes(seconds=1, rate=22050):
+    t = np.arange(int(seconds * rate)) / rate
+    samples = (np.sin(2 * np.pi * 440 * t) * 20000).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+def test_decode_and_extract_wav():
+    samples, rate = audio_features.decode_audio(_wav_bytes(), "wav")
+    assert rate == 22050 and samples.dtype == np.float32
+    vector = audio_features.extract_features(samples, rate)
+    assert vector.shape == (len(audio_features.FEATURE_NAMES),)
+
+def test_single_song_is_decoded_outside_the_page_process(db, monkeypatch):
+    song_id, = add_songs(db, 1)
+    data = _wav_bytes()
+    cursor = db.cursor()
+    # Not a WAV by name, so it goes through pygame's decoder
+    cursor.execute("UPDATE Songs SET file_data = %s, file_type = 'mp3', file_size = %s WHERE song_id = %s",
+                   (data, len(data), song_id))
+    db.commit()
+    indexed = []
+    monkeypatch.setattr(audio_features.ann_index, "add_songs", lambda song_ids, vectors: indexed.extend(song_ids))
+
+    assert audio_features.extract_song_features(song_id)
+    assert indexed == [song_id]
+    cursor.execute("SELECT version FROM Song_Features WHERE song_id = %s", (song_id,))
+    assert cursor.fetchone() == (audio_features.FEATURE_VERSION,)
+    cursor.close()
+    # This process's mixer is left for playback
+    mixer = sys.modules.get("pygame.mixer")
+    assert mixer is None or not mixer.get_init()
@@ -0,0 +1,38 @@
+import os
+from conftest import add_songs
+from utils import batch_download
+
+def _song(song_id, size):
+    return {"song_id": song_id, "title": "Song", "artist_name": "Artist", "file_type": "mp3", "file_size": size}
+
+def _store_data(connection, song_id, data):
+    cursor = connection.cursor()
+    cursor.execute("UPDATE Songs SET file_data = %s, file_size = %s WHERE song_id = %s", (data, len(data), song_id))
+    connection.commit()
+    cursor.close()
+
+def test_songs_with_the_same_name_get_their_own_files(db, tmp_path):
+    first, second = add_songs(db, 2)
+    _store_data(db, first, b"a" * 10)
+    _store_data(db, second, b"b" * 10)
+
+    songs = [_song(first, 10), _song(second, 10), _song(first, 10)]
+    results = batch_download.download_songs(songs, str(tmp_path))
+
+    assert [result["song_id"] for result in results] == [first, second]
+    contents = {result["song_id"]: open(result["path"], "rb").read() for result in results}
+    assert contents == {first: b"a" * 10, second: b"b" * 10}
+
+def test_same_sized_file_of_another_song_is_not_skipped(db, tmp_path):
+    song_id, = add_songs(db, 1)
+    _store_data(db, song_id, b"a" * 10)
+    with open(os.path.join(tmp_path, "Artist - Song.mp3"), "wb") as f:
+        f.write(b"x" * 10)
+
+    result, = batch_download.download_songs([_song(song_id, 10)], str(tmp_path))
+    assert result["status"] == "downloaded"
+    assert open(result["path"], "rb").read() == b"a" * 10
+
+    # Downloaded by this song, so skipped the next time
+    result, = batch_download.download_songs([_song(song_id, 10)], str(tmp_path))
+    assert result["status"] == "exists"
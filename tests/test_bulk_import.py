@@ -0,0 +1,42 @@
+import datetime
+import json
+from conftest import add_songs, add_user
+from utils.bulk_import import import_file
+from utils.history_retention import TOTAL_PLAYS_SQL, get_history_watermark, roll_up_history
+
+def _total_plays(connection):
+    cursor = connection.cursor()
+    cursor.execute(TOTAL_PLAYS_SQL, (get_history_watermark(connection),))
+    total = cursor.fetchone()[0]
+    cursor.close()
+    return total
+
+def _write_events(path, events):
+    with open(path, "w") as f:
+        for user_id, song_id, played_at in events:
+            f.write(json.dumps({"user_id": user_id, "song_id": song_id, "played_at": played_at}) + "\n")
+
+def test_history_older_than_rollup_is_counted(db, tmp_path):
+    user_id = add_user(db)
+    song_id = add_songs(db, 1)[0]
+    now = datetime.datetime.now()
+    recent = f"{now:%Y-%m-%d %H:%M:%S}"
+    old = f"{now - datetime.timedelta(days=400):%Y-%m-%d %H:%M:%S}"
+    _write_events(tmp_path / "first.jsonl", [(user_id, song_id, old), (user_id, song_id, recent)])
+    assert import_file("history", str(tmp_path / "first.jsonl"), workers=0)["imported"] == 2
+    roll_up_history()
+    assert _total_plays(db) == 2
+
+    # Plays from before the watermark, e.g. an older play log migrated later
+    _write_events(tmp_path / "old.jsonl", [(user_id, song_id, "2020-01-01T10:00:00")] * 3
+                  + [(user_id, song_id, recent)])
+    summary = import_file("history", str(tmp_path / "old.jsonl"), workers=0)
+    assert summary["imported"] == 4
+    assert _total_plays(db) == 6
+
+    roll_up_history()
+    assert _total_plays(db) == 6
+    cursor = db.cursor()
+    cursor.execute("SELECT plays FROM User_Daily_Plays WHERE user_id = %s AND day = %s", (user_id, "2020-01-01"))
+    assert cursor.fetchone()[0] == 3
+    cursor.close()
@@ -0,0 +1,43 @@
+import multiprocessing
+import pickle
+import pytest
+from utils import cache
+
+@pytest.fixture
+def cache_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_FILE", str(tmp_path / "cache.pickle"))
+    monkeypatch.setattr(cache, "_entries", {})
+    monkeypatch.setattr(cache, "_generation", 0)
+    monkeypatch.setattr(cache, "_invalidated", {})
+    monkeypatch.setattr(cache, "_loaded_mtime", None)
+
+def _fill(worker):
+    for i in range(40):
+        cache.cached(f"songs:{worker}:{i}", lambda: [i], ttl=60)
+
+def test_concurrent_processes_keep_each_others_entries(cache_file):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_fill, args=(worker,)) for worker in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    cache._sync_from_disk()
+    assert len(cache._entries) == 4 * 40
+
+def test_value_loaded_before_an_invalidation_is_not_stored(cache_file):
+    def loader():
+        cache.invalidate("songs:")  # e.g. an upload committed during the load
+        return ["old"]
+
+    assert cache.cached("songs:all", loader, ttl=60) == ["old"]
+    assert cache.cached("songs:all", lambda: ["new"], ttl=60) == ["new"]
+    # Other prefixes are still cached
+    assert cache.cached("features:1", loader, ttl=60) == ["old"]
+    assert cache.cached("features:1", lambda: ["new"], ttl=60) == ["old"]
+
+def test_unknown_file_contents_are_a_miss(cache_file):
+    with open(cache.CACHE_FILE, "wb") as f:
+        pickle.dump({"songs:all": (0, ["old"])}, f)
+    assert cache.cached("songs:all", lambda: ["new"], ttl=60) == ["new"]
@@ -0,0 +1,79 @@
+import pytest
+from conftest import add_songs
+from utils import catalog_mirror
+
+@pytest.fixture
+def mirror(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog_mirror, "CATALOG_MIRROR_PATH", str(tmp_path / "mirror.db"))
+    monkeypatch.setattr(catalog_mirror._local, "connection", None, raising=False)
+    yield catalog_mirror
+    catalog_mirror._local.connection.close()
+    catalog_mirror._local.connection = None
+
+def _titles(mirror):
+    return {row["song_id"]: row["title"] for row in mirror.query_mirror("SELECT song_id, title FROM Songs")}
+
+def test_reconcile_pulls_late_rows_and_edits(db, mirror, monkeypatch):
+    song_ids = add_songs(db, 3)
+    mirror.sync_catalog()
+
+    cursor = db.cursor()
+    # A row below the synced ID and past the lookback, as if committed late
+    monkeypatch.setattr(mirror, "SYNC_LOOKBACK_IDS", 0)
+    cursor.execute("DELETE FROM Songs WHERE song_id = %s", (song_ids[0],))
+    cursor.execute("UPDATE Songs SET title = %s WHERE song_id = %s", ("Renamed", song_ids[1]))
+    cursor.execute(
+        "INSERT INTO Songs (song_id, title, file_data, file_type, file_size) VALUES (%s, %s, %s, %s, %s)",
+        (song_ids[0], "Late", b"", "mp3", 0)
+    )
+    db.commit()
+    cursor.close()
+
+    mirror.sync_catalog()
+    assert _titles(mirror)[song_ids[1]] == "Song 1"
+
+    monkeypatch.setattr(mirror, "CATALOG_MIRROR_RECONCILE_INTERVAL", 0)
+    mirror.sync_catalog()
+    assert _titles(mirror) == {song_ids[0]: "Late", song_ids[1]: "Renamed", song_ids[2]: "Song 2"}
+
+def test_lookback_pulls_rows_committed_after_a_higher_id(db, mirror):
+    song_ids = add_songs(db, 3)
+    cursor = db.cursor()
+    cursor.execute("DELETE FROM Songs WHERE song_id = %s", (song_ids[1],))
+    db.commit()
+    mirror.sync_catalog()
+
+    cursor.execute(
+        "INSERT INTO Songs (song_id, title, file_data, file_type, file_size) VALUES (%s, %s, %s, %s, %s)",
+        (song_ids[1], "Late", b"", "mp3", 0)
+    )
+    db.commit()
+    cursor.close()
+    mirror.sync_catalog()
+    assert _titles(mirror)[song_ids[1]] == "Late"
+
+def test_reconcile_rereads_only_ranges_that_differ(db, mirror, monkeypatch):
+    song_ids = add_songs(db, 6)
+    mirror.sync_catalog()
+
+    cursor = db.cursor()
+    cursor.execute("UPDATE Songs SET title = %s WHERE song_id = %s", ("Renamed", song_ids[1]))
+    cursor.execute("UPDATE Songs SET duration = %s WHERE song_id = %s", (180, song_ids[4]))
+    cursor.execute("DELETE FROM Songs WHERE song_id = %s", (song_ids[5],))
+    db.commit()
+    cursor.close()
+
+    compared = []
+    row_key = mirror._row_key
+    monkeypatch.setattr(mirror, "_row_key", lambda row: compared.append(row[0]) or row_key(row))
+    monkeypatch.setattr(mirror, "SYNC_LOOKBACK_IDS", 0)
+    monkeypatch.setattr(mirror, "RECONCILE_CHUNK_SIZE", 2)
+    monkeypatch.setattr(mirror, "CATALOG_MIRROR_RECONCILE_INTERVAL", 0)
+    mirror.sync_catalog()
+
+    titles = _titles(mirror)
+    assert sorted(titles) == song_ids[:5]
+    assert titles[song_ids[1]] == "Renamed"
+    assert mirror.query_mirror("SELECT duration FROM Songs WHERE song_id = %s", (song_ids[4],)) == [{"duration": 180}]
+    # The middle range matched and was never read row by row
+    assert set(compared).isdisjoint(song_ids[2:4])
@@ -0,0 +1,76 @@
+import pytest
+from utils import change_events
+from utils.change_events import ChangeListener, publish
+
+@pytest.fixture
+def invalidated(monkeypatch):
+    prefixes = []
+    monkeypatch.setattr(change_events, "invalidate", prefixes.append)
+    return prefixes
+
+def _publish(connection, event_type, entity_id=None, user_id=None, event_id=None):
+    if event_id is None:
+        publish(connection, event_type, entity_id, user_id)
+    else:
+        cursor = connection.cursor()
+        cursor.execute("INSERT INTO Change_Events (event_id, event_type, entity_id, user_id) VALUES (%s, %s, %s, %s)",
+                       (event_id, event_type, entity_id, user_id))
+        cursor.close()
+    connection.commit()
+
+def _ids(events):
+    return [event["event_id"] for event in events]
+
+def test_event_committed_under_a_lower_id_is_delivered_once(db, invalidated):
+    _publish(db, "song.played", 1)
+    listener = ChangeListener()
+    listener.poll()  # Starts after the newest event
+
+    # event_id 2 is taken by a transaction that commits after 3
+    _publish(db, "song.played", 3, event_id=3)
+    assert _ids(listener.poll()) == [3]
+    _publish(db, "song.played", 2, event_id=2)
+    assert _ids(listener.poll()) == [2]
+    assert listener.poll() == []
+
+def test_gaps_expire(db, invalidated, monkeypatch):
+    monkeypatch.setattr(change_events, "CHANGE_GAP_SECONDS", 0)
+    listener = ChangeListener()
+    listener.poll()
+
+    _publish(db, "song.played", 2, event_id=2)
+    assert _ids(listener.poll()) == [2]
+    assert listener.poll() == []
+    _publish(db, "song.played", 1, event_id=1)
+    assert listener.poll() == []
+
+def test_events_invalidate_cached_entries(db, invalidated):
+    listener = ChangeListener()
+    listener.poll()
+    _publish(db, "song.uploaded", 1)
+    _publish(db, "artist.created", 1)
+    _publish(db, "song.played", 1)
+    listener.poll()
+    assert sorted(invalidated) == ["catalog:artists", "songs:"]
+
+    quiet = ChangeListener(invalidate_caches=False)
+    quiet.poll()
+    _publish(db, "song.uploaded", 2)
+    quiet.poll()
+    assert sorted(invalidated) == ["catalog:artists", "songs:"]
+
+def test_subscribers_get_their_users_events(db, invalidated):
+    listener = ChangeListener()
+    listener.poll()
+    received = []
+    listener.subscribe(["song.played"], received.append, user_id=5)
+    _publish(db, "song.played", 1, 5)
+    _publish(db, "song.played", 2, 6)
+    _publish(db, "song.played", 3)
+    _publish(db, "favorite.added", 4, 5)
+
+    listener.poll()
+    listener.dispatch()
+    assert [[event["entity_id"] for event in batch] for batch in received] == [[1, 3]]
+    listener.dispatch()
+    assert len(received) == 1
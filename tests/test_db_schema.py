@@ -0,0 +1,20 @@
+from conftest import add_songs
+from utils.db_schema import create_tables
+
+def test_duplicate_artists_are_merged_before_the_unique_index(db):
+    cursor = db.cursor()
+    cursor.execute("DROP INDEX idx_artists_name")
+    first_song, = add_songs(db, 1, artist="The Band")
+    second_song, = add_songs(db, 1, artist="the band")
+    add_songs(db, 1, artist="Other")
+
+    create_tables(cursor, "sqlite", log=lambda message: None)
+    db.commit()
+
+    cursor.execute("SELECT name FROM Artists ORDER BY artist_id")
+    assert cursor.fetchall() == [("The Band",), ("Other",)]
+    cursor.execute("SELECT COUNT(DISTINCT artist_id) FROM Songs WHERE song_id IN (%s, %s)", (first_song, second_song))
+    assert cursor.fetchone()[0] == 1
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name = 'idx_artists_name'")
+    assert cursor.fetchone() is not None
+    cursor.close()
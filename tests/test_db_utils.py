@@ -0,0 +1,22 @@
+import mysql.connector
+from utils import db_utils
+
+class FakeConnection:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+def test_replica_connection_is_closed_when_the_lag_check_fails(monkeypatch):
+    connection = FakeConnection()
+
+    def lag(connection):
+        raise mysql.connector.Error("lost connection")
+
+    monkeypatch.setattr(db_utils, "DB_REPLICAS", [{"host": "replica"}])
+    monkeypatch.setattr(db_utils, "_replica_state", {})
+    monkeypatch.setattr(db_utils, "_connect_mysql", lambda name, settings: connection)
+    monkeypatch.setattr(db_utils, "_replication_lag", lag)
+
+    assert db_utils._connect_replica() is None
+    assert connection.closed
@@ -0,0 +1,34 @@
+import csv
+import pytest
+from conftest import add_songs, add_user
+from utils import export
+
+def test_csv_export(db, tmp_path):
+    song_ids = add_songs(db, 3)
+    user_id = add_user(db)
+    cursor = db.cursor()
+    cursor.execute("INSERT INTO Listening_History (user_id, song_id) VALUES (%s, %s)", (user_id, song_ids[0]))
+    db.commit()
+    cursor.close()
+
+    progress = []
+    path = str(tmp_path / "out" / "songs.csv")
+    result = export.export_dataset("songs", path, batch_size=2, on_progress=progress.append)
+    assert [p["rows"] for p in progress] == [2, 3]
+    assert result["rows"] == 3
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == [column for column, _ in export.DATASETS["songs"][1]]
+    assert [row[1] for row in rows[1:]] == ["Song 0", "Song 1", "Song 2"]
+
+    assert export.export_dataset("history", str(tmp_path / "history.csv"))["rows"] == 1
+    assert not (tmp_path / "history.csv.part").exists()
+
+def test_parquet_export(db, tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    add_songs(db, 2)
+    path = str(tmp_path / "songs.parquet")
+    assert export.export_dataset("songs", path, "parquet")["rows"] == 2
+    table = parquet.read_table(path)
+    assert table.column("title").to_pylist() == ["Song 0", "Song 1"]
+    assert table.schema.field("song_id").type == "int64"
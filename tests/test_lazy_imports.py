@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+from utils.audio_utils import LazyMixer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_audio_utils_defers_pygame_and_mutagen():
+    script = "import sys, utils.audio_utils; print(sorted({'pygame', 'mutagen', 'numpy'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+def test_mixer_opens_on_first_use(monkeypatch):
+    opened = []
+
+    class StubPygameMixer:
+        def init(self):
+            opened.append(True)
+
+        def get_busy(self):
+            return False
+
+    import pygame
+    monkeypatch.setattr(pygame, "mixer", StubPygameMixer())
+    mixer = LazyMixer()
+    assert not mixer.started and opened == []
+    assert mixer.get_busy() is False
+    assert mixer.get_busy() is False
+    assert mixer.started and opened == [True]
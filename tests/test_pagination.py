@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from conftest import add_songs
+from utils import pagination
+from utils.pagination import songs_pager
+
+@pytest.fixture(autouse=True)
+def prefetcher(monkeypatch):
+    # Wait for prefetches so none reads the database while the next test recreates it
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="page-prefetch")
+    monkeypatch.setattr(pagination, "_prefetcher", executor)
+    yield
+    executor.shutdown(wait=True)
+
+def _set_songs(connection, values):
+    """Set (title, upload_date) of new songs; returns their IDs"""
+    song_ids = add_songs(connection, len(values))
+    cursor = connection.cursor()
+    for song_id, (title, uploaded) in zip(song_ids, values):
+        cursor.execute("UPDATE Songs SET title = %s, upload_date = %s WHERE song_id = %s", (title, uploaded, song_id))
+    connection.commit()
+    cursor.close()
+    return song_ids
+
+def _ids(rows):
+    return [row["song_id"] for row in rows]
+
+def test_equal_sort_keys_are_paged_by_id_newest_first(db):
+    song_ids = _set_songs(db, [("Song", "2024-01-01 00:00:00")] * 5 + [("Song", "2024-02-01 00:00:00")])
+    pager = songs_pager("Newest", page_size=2)
+
+    pages = [_ids(pager.first_page())]
+    while pager.has_next:
+        pages.append(_ids(pager.next_page()))
+    expected = [song_ids[5]] + song_ids[4::-1]
+    assert pages == [expected[0:2], expected[2:4], expected[4:6]]
+
+def test_previous_page_after_next_page(db):
+    _set_songs(db, [(f"Song {i}", "2024-01-01 00:00:00") for i in range(5)])
+    pager = songs_pager("Title", page_size=2)
+
+    first = _ids(pager.first_page())
+    second = _ids(pager.next_page())
+    assert pager.page_number == 2 and second != first
+    assert _ids(pager.previous_page()) == first
+    assert pager.page_number == 1
+    assert _ids(pager.next_page()) == second
+
+def test_prefix_wildcards_match_literally(db):
+    percent, _, underscore, _, bang = _set_songs(db, [
+        ("50% off", "2024-01-01"), ("500 miles", "2024-01-01"),
+        ("a_b", "2024-01-01"), ("axb", "2024-01-01"), ("Hey!", "2024-01-01"),
+    ])
+    assert _ids(songs_pager("Title", "50%").first_page()) == [percent]
+    assert _ids(songs_pager("Title", "a_").first_page()) == [underscore]
+    assert _ids(songs_pager("Title", "Hey!").first_page()) == [bang]
@@ -0,0 +1,128 @@
+import sqlite3
+import pytest
+from conftest import add_songs, add_user
+import playback_daemon
+from utils import audio_utils, db_utils
+from utils.playback import LocalPlayer, PlaybackError
+
+class StubMusic:
+    """pygame.mixer.music stand-in: "plays" until finish() is called"""
+
+    def __init__(self):
+        self.busy = False
+        self.fail_play = False
+
+    def load(self, source, file_type=None):
+        pass
+
+    def play(self, start=0):
+        if self.fail_play:
+            raise RuntimeError("cannot decode")
+        self.busy = True
+
+    def pause(self):
+        pass
+
+    def unpause(self):
+        pass
+
+    def stop(self):
+        self.busy = False
+
+    def get_busy(self):
+        return self.busy
+
+    def get_pos(self):
+        return 0
+
+    def finish(self):
+        self.busy = False
+
+class StubMixer:
+    def __init__(self):
+        self.music = StubMusic()
+
+@pytest.fixture
+def player(db, monkeypatch):
+    monkeypatch.setattr(audio_utils, "recent_audio", audio_utils.RecentAudio())
+    player = LocalPlayer(StubMixer(), quiet=True)
+    monkeypatch.setattr(playback_daemon, "player", player)
+    return player
+
+def test_play_records_the_listen(db, player):
+    user_id = add_user(db)
+    song_id, = add_songs(db, 1)
+
+    status = player.play(song_id, user_id)
+    assert (status["id"], status["playing"], status["queue"]) == (song_id, True, [])
+    cursor = db.cursor()
+    cursor.execute("SELECT song_id FROM Listening_History WHERE user_id = %s", (user_id,))
+    assert cursor.fetchall() == [(song_id,)]
+    cursor.close()
+
+def test_queue_advances_when_a_song_ends(db, player):
+    first, second, third = add_songs(db, 3)
+    player.play(first)
+    player.enqueue([second, third])
+
+    player.tick()
+    assert player.status()["id"] == first
+
+    player.mixer.music.finish()
+    player.tick()
+    assert (player.status()["id"], player.status()["queue"]) == (second, [third])
+
+    assert player.next()["id"] == third
+    status = player.next()
+    assert (status["id"], status["playing"]) == (None, False)
+
+def test_last_song_ending_leaves_it_stopped(db, player):
+    song_id, = add_songs(db, 1)
+    player.play(song_id)
+    player.mixer.music.finish()
+    player.tick()
+    assert (player.status()["id"], player.status()["playing"]) == (song_id, False)
+
+def test_next_skips_missing_songs(db, player):
+    song_id, = add_songs(db, 1)
+    player.enqueue([999, song_id])
+    assert player.next()["id"] == song_id
+
+def test_seek_errors(db, player):
+    with pytest.raises(PlaybackError, match="No song is playing"):
+        player.seek(10)
+
+    song_id, = add_songs(db, 1)
+    player.play(song_id)
+    assert player.seek(10)["start"] == 10
+    player.mixer.music.fail_play = True
+    with pytest.raises(PlaybackError, match="Could not seek"):
+        player.seek(20)
+
+def test_handle_command(db, player):
+    song_id, = add_songs(db, 1)
+
+    assert playback_daemon.handle_command({"command": "rewind"}) == {"ok": False, "error": "Unknown command: rewind"}
+    reply = playback_daemon.handle_command({"command": "play"})
+    assert not reply["ok"] and reply["error"].startswith("Bad arguments for play")
+    assert playback_daemon.handle_command({"command": "play", "song_id": 999}) == \
+        {"ok": False, "error": "Song 999 not found"}
+    assert playback_daemon.handle_command({"command": "seek", "seconds": 5}) == \
+        {"ok": False, "error": "No song is playing"}
+
+    reply = playback_daemon.handle_command({"command": "play", "song_id": str(song_id)})
+    assert reply["ok"] and reply["status"]["id"] == song_id
+    reply = playback_daemon.handle_command({"command": "enqueue", "song_ids": [song_id]})
+    assert reply["status"]["queue"] == [song_id]
+    assert playback_daemon.handle_command({"command": "toggle"})["status"]["paused"]
+
+def test_database_errors_are_not_shown_in_a_dialog(db, player, monkeypatch):
+    def unavailable(path):
+        raise sqlite3.OperationalError("unable to open database file")
+
+    dialogs = []
+    monkeypatch.setattr(db_utils, "connect_sqlite", unavailable)
+    monkeypatch.setattr(db_utils.messagebox, "showerror", lambda *args: dialogs.append(args))
+    reply = playback_daemon.handle_command({"command": "play", "song_id": 1, "user_id": 1})
+    assert not reply["ok"]
+    assert dialogs == []
@@ -0,0 +1,77 @@
+import json
+import pytest
+from utils import query_metrics
+from utils.sqlite_backend import connect_sqlite
+
+@pytest.fixture
+def metrics(monkeypatch):
+    monkeypatch.setattr(query_metrics, "SLOW_QUERY_MS", float("inf"))
+    query_metrics.reset_metrics()
+    yield query_metrics
+    query_metrics.reset_metrics()
+
+def test_normalize_query():
+    normalize = query_metrics.normalize_query
+    assert normalize("SELECT * FROM Songs WHERE title = 'It''s' AND song_id = 42") == \
+        "SELECT * FROM Songs WHERE title = ?? AND song_id = ?"
+    assert normalize(b"SELECT *\n  FROM Songs WHERE song_id IN (%s, %s,%s)") == \
+        "SELECT * FROM Songs WHERE song_id IN (...)"
+    assert normalize("SELECT name FROM Users WHERE email = \"a@b\" LIMIT 10") == \
+        normalize("SELECT name FROM Users  WHERE email = ? LIMIT ?")
+    # Digits inside identifiers are kept
+    assert normalize("SELECT col1 FROM t2") == "SELECT col1 FROM t2"
+
+def test_latency_buckets(metrics):
+    for elapsed_ms in (0.5, 1, 1.5, 5000, 9999):
+        key = metrics.record_execute("SELECT 1", (), elapsed_ms)
+    entry = metrics.get_metrics()[key]
+    assert entry["calls"] == 5
+    assert entry["max_ms"] == 9999
+    buckets = dict(zip(metrics.LATENCY_BUCKETS_MS + ["+Inf"], entry["buckets"]))
+    assert (buckets[1], buckets[2], buckets[5000], buckets["+Inf"]) == (2, 1, 1, 1)
+    assert sum(entry["buckets"]) == 5
+
+def _run_queries(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT %s, %s", (1, "abc"))
+    cursor.fetchall()
+    cursor.close()
+
+def test_rows_bytes_and_caller(metrics, tmp_path, monkeypatch):
+    resolved = []
+    caller_name = metrics._caller_name
+    monkeypatch.setattr(metrics, "_caller_names", {})
+    monkeypatch.setattr(metrics, "_caller_name", lambda code: resolved.append(code.co_name) or caller_name(code))
+    connection = metrics.instrument(connect_sqlite(str(tmp_path / "metrics.db")))
+    for _ in range(3):
+        _run_queries(connection)
+    connection.close()
+
+    entry = metrics.get_metrics()[metrics.fingerprint("SELECT ?, ?")]
+    assert (entry["calls"], entry["rows"], entry["bytes_out"], entry["bytes_in"]) == (3, 3, 3 * 11, 3 * 11)
+    assert entry["callers"] == {"tests/test_query_metrics.py:_run_queries": 3}
+    # Each function's label is resolved once
+    assert resolved.count("_run_queries") == 1
+
+def test_dump_merges_processes_and_writes_prometheus(metrics, tmp_path):
+    path, prom_path = str(tmp_path / "metrics.json"), str(tmp_path / "metrics.prom")
+    key = metrics.record_execute("SELECT \"x\"", None, 3)
+    assert metrics.dump_metrics(path, prom_path)
+    assert metrics.get_metrics() == {}
+
+    # A second process dumping the same statement adds to the counters
+    metrics.record_execute("SELECT 'y'", None, 30)
+    assert metrics.dump_metrics(path, prom_path)
+    assert not metrics.dump_metrics(path, prom_path)
+
+    with open(path, encoding="utf-8") as f:
+        entry = json.load(f)[key]
+    assert (entry["calls"], entry["total_ms"], entry["max_ms"]) == (2, 33, 30)
+
+    with open(prom_path, encoding="utf-8") as f:
+        prom = f.read().splitlines()
+    assert f'music_db_query_info{{fingerprint="{key}",statement="SELECT ?"}} 1' in prom
+    assert f'music_db_query_duration_seconds_bucket{{fingerprint="{key}",le="0.005"}} 1' in prom
+    assert f'music_db_query_duration_seconds_bucket{{fingerprint="{key}",le="+Inf"}} 2' in prom
+    assert f'music_db_query_duration_seconds_sum{{fingerprint="{key}"}} 0.033000' in prom
+    assert f'music_db_query_duration_seconds_count{{fingerprint="{key}"}} 2' in prom
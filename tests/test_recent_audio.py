@@ -0,0 +1,48 @@
+import os
+import config
+from conftest import add_songs
+from utils import audio_utils
+
+class StubMusic:
+    def load(self, source, file_type):
+        self.loaded = (source.read(), file_type)
+
+    def play(self, start=0):
+        pass
+
+class StubMixer:
+    def __init__(self):
+        self.music = StubMusic()
+
+def test_songs_play_from_memory(db, monkeypatch):
+    song_id, = add_songs(db, 1)
+    cursor = db.cursor()
+    cursor.execute("UPDATE Songs SET file_data = %s WHERE song_id = %s", (b"audio", song_id))
+    db.commit()
+    cursor.close()
+
+    monkeypatch.setattr(audio_utils, "recent_audio", audio_utils.RecentAudio())
+    fetched = []
+    get_song_data = audio_utils.get_song_data
+    monkeypatch.setattr(audio_utils, "get_song_data", lambda *args: fetched.append(args) or get_song_data(*args))
+    mixer = StubMixer()
+
+    for _ in range(2):
+        song = audio_utils.start_song(song_id, mixer)
+        assert (song["id"], song["file_size"]) == (song_id, 5)
+        assert mixer.music.loaded == (b"audio", "mp3")
+    # The replay was decoded from the bytes already in memory
+    assert len(fetched) == 1
+    assert not os.path.exists(os.path.join(config.TEMP_DIR, f"song_{song_id}.mp3"))
+    assert audio_utils.start_song(999, mixer) is None
+
+def test_recent_audio_keeps_the_newest_song():
+    recent = audio_utils.RecentAudio(max_bytes=10)
+    recent.put(1, b"x" * 6)
+    recent.put(2, b"y" * 4)
+    assert recent.get(1) is not None
+    recent.put(3, b"z" * 4)
+    # 2 was used least recently
+    assert (recent.get(1), recent.get(2), recent.get(3)) == (b"x" * 6, None, b"z" * 4)
+    recent.put(4, b"w" * 20)
+    assert (recent.get(1), recent.get(3), recent.get(4)) == (None, None, b"w" * 20)
@@ -0,0 +1,36 @@
+from conftest import add_songs, add_user
+from utils import reports
+
+def _play(connection, user_id, song_id, history_id=None):
+    cursor = connection.cursor()
+    if history_id is None:
+        cursor.execute("INSERT INTO Listening_History (user_id, song_id) VALUES (%s, %s)", (user_id, song_id))
+    else:
+        cursor.execute("INSERT INTO Listening_History (history_id, user_id, song_id) VALUES (%s, %s, %s)",
+                       (history_id, user_id, song_id))
+    connection.commit()
+    cursor.close()
+
+def _rollup_plays(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT COALESCE(SUM(plays), 0) FROM Report_Hourly_Plays")
+    total = cursor.fetchone()[0]
+    cursor.close()
+    return total
+
+def test_play_committed_under_a_lower_id_is_rolled_up_once(db):
+    user_id = add_user(db)
+    song_id = add_songs(db, 1)[0]
+    _play(db, user_id, song_id, history_id=1)
+    # history_id 2 is taken by a transaction that commits after 3
+    _play(db, user_id, song_id, history_id=3)
+    assert reports.refresh_rollups()["plays"] == 2
+
+    _play(db, user_id, song_id, history_id=2)
+    assert reports.refresh_rollups()["plays"] == 1
+    assert reports.refresh_rollups()["plays"] == 0
+    assert _rollup_plays(db) == 3
+
+    report = reports.build_report(7)
+    assert report["total_plays"] == 3
+    assert report["top_songs"][0][2] == 3
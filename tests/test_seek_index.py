@@ -0,0 +1,33 @@
+from collections import OrderedDict
+import pytest
+from conftest import add_songs
+from utils import seek_index
+from utils.seek_index import SeekIndex, get_seek_index
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(seek_index, "_loaded", OrderedDict())
+
+def _insert_index(connection, song_id):
+    """Store an index the way another process would, leaving this one's cache alone"""
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO Song_Seek_Index (song_id, step_ms, offsets) VALUES (%s, %s, %s)",
+                   (song_id, 500, SeekIndex(500, [100, 200, 300]).to_bytes()))
+    connection.commit()
+    cursor.close()
+
+def test_index_saved_after_a_miss_is_found(db):
+    song_id, = add_songs(db, 1)
+    assert get_seek_index(song_id) is None
+
+    _insert_index(db, song_id)
+    assert list(get_seek_index(song_id).offsets) == [100, 200, 300]
+
+def test_loaded_indexes_are_capped(db, monkeypatch):
+    monkeypatch.setattr(seek_index, "MAX_LOADED_INDEXES", 2)
+    song_ids = add_songs(db, 3)
+    for song_id in song_ids:
+        _insert_index(db, song_id)
+        get_seek_index(song_id)
+
+    assert list(seek_index._loaded) == song_ids[1:]
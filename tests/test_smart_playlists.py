@@ -0,0 +1,39 @@
+import datetime
+from conftest import add_songs, add_user
+from utils.history_retention import get_history_watermark
+from utils.smart_playlists import (create_smart_playlist, get_smart_playlist_songs, refresh_playlist,
+                                   _load_playlist)
+
+def _refresh(connection, playlist_id, max_song_id):
+    cursor = connection.cursor(dictionary=True)
+    cursor.execute("SELECT * FROM Smart_Playlists WHERE smart_playlist_id = %s", (playlist_id,))
+    playlist = _load_playlist(cursor.fetchone())
+    cursor.close()
+    writer = connection.cursor()
+    kind = refresh_playlist(writer, playlist, get_history_watermark(connection), max_song_id,
+                            today=datetime.date.today())
+    connection.commit()
+    writer.close()
+    return kind
+
+def test_song_uploaded_during_refresh_is_added_once(db):
+    user_id = add_user(db)
+    song_ids = add_songs(db, 3)
+    playlist_id = create_smart_playlist(user_id, "Newest", {"order": "newest"})
+
+    # MAX(song_id) was read before the last song was committed
+    assert _refresh(db, playlist_id, song_ids[-2]) == "full"
+    assert _refresh(db, playlist_id, song_ids[-1]) == "incremental"
+
+    songs = get_smart_playlist_songs(playlist_id)
+    assert [song["song_id"] for song in songs] == song_ids[::-1]
+
+def test_incremental_refresh_matches_full_refresh(db):
+    user_id = add_user(db)
+    playlist_id = create_smart_playlist(user_id, "Newest", {"order": "newest", "limit": 5})
+    first = add_songs(db, 3)
+    assert [song["song_id"] for song in get_smart_playlist_songs(playlist_id)] == first[::-1]
+
+    second = add_songs(db, 4, artist="Other")
+    expected = (first + second)[::-1][:5]
+    assert [song["song_id"] for song in get_smart_playlist_songs(playlist_id)] == expected
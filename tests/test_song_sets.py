@@ -0,0 +1,75 @@
+import multiprocessing
+import pytest
+from conftest import add_songs, add_user
+from utils import song_sets
+from utils.song_sets import SongIdSet, UserSongSets
+
+@pytest.fixture(autouse=True)
+def sets_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(song_sets, "SONG_SETS_DIR", str(tmp_path))
+    monkeypatch.setattr(song_sets, "_user_sets", {})
+
+def test_song_id_set():
+    ids = SongIdSet([5, 1, 3, 3])
+    assert list(ids) == [1, 3, 5] and len(ids) == 3
+    ids.add(4)
+    ids.add(4)
+    ids.discard(1)
+    ids.discard(2)
+    ids.update([9, 3, 7])
+    assert list(ids) == [3, 4, 5, 7, 9]
+    assert 7 in ids and 6 not in ids and 10 not in ids
+
+def test_mark_songs(db):
+    user_id = add_user(db)
+    favorite, played, other = add_songs(db, 3)
+    sets = song_sets.get_song_sets(user_id)
+    assert sets.set_favorite(favorite)
+    song_sets.record_play(user_id, played)
+
+    marked = sets.mark_songs([{"song_id": song_id} for song_id in (favorite, played, other)])
+    assert [(song["favorite"], song["played"]) for song in marked] == [(True, False), (False, True), (False, False)]
+    assert sets.not_played([favorite, played, other]) == [favorite, other]
+
+def test_load_catches_up_with_changes_made_elsewhere(db):
+    user_id = add_user(db)
+    first, second = add_songs(db, 2)
+    UserSongSets(user_id).load()
+
+    # Written by another machine, so the file was not updated
+    cursor = db.cursor()
+    cursor.execute("INSERT INTO Listening_History (user_id, song_id) VALUES (%s, %s)", (user_id, first))
+    cursor.execute("INSERT INTO User_Favorites (user_id, song_id) VALUES (%s, %s)", (user_id, second))
+    db.commit()
+    cursor.close()
+
+    sets = UserSongSets(user_id).load()
+    assert list(sets.played) == [first]
+    assert list(sets.favorites) == [second]
+
+def _toggle_favorites(user_id, song_ids):
+    sets = UserSongSets(user_id)
+    for song_id in song_ids:
+        sets.set_favorite(song_id)
+
+def _record_plays(user_id, song_ids):
+    for song_id in song_ids:
+        UserSongSets(user_id).add_play(song_id)
+
+def test_concurrent_processes_keep_each_others_updates(db):
+    user_id = add_user(db)
+    song_ids = add_songs(db, 40)
+    UserSongSets(user_id).load()
+
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_toggle_favorites, args=(user_id, song_ids[:20])),
+               context.Process(target=_record_plays, args=(user_id, song_ids[20:]))]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    sets = UserSongSets(user_id)
+    sets._sync_from_disk()
+    assert list(sets.favorites) == song_ids[:20]
+    assert list(sets.played) == song_ids[20:]
@@ -0,0 +1,88 @@
+import hashlib
+import os
+import threading
+from conftest import add_songs
+from utils.audio_utils import read_song_chunks_from_db
+from utils.song_upload import upload_song_chunked, read_uploaded_chunks, purge_abandoned_uploads
+
+CHUNK = 1000
+DATA = os.urandom(CHUNK * 9 + 123)
+
+def _write_song(tmp_path):
+    path = tmp_path / "song.ogg"
+    path.write_bytes(DATA)
+    return str(path)
+
+def _count(connection, query, params=()):
+    cursor = connection.cursor()
+    cursor.execute(query, params)
+    count = cursor.fetchone()[0]
+    cursor.close()
+    return count
+
+def test_resume_after_cancel_sends_only_the_missing_chunks(db, tmp_path):
+    path = _write_song(tmp_path)
+    cancel = threading.Event()
+    sent = []
+
+    def cancel_after_three(progress):
+        sent.append(progress)
+        if len(sent) == 3:
+            cancel.set()
+
+    result = upload_song_chunked(path, "Song", None, chunk_size=CHUNK, on_progress=cancel_after_three,
+                                 cancel_event=cancel)
+    assert result["status"] == "cancelled"
+    assert _count(db, "SELECT COUNT(*) FROM Upload_Chunks") == 3
+
+    sent.clear()
+    result = upload_song_chunked(path, "Song", None, chunk_size=CHUNK, on_progress=sent.append)
+    assert result["status"] == "uploaded"
+    assert len(sent) == 7
+    assert sent[0]["resumed_from"] == 3 * CHUNK and sent[-1]["bytes_done"] == len(DATA)
+    assert result["sha256"] == hashlib.sha256(DATA).hexdigest()
+    assert b"".join(read_uploaded_chunks(db, result["song_id"])) == DATA
+
+def test_reads_start_at_an_offset(db, tmp_path):
+    song_id = upload_song_chunked(_write_song(tmp_path), "Song", None, chunk_size=CHUNK)["song_id"]
+    assert b"".join(read_uploaded_chunks(db, song_id, 2500)) == DATA[2500:]
+    assert b"".join(read_song_chunks_from_db(song_id, 2500, chunk_size=700)) == DATA[2500:]
+
+    # Stored in one piece
+    stored, = add_songs(db, 1)
+    cursor = db.cursor()
+    cursor.execute("UPDATE Songs SET file_data = %s, file_size = %s WHERE song_id = %s", (DATA, len(DATA), stored))
+    db.commit()
+    cursor.close()
+    assert b"".join(read_song_chunks_from_db(stored, 2500, chunk_size=700)) == DATA[2500:]
+
+def _abandon(tmp_path, name):
+    """An upload cancelled before its first chunk; returns its upload_id"""
+    path = tmp_path / name
+    path.write_bytes(DATA)
+    cancel = threading.Event()
+    cancel.set()
+    return upload_song_chunked(str(path), "Song", None, chunk_size=CHUNK, cancel_event=cancel)["upload_id"]
+
+def _age(connection, upload_id):
+    cursor = connection.cursor()
+    cursor.execute("UPDATE Upload_Sessions SET started_at = '2000-01-01 00:00:00' WHERE upload_id = %s", (upload_id,))
+    connection.commit()
+    cursor.close()
+
+def test_abandoned_uploads_are_purged(db, tmp_path):
+    old, recent = _abandon(tmp_path, "old.ogg"), _abandon(tmp_path, "recent.ogg")
+    cursor = db.cursor()
+    cursor.execute("INSERT INTO Upload_Chunks (upload_id, chunk_index, data) VALUES (%s, 0, %s)", (old, b"x"))
+    db.commit()
+    cursor.close()
+    _age(db, old)
+
+    assert purge_abandoned_uploads(7) == 1
+    assert _count(db, "SELECT COUNT(*) FROM Upload_Chunks") == 0
+    assert _count(db, "SELECT upload_id FROM Upload_Sessions") == recent
+
+    # Also purged when a new upload starts
+    _age(db, recent)
+    _abandon(tmp_path, "new.ogg")
+    assert _count(db, "SELECT COUNT(*) FROM Upload_Sessions WHERE upload_id = %s", (recent,)) == 0
@@ -0,0 +1,28 @@
+import datetime
+from conftest import add_user
+from utils.db_schema import create_tables
+from utils.sqlite_backend import translate_query
+
+def test_translate_query():
+    assert translate_query("SELECT * FROM Songs WHERE title LIKE %s AND file_type = %s") == \
+        "SELECT * FROM Songs WHERE title LIKE ? AND file_type = ?"
+    assert translate_query("SELECT DATE_FORMAT(played_at, '%%Y') FROM Listening_History") == \
+        "SELECT DATE_FORMAT(played_at, '%Y') FROM Listening_History"
+
+def test_connection_behaves_like_mysql(db):
+    user_id = add_user(db)
+    cursor = db.cursor(dictionary=True)
+    cursor.execute("SELECT user_id, created_at, CONCAT(email, '!') AS shout, CONCAT(email, NULL) AS gone "
+                   "FROM Users WHERE user_id = %s", (user_id,))
+    row = cursor.fetchone()
+    assert row["user_id"] == user_id
+    assert isinstance(row["created_at"], datetime.datetime)
+    assert row["shout"].endswith("!") and row["gone"] is None
+    cursor.close()
+
+def test_create_tables_is_idempotent(db):
+    cursor = db.cursor()
+    create_tables(cursor, "sqlite", log=lambda message: None)
+    cursor.execute("SELECT COUNT(*) FROM Songs")
+    assert cursor.fetchone() == (0,)
+    cursor.close()
@@ -0,0 +1,120 @@
+import http.client
+import os
+import sqlite3
+import threading
+import time
+from http.server import ThreadingHTTPServer
+import pytest
+from conftest import add_songs
+import stream_server
+from utils import db_utils
+
+AUDIO = bytes(range(256)) * 40
+
+@pytest.fixture
+def server(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(stream_server, "STREAM_CACHE_DIR", str(tmp_path / "cache"))
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), stream_server.SongStreamHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture
+def song_id(db):
+    song_id, = add_songs(db, 1)
+    cursor = db.cursor()
+    cursor.execute("UPDATE Songs SET file_data = %s, file_size = %s WHERE song_id = %s",
+                   (AUDIO, len(AUDIO), song_id))
+    db.commit()
+    cursor.close()
+    return song_id
+
+def _request(server, path, method="GET", headers=None):
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+    try:
+        connection.request(method, path, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+def test_whole_song(server, song_id):
+    status, headers, body = _request(server, f"/songs/{song_id}")
+    assert status == 200
+    assert body == AUDIO
+    assert headers["Accept-Ranges"] == "bytes"
+
+    # Copied to the disk cache in the background, then sent from there
+    def cached_files():
+        cache_dir = stream_server.STREAM_CACHE_DIR
+        return [name for name in os.listdir(cache_dir) if not name.endswith(".part")] if os.path.isdir(cache_dir) else []
+
+    deadline = time.time() + 5
+    while not cached_files() and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(cached_files()) == 1
+    status, _, body = _request(server, f"/songs/{song_id}", headers={"Range": "bytes=100-"})
+    assert (status, body) == (206, AUDIO[100:])
+
+def test_byte_ranges(server, song_id):
+    status, headers, body = _request(server, f"/songs/{song_id}", headers={"Range": "bytes=10-19"})
+    assert (status, body) == (206, AUDIO[10:20])
+    assert headers["Content-Range"] == f"bytes 10-19/{len(AUDIO)}"
+
+    status, headers, body = _request(server, f"/songs/{song_id}", headers={"Range": "bytes=-5"})
+    assert (status, body) == (206, AUDIO[-5:])
+
+    status, headers, _ = _request(server, f"/songs/{song_id}", headers={"Range": f"bytes={len(AUDIO)}-"})
+    assert status == 416
+    assert headers["Content-Range"] == f"bytes */{len(AUDIO)}"
+
+def test_conditional_requests(server, song_id):
+    _, headers, _ = _request(server, f"/songs/{song_id}", method="HEAD")
+    etag = headers["ETag"]
+
+    status, _, body = _request(server, f"/songs/{song_id}", headers={"If-None-Match": etag})
+    assert (status, body) == (304, b"")
+
+    # A range for another version of the song gets the whole current one
+    status, _, body = _request(server, f"/songs/{song_id}", headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+    assert (status, body) == (200, AUDIO)
+    status, _, body = _request(server, f"/songs/{song_id}", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert (status, body) == (206, AUDIO[:10])
+
+def test_head_has_no_body(server, song_id):
+    status, headers, body = _request(server, f"/songs/{song_id}", method="HEAD")
+    assert (status, body) == (200, b"")
+    assert headers["Content-Length"] == str(len(AUDIO))
+
+def test_missing_song(server, db):
+    status, _, _ = _request(server, "/songs/999")
+    assert status == 404
+
+def test_database_down_is_a_503_without_a_dialog(server, song_id, monkeypatch):
+    def unavailable(path):
+        raise sqlite3.OperationalError("unable to open database file")
+
+    dialogs = []
+    monkeypatch.setattr(db_utils, "connect_sqlite", unavailable)
+    monkeypatch.setattr(db_utils.messagebox, "showerror", lambda *args: dialogs.append(args))
+    status, headers, _ = _request(server, f"/songs/{song_id}")
+    assert status == 503
+    assert "Retry-After" in headers
+    assert dialogs == []
+
+def test_cache_evicts_least_recently_sent_songs(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    monkeypatch.setattr(stream_server, "STREAM_CACHE_DIR", str(cache_dir))
+    now = time.time()
+    for name, accessed in (("old.mp3", now - 300), ("recent.mp3", now - 10), ("new.mp3", now)):
+        (cache_dir / name).write_bytes(b"x" * 100)
+        os.utime(cache_dir / name, (accessed, accessed))
+    (cache_dir / "crashed.mp3.1.part").write_bytes(b"x")
+    os.utime(cache_dir / "crashed.mp3.1.part", (now - 3600, now - 3600))
+    (cache_dir / "copying.mp3.2.part").write_bytes(b"x")
+
+    stream_server.prune_cache(max_bytes=200)
+    assert sorted(os.listdir(cache_dir)) == ["copying.mp3.2.part", "new.mp3", "recent.mp3"]
@@ -0,0 +1,44 @@
+import datetime
+import pytest
+from conftest import add_songs, add_user
+from utils import trending
+
+@pytest.fixture
+def state_file(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(trending, "TRENDING_STATE_FILE", str(tmp_path / "trending.pickle"))
+
+def _play(connection, user_id, song_id, history_id=None):
+    cursor = connection.cursor()
+    played_at = f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S}"
+    if history_id is None:
+        cursor.execute("INSERT INTO Listening_History (user_id, song_id, played_at) VALUES (%s, %s, %s)",
+                       (user_id, song_id, played_at))
+    else:
+        cursor.execute("INSERT INTO Listening_History (history_id, user_id, song_id, played_at) "
+                       "VALUES (%s, %s, %s, %s)", (history_id, user_id, song_id, played_at))
+    connection.commit()
+    cursor.close()
+
+def test_play_committed_under_a_lower_id_is_counted(db, state_file):
+    user_id = add_user(db)
+    first, second = add_songs(db, 2)
+    _play(db, user_id, first)
+    trending.refresh_trending()
+
+    # history_id 2 is taken by a transaction that commits after 3
+    _play(db, user_id, first, history_id=3)
+    assert trending.refresh_trending() == 1
+    _play(db, user_id, second, history_id=2)
+    assert trending.refresh_trending() == 1
+
+    assert {song_id for song_id, _ in trending.get_trending("24h", 10)} == {first, second}
+
+def test_get_trending_does_not_refresh_inline(db, state_file, monkeypatch):
+    started = []
+    monkeypatch.setattr(trending, "refresh_trending_async", lambda: started.append(True))
+    monkeypatch.setattr(trending, "refresh_trending", lambda: pytest.fail("refreshed on the caller's thread"))
+    assert trending.get_trending("24h", 10) == []
+    assert started
+
+def test_text_timestamps_are_converted():
+    assert trending._unix_time("2024-01-02 03:04:05") == datetime.datetime(2024, 1, 2, 3, 4, 5).timestamp()
@@ -0,0 +1,407 @@
+"""
+Similar-song index
+Approximate nearest-neighbour search over song vectors (audio features by
+default), so "sounds like" lookups stay fast on large catalogs.
+
+Random-projection LSH: each of ANN_TABLES tables hashes a vector to the
+signs of its projections on ANN_BITS random hyperplanes, so vectors with
+high cosine similarity tend to share buckets. A query collects the rows in
+its buckets, plus the buckets reached by flipping its ANN_PROBES least
+certain bits, and ranks only those rows exactly.
+
+The index lives in memory-mapped files under ANN_INDEX_DIR. Rows (song
+IDs, standardised vectors and bucket codes) are appended in place as songs
+are added; meta.json is replaced atomically after the rows are written, so
+readers never see a partial row. Each table is kept sorted by bucket code
+for binary search; rows added since the last sort form a short tail that
+is scanned directly until the next compaction re-sorts the tables.
+
+Usage: python -m utils.ann_index [--rebuild] [--recall QUERIES]
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+from config import ANN_INDEX_DIR, ANN_TABLES, ANN_BITS, ANN_PROBES
+
+try:
+    import fcntl
+except ImportError:  # Windows: index writes are not locked across processes
+    fcntl = None
+
+META_FILE = "meta.json"
+MIN_CAPACITY = 1024
+# Re-sort the tables once the unsorted tail reaches this many rows or 5% of the index
+COMPACT_MIN_TAIL = 2048
+# Below this many rows an exact scan is about as fast as probing, so it is used instead
+EXACT_SEARCH_MAX_ROWS = 20000
+_EPS = 1e-10
+
+# ------------------- Hashing -------------------
+def make_planes(seed, count, dim):
+    """The random hyperplanes (count, dim) for an index seed"""
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+def hash_vectors(vectors, planes, tables, bits):
+    """Bucket codes (n, tables) uint32 and the projections behind them"""
+    projections = (vectors @ planes.T).reshape(len(vectors), tables, bits)
+    weights = (1 << np.arange(bits)).astype(np.uint32)
+    codes = ((projections > 0) * weights).sum(axis=2, dtype=np.uint32)
+    return codes, projections
+
+def standardize(raw, mean, std):
+    """Scale raw vectors with the index statistics and normalise them to unit length"""
+    vectors = (np.asarray(raw, dtype=np.float32) - mean) / std
+    return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + _EPS)
+
+# ------------------- Files -------------------
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_meta(path, meta):
+    """Replace meta.json atomically, then remove files it no longer references"""
+    tmp_path = os.path.join(path, f"{META_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(path, META_FILE))
+
+    # Readers that still map an old file keep it alive until they reopen
+    referenced = set(meta["files"].values()) | {META_FILE, "lock"}
+    for name in os.listdir(path):
+        if name not in referenced and not name.endswith(".tmp"):
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError:
+                pass
+
+class _Lock:
+    """Exclusive lock on an index directory for writers"""
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self._file = open(os.path.join(path, "lock"), "w")
+
+    def __enter__(self):
+        if fcntl:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        self._file.close()
+
+def _row_shapes(meta):
+    capacity = meta["capacity"]
+    return {
+        "ids": (np.int64, (capacity,)),
+        "vectors": (np.float32, (capacity, meta["dim"])),
+        "codes": (np.uint32, (capacity, meta["tables"])),
+    }
+
+def _map_rows(path, meta, mode="r"):
+    """Memory-map the row files as {name: array}"""
+    return {
+        name: np.memmap(os.path.join(path, meta["files"][name]), dtype=dtype, mode=mode, shape=shape)
+        for name, (dtype, shape) in _row_shapes(meta).items()
+    }
+
+def _grow(path, meta, needed):
+    """Extend the row files in place to hold at least needed rows"""
+    capacity = meta["capacity"]
+    while capacity < needed:
+        capacity *= 2
+    meta["capacity"] = capacity
+    for name, (dtype, shape) in _row_shapes(meta).items():
+        with open(os.path.join(path, meta["files"][name]), "r+b") as f:
+            f.truncate(int(np.prod(shape)) * np.dtype(dtype).itemsize)
+
+def _compact(path, meta):
+    """Sort every table by bucket code and the rows by song ID, as new files"""
+    rows = _map_rows(path, meta)
+    count = meta["count"]
+    generation = meta["generation"] + 1
+
+    codes = np.asarray(rows["codes"][:count])
+    table_rows = np.argsort(codes, axis=0, kind="stable").T.astype(np.int32)
+    table_codes = np.take_along_axis(codes.T, table_rows, axis=1)
+    id_rows = np.argsort(rows["ids"][:count], kind="stable").astype(np.int32)
+    sorted_ids = np.asarray(rows["ids"][:count])[id_rows]
+
+    for name, array in (("table_codes", table_codes), ("table_rows", table_rows),
+                        ("id_rows", id_rows), ("sorted_ids", sorted_ids)):
+        file_name = f"{name}.{generation}.npy"
+        np.save(os.path.join(path, file_name), np.ascontiguousarray(array))
+        meta["files"][name] = file_name
+
+    meta["generation"] = generation
+    meta["sorted_count"] = count
+
+# ------------------- Writing -------------------
+def build_index(song_ids, raw_vectors, path=ANN_INDEX_DIR, tables=ANN_TABLES, bits=ANN_BITS, seed=None):
+    """Build a new index over all songs, replacing any existing one
+
+    Vectors are standardised with statistics of this set; songs added later
+    reuse them, so rebuild occasionally as the catalog changes.
+    """
+    raw = np.asarray(raw_vectors, dtype=np.float32)
+    count, dim = raw.shape
+    seed = int(seed if seed is not None else np.random.SeedSequence().entropy % 2**32)
+    mean, std = raw.mean(axis=0), raw.std(axis=0) + _EPS
+    vectors = standardize(raw, mean, std)
+
+    with _Lock(path):
+        previous = _read_meta(path)
+        generation = previous["generation"] + 1 if previous else 1
+        meta = {
+            "dim": dim, "tables": tables, "bits": bits, "seed": seed,
+            "count": count, "sorted_count": 0, "capacity": max(MIN_CAPACITY, count + count // 4),
+            "generation": generation, "mean": mean.tolist(), "std": std.tolist(),
+            "files": {name: f"{name}.{generation}.bin" for name in ("ids", "vectors", "codes")},
+        }
+        for name in meta["files"].values():
+            open(os.path.join(path, name), "wb").close()
+        _grow(path, meta, meta["capacity"])
+
+        rows = _map_rows(path, meta, mode="r+")
+        planes = make_planes(seed, tables * bits, dim)
+        rows["ids"][:count] = song_ids
+        rows["vectors"][:count] = vectors
+        for start in range(0, count, 65536):
+            end = min(start + 65536, count)
+            rows["codes"][start:end] = hash_vectors(vectors[start:end], planes, tables, bits)[0]
+        for array in rows.values():
+            array.flush()
+        del rows
+
+        _compact(path, meta)
+        _write_meta(path, meta)
+    return meta
+
+def add_songs(song_ids, raw_vectors, path=ANN_INDEX_DIR):
+    """Append songs to an existing index; returns False if there is no compatible index
+
+    A song that is added again keeps its newest vector.
+    """
+    raw = np.asarray(raw_vectors, dtype=np.float32).reshape(len(song_ids), -1)
+    with _Lock(path):
+        meta = _read_meta(path)
+        if meta is None or meta["dim"] != raw.shape[1]:
+            return False
+
+        start, end = meta["count"], meta["count"] + len(song_ids)
+        if end > meta["capacity"]:
+            _grow(path, meta, end)
+
+        vectors = standardize(raw, np.array(meta["mean"], dtype=np.float32), np.array(meta["std"], dtype=np.float32))
+        planes = make_planes(meta["seed"], meta["tables"] * meta["bits"], meta["dim"])
+        rows = _map_rows(path, meta, mode="r+")
+        rows["ids"][start:end] = song_ids
+        rows["vectors"][start:end] = vectors
+        rows["codes"][start:end] = hash_vectors(vectors, planes, meta["tables"], meta["bits"])[0]
+        for array in rows.values():
+            array.flush()
+        del rows
+
+        meta["count"] = end
+        if end - meta["sorted_count"] >= max(COMPACT_MIN_TAIL, meta["sorted_count"] // 20):
+            _compact(path, meta)
+        _write_meta(path, meta)
+    return True
+
+# ------------------- Reading -------------------
+class AnnIndex:
+    """Read-only view of an index as of one meta.json"""
+
+    def __init__(self, path, meta):
+        self.meta = meta
+        self.count = meta["count"]
+        self.sorted_count = meta["sorted_count"]
+        self.tables, self.bits = meta["tables"], meta["bits"]
+        self.planes = make_planes(meta["seed"], self.tables * self.bits, meta["dim"])
+
+        rows = _map_rows(path, meta)
+        self.ids, self.vectors, self.codes = rows["ids"], rows["vectors"], rows["codes"]
+        sorted_files = {name: np.load(os.path.join(path, meta["files"][name]), mmap_mode="r")
+                        for name in ("table_codes", "table_rows", "id_rows", "sorted_ids")}
+        self.table_codes = sorted_files["table_codes"]
+        self.table_rows = sorted_files["table_rows"]
+        self.id_rows = sorted_files["id_rows"]
+        self.sorted_ids = sorted_files["sorted_ids"]
+
+        # The unsorted tail is small; keep it in memory
+        self.tail_ids = np.array(self.ids[self.sorted_count:self.count])
+        self.tail_codes = np.array(self.codes[self.sorted_count:self.count])
+        self.tail_order = np.argsort(self.tail_ids, kind="stable")
+
+    def latest_rows(self, song_ids):
+        """Newest row of each song ID, or -1 for songs not in the index"""
+        song_ids = np.asarray(song_ids, dtype=np.int64)
+        rows = np.full(len(song_ids), -1, dtype=np.int64)
+        # Equal IDs stay in row order, so the last match is the newest; tail rows are newer still
+        for sorted_ids, order, base in ((self.sorted_ids, self.id_rows, 0),
+                                        (self.tail_ids[self.tail_order], self.tail_order, self.sorted_count)):
+            if not len(sorted_ids):
+                continue
+            positions = np.searchsorted(sorted_ids, song_ids, side="right") - 1
+            found = (positions >= 0) & (sorted_ids[np.maximum(positions, 0)] == song_ids)
+            rows[found] = base + order[positions[found]]
+        return rows
+
+    def _probe_codes(self, query):
+        """Bucket codes to visit in each table: the query's own plus single-bit flips"""
+        codes, projections = hash_vectors(query[None, :], self.planes, self.tables, self.bits)
+        codes, projections = codes[0], np.abs(projections[0])
+        probes = [codes]
+        if ANN_PROBES:
+            uncertain = np.argsort(projections, axis=1)[:, :ANN_PROBES]
+            for i in range(uncertain.shape[1]):
+                probes.append(codes ^ (np.uint32(1) << uncertain[:, i].astype(np.uint32)))
+        return np.stack(probes, axis=1)  # (tables, probes)
+
+    def candidates(self, query):
+        """Rows sharing a probed bucket with the query"""
+        probe_codes = self._probe_codes(query)
+        found = []
+        for table in range(self.tables):
+            table_codes = self.table_codes[table]
+            starts = np.searchsorted(table_codes, probe_codes[table], side="left")
+            ends = np.searchsorted(table_codes, probe_codes[table], side="right")
+            found.extend(self.table_rows[table][start:end] for start, end in zip(starts, ends) if end > start)
+        if len(self.tail_ids):
+            in_bucket = (self.tail_codes[:, :, None] == probe_codes[None, :, :]).any(axis=(1, 2))
+            found.append(np.nonzero(in_bucket)[0] + self.sorted_count)
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found).astype(np.int64))
+
+    def search(self, query, k=10, exclude=(), exact=False):
+        """Top-k songs by cosine similarity to a standardised query, as [(song_id, similarity)]
+
+        Falls back to an exact scan when the probed buckets hold fewer than
+        k songs.
+        """
+        exact = exact or self.count <= EXACT_SEARCH_MAX_ROWS
+        rows = np.arange(self.count) if exact else self.candidates(query)
+        if not exact and len(rows) < k:
+            return self.search(query, k, exclude, exact=True)
+        if not len(rows):
+            return []
+
+        ids = np.asarray(self.ids[rows])
+        # Drop superseded vectors of re-added songs, and excluded songs
+        keep = self.latest_rows(ids) == rows
+        if len(exclude):
+            keep &= ~np.isin(ids, list(exclude))
+        rows, ids = rows[keep], ids[keep]
+        if not len(rows):
+            return []
+
+        scores = np.asarray(self.vectors[rows]) @ query
+        k = min(k, len(rows))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(ids[i]), float(scores[i])) for i in best]
+
+    def songs_like(self, seed_ids, k=10, exclude=(), exact=False):
+        """Songs similar to the average of the seed songs' vectors"""
+        rows = self.latest_rows(list(seed_ids))
+        rows = rows[rows >= 0]
+        if not len(rows):
+            return []
+        query = np.asarray(self.vectors[np.sort(rows)]).mean(axis=0)
+        query /= np.linalg.norm(query) + _EPS
+        return self.search(query, k, set(seed_ids) | set(exclude), exact)
+
+_open = {}
+
+def load_index(path=ANN_INDEX_DIR):
+    """The index at path, reopened when it changes, or None if it has not been built"""
+    try:
+        mtime = os.stat(os.path.join(path, META_FILE)).st_mtime_ns
+    except OSError:
+        return None
+    cached_index = _open.get(path)
+    if cached_index and cached_index[0] == mtime:
+        return cached_index[1]
+
+    meta = _read_meta(path)
+    if meta is None:
+        return None
+    try:
+        index = AnnIndex(path, meta)
+    except (OSError, ValueError) as e:
+        print(f"Error opening similar-song index: {e}")
+        return None
+    _open[path] = (mtime, index)
+    return index
+
+def measure_recall(index, queries=200, k=10, seed=0):
+    """Recall@k of the index against exact search, with average timings"""
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(index.count, size=min(queries, index.count), replace=False)
+    hits = total = candidates = 0
+    ann_seconds = exact_seconds = 0.0
+
+    for row in sample:
+        query = np.asarray(index.vectors[row])
+        exclude = {int(index.ids[row])}
+        start = time.perf_counter()
+        approximate = index.search(query, k, exclude)
+        ann_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        exact = index.search(query, k, exclude, exact=True)
+        exact_seconds += time.perf_counter() - start
+
+        candidates += len(index.candidates(query))
+        hits += len({song_id for song_id, _ in approximate} & {song_id for song_id, _ in exact})
+        total += len(exact)
+
+    return {
+        "queries": len(sample),
+        "recall": hits / total if total else 0.0,
+        "ann_ms": ann_seconds * 1000 / len(sample),
+        "exact_ms": exact_seconds * 1000 / len(sample),
+        "candidates": candidates / len(sample),
+    }
+
+def format_recall(result, k=10):
+    """One-line summary of measure_recall"""
+    return (f"recall@{k} {result['recall']:.3f} over {result['queries']} queries • "
+            f"ANN {result['ann_ms']:.2f} ms ({result['candidates']:.0f} candidates) • "
+            f"exact {result['exact_ms']:.2f} ms")
+
+# ------------------- Audio Features -------------------
+def rebuild_feature_index(path=ANN_INDEX_DIR):
+    """Build the index from all stored audio feature vectors; returns the row count"""
+    from utils.audio_features import load_song_vectors
+
+    vectors = load_song_vectors()
+    if vectors is None:
+        return 0
+    song_ids, raw = vectors
+    build_index(song_ids, raw, path)
+    return len(song_ids)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or check the similar-song index")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild from the stored audio features")
+    parser.add_argument("--recall", type=int, metavar="QUERIES", help="measure recall against exact search")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        start = time.perf_counter()
+        count = rebuild_feature_index()
+        print(f"Indexed {count} songs in {time.perf_counter() - start:.1f}s")
+
+    index = load_index()
+    if index is None:
+        print("No similar-song index yet; run with --rebuild.")
+    else:
+        print(f"{index.count} songs, {index.tables} tables x {index.bits} bits, "
+              f"{index.count - index.sorted_count} unsorted")
+        if args.recall:
+            print(format_recall(measure_recall(index, args.recall)))
@@ -0,0 +1,446 @@
+"""
+Audio features
+Content-based feature vectors for "sounds like" recommendations, so new
+songs with no listening history can still be recommended.
+
+Songs are decoded (wave for WAV, pygame's decoder for everything else),
+reduced to a mono window of FEATURE_ANALYSIS_SECONDS from the middle of
+the song and analysed with NumPy FFTs: tempo, spectral centroid/rolloff,
+loudness, chroma and MFCC-like cepstral bands. Extraction runs in a
+process pool; vectors are stored in Song_Features and added to the
+similar-song index (utils.ann_index), which answers "sounds like" queries
+once it has been built.
+
+Usage: python -m utils.audio_features [--rebuild] [--workers N]
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import threading
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from functools import lru_cache
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from config import (FEATURE_SAMPLE_RATE, FEATURE_ANALYSIS_SECONDS, FEATURE_WORKERS,
+                    SONG_LIST_CACHE_TTL, CACHE_STALE_TTL)
+from utils.db_utils import connect_db, DB_ERRORS
+from utils.cache import cached, invalidate
+from utils.change_events import publish
+from utils.song_upload import read_uploaded_chunks
+from utils import ann_index
+
+# Bump when the vector layout changes so stored vectors are re-extracted
+FEATURE_VERSION = 1
+
+FRAME_SIZE = 2048
+HOP_SIZE = 512
+MEL_BANDS = 26
+CEPSTRAL_COEFFICIENTS = 13
+TEMPO_RANGE = (60, 200)
+_TEMPO_SCALE = 100.0
+_EPS = 1e-10
+
+PITCH_CLASSES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+FEATURE_NAMES = (
+    ["tempo", "pulse_clarity", "centroid_mean", "centroid_std", "rolloff_mean", "rolloff_std",
+     "loudness_mean", "loudness_std", "zero_crossing_rate"]
+    + [f"chroma_{name}" for name in PITCH_CLASSES]
+    + [f"cepstral_mean_{i}" for i in range(CEPSTRAL_COEFFICIENTS)]
+    + [f"cepstral_std_{i}" for i in range(CEPSTRAL_COEFFICIENTS)]
+)
+
+# pygame.error is a RuntimeError
+DECODE_ERRORS = (ValueError, RuntimeError, EOFError, wave.Error)
+
+# ------------------- Decoding -------------------
+def _decode_wav(data):
+    """Decode PCM WAV bytes to (float32 samples of shape (frames, channels), rate)"""
+    with wave.open(io.BytesIO(data)) as wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768
+    elif width == 3:
+        # Sign-extend 24-bit samples into the top of an int32
+        triplets = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = ((triplets[:, 0] << 8) | (triplets[:, 1] << 16) | (triplets[:, 2] << 24)).astype(np.float32) / 2**31
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2**31
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width}")
+    return samples.reshape(-1, channels), rate
+
+def _decode_pygame(data, file_type):
+    """Decode compressed audio with pygame's mixer (no audio device needed)"""
+    # Imported here so pages that only look up similar songs skip loading pygame
+    try:
+        import pygame.mixer
+        import pygame.sndarray
+    except ImportError:  # Only WAV can be decoded
+        raise RuntimeError(f"Decoding {file_type} needs pygame")
+    if not pygame.mixer.get_init():
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        pygame.mixer.init(frequency=FEATURE_SAMPLE_RATE, size=-16, channels=1)
+    rate = pygame.mixer.get_init()[0]
+
+    raw = pygame.sndarray.array(pygame.mixer.Sound(file=io.BytesIO(data)))
+    if raw.dtype.kind == "f":
+        samples = raw.astype(np.float32)
+    else:
+        samples = raw.astype(np.float32) / 2 ** (raw.dtype.itemsize * 8 - 1)
+        if raw.dtype.kind == "u":
+            samples -= 1.0
+    return samples.reshape(len(samples), -1), rate
+
+def decode_audio(data, file_type):
+    """Decode audio bytes to the analysis window: mono float32 samples and their rate"""
+    if file_type in ("wav", "wave"):
+        samples, rate = _decode_wav(data)
+    else:
+        samples, rate = _decode_pygame(data, file_type)
+
+    # Keep a window from the middle of the song, where intros and fades are least likely
+    window = int(FEATURE_ANALYSIS_SECONDS * rate)
+    start = max(0, (len(samples) - window) // 2)
+    samples = samples[start:start + window].mean(axis=1)
+
+    # Average blocks down towards the analysis rate (a crude low-pass)
+    factor = rate // FEATURE_SAMPLE_RATE
+    if factor > 1:
+        samples = samples[:len(samples) // factor * factor].reshape(-1, factor).mean(axis=1)
+        rate //= factor
+    return np.ascontiguousarray(samples, dtype=np.float32), rate
+
+# ------------------- Feature Extraction -------------------
+@lru_cache(maxsize=8)
+def _filterbanks(rate):
+    """Per-rate analysis matrices: bin frequencies, chroma map, mel filters, DCT"""
+    freqs = np.fft.rfftfreq(FRAME_SIZE, 1 / rate)
+
+    # Each bin from A0 up to 5 kHz contributes to its nearest pitch class
+    chroma = np.zeros((len(freqs), 12), dtype=np.float32)
+    tonal = (freqs >= 27.5) & (freqs <= 5000)
+    pitch = np.round(12 * np.log2(freqs[tonal] / 440.0)).astype(int) + 69
+    chroma[np.nonzero(tonal)[0], pitch % 12] = 1.0
+
+    # Triangular filters evenly spaced on the mel scale
+    mel_max = 2595 * np.log10(1 + (rate / 2) / 700)
+    edges = 700 * (10 ** (np.linspace(0, mel_max, MEL_BANDS + 2) / 2595) - 1)
+    mel = np.zeros((len(freqs), MEL_BANDS), dtype=np.float32)
+    for band in range(MEL_BANDS):
+        low, center, high = edges[band:band + 3]
+        rising = (freqs - low) / (center - low)
+        falling = (high - freqs) / (high - center)
+        mel[:, band] = np.clip(np.minimum(rising, falling), 0, None)
+
+    # DCT-II turns log band energies into cepstral coefficients
+    n = np.arange(MEL_BANDS)
+    dct = np.cos(np.pi / MEL_BANDS * (n[None, :] + 0.5) * np.arange(CEPSTRAL_COEFFICIENTS)[:, None])
+    return freqs, chroma, mel, dct.T.astype(np.float32)
+
+def _estimate_tempo(magnitudes, rate):
+    """Tempo in BPM and pulse clarity, from the autocorrelation of spectral flux"""
+    flux = np.maximum(np.diff(np.log1p(magnitudes), axis=0), 0).sum(axis=1)
+    flux -= flux.mean()
+    n = len(flux)
+    spectrum = np.fft.rfft(flux, 2 * n)
+    autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum))[:n]
+    if autocorrelation[0] <= 0:
+        return 0.0, 0.0
+
+    frame_rate = rate / HOP_SIZE
+    lags = np.arange(int(60 * frame_rate / TEMPO_RANGE[1]), int(60 * frame_rate / TEMPO_RANGE[0]) + 1)
+    lags = lags[(lags > 0) & (lags < n)]
+    if not len(lags):
+        return 0.0, 0.0
+    # Prefer tempos near 120 BPM to damp octave errors
+    bpm = 60 * frame_rate / lags
+    weighted = autocorrelation[lags] * np.exp(-0.5 * np.log2(bpm / 120) ** 2)
+    best = int(np.argmax(weighted))
+    return float(bpm[best]), float(max(autocorrelation[lags[best]], 0) / autocorrelation[0])
+
+def extract_features(samples, rate):
+    """Feature vector (float32, laid out as FEATURE_NAMES) for mono samples"""
+    if len(samples) < FRAME_SIZE * 4:
+        raise ValueError("Audio is too short to analyse")
+    freqs, chroma_map, mel, dct = _filterbanks(rate)
+
+    frames = sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE] * np.hanning(FRAME_SIZE).astype(np.float32)
+    magnitudes = np.abs(np.fft.rfft(frames, axis=1)).astype(np.float32)
+    power = magnitudes ** 2
+    nyquist = rate / 2
+
+    total = magnitudes.sum(axis=1) + _EPS
+    centroid = (magnitudes @ freqs) / total / nyquist
+    cumulative = np.cumsum(magnitudes, axis=1)
+    rolloff = freqs[np.argmax(cumulative >= 0.85 * cumulative[:, -1:], axis=1)] / nyquist
+    loudness = 10 * np.log10(np.mean(frames ** 2, axis=1) + _EPS)
+    zero_crossings = np.mean(np.signbit(samples[1:]) != np.signbit(samples[:-1]))
+    tempo, pulse_clarity = _estimate_tempo(magnitudes, rate)
+
+    chroma = power.sum(axis=0) @ chroma_map
+    chroma /= chroma.sum() + _EPS
+    cepstrum = np.log(power @ mel + _EPS) @ dct
+
+    return np.concatenate([
+        [tempo / _TEMPO_SCALE, pulse_clarity, centroid.mean(), centroid.std(), rolloff.mean(), rolloff.std(),
+         loudness.mean() / 10, loudness.std() / 10, zero_crossings],
+        chroma,
+        cepstrum.mean(axis=0),
+        cepstrum.std(axis=0),
+    ]).astype(np.float32)
+
+def _extract_payload(payload):
+    """Process pool worker: (song_id, data, file_type) -> (song_id, vector or None, error)"""
+    song_id, data, file_type = payload
+    try:
+        return song_id, extract_features(*decode_audio(data, file_type)), None
+    except DECODE_ERRORS as e:
+        return song_id, None, str(e) or type(e).__name__
+
+def extract_in_pool(payloads, workers=None):
+    """Extract features from (song_id, data, file_type) payloads in a process pool
+
+    Yields (song_id, vector or None, error) as songs finish. At most two
+    payloads per worker are in flight, so memory stays bounded however
+    many payloads there are.
+    """
+    workers = workers or FEATURE_WORKERS or os.cpu_count() or 1
+    # Spawned workers do not inherit database sockets or an initialised mixer
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = set()
+        for payload in payloads:
+            pending.add(pool.submit(_extract_payload, payload))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in wait(pending).done:
+            yield future.result()
+
+# ------------------- Storage -------------------
+def save_song_features(cursor, song_id, vector):
+    """Store a song's feature vector using the caller's cursor (commit is left to the caller)"""
+    cursor.execute("DELETE FROM Song_Features WHERE song_id = %s", (song_id,))
+    cursor.execute(
+        "INSERT INTO Song_Features (song_id, version, tempo, vector) VALUES (%s, %s, %s, %s)",
+        (song_id, FEATURE_VERSION, float(vector[0]) * _TEMPO_SCALE, vector.tobytes())
+    )
+
+def extract_pending(rebuild=False, workers=None, on_progress=None):
+    """Extract features for songs without a current vector
+
+    Payloads are read one song at a time and fed to the process pool.
+    on_progress is called with the summary dict after every song. The
+    new vectors are added to the similar-song index, which is rebuilt
+    instead when rebuilding or if it does not exist yet. Returns a summary
+    of songs, failed, seconds, workers and songs_per_second.
+    """
+    workers = workers or FEATURE_WORKERS or os.cpu_count() or 1
+    summary = {"songs": 0, "failed": 0, "seconds": 0.0, "workers": workers, "songs_per_second": 0.0}
+    started = time.perf_counter()
+
+    try:
+        connection = connect_db()
+        if not connection:
+            return None
+
+        cursor = connection.cursor()
+        query = "SELECT s.song_id FROM Songs s"
+        if not rebuild:
+            query += (" WHERE NOT EXISTS (SELECT 1 FROM Song_Features f"
+                      " WHERE f.song_id = s.song_id AND f.version = %s)")
+        cursor.execute(query + " ORDER BY s.song_id", () if rebuild else (FEATURE_VERSION,))
+        song_ids = [row[0] for row in cursor.fetchall()]
+
+        def payloads():
+            reader = connection.cursor()
+            try:
+                for song_id in song_ids:
+                    reader.execute("SELECT file_data, file_type FROM Songs WHERE song_id = %s", (song_id,))
+                    row = reader.fetchone()
+                    reader.fetchall()
+                    if row:
+                        data = bytes(row[0]) or b"".join(read_uploaded_chunks(connection, song_id))
+                        yield song_id, data, row[1]
+            finally:
+                reader.close()
+
+        extracted = []
+        for song_id, vector, error in extract_in_pool(payloads(), workers):
+            if vector is None:
+                print(f"Song {song_id}: {error}")
+                summary["failed"] += 1
+            else:
+                save_song_features(cursor, song_id, vector)
+                publish(connection, "features.extracted", song_id)
+                connection.commit()
+                extracted.append((song_id, vector))
+                summary["songs"] += 1
+
+            summary["seconds"] = time.perf_counter() - started
+            summary["songs_per_second"] = summary["songs"] / summary["seconds"]
+            if on_progress:
+                on_progress(dict(summary))
+
+        if extracted:
+            invalidate("features:")
+            song_ids, vectors = zip(*extracted)
+            if rebuild or not ann_index.add_songs(song_ids, vectors):
+                ann_index.rebuild_feature_index()
+        return summary
+
+    except DB_ERRORS as e:
+        print(f"Error extracting audio features: {e}")
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def extract_song_features(song_id):
+    """Extract and store one song's features; returns True on success
+
+    The song is decoded in a spawned worker: pygame's mixer is global to a
+    process, and opening it here for decoding would leave this page's
+    playback on the dummy driver in mono.
+    """
+    try:
+        connection = connect_db()
+        if not connection:
+            return False
+
+        cursor = connection.cursor()
+        cursor.execute("SELECT file_data, file_type FROM Songs WHERE song_id = %s", (song_id,))
+        row = cursor.fetchone()
+        cursor.fetchall()
+        if not row:
+            return False
+
+        data = bytes(row[0]) or b"".join(read_uploaded_chunks(connection, song_id))
+        _, vector, error = next(extract_in_pool([(song_id, data, row[1])], workers=1))
+        if vector is None:
+            print(f"Error extracting features for song {song_id}: {error}")
+            return False
+        save_song_features(cursor, song_id, vector)
+        publish(connection, "features.extracted", song_id)
+        connection.commit()
+        invalidate("features:")
+        ann_index.add_songs([song_id], [vector])
+        return True
+
+    except DB_ERRORS + DECODE_ERRORS + (OSError,) as e:
+        print(f"Error extracting features for song {song_id}: {e}")
+        return False
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def extract_song_features_async(song_id):
+    """Extract one song's features on a background thread (e.g. right after upload)"""
+    thread = threading.Thread(target=extract_song_features, args=(song_id,), daemon=True)
+    thread.start()
+    return thread
+
+# ------------------- Similarity -------------------
+def load_song_vectors():
+    """Raw feature vectors of all songs as (song_ids, matrix), or None if there are none"""
+    try:
+        connection = connect_db(read_only=True)
+        if not connection:
+            return None
+
+        cursor = connection.cursor()
+        cursor.execute("SELECT song_id, vector FROM Song_Features WHERE version = %s ORDER BY song_id",
+                       (FEATURE_VERSION,))
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+
+        song_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        matrix = np.frombuffer(b"".join(bytes(row[1]) for row in rows), dtype=np.float32)
+        return song_ids, matrix.reshape(len(rows), len(FEATURE_NAMES))
+
+    except DB_ERRORS as e:
+        print(f"Error loading audio features: {e}")
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def _load_feature_matrix():
+    """Standardised, unit-length feature vectors of all songs as (song_ids, matrix)"""
+    vectors = load_song_vectors()
+    if vectors is None:
+        return None
+    song_ids, raw = vectors
+    # Put every feature on the same scale, then compare by cosine similarity
+    return song_ids, ann_index.standardize(raw, raw.mean(axis=0), raw.std(axis=0) + _EPS)
+
+def get_feature_matrix():
+    """Cached (song_ids, matrix) of all feature vectors, or None if none are stored"""
+    return cached("features:matrix", _load_feature_matrix, SONG_LIST_CACHE_TTL, CACHE_STALE_TTL)
+
+def songs_like(seed_ids, limit=10, exclude=()):
+    """Songs that sound like the seed songs, as [(song_id, similarity)]
+
+    The seeds are averaged into one taste vector; seeds and exclude are
+    left out of the results. Uses the similar-song index once it has been
+    built, otherwise an exact scan of all vectors.
+    """
+    index = ann_index.load_index()
+    if index is not None:
+        return index.songs_like(seed_ids, limit, exclude)
+
+    features = get_feature_matrix()
+    if features is None:
+        return []
+    song_ids, matrix = features
+
+    rows = np.nonzero(np.isin(song_ids, list(seed_ids)))[0]
+    if not len(rows):
+        return []
+    taste = matrix[rows].mean(axis=0)
+    scores = matrix @ taste
+
+    skipped = np.isin(song_ids, list(set(seed_ids) | set(exclude)))
+    scores[skipped] = -np.inf
+    limit = min(limit, int((~skipped).sum()))
+    if limit <= 0:
+        return []
+    best = np.argpartition(-scores, limit - 1)[:limit]
+    best = best[np.argsort(-scores[best])]
+    return [(int(song_ids[i]), float(scores[i])) for i in best]
+
+def similar_songs(song_id, limit=10):
+    """Songs that sound like one song, as [(song_id, similarity)]"""
+    return songs_like([song_id], limit)
+
+def format_summary(summary):
+    """One-line summary of an extraction run"""
+    per_core = summary["songs_per_second"] / summary["workers"]
+    return (f"{summary['songs']} songs ({summary['failed']} failed) in {summary['seconds']:.1f}s • "
+            f"{summary['songs_per_second']:.2f} songs/s • {per_core:.2f} songs/s/core "
+            f"({summary['workers']} workers)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract audio features for similarity recommendations")
+    parser.add_argument("--rebuild", action="store_true", help="re-extract songs that already have features")
+    parser.add_argument("--workers", type=int, default=FEATURE_WORKERS, help="default: one per core")
+    args = parser.parse_args()
+
+    summary = extract_pending(args.rebuild, args.workers,
+                              on_progress=lambda s: print(f"\r{format_summary(s)}", end="", flush=True))
+    print()
+    if summary is None:
+        print("Feature extraction failed.")
+    else:
+        print(format_summary(summary))
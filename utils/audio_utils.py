@@ -0,0 +1,377 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+from config import DOWNLOAD_CHUNK_SIZE, STREAM_SERVER_URL, PLAYBACK_MEMORY_CACHE_BYTES
+from utils.db_utils import connect_db, prepared_cursor, DB_ERRORS
+from utils import stream_client
+from utils.seek_index import get_seek_index, SeekedStream
+from utils.song_upload import read_uploaded_chunks
+from utils.song_sets import record_play
+from utils.change_events import publish
+
+class LazyMixer:
+    """pygame.mixer, imported and opened on first use
+
+    Importing pygame and opening the audio device are the slowest part of
+    starting a page, and every page is its own process, so players use
+    this stand-in and only pay for it when they actually play something.
+    """
+
+    def __init__(self):
+        self._mixer = None
+        self._lock = threading.Lock()
+
+    @property
+    def started(self):
+        """Whether the mixer has been opened (nothing can be playing if not)"""
+        return self._mixer is not None
+
+    def __getattr__(self, name):
+        if self._mixer is None:
+            with self._lock:
+                if self._mixer is None:
+                    from pygame import mixer
+                    mixer.init()
+                    self._mixer = mixer
+        return getattr(self._mixer, name)
+
+# Shared by the players in this process
+mixer = LazyMixer()
+
+class RecentAudio:
+    """Audio of the songs played last in this process, up to max_bytes
+
+    Players decode straight from these bytes, so seeking or replaying a
+    song does not fetch its BLOB again. The most recent song is always
+    kept, whatever its size, because the mixer may still be reading it.
+    """
+
+    def __init__(self, max_bytes=PLAYBACK_MEMORY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._songs = OrderedDict()  # song_id -> bytes, least recently played first
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, song_id):
+        with self._lock:
+            data = self._songs.get(song_id)
+            if data is not None:
+                self._songs.move_to_end(song_id)
+            return data
+
+    def put(self, song_id, data):
+        with self._lock:
+            if song_id in self._songs:
+                self._size -= len(self._songs.pop(song_id))
+            self._songs[song_id] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and len(self._songs) > 1:
+                _, evicted = self._songs.popitem(last=False)
+                self._size -= len(evicted)
+
+recent_audio = RecentAudio()
+
+def get_audio_duration(file_path):
+    """Get the duration of an audio file"""
+    try:
+        # Imported here: only uploads need mutagen
+        import mutagen
+        from mutagen.mp3 import MP3
+        from mutagen.flac import FLAC
+        from mutagen.wave import WAVE
+
+        file_type = os.path.splitext(file_path)[1][1:].lower()
+        
+        if file_type == 'mp3':
+            audio = MP3(file_path)
+        elif file_type == 'flac':
+            audio = FLAC(file_path)
+        elif file_type in ['wav', 'wave']:
+            audio = WAVE(file_path)
+        else:
+            # Fallback for other formats
+            audio = mutagen.File(file_path)
+            
+        return int(audio.info.length)
+    except Exception as e:
+        print(f"Error getting audio duration: {e}")
+        return 0
+
+def get_song_data(song_id, quiet=False):
+    """Get binary song data from database"""
+    try:
+        connection = connect_db(read_only=True, quiet=quiet)
+        if not connection:
+            return None
+            
+        query = """
+        SELECT s.file_data, s.file_type, s.title, a.name as artist_name 
+        FROM Songs s
+        JOIN Artists a ON s.artist_id = a.artist_id
+        WHERE s.song_id = %s
+        """
+        # Prepared statement: BLOB comes back over the binary protocol
+        cursor = prepared_cursor(connection, query)
+        cursor.execute(query, (song_id,))
+        
+        result = cursor.fetchone()
+        cursor.fetchall()
+        if result:
+            data = result[0]
+            if not data:
+                # Uploaded in chunks
+                data = b"".join(read_uploaded_chunks(connection, song_id))
+            return {
+                'data': data, 
+                'type': result[1],
+                'title': result[2],
+                'artist': result[3]
+            }
+        return None
+        
+    except DB_ERRORS as e:
+        print(f"Error getting song data: {e}")
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def get_song_info(song_id):
+    """Get a song's metadata without its binary data"""
+    if STREAM_SERVER_URL:
+        return stream_client.get_song_info(song_id)
+    return get_song_info_from_db(song_id)
+
+def fetch_song_info(connection, song_id):
+    """Get a song's metadata over the caller's connection (None if there is no such song)"""
+    query = """
+    SELECT s.song_id, s.title, a.name as artist_name, s.file_type, s.file_size, s.upload_date
+    FROM Songs s
+    LEFT JOIN Artists a ON s.artist_id = a.artist_id
+    WHERE s.song_id = %s
+    """
+    cursor = prepared_cursor(connection, query, dictionary=True)
+    try:
+        cursor.execute(query, (song_id,))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+
+def get_song_info_from_db(song_id, quiet=False):
+    """Get a song's metadata from the database without its binary data
+
+    quiet=True logs connection errors instead of showing a dialog (for
+    processes without a UI).
+    """
+    try:
+        connection = connect_db(read_only=True, quiet=quiet)
+        if not connection:
+            return None
+        return fetch_song_info(connection, song_id)
+        
+    except DB_ERRORS as e:
+        print(f"Error getting song info: {e}")
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            connection.close()
+
+def read_song_chunks(song_id, offset=0, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """Yield a song's binary data in chunks, starting at a byte offset
+    
+    Reads through the streaming service when STREAM_SERVER_URL is set,
+    otherwise straight from the database.
+    """
+    if STREAM_SERVER_URL:
+        return stream_client.iter_song_chunks(song_id, offset, chunk_size)
+    return read_song_chunks_from_db(song_id, offset, chunk_size)
+
+def read_song_chunks_from_db(song_id, offset=0, chunk_size=DOWNLOAD_CHUNK_SIZE, quiet=False):
+    """Yield a song's binary data from the database in chunks
+    
+    Each chunk is a separate SUBSTRING read over one connection, so the
+    whole BLOB is never held in memory.
+    """
+    connection = connect_db(read_only=True, quiet=quiet)
+    if not connection:
+        raise IOError(f"Could not connect to database to read song {song_id}")
+    
+    # SUBSTRING positions are 1-based
+    query = "SELECT SUBSTRING(file_data, %s, %s), file_size FROM Songs WHERE song_id = %s"
+    cursor = prepared_cursor(connection, query)
+    try:
+        while True:
+            cursor.execute(query, (offset + 1, chunk_size, song_id))
+            row = cursor.fetchone()
+            cursor.fetchall()
+            if row is None:
+                raise IOError(f"Song {song_id} not found")
+            
+            chunk, file_size = row
+            if not chunk:
+                if offset < file_size:
+                    # Uploaded in chunks: file_data is empty
+                    yield from read_uploaded_chunks(connection, song_id, offset)
+                return
+            
+            yield bytes(chunk)
+            offset += len(chunk)
+            if len(chunk) < chunk_size:
+                return
+    finally:
+        cursor.close()
+        connection.close()
+
+def safe_filename(artist, title, file_type):
+    """Build an "Artist - Title.ext" filename without invalid characters"""
+    filename = f"{artist} - {title}.{file_type}"
+    for char in '/\\:*?"<>|':
+        filename = filename.replace(char, '_')
+    return filename
+
+def start_song(song_id, mixer, quiet=False):
+    """Load a song from the database and start playing it on a mixer
+
+    Returns the song's playback state, or None if the song was not found;
+    playback errors are raised. quiet=True logs database connection errors
+    instead of showing a dialog (for processes without a UI).
+    """
+    if STREAM_SERVER_URL:
+        # Stream over HTTP: playback starts once the first block arrives
+        song_info = get_song_info(song_id)
+        if not song_info:
+            return None
+        
+        title, artist = song_info['title'], song_info['artist_name']
+        file_type, file_size = song_info['file_type'], song_info['file_size']
+        stream = stream_client.open_song_stream(song_id, file_size)
+        mixer.music.load(stream, file_type)
+    else:
+        data = recent_audio.get(song_id)
+        if data is None:
+            song_data = get_song_data(song_id, quiet)
+            if not song_data:
+                return None
+            title, artist, file_type = song_data['title'], song_data['artist'], song_data['type']
+            data = song_data['data']
+            recent_audio.put(song_id, data)
+        else:
+            # Audio already in memory: only check the song still exists
+            song_info = get_song_info_from_db(song_id, quiet)
+            if not song_info:
+                return None
+            title, artist, file_type = song_info['title'], song_info['artist_name'], song_info['file_type']
+        file_size = len(data)
+        
+        # Decode from memory; BytesIO shares the bytes instead of copying them
+        mixer.music.load(io.BytesIO(data), file_type)
+    
+    # Play the song
+    mixer.music.play()
+    
+    # Return song info for caller to maintain state
+    return {
+        "id": song_id,
+        "title": title,
+        "artist": artist,
+        "file_type": file_type,
+        "file_size": file_size,
+        "start": 0,
+        "playing": True,
+        "paused": False
+    }
+
+def get_recent_audio(song_id, quiet=False):
+    """A song's audio bytes, from memory if it was played recently"""
+    data = recent_audio.get(song_id)
+    if data is None:
+        song_data = get_song_data(song_id, quiet)
+        if not song_data:
+            raise ValueError(f"Song {song_id} not found")
+        data = song_data['data']
+        recent_audio.put(song_id, data)
+    return data
+
+def seek_song(song, mixer, seconds, quiet=False):
+    """Continue playing the current song from a position in seconds
+    
+    song is the state dict returned by start_song; its "start" is
+    updated. With a seek index the decoder is handed a stream that begins
+    at the frame playing at that time, so only bytes from there on are
+    read. Other songs fall back to the mixer's own seeking.
+    """
+    seconds = max(0, seconds)
+    try:
+        seek_index = get_seek_index(song['id'], quiet)
+        if seek_index is None:
+            mixer.music.play(start=seconds)
+        else:
+            if STREAM_SERVER_URL:
+                source = stream_client.open_song_stream(song['id'], song['file_size'])
+            else:
+                source = io.BytesIO(get_recent_audio(song['id'], quiet))
+            
+            # FLAC decoders need the stream header and metadata before the first frame
+            prefix = b""
+            if song['file_type'] == 'flac':
+                prefix = source.read(seek_index.audio_start)
+            
+            offset = seek_index.offset_for(seconds)
+            stream = SeekedStream(source, song['file_size'], offset, prefix)
+            mixer.music.load(stream, song['file_type'])
+            mixer.music.play()
+        
+        song['start'] = seconds
+        song['playing'], song['paused'] = True, False
+        return True
+        
+    except Exception as e:
+        print(f"Error seeking song: {e}")
+        return False
+
+def get_play_position(song, mixer):
+    """Current playback position of the song in seconds"""
+    return song.get('start', 0) + max(0, mixer.music.get_pos()) / 1000
+
+def format_file_size(size_bytes):
+    """Format file size from bytes to human-readable format"""
+    if not size_bytes:
+        return "0 B"
+    
+    # Define size units
+    units = ['B', 'KB', 'MB', 'GB']
+    size = float(size_bytes)
+    unit_index = 0
+    
+    # Convert to appropriate unit
+    while size >= 1024 and unit_index < len(units) - 1:
+        size /= 1024.0
+        unit_index += 1
+    
+    # Return formatted size
+    return f"{size:.2f} {units[unit_index]}"
+
+def record_listening_history(user_id, song_id, quiet=False):
+    """Record that the user listened to a song"""
+    try:
+        connection = connect_db(quiet=quiet)
+        if not connection:
+            return False
+            
+        query = "INSERT INTO Listening_History (user_id, song_id) VALUES (%s, %s)"
+        cursor = prepared_cursor(connection, query)
+        cursor.execute(query, (user_id, song_id))
+        publish(connection, "song.played", song_id, user_id)
+        connection.commit()
+        record_play(user_id, song_id)
+        return True
+        
+    except Exception as e:
+        print(f"Error recording listening history: {e}")
+        return False
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
\ No newline at end of file
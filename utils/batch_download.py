@@ -0,0 +1,203 @@
+"""
+Batch downloads
+Downloads many songs concurrently, streaming each one to disk in chunks.
+Partial files are resumed after a crash using the byte offset and checksum
+recorded next to them. Finished files are listed with their song_id in a
+manifest in the destination folder, so a file is only skipped as already
+downloaded if it is that song.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import DOWNLOAD_WORKERS, DOWNLOAD_CHUNK_SIZE
+from utils.audio_utils import read_song_chunks, safe_filename
+
+MANIFEST_NAME = ".downloads.json"
+
+_manifest_lock = threading.Lock()
+
+def _hash_prefix(path, length):
+    """SHA-256 of the first length bytes of a file"""
+    digest = hashlib.sha256()
+    remaining = length
+    with open(path, "rb") as f:
+        while remaining > 0:
+            block = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest
+
+def _resume_point(part_path, state_path, song_id):
+    """Return (offset, digest) to continue a partial download from"""
+    if not (os.path.exists(part_path) and os.path.exists(state_path)):
+        return 0, hashlib.sha256()
+
+    try:
+        with open(state_path, "r") as f:
+            state = json.load(f)
+        offset = state["offset"]
+        if state["song_id"] != song_id or os.path.getsize(part_path) < offset:
+            return 0, hashlib.sha256()
+
+        # Bytes written after the last checkpoint are discarded
+        with open(part_path, "r+b") as f:
+            f.truncate(offset)
+
+        digest = _hash_prefix(part_path, offset)
+        if digest.hexdigest() != state["sha256"]:
+            print(f"Partial download of song {song_id} is corrupt, restarting")
+            return 0, hashlib.sha256()
+        return offset, digest
+
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error reading partial download state: {e}")
+        return 0, hashlib.sha256()
+
+def _write_state(state_path, song_id, offset, digest):
+    """Checkpoint a partial download"""
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"song_id": song_id, "offset": offset, "sha256": digest.hexdigest()}, f)
+    os.replace(tmp_path, state_path)
+
+def _read_manifest(dest_dir):
+    """File name -> song_id of the songs downloaded to dest_dir"""
+    try:
+        with open(os.path.join(dest_dir, MANIFEST_NAME), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Error reading download manifest: {e}")
+        return {}
+
+def _record_download(dest_dir, filename, song_id):
+    """Add a finished file to the manifest"""
+    manifest_path = os.path.join(dest_dir, MANIFEST_NAME)
+    with _manifest_lock:
+        manifest = _read_manifest(dest_dir)
+        manifest[filename] = song_id
+        tmp_path = f"{manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, manifest_path)
+
+def _file_owner(dest_dir, filename, manifest):
+    """song_id a file name in dest_dir belongs to: None if unused, -1 if unknown"""
+    if filename in manifest:
+        return manifest[filename]
+    path = os.path.join(dest_dir, filename)
+    try:
+        with open(f"{path}.part.json", "r") as f:
+            return json.load(f)["song_id"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return -1 if os.path.exists(path) else None
+
+def _assign_filenames(songs, dest_dir):
+    """Pick a file name per song ("Artist - Title.ext", with the song_id added on a collision)"""
+    manifest = _read_manifest(dest_dir)
+    taken = set()
+    filenames = {}
+    for song in songs:
+        song_id = song["song_id"]
+        filename = safe_filename(song["artist_name"], song["title"], song["file_type"])
+        if filename in taken or _file_owner(dest_dir, filename, manifest) not in (None, song_id):
+            filename = safe_filename(song["artist_name"], f"{song['title']} ({song_id})", song["file_type"])
+        taken.add(filename)
+        filenames[song_id] = filename
+    return filenames
+
+def download_song_to_file(song, dest_dir, on_bytes=None, cancel_event=None, filename=None):
+    """Stream one song to dest_dir, resuming a partial file if there is one
+
+    song is a dict with song_id, title, artist_name, file_type and file_size.
+    Returns a result dict with the final path, status and SHA-256.
+    """
+    song_id = song["song_id"]
+    filename = filename or safe_filename(song["artist_name"], song["title"], song["file_type"])
+    path = os.path.join(dest_dir, filename)
+    part_path = f"{path}.part"
+    state_path = f"{path}.part.json"
+
+    if (os.path.exists(path) and os.path.getsize(path) == song["file_size"]
+            and _read_manifest(dest_dir).get(filename) == song_id):
+        if on_bytes:
+            on_bytes(song["file_size"])
+        return {"song_id": song_id, "path": path, "status": "exists", "sha256": None}
+
+    offset, digest = _resume_point(part_path, state_path, song_id)
+    if offset and on_bytes:
+        on_bytes(offset)
+
+    with open(part_path, "ab") as f:
+        for chunk in read_song_chunks(song_id, offset):
+            if cancel_event is not None and cancel_event.is_set():
+                return {"song_id": song_id, "path": part_path, "status": "cancelled", "sha256": None}
+
+            f.write(chunk)
+            f.flush()
+            digest.update(chunk)
+            offset += len(chunk)
+            _write_state(state_path, song_id, offset, digest)
+
+            if on_bytes:
+                on_bytes(len(chunk))
+
+    if offset != song["file_size"]:
+        raise IOError(f"Song {song_id}: got {offset} bytes, expected {song['file_size']}")
+
+    os.replace(part_path, path)
+    os.remove(state_path)
+    _record_download(dest_dir, filename, song_id)
+    return {"song_id": song_id, "path": path, "status": "downloaded", "sha256": digest.hexdigest()}
+
+def download_songs(songs, dest_dir, workers=DOWNLOAD_WORKERS, on_progress=None, cancel_event=None):
+    """Download songs concurrently over pooled connections
+
+    A song listed more than once is downloaded once, with one result.
+    on_progress is called from worker threads with a dict of aggregate
+    progress: files_done, files_total, bytes_done, bytes_total and
+    bytes_per_second.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    songs = list({song["song_id"]: song for song in songs}.values())
+    filenames = _assign_filenames(songs, dest_dir)
+
+    lock = threading.Lock()
+    progress = {
+        "files_done": 0,
+        "files_total": len(songs),
+        "bytes_done": 0,
+        "bytes_total": sum(song["file_size"] for song in songs),
+        "bytes_per_second": 0.0
+    }
+    start = time.perf_counter()
+
+    def report(files=0, nbytes=0):
+        with lock:
+            progress["files_done"] += files
+            progress["bytes_done"] += nbytes
+            elapsed = time.perf_counter() - start
+            progress["bytes_per_second"] = progress["bytes_done"] / elapsed if elapsed else 0.0
+            snapshot = dict(progress)
+        if on_progress:
+            on_progress(snapshot)
+
+    def worker(song):
+        try:
+            result = download_song_to_file(song, dest_dir, lambda n: report(nbytes=n), cancel_event,
+                                           filenames[song["song_id"]])
+        except Exception as e:
+            print(f"Error downloading song {song['song_id']}: {e}")
+            result = {"song_id": song["song_id"], "path": None, "status": "failed", "sha256": None, "error": str(e)}
+        report(files=1)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(worker, songs))
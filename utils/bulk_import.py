@@ -0,0 +1,352 @@
+"""
+Bulk import
+Loads users, artists and listening events from CSV or JSON Lines files, for
+example to migrate an existing user base and its play logs.
+
+Records are read in batches and validated by a pool of worker processes
+(hashing passwords dominates for users). Valid rows are written in file
+order with executemany, or on MySQL with LOAD DATA LOCAL INFILE, in
+transactions committed every commit_every rows. Rejected records are
+reported by line number. Users and artists that already exist (same email
+or name) are skipped; listening events are always added, those older than
+the history rollup watermark directly to the daily play counts.
+
+Columns (CSV header names or JSON keys):
+    users:   first_name, last_name, email, password or password_hash, [is_admin], [created_at]
+    artists: name, [bio], [image_url]
+    history: user_id, song_id, played_at
+Dates are ISO 8601 or unix seconds.
+
+Usage: python -m utils.bulk_import <users|artists|history> <file> [--format csv|jsonl]
+           [--batch-size N] [--commit-every N] [--workers N] [--load-data]
+"""
+import argparse
+import csv
+import datetime
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from config import DB_BACKEND, DB_CONFIG, IMPORT_BATCH_SIZE, IMPORT_COMMIT_ROWS, IMPORT_WORKERS
+from utils.db_utils import connect_db, hash_password, DB_ERRORS
+from utils.cache import invalidate
+from utils.change_events import publish
+from utils.history_retention import add_rolled_up_plays, get_history_watermark
+
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+_PASSWORD_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+_UNIX_TIME_RE = re.compile(r"^\d+(\.\d+)?$")
+_FLAGS = {"": 0, "0": 0, "false": 0, "no": 0, "1": 1, "true": 1, "yes": 1}
+
+# Rejected records kept in the summary (all of them are counted)
+MAX_REPORTED_ERRORS = 20
+
+# ------------------- Validation -------------------
+def _text(record, key, max_length, required=True):
+    value = record.get(key)
+    value = "" if value is None else str(value).strip()
+    if not value:
+        if required:
+            raise ValueError(f"{key} is required")
+        return None
+    if len(value) > max_length:
+        raise ValueError(f"{key} is longer than {max_length} characters")
+    return value
+
+def _id(record, key):
+    value = str(record.get(key, "")).strip()
+    if not value.isdigit() or int(value) == 0:
+        raise ValueError(f"{key} is not a valid ID: {record.get(key)!r}")
+    return int(value)
+
+def _timestamp(record, key):
+    """A date as local time in the database's 'YYYY-MM-DD HH:MM:SS' form"""
+    value = str(record.get(key, "")).strip()
+    if _UNIX_TIME_RE.match(value):
+        moment = datetime.datetime.fromtimestamp(float(value))
+    else:
+        try:
+            moment = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"{key} is not a date: {record.get(key)!r}")
+        if moment.tzinfo is not None:
+            moment = moment.astimezone().replace(tzinfo=None)
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+def _validate_user(record):
+    email = _text(record, "email", 100).lower()
+    if not _EMAIL_RE.match(email):
+        raise ValueError(f"email is not valid: {email!r}")
+
+    password_hash = _text(record, "password_hash", 64, required=False)
+    if password_hash:
+        password_hash = password_hash.lower()
+        if not _PASSWORD_HASH_RE.match(password_hash):
+            raise ValueError("password_hash is not a SHA-256 hex digest")
+    elif record.get("password"):
+        password_hash = hash_password(str(record["password"]))
+    else:
+        raise ValueError("password or password_hash is required")
+
+    is_admin = _FLAGS.get(str(record.get("is_admin") or "").strip().lower())
+    if is_admin is None:
+        raise ValueError(f"is_admin is not true or false: {record.get('is_admin')!r}")
+
+    created_at = (_timestamp(record, "created_at") if record.get("created_at")
+                  else datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    return (_text(record, "first_name", 50), _text(record, "last_name", 50), email,
+            password_hash, is_admin, created_at)
+
+def _validate_artist(record):
+    return (_text(record, "name", 100), _text(record, "bio", 65535, required=False),
+            _text(record, "image_url", 255, required=False))
+
+def _validate_event(record):
+    return (_id(record, "user_id"), _id(record, "song_id"), _timestamp(record, "played_at"))
+
+# Importable datasets as name -> (table, columns, validator, skip existing rows,
+# [(column index, query for the IDs it may reference)])
+IMPORTS = {
+    "users": (
+        "Users", ("first_name", "last_name", "email", "password", "is_admin", "created_at"),
+        _validate_user, True, []
+    ),
+    "artists": (
+        "Artists", ("name", "bio", "image_url"),
+        _validate_artist, True, []
+    ),
+    "history": (
+        "Listening_History", ("user_id", "song_id", "played_at"),
+        _validate_event, False,
+        [(0, "SELECT user_id FROM Users"), (1, "SELECT song_id FROM Songs")]
+    ),
+}
+
+def validate_batch(dataset, records):
+    """Validate (line number, record) pairs; returns (rows, their line numbers, [(line number, error)])
+
+    Records are dicts (CSV) or raw JSON lines, which are parsed here so the
+    workers share that work too.
+    """
+    validate = IMPORTS[dataset][2]
+    rows, lines, errors = [], [], []
+    for line_number, record in records:
+        try:
+            if isinstance(record, str):
+                record = json.loads(record)
+                if not isinstance(record, dict):
+                    raise ValueError("not a JSON object")
+            rows.append(validate(record))
+            lines.append(line_number)
+        except ValueError as e:
+            errors.append((line_number, str(e)))
+    return rows, lines, errors
+
+def _validated_batches(dataset, batches, workers):
+    """Validate batches in a process pool, yielding results in file order"""
+    if not workers:
+        for batch in batches:
+            yield validate_batch(dataset, batch)
+        return
+
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # At most two batches per worker are in flight, so memory stays bounded
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(validate_batch, dataset, batch))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+# ------------------- Reading -------------------
+def read_records(path, file_format):
+    """Yield (line number, record) from a CSV file (dicts) or JSON Lines file (raw lines)"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if file_format == "csv":
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    yield line_number, line
+
+def _batches(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# ------------------- Writing -------------------
+def _insert_rows(cursor, table, columns, rows, skip_existing):
+    """Insert rows with one executemany; returns the number inserted"""
+    verb = "INSERT"
+    if skip_existing:
+        verb = "INSERT OR IGNORE" if DB_BACKEND == "sqlite" else "INSERT IGNORE"
+    placeholders = ", ".join(["%s"] * len(columns))
+    cursor.executemany(f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+    return cursor.rowcount
+
+def _tsv_field(value):
+    """A value in LOAD DATA's default format (tab separated, backslash escapes, \\N for NULL)"""
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+def _load_rows(cursor, table, columns, rows, skip_existing):
+    """Write rows to a temporary file and load it with LOAD DATA LOCAL INFILE; returns the number loaded"""
+    with tempfile.NamedTemporaryFile("w", suffix=".tsv", encoding="utf-8", newline="\n", delete=False) as f:
+        for row in rows:
+            f.write("\t".join(_tsv_field(value) for value in row) + "\n")
+    try:
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s {'IGNORE ' if skip_existing else ''}INTO TABLE {table} "
+            f"CHARACTER SET utf8mb4 ({', '.join(columns)})",
+            (f.name,)
+        )
+        return cursor.rowcount
+    finally:
+        os.remove(f.name)
+
+def _connect(load_data):
+    if not load_data:
+        return connect_db(quiet=True)
+    if DB_BACKEND == "sqlite":
+        raise ValueError("LOAD DATA LOCAL INFILE needs the MySQL backend")
+    # Local infile is off by default in the client; the server must allow it too
+    import mysql.connector
+    return mysql.connector.connect(**DB_CONFIG, allow_local_infile=True)
+
+# ------------------- Import -------------------
+def import_file(dataset, path, file_format=None, batch_size=IMPORT_BATCH_SIZE, commit_every=IMPORT_COMMIT_ROWS,
+                workers=None, load_data=False, on_progress=None):
+    """Import a CSV or JSON Lines file into a dataset's table
+
+    on_progress is called after every batch with the summary so far: records
+    (read), imported, skipped (already existing), rejected, errors (the first
+    MAX_REPORTED_ERRORS as (line number, message)), seconds and
+    rows_per_second. Returns the final summary, or None if the import
+    failed; transactions committed before a failure are kept.
+    """
+    table, columns, _, skip_existing, references = IMPORTS[dataset]
+    file_format = file_format or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    workers = IMPORT_WORKERS if workers is None else workers
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    write_rows = _load_rows if load_data else _insert_rows
+
+    summary = {"records": 0, "imported": 0, "skipped": 0, "rejected": 0, "errors": [],
+               "seconds": 0.0, "rows_per_second": 0.0}
+    started = time.perf_counter()
+
+    try:
+        connection = _connect(load_data)
+        if not connection:
+            return None
+        cursor = connection.cursor()
+
+        # IDs that events may refer to, checked here rather than by each worker
+        known_ids = []
+        for column, query in references:
+            cursor.execute(query)
+            known_ids.append((column, columns[column], {row[0] for row in cursor.fetchall()}))
+
+        uncommitted = 0
+        batches = _batches(read_records(path, file_format), batch_size)
+        for rows, lines, errors in _validated_batches(dataset, batches, workers):
+            if known_ids:
+                valid = []
+                for row, line_number in zip(rows, lines):
+                    missing = [name for column, name, ids in known_ids if row[column] not in ids]
+                    if missing:
+                        errors.append((line_number, f"unknown {', '.join(missing)}"))
+                    else:
+                        valid.append(row)
+                rows = valid
+
+            raw_rows = rows
+            if dataset == "history" and rows:
+                # Plays from days already rolled up go to the daily counts;
+                # the watermark is re-read as a rollup may run meanwhile
+                watermark = get_history_watermark(connection)
+                rolled_up = [row for row in rows if row[2] < watermark]
+                if rolled_up:
+                    add_rolled_up_plays(cursor, rolled_up)
+                    summary["imported"] += len(rolled_up)
+                    raw_rows = [row for row in rows if row[2] >= watermark]
+
+            if raw_rows:
+                written = write_rows(cursor, table, columns, raw_rows, skip_existing)
+                summary["imported"] += written
+                summary["skipped"] += len(raw_rows) - written
+            uncommitted += len(rows)
+            if uncommitted >= commit_every:
+                connection.commit()
+                uncommitted = 0
+
+            summary["records"] += len(rows) + len(errors)
+            summary["rejected"] += len(errors)
+            summary["errors"].extend(errors[:MAX_REPORTED_ERRORS - len(summary["errors"])])
+            summary["seconds"] = time.perf_counter() - started
+            summary["rows_per_second"] = summary["records"] / summary["seconds"] if summary["seconds"] else 0.0
+            if on_progress:
+                on_progress(dict(summary))
+
+        # One event for the whole import, with its last transaction
+        if summary["imported"]:
+            publish(connection, f"{dataset}.imported")
+        connection.commit()
+
+    except DB_ERRORS + (OSError, ValueError, UnicodeDecodeError, csv.Error) as e:
+        print(f"Error importing {dataset}: {e}")
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+    # Cached lists built from the imported table
+    cache_prefix = {"artists": "catalog:artists", "history": "songs:"}.get(dataset)
+    if cache_prefix:
+        invalidate(cache_prefix)
+    summary["seconds"] = time.perf_counter() - started
+    summary["rows_per_second"] = summary["records"] / summary["seconds"] if summary["seconds"] else 0.0
+    return summary
+
+def format_summary(summary):
+    """One-line summary of import progress"""
+    return (f"{summary['records']:,} records • {summary['imported']:,} imported • "
+            f"{summary['skipped']:,} existing • {summary['rejected']:,} rejected • "
+            f"{summary['rows_per_second']:,.0f} rows/s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import users, artists or listening events")
+    parser.add_argument("dataset", choices=sorted(IMPORTS))
+    parser.add_argument("input")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="default: csv for .csv files, else jsonl")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--commit-every", type=int, default=IMPORT_COMMIT_ROWS, help="rows per transaction")
+    parser.add_argument("--workers", type=int, help="validation processes (0 validates in this process)")
+    parser.add_argument("--load-data", action="store_true", help="write with LOAD DATA LOCAL INFILE (MySQL)")
+    args = parser.parse_args()
+
+    result = import_file(args.dataset, args.input, args.format, args.batch_size, args.commit_every,
+                         args.workers, args.load_data,
+                         on_progress=lambda s: print(f"\r{format_summary(s)}", end="", flush=True))
+    print()
+    if result is None:
+        print("Import failed.")
+    else:
+        print(f"Imported {args.input} in {result['seconds']:.1f}s: {format_summary(result)}")
+        for line_number, message in result["errors"]:
+            print(f"  line {line_number}: {message}")
+        if result["rejected"] > len(result["errors"]):
+            print(f"  ... and {result['rejected'] - len(result['errors']):,} more rejected records")
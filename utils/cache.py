@@ -0,0 +1,150 @@
+"""
+Catalog cache
+TTL cache with stale-while-revalidate, shared by page processes through a file in TEMP_DIR
+
+Changes to the file are read-modify-write under a file lock. Each
+invalidation bumps a generation stored with the entries and records it for
+its prefix, so a value loaded before an invalidation of its key is not
+stored after it.
+"""
+import os
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+from config import TEMP_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows: cache updates are not locked across processes
+    fcntl = None
+
+CACHE_FILE = os.path.join(TEMP_DIR, "catalog_cache.pickle")
+
+_lock = threading.RLock()
+_entries = {}
+_generation = 0
+_invalidated = {}  # Key prefix -> generation of its last invalidation
+_loaded_mtime = None
+_refreshing = set()
+
+def _sync_from_disk():
+    """Reload the shared cache file if another process changed it"""
+    global _entries, _generation, _invalidated, _loaded_mtime
+    try:
+        mtime = os.stat(CACHE_FILE).st_mtime_ns
+    except OSError:
+        return
+    if mtime == _loaded_mtime:
+        return
+    try:
+        with open(CACHE_FILE, "rb") as f:
+            data = pickle.load(f)
+        if isinstance(data, tuple):
+            _generation, _invalidated, _entries = data
+        _loaded_mtime = mtime
+    except (OSError, pickle.PickleError, EOFError, ValueError) as e:
+        print(f"Error reading catalog cache: {e}")
+
+def _save_to_disk():
+    """Write the cache file atomically"""
+    global _loaded_mtime
+    try:
+        os.makedirs(TEMP_DIR, exist_ok=True)
+        tmp_path = f"{CACHE_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((_generation, _invalidated, _entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, CACHE_FILE)
+        _loaded_mtime = os.stat(CACHE_FILE).st_mtime_ns
+    except OSError as e:
+        print(f"Error writing catalog cache: {e}")
+
+@contextmanager
+def _file_lock():
+    """Hold the thread lock and the cache file lock for a read-modify-write"""
+    with _lock:
+        try:
+            os.makedirs(TEMP_DIR, exist_ok=True)
+            lock_file = open(f"{CACHE_FILE}.lock", "w")
+        except OSError as e:
+            print(f"Error locking catalog cache: {e}")
+            lock_file = None
+        try:
+            if lock_file and fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            _sync_from_disk()
+            yield
+        finally:
+            if lock_file:
+                lock_file.close()
+
+def _current_generation():
+    with _lock:
+        _sync_from_disk()
+        return _generation
+
+def _store(key, value, generation):
+    """Cache a value loaded at generation, unless an invalidation happened since"""
+    with _file_lock():
+        if any(key.startswith(prefix) and invalidated > generation
+               for prefix, invalidated in _invalidated.items()):
+            return
+        _entries[key] = (time.time(), value)
+        _save_to_disk()
+
+def _refresh_in_background(key, loader):
+    """Reload an entry on a daemon thread, at most one refresh per key"""
+    with _lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def refresh():
+        try:
+            generation = _current_generation()
+            value = loader()
+            if value:
+                _store(key, value, generation)
+        except Exception as e:
+            print(f"Error refreshing cache entry {key}: {e}")
+        finally:
+            with _lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+def cached(key, loader, ttl, stale_ttl=0):
+    """Return a cached value, loading it on a miss
+
+    Within ttl seconds the cached value is returned as is. For a further
+    stale_ttl seconds the stale value is returned immediately and reloaded
+    in the background. Empty results are not cached.
+    """
+    with _lock:
+        _sync_from_disk()
+        entry = _entries.get(key)
+
+    if entry is not None:
+        age = time.time() - entry[0]
+        if age < ttl:
+            return entry[1]
+        if age < ttl + stale_ttl:
+            _refresh_in_background(key, loader)
+            return entry[1]
+
+    generation = _current_generation()
+    value = loader()
+    if value:
+        _store(key, value, generation)
+    return value
+
+def invalidate(prefix):
+    """Drop every entry whose key starts with prefix, in all page processes"""
+    global _generation
+    with _file_lock():
+        for key in [key for key in _entries if key.startswith(prefix)]:
+            del _entries[key]
+        # Saved even with no matching entry: a load in progress may store one
+        _generation += 1
+        _invalidated[prefix] = _generation
+        _save_to_disk()
@@ -0,0 +1,363 @@
+"""
+Local catalog mirror
+An on-disk SQLite copy of the catalog metadata (no audio) and the current
+user's playlists and favorites. It is synced incrementally by monotonic IDs
+and read locally, so browsing is fast and keeps working while the database
+is unreachable. Every CATALOG_MIRROR_RECONCILE_INTERVAL the whole catalog
+is compared range by range, which picks up edited and deleted rows and any
+row whose ID committed after a higher one was synced.
+"""
+import os
+import threading
+import time
+from config import CATALOG_MIRROR_PATH, CATALOG_MIRROR_RECONCILE_INTERVAL
+from utils.db_utils import connect_db, like_prefix
+from utils.sqlite_backend import connect_sqlite
+
+# Catalog tables pulled incrementally as (table, id column, columns)
+MIRRORED_TABLES = [
+    ("Genres", "genre_id", "genre_id, name"),
+    ("Artists", "artist_id", "artist_id, name, bio, image_url"),
+    ("Albums", "album_id", "album_id, title, artist_id, release_year"),
+    ("Songs", "song_id", "song_id, title, artist_id, album_id, genre_id, duration, file_type, file_size, upload_date"),
+]
+
+SYNC_BATCH_SIZE = 5000
+# IDs below the last synced one that are re-read on every sync, for rows
+# whose transaction committed after a higher ID's (auto-increment order is
+# not commit order)
+SYNC_LOOKBACK_IDS = 200
+# Rows per ID range whose checksums are compared when reconciling; only
+# ranges that differ are read in full
+RECONCILE_CHUNK_SIZE = 1000
+
+MIRROR_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS Genres (
+        genre_id INTEGER PRIMARY KEY,
+        name VARCHAR(50) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Artists (
+        artist_id INTEGER PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        bio TEXT,
+        image_url VARCHAR(255)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Albums (
+        album_id INTEGER PRIMARY KEY,
+        title VARCHAR(100) NOT NULL,
+        artist_id INT,
+        release_year INT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Songs (
+        song_id INTEGER PRIMARY KEY,
+        title VARCHAR(100) NOT NULL,
+        artist_id INT,
+        album_id INT,
+        genre_id INT,
+        duration INT,
+        file_type VARCHAR(10) NOT NULL,
+        file_size INT NOT NULL,
+        upload_date TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Playlists (
+        playlist_id INTEGER PRIMARY KEY,
+        user_id INT NOT NULL,
+        name VARCHAR(100) NOT NULL,
+        description TEXT,
+        created_at TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Playlist_Songs (
+        playlist_id INT NOT NULL,
+        song_id INT NOT NULL,
+        position INT NOT NULL,
+        PRIMARY KEY (playlist_id, song_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS User_Favorites (
+        user_id INT NOT NULL,
+        song_id INT NOT NULL,
+        added_at TIMESTAMP,
+        PRIMARY KEY (user_id, song_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Sync_State (
+        table_name VARCHAR(50) PRIMARY KEY,
+        last_id INT NOT NULL,
+        synced_at REAL,
+        reconciled_at REAL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_mirror_songs_title ON Songs (title COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS idx_mirror_songs_upload ON Songs (upload_date)",
+    "CREATE INDEX IF NOT EXISTS idx_mirror_songs_artist ON Songs (artist_id)",
+    "CREATE INDEX IF NOT EXISTS idx_mirror_artists_name ON Artists (name COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS idx_mirror_playlists_user ON Playlists (user_id)",
+]
+
+_local = threading.local()
+_sync_lock = threading.Lock()
+
+# ------------------- Mirror Connection -------------------
+def connect_mirror():
+    """Get this thread's connection to the local mirror, creating it if needed"""
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        os.makedirs(os.path.dirname(CATALOG_MIRROR_PATH) or ".", exist_ok=True)
+        connection = connect_sqlite(CATALOG_MIRROR_PATH)
+        cursor = connection.cursor()
+        for statement in MIRROR_SCHEMA:
+            cursor.execute(statement)
+        connection.commit()
+        cursor.close()
+        _local.connection = connection
+    return connection
+
+def query_mirror(query, params=()):
+    """Run a read query against the mirror and return rows as dicts"""
+    cursor = connect_mirror().cursor(dictionary=True)
+    try:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+def mirror_has_data():
+    """Whether the mirror has completed at least one sync"""
+    return bool(query_mirror("SELECT 1 FROM Sync_State LIMIT 1"))
+
+# ------------------- Sync -------------------
+def _row_key(row):
+    # The two drivers may return e.g. numbers or dates as different types
+    return tuple(str(value) for value in row)
+
+def _id_range(id_column, after, upper):
+    """WHERE clause and params for the IDs in (after, upper]; no upper bound if upper is None"""
+    if upper is None:
+        return f"{id_column} > %s", (after,)
+    return f"{id_column} > %s AND {id_column} <= %s", (after, upper)
+
+def _range_checksum(cursor, table, columns, where, params):
+    """Row count and XOR of per-row CRC32s, computed by the database (MySQL or the mirror)"""
+    # "col IS NULL" keeps NULL apart from an empty string, which CONCAT_WS would skip
+    values = ", ".join(f"{column}, {column} IS NULL" for column in columns.replace(" ", "").split(","))
+    cursor.execute(f"SELECT COUNT(*), BIT_XOR(CRC32(CONCAT_WS('|', {values}))) FROM {table} WHERE {where}", params)
+    count, checksum = cursor.fetchone()
+    return count, int(checksum or 0)
+
+def _reconcile_table(remote, local, table, id_column, columns, upsert):
+    """Compare the table in keyset-ordered ID ranges, re-reading only the ranges whose checksums differ"""
+    changed_count = 0
+    after = 0
+    while True:
+        # The last ID of the next chunk on the source; the final range is open-ended
+        # so it also covers rows the mirror still has above the source's highest ID
+        remote.execute(
+            f"SELECT {id_column} FROM {table} WHERE {id_column} > %s ORDER BY {id_column} LIMIT 1 OFFSET %s",
+            (after, RECONCILE_CHUNK_SIZE - 1)
+        )
+        row = remote.fetchone()
+        upper = row[0] if row else None
+        where, params = _id_range(id_column, after, upper)
+
+        if _range_checksum(remote, table, columns, where, params) != _range_checksum(local, table, columns, where, params):
+            remote.execute(f"SELECT {columns} FROM {table} WHERE {where}", params)
+            remote_rows = {row[0]: row for row in remote.fetchall()}
+            local.execute(f"SELECT {columns} FROM {table} WHERE {where}", params)
+            local_rows = {row[0]: _row_key(row) for row in local.fetchall()}
+            deleted = [(row_id,) for row_id in local_rows if row_id not in remote_rows]
+            changed = [row for row_id, row in remote_rows.items() if local_rows.get(row_id) != _row_key(row)]
+            local.executemany(f"DELETE FROM {table} WHERE {id_column} = %s", deleted)
+            local.executemany(upsert, changed)
+            changed_count += len(changed)
+
+        if upper is None:
+            return changed_count
+        after = upper
+
+def _sync_table(source, mirror, table, id_column, columns):
+    """Pull rows added since the last sync, then reconcile the whole table periodically"""
+    local = mirror.cursor()
+    local.execute("SELECT last_id, reconciled_at FROM Sync_State WHERE table_name = %s", (table,))
+    state = local.fetchone()
+    last_id, reconciled_at = state if state else (0, 0)
+
+    remote = source.cursor()
+    upsert = f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({', '.join(['%s'] * len(columns.split(',')))})"
+    pulled = 0
+    after = max(last_id - SYNC_LOOKBACK_IDS, 0)
+    while True:
+        remote.execute(
+            f"SELECT {columns} FROM {table} WHERE {id_column} > %s ORDER BY {id_column} LIMIT %s",
+            (after, SYNC_BATCH_SIZE)
+        )
+        rows = remote.fetchall()
+        if not rows:
+            break
+        local.executemany(upsert, rows)
+        after = rows[-1][0]
+        last_id = max(last_id, after)
+        pulled += len(rows)
+        if len(rows) < SYNC_BATCH_SIZE:
+            break
+
+    # Edits, deletions and rows that committed too late for the lookback
+    # are only found by comparing the whole table
+    now = time.time()
+    if now - (reconciled_at or 0) >= CATALOG_MIRROR_RECONCILE_INTERVAL:
+        pulled += _reconcile_table(remote, local, table, id_column, columns, upsert)
+        reconciled_at = now
+
+    local.execute(
+        "INSERT OR REPLACE INTO Sync_State (table_name, last_id, synced_at, reconciled_at) VALUES (%s, %s, %s, %s)",
+        (table, last_id, now, reconciled_at)
+    )
+    remote.close()
+    local.close()
+    return pulled
+
+def _sync_user_data(source, mirror, user_id):
+    """Replace the mirrored playlists and favorites of one user"""
+    remote = source.cursor()
+    local = mirror.cursor()
+
+    remote.execute("SELECT playlist_id, user_id, name, description, created_at FROM Playlists WHERE user_id = %s", (user_id,))
+    playlists = remote.fetchall()
+    remote.execute(
+        """
+        SELECT ps.playlist_id, ps.song_id, ps.position
+        FROM Playlist_Songs ps
+        JOIN Playlists p ON ps.playlist_id = p.playlist_id
+        WHERE p.user_id = %s
+        """,
+        (user_id,)
+    )
+    playlist_songs = remote.fetchall()
+    remote.execute("SELECT user_id, song_id, added_at FROM User_Favorites WHERE user_id = %s", (user_id,))
+    favorites = remote.fetchall()
+
+    local.execute("DELETE FROM Playlist_Songs WHERE playlist_id IN (SELECT playlist_id FROM Playlists WHERE user_id = %s)", (user_id,))
+    local.execute("DELETE FROM Playlists WHERE user_id = %s", (user_id,))
+    local.execute("DELETE FROM User_Favorites WHERE user_id = %s", (user_id,))
+    local.executemany("INSERT INTO Playlists (playlist_id, user_id, name, description, created_at) VALUES (%s, %s, %s, %s, %s)", playlists)
+    local.executemany("INSERT INTO Playlist_Songs (playlist_id, song_id, position) VALUES (%s, %s, %s)", playlist_songs)
+    local.executemany("INSERT INTO User_Favorites (user_id, song_id, added_at) VALUES (%s, %s, %s)", favorites)
+
+    remote.close()
+    local.close()
+
+def sync_catalog(user_id=None):
+    """Bring the mirror up to date; returns the number of catalog rows written, or None if offline"""
+    with _sync_lock:
+        source = connect_db(read_only=True, quiet=True)
+        if not source:
+            return None
+
+        mirror = connect_mirror()
+        try:
+            pulled = 0
+            for table, id_column, columns in MIRRORED_TABLES:
+                pulled += _sync_table(source, mirror, table, id_column, columns)
+            if user_id is not None:
+                _sync_user_data(source, mirror, user_id)
+            mirror.commit()
+            return pulled
+
+        except Exception as e:
+            mirror.rollback()
+            print(f"Error syncing catalog mirror: {e}")
+            return None
+        finally:
+            source.close()
+
+def sync_catalog_async(user_id=None):
+    """Sync the mirror on a background thread"""
+    thread = threading.Thread(target=sync_catalog, args=(user_id,), daemon=True)
+    thread.start()
+    return thread
+
+# ------------------- Local Reads -------------------
+def get_newest_songs(limit=8):
+    """Newest songs, read from the mirror"""
+    return query_mirror(
+        """
+        SELECT s.song_id, s.title, a.name as artist_name, g.name as genre_name,
+               s.file_size, s.file_type, s.duration
+        FROM Songs s
+        LEFT JOIN Artists a ON s.artist_id = a.artist_id
+        LEFT JOIN Genres g ON s.genre_id = g.genre_id
+        ORDER BY s.upload_date DESC, s.song_id DESC
+        LIMIT %s
+        """,
+        (limit,)
+    )
+
+def search_songs(text, limit=20):
+    """Songs whose title or artist name starts with text, read from the mirror"""
+    pattern = like_prefix(text)
+    return query_mirror(
+        """
+        SELECT s.song_id, s.title, a.name as artist_name, g.name as genre_name,
+               s.file_size, s.file_type, s.duration
+        FROM Songs s
+        LEFT JOIN Artists a ON s.artist_id = a.artist_id
+        LEFT JOIN Genres g ON s.genre_id = g.genre_id
+        WHERE s.title LIKE %s ESCAPE '!'
+           OR s.artist_id IN (SELECT artist_id FROM Artists WHERE name LIKE %s ESCAPE '!')
+        ORDER BY s.title COLLATE NOCASE
+        LIMIT %s
+        """,
+        (pattern, pattern, limit)
+    )
+
+def search_by_name_prefix(table, prefix="", after_name=None, limit=50):
+    """Mirror version of catalog_utils.load_by_name_prefix (Artists or Genres)"""
+    id_column = "artist_id" if table == "Artists" else "genre_id"
+    query = f"SELECT {id_column}, name FROM {table} WHERE name LIKE %s ESCAPE '!'"
+    params = [like_prefix(prefix)]
+    if after_name is not None:
+        query += " AND name COLLATE NOCASE > %s"
+        params.append(after_name)
+    query += " ORDER BY name COLLATE NOCASE LIMIT %s"
+    params.append(limit)
+    return query_mirror(query, tuple(params))
+
+def get_user_playlists(user_id):
+    """A user's playlists with song counts, read from the mirror"""
+    return query_mirror(
+        """
+        SELECT p.playlist_id, p.name, p.description, COUNT(ps.song_id) as song_count
+        FROM Playlists p
+        LEFT JOIN Playlist_Songs ps ON p.playlist_id = ps.playlist_id
+        WHERE p.user_id = %s
+        GROUP BY p.playlist_id
+        ORDER BY p.name
+        """,
+        (user_id,)
+    )
+
+def get_user_favorites(user_id):
+    """A user's favorite songs, read from the mirror"""
+    return query_mirror(
+        """
+        SELECT s.song_id, s.title, a.name as artist_name, s.file_size, s.file_type
+        FROM User_Favorites f
+        JOIN Songs s ON f.song_id = s.song_id
+        LEFT JOIN Artists a ON s.artist_id = a.artist_id
+        WHERE f.user_id = %s
+        ORDER BY f.added_at DESC
+        """,
+        (user_id,)
+    )
@@ -0,0 +1,115 @@
+"""
+Catalog lookups
+Indexed prefix search over artists and genres, and artist upserts
+"""
+from config import (DB_BACKEND, PICKER_PAGE_SIZE, CATALOG_CACHE_TTL, CACHE_STALE_TTL,
+                    CATALOG_MIRROR_ENABLED)
+from utils.db_utils import connect_db, like_prefix
+from utils.cache import cached, invalidate
+from utils.change_events import publish
+from utils import catalog_mirror
+
+# Tables searchable by name, with their ID columns
+_NAME_TABLES = {
+    "Artists": "artist_id",
+    "Genres": "genre_id"
+}
+
+def load_by_name_prefix(table, prefix="", after_name=None, limit=PICKER_PAGE_SIZE):
+    """Get one page of rows whose name starts with prefix, ordered by name
+
+    Pages are keyset-paged on the unique name index: pass the last name of
+    the previous page as after_name.
+    """
+    id_column = _NAME_TABLES[table]
+    try:
+        connection = connect_db(read_only=True)
+        if not connection:
+            return []
+
+        cursor = connection.cursor(dictionary=True)
+
+        # Compare and sort case-insensitively, like MySQL's default collation,
+        # so SQLite can walk its NOCASE index
+        collate = " COLLATE NOCASE" if DB_BACKEND == "sqlite" else ""
+
+        query = f"SELECT {id_column}, name FROM {table} WHERE name LIKE %s ESCAPE '!'"
+        params = [like_prefix(prefix)]
+        if after_name is not None:
+            query += f" AND name{collate} > %s"
+            params.append(after_name)
+        query += f" ORDER BY name{collate} LIMIT %s"
+        params.append(limit)
+
+        cursor.execute(query, tuple(params))
+        return cursor.fetchall()
+
+    except Exception as e:
+        print(f"Error searching {table}: {e}")
+        return []
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def search_by_name_prefix(table, prefix="", after_name=None, limit=PICKER_PAGE_SIZE):
+    """Prefix search, read from the local mirror once it has synced
+
+    Without a mirror the unfiltered first page is served from the catalog cache.
+    """
+    if CATALOG_MIRROR_ENABLED and catalog_mirror.mirror_has_data():
+        return catalog_mirror.search_by_name_prefix(table, prefix, after_name, limit)
+    if prefix or after_name is not None:
+        return load_by_name_prefix(table, prefix, after_name, limit)
+    return cached(f"catalog:{table.lower()}:first:{limit}",
+                  lambda: load_by_name_prefix(table, limit=limit),
+                  CATALOG_CACHE_TTL, CACHE_STALE_TTL)
+
+def search_artists(prefix="", after_name=None, limit=PICKER_PAGE_SIZE):
+    """Get a page of artists whose name starts with prefix"""
+    return search_by_name_prefix("Artists", prefix, after_name, limit)
+
+def search_genres(prefix="", after_name=None, limit=PICKER_PAGE_SIZE):
+    """Get a page of genres whose name starts with prefix"""
+    return search_by_name_prefix("Genres", prefix, after_name, limit)
+
+def upsert_artist(name):
+    """Get the ID of the artist with this name, creating the artist if needed"""
+    try:
+        connection = connect_db()
+        if not connection:
+            return None
+
+        cursor = connection.cursor()
+
+        if DB_BACKEND == "sqlite":
+            cursor.execute("INSERT OR IGNORE INTO Artists (name) VALUES (%s)", (name,))
+            created = cursor.rowcount == 1
+            cursor.execute("SELECT artist_id FROM Artists WHERE name = %s COLLATE NOCASE", (name,))
+            artist_id = cursor.fetchone()[0]
+        else:
+            # LAST_INSERT_ID(expr) makes lastrowid the existing ID on a duplicate
+            cursor.execute(
+                "INSERT INTO Artists (name) VALUES (%s) "
+                "ON DUPLICATE KEY UPDATE artist_id = LAST_INSERT_ID(artist_id)",
+                (name,)
+            )
+            # 1 row affected for an insert, 0 for an existing artist
+            created = cursor.rowcount == 1
+            artist_id = cursor.lastrowid
+
+        if created:
+            publish(connection, "artist.created", artist_id)
+        connection.commit()
+        invalidate("catalog:artists")
+        if CATALOG_MIRROR_ENABLED:
+            catalog_mirror.sync_catalog_async()
+        return artist_id
+
+    except Exception as e:
+        print(f"Error adding artist: {e}")
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
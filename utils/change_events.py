@@ -0,0 +1,260 @@
+"""
+Change events
+A lightweight event bus between the page processes, the playback daemon
+and the admin panel. Write paths add a typed event ("song.uploaded",
+"song.played", "artist.created", ...) to the Change_Events outbox table in
+the same transaction as the change, so an event exists exactly when its
+change was committed, from any process or machine.
+
+A ChangeListener polls the table by event_id every CHANGE_POLL_SECONDS,
+drops the cached entries an event makes stale (CACHE_INVALIDATIONS) and
+hands matching events to the page's subscribers on the Tk thread, so a
+page redraws only what changed instead of re-querying on a timer.
+
+Usage: python -m utils.change_events --follow | --prune [--days N]
+"""
+import argparse
+import datetime
+import threading
+import time
+from collections import deque
+from config import CHANGE_POLL_SECONDS, CHANGE_GAP_SECONDS, CHANGE_EVENT_RETENTION_DAYS
+from utils.db_utils import connect_db, DB_ERRORS
+from utils.cache import invalidate
+
+PUBLISH_QUERY = "INSERT INTO Change_Events (event_type, entity_id, user_id) VALUES (%s, %s, %s)"
+# Most events read per poll; the rest are read on the next one
+POLL_BATCH = 500
+# Skipped event_ids tracked at most (a burst of rolled back inserts)
+MAX_GAPS = 1000
+
+# Cache key prefixes made stale by each event type
+CACHE_INVALIDATIONS = {
+    "song.uploaded": ("songs:",),
+    "history.imported": ("songs:",),
+    "artist.created": ("catalog:artists",),
+    "artists.imported": ("catalog:artists",),
+    "features.extracted": ("features:",),
+}
+
+def publish(connection, event_type, entity_id=None, user_id=None):
+    """Add an event to the outbox; it is delivered once the caller commits"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(PUBLISH_QUERY, (event_type, entity_id, user_id))
+    finally:
+        cursor.close()
+
+def latest_event_id():
+    """ID of the newest event, 0 if there is none (None if the database is unavailable)"""
+    try:
+        connection = connect_db(read_only=True, quiet=True)
+        if not connection:
+            return None
+
+        cursor = connection.cursor()
+        cursor.execute("SELECT COALESCE(MAX(event_id), 0) FROM Change_Events")
+        latest = cursor.fetchone()[0]
+        # End the read transaction so the next poll gets a fresh snapshot
+        connection.rollback()
+        return latest
+
+    except DB_ERRORS as e:
+        print(f"Error reading change events: {e}")
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+class ChangeListener:
+    """Polls the outbox on a daemon thread and delivers new events to subscribers
+
+    Events are read in event_id order starting after the newest one when the
+    listener starts. An auto-increment ID is taken at insert time but becomes
+    visible at commit, so a lower ID can appear after a higher one: skipped
+    IDs are re-checked for CHANGE_GAP_SECONDS before they are given up on.
+    """
+
+    def __init__(self, poll_seconds=CHANGE_POLL_SECONDS, invalidate_caches=True):
+        self.poll_seconds = poll_seconds
+        self.invalidate_caches = invalidate_caches
+        self.last_id = None
+        self._gaps = {}  # Skipped event_id -> when it was first missed
+        self._pending = deque()
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, event_types, callback, user_id=None):
+        """Call callback(events) with each batch of new events of these types
+
+        With a user_id, only events about that user (or about no user) are
+        passed on. Callbacks run in dispatch(), so a burst of events (e.g. a
+        bulk import) is one call with all of them.
+        """
+        with self._lock:
+            self._subscribers.append((frozenset(event_types), callback, user_id))
+
+    def poll(self):
+        """Read the events committed since the last poll and queue them; returns them"""
+        if self.last_id is None:
+            self.last_id = latest_event_id()
+            return []
+
+        try:
+            connection = connect_db(read_only=True, quiet=True)
+            if not connection:
+                return []
+
+            cursor = connection.cursor(dictionary=True)
+            now = time.monotonic()
+            self._gaps = {event_id: missed for event_id, missed in self._gaps.items()
+                          if now - missed < CHANGE_GAP_SECONDS}
+            condition, params = "event_id > %s", [self.last_id]
+            if self._gaps:
+                condition += f" OR event_id IN ({', '.join(['%s'] * len(self._gaps))})"
+                params.extend(self._gaps)
+            cursor.execute(
+                f"""
+                SELECT event_id, event_type, entity_id, user_id
+                FROM Change_Events
+                WHERE {condition}
+                ORDER BY event_id
+                LIMIT %s
+                """,
+                params + [POLL_BATCH]
+            )
+            events = cursor.fetchall()
+            # End the read transaction so the next poll gets a fresh snapshot
+            connection.rollback()
+
+        except DB_ERRORS as e:
+            print(f"Error reading change events: {e}")
+            return []
+        finally:
+            if 'connection' in locals() and connection and connection.is_connected():
+                cursor.close()
+                connection.close()
+
+        for event in events:
+            event_id = event["event_id"]
+            if self._gaps.pop(event_id, None) is not None:
+                continue
+            for missing in range(max(self.last_id + 1, event_id - MAX_GAPS), event_id):
+                self._gaps[missing] = now
+            self.last_id = event_id
+        if len(self._gaps) > MAX_GAPS:
+            for event_id in sorted(self._gaps)[:len(self._gaps) - MAX_GAPS]:
+                del self._gaps[event_id]
+
+        if events and self.invalidate_caches:
+            # Changes made by other processes or machines
+            prefixes = {prefix for event in events for prefix in CACHE_INVALIDATIONS.get(event["event_type"], ())}
+            for prefix in prefixes:
+                invalidate(prefix)
+        with self._lock:
+            self._pending.extend(events)
+        return events
+
+    def dispatch(self):
+        """Pass the queued events to their subscribers (call on the thread that owns the UI)"""
+        with self._lock:
+            events = list(self._pending)
+            self._pending.clear()
+            subscribers = list(self._subscribers)
+        if not events:
+            return
+
+        for event_types, callback, user_id in subscribers:
+            matching = [event for event in events
+                        if event["event_type"] in event_types
+                        and (user_id is None or event["user_id"] in (None, user_id))]
+            if matching:
+                try:
+                    callback(matching)
+                except Exception as e:
+                    print(f"Error handling change events: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.poll()
+            self._stop.wait(self.poll_seconds)
+
+    def start(self):
+        """Start polling on a daemon thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def dispatch_every(self, widget, interval_ms=200):
+        """Start polling and dispatch events from the Tk event loop of widget"""
+        self.start()
+
+        def tick():
+            self.dispatch()
+            widget.after(interval_ms, tick)
+
+        widget.after(interval_ms, tick)
+        return self
+
+def prune_change_events(retention_days=CHANGE_EVENT_RETENTION_DAYS):
+    """Delete events older than the retention period; returns how many were deleted"""
+    cutoff_day = datetime.date.today() - datetime.timedelta(days=retention_days)
+    try:
+        connection = connect_db()
+        if not connection:
+            return 0
+
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM Change_Events WHERE created_at < %s", (f"{cutoff_day:%Y-%m-%d} 00:00:00",))
+        connection.commit()
+        return cursor.rowcount
+
+    except DB_ERRORS as e:
+        print(f"Error pruning change events: {e}")
+        return 0
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def format_event(event):
+    """One-line description of a change event"""
+    text = f"#{event['event_id']} {event['event_type']}"
+    if event["entity_id"] is not None:
+        text += f" {event['entity_id']}"
+    if event["user_id"] is not None:
+        text += f" (user {event['user_id']})"
+    return text
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Follow or prune change events")
+    parser.add_argument("--follow", action="store_true", help="print new events as they are committed")
+    parser.add_argument("--prune", action="store_true", help="delete events past retention")
+    parser.add_argument("--days", type=int, default=CHANGE_EVENT_RETENTION_DAYS,
+                        help=f"retention for --prune (default {CHANGE_EVENT_RETENTION_DAYS})")
+    args = parser.parse_args()
+
+    if args.prune:
+        print(f"Deleted {prune_change_events(args.days)} events")
+    elif args.follow:
+        # Only printing: leave this machine's cache alone
+        listener = ChangeListener(invalidate_caches=False)
+        listener.poll()
+        try:
+            while True:
+                for event in listener.poll():
+                    print(format_event(event), flush=True)
+                listener.dispatch()  # Nothing subscribed: just empties the queue
+                time.sleep(listener.poll_seconds)
+        except KeyboardInterrupt:
+            pass
+    else:
+        parser.error("choose --follow or --prune")
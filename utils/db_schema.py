@@ -0,0 +1,338 @@
+"""
+Database schema
+Table definitions shared by the MySQL and SQLite backends
+"""
+import re
+
+# Tables in creation order (MySQL dialect, translated for SQLite on the fly)
+TABLES = [
+    ("Users", """
+    CREATE TABLE IF NOT EXISTS Users (
+        user_id INT AUTO_INCREMENT PRIMARY KEY,
+        first_name VARCHAR(50) NOT NULL,
+        last_name VARCHAR(50) NOT NULL,
+        email VARCHAR(100) NOT NULL UNIQUE,
+        password VARCHAR(64) NOT NULL,
+        is_admin BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """),
+    ("Artists", """
+    CREATE TABLE IF NOT EXISTS Artists (
+        artist_id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        bio TEXT,
+        image_url VARCHAR(255)
+    )
+    """),
+    ("Albums", """
+    CREATE TABLE IF NOT EXISTS Albums (
+        album_id INT AUTO_INCREMENT PRIMARY KEY,
+        title VARCHAR(100) NOT NULL,
+        artist_id INT,
+        release_year INT,
+        cover_art MEDIUMBLOB,
+        FOREIGN KEY (artist_id) REFERENCES Artists(artist_id) ON DELETE SET NULL
+    )
+    """),
+    ("Genres", """
+    CREATE TABLE IF NOT EXISTS Genres (
+        genre_id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(50) NOT NULL UNIQUE
+    )
+    """),
+    ("Songs", """
+    CREATE TABLE IF NOT EXISTS Songs (
+        song_id INT AUTO_INCREMENT PRIMARY KEY,
+        title VARCHAR(100) NOT NULL,
+        artist_id INT,
+        album_id INT,
+        genre_id INT,
+        duration INT,
+        file_data LONGBLOB NOT NULL,
+        file_type VARCHAR(10) NOT NULL,
+        file_size INT NOT NULL,
+        upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (artist_id) REFERENCES Artists(artist_id) ON DELETE SET NULL,
+        FOREIGN KEY (album_id) REFERENCES Albums(album_id) ON DELETE SET NULL,
+        FOREIGN KEY (genre_id) REFERENCES Genres(genre_id) ON DELETE SET NULL
+    )
+    """),
+    ("Playlists", """
+    CREATE TABLE IF NOT EXISTS Playlists (
+        playlist_id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        name VARCHAR(100) NOT NULL,
+        description TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
+    )
+    """),
+    ("Playlist_Songs", """
+    CREATE TABLE IF NOT EXISTS Playlist_Songs (
+        playlist_id INT NOT NULL,
+        song_id INT NOT NULL,
+        position INT NOT NULL,
+        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (playlist_id, song_id),
+        FOREIGN KEY (playlist_id) REFERENCES Playlists(playlist_id) ON DELETE CASCADE,
+        FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
+    )
+    """),
+    ("User_Favorites", """
+    CREATE TABLE IF NOT EXISTS User_Favorites (
+        user_id INT NOT NULL,
+        song_id INT NOT NULL,
+        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, song_id),
+        FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE,
+        FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
+    )
+    """),
+    ("Listening_History", """
+    CREATE TABLE IF NOT EXISTS Listening_History (
+        history_id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        song_id INT NOT NULL,
+        played_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE,
+        FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
+    )
+    """),
+    ("Song_Seek_Index", """
+    CREATE TABLE IF NOT EXISTS Song_Seek_Index (
+        song_id INT PRIMARY KEY,
+        step_ms INT NOT NULL,
+        offsets MEDIUMBLOB NOT NULL,
+        FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
+    )
+    """),
+    # Chunked uploads (utils/song_upload.py): a session per uploaded file;
+    # once finished, song_id is set and the song's audio is its chunks
+    ("Upload_Sessions", """
+    CREATE TABLE IF NOT EXISTS Upload_Sessions (
+        upload_id INT AUTO_INCREMENT PRIMARY KEY,
+        song_id INT UNIQUE,
+        file_path VARCHAR(500) NOT NULL,
+        file_size BIGINT NOT NULL,
+        file_mtime BIGINT NOT NULL,
+        chunk_size INT NOT NULL,
+        sha256 CHAR(64),
+        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
+    )
+    """),
+    ("Upload_Chunks", """
+    CREATE TABLE IF NOT EXISTS Upload_Chunks (
+        upload_id INT NOT NULL,
+        chunk_index INT NOT NULL,
+        data MEDIUMBLOB NOT NULL,
+        PRIMARY KEY (upload_id, chunk_index),
+        FOREIGN KEY (upload_id) REFERENCES Upload_Sessions(upload_id) ON DELETE CASCADE
+    )
+    """),
+    # Rule-based playlists (utils/smart_playlists.py) and their materialized
+    # songs, refreshed from the history/song IDs and favorites seen last
+    ("Smart_Playlists", """
+    CREATE TABLE IF NOT EXISTS Smart_Playlists (
+        smart_playlist_id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        name VARCHAR(100) NOT NULL,
+        rules TEXT NOT NULL,
+        last_history_id BIGINT NOT NULL DEFAULT 0,
+        last_song_id INT NOT NULL DEFAULT 0,
+        favorites_key VARCHAR(64),
+        refreshed_day DATE,
+        refreshed_at DATETIME,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
+    )
+    """),
+    ("Smart_Playlist_Songs", """
+    CREATE TABLE IF NOT EXISTS Smart_Playlist_Songs (
+        smart_playlist_id INT NOT NULL,
+        song_id INT NOT NULL,
+        plays INT NOT NULL,
+        PRIMARY KEY (smart_playlist_id, song_id),
+        FOREIGN KEY (smart_playlist_id) REFERENCES Smart_Playlists(smart_playlist_id) ON DELETE CASCADE,
+        FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
+    )
+    """),
+    # Outbox of change events (utils/change_events.py), written in the same
+    # transaction as the change and read by event_id by open pages
+    ("Change_Events", """
+    CREATE TABLE IF NOT EXISTS Change_Events (
+        event_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        event_type VARCHAR(50) NOT NULL,
+        entity_id INT,
+        user_id INT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """),
+    # Daily play counts rolled up from Listening_History rows past retention
+    ("Song_Daily_Plays", """
+    CREATE TABLE IF NOT EXISTS Song_Daily_Plays (
+        day DATE NOT NULL,
+        song_id INT NOT NULL,
+        plays INT NOT NULL,
+        PRIMARY KEY (day, song_id)
+    )
+    """),
+    ("User_Daily_Plays", """
+    CREATE TABLE IF NOT EXISTS User_Daily_Plays (
+        day DATE NOT NULL,
+        user_id INT NOT NULL,
+        song_id INT NOT NULL,
+        plays INT NOT NULL,
+        PRIMARY KEY (user_id, day, song_id)
+    )
+    """),
+    ("History_Rollup_State", """
+    CREATE TABLE IF NOT EXISTS History_Rollup_State (
+        name VARCHAR(50) PRIMARY KEY,
+        rolled_until DATETIME NOT NULL
+    )
+    """),
+    # Reporting rollups, refreshed incrementally by utils/reports.py
+    ("Report_Hourly_Plays", """
+    CREATE TABLE IF NOT EXISTS Report_Hourly_Plays (
+        hour DATETIME PRIMARY KEY,
+        plays INT NOT NULL
+    )
+    """),
+    ("Report_Daily_Song_Plays", """
+    CREATE TABLE IF NOT EXISTS Report_Daily_Song_Plays (
+        day DATE NOT NULL,
+        song_id INT NOT NULL,
+        plays INT NOT NULL,
+        PRIMARY KEY (day, song_id)
+    )
+    """),
+    ("Report_Daily_Users", """
+    CREATE TABLE IF NOT EXISTS Report_Daily_Users (
+        day DATE NOT NULL,
+        user_id INT NOT NULL,
+        plays INT NOT NULL,
+        PRIMARY KEY (day, user_id)
+    )
+    """),
+    ("Report_Daily_Uploads", """
+    CREATE TABLE IF NOT EXISTS Report_Daily_Uploads (
+        day DATE PRIMARY KEY,
+        uploads INT NOT NULL,
+        bytes BIGINT NOT NULL
+    )
+    """),
+    ("Report_State", """
+    CREATE TABLE IF NOT EXISTS Report_State (
+        name VARCHAR(50) PRIMARY KEY,
+        last_id BIGINT NOT NULL
+    )
+    """),
+    # IDs below a rollup's last_id that were missing when it was aggregated,
+    # re-read in case their transaction commits late
+    ("Report_Gaps", """
+    CREATE TABLE IF NOT EXISTS Report_Gaps (
+        name VARCHAR(50) NOT NULL,
+        id BIGINT NOT NULL,
+        missed_at DOUBLE NOT NULL,
+        PRIMARY KEY (name, id)
+    )
+    """),
+    # Content-based audio features (float32 vector) for similarity
+    ("Song_Features", """
+    CREATE TABLE IF NOT EXISTS Song_Features (
+        song_id INT PRIMARY KEY,
+        version INT NOT NULL,
+        tempo FLOAT,
+        vector BLOB NOT NULL,
+        extracted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
+    )
+    """),
+]
+
+# Secondary indexes as (name, table, columns, unique, sqlite_columns);
+# sqlite_columns overrides columns on SQLite (e.g. to match MySQL's case-insensitive collation)
+INDEXES = [
+    ("idx_artists_name", "Artists", "name", True, "name COLLATE NOCASE"),
+    ("idx_history_played_at", "Listening_History", "played_at", False, None),
+    ("idx_song_daily_plays_song", "Song_Daily_Plays", "song_id", False, None),
+    # Sort keys of the paged listings (the primary key is the implicit tiebreaker)
+    ("idx_users_created", "Users", "created_at", False, None),
+    ("idx_songs_upload_date", "Songs", "upload_date", False, None),
+    ("idx_songs_title", "Songs", "title", False, None),
+    ("idx_history_user_played", "Listening_History", "user_id, played_at", False, None),
+    ("idx_smart_playlists_user", "Smart_Playlists", "user_id", False, None),
+    ("idx_change_events_created", "Change_Events", "created_at", False, None),
+]
+
+# MySQL -> SQLite type and clause rewrites
+_SQLITE_REWRITES = [
+    (re.compile(r"\b(?:BIG)?INT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b", re.I), "INTEGER PRIMARY KEY AUTOINCREMENT"),
+    (re.compile(r"\b(?:TINY|MEDIUM|LONG)BLOB\b", re.I), "BLOB"),
+    (re.compile(r"\bDEFAULT\s+CURRENT_TIMESTAMP\b", re.I), "DEFAULT (datetime('now', 'localtime'))"),
+    (re.compile(r"\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP\b", re.I), ""),
+    (re.compile(r"\)\s*ENGINE\s*=\s*\w+[^;]*$", re.I | re.S), ")"),
+]
+
+def sqlite_ddl(ddl):
+    """Translate a MySQL CREATE TABLE statement into SQLite syntax"""
+    for pattern, replacement in _SQLITE_REWRITES:
+        ddl = pattern.sub(replacement, ddl)
+    return ddl
+
+def create_index(cursor, backend, name, table, columns, unique=False, sqlite_columns=None):
+    """Create an index if it does not exist yet"""
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    if backend == "sqlite":
+        cursor.execute(f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({sqlite_columns or columns})")
+        return
+
+    # MySQL has no CREATE INDEX IF NOT EXISTS
+    cursor.execute(
+        """
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        """,
+        (table, name)
+    )
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"CREATE {kind} {name} ON {table} ({columns})")
+
+def merge_duplicate_artists(cursor, backend):
+    """Merge artists whose names differ only in case into the oldest one; returns how many were merged
+
+    Databases from before idx_artists_name can have them, and the unique
+    index cannot be created until they are gone.
+    """
+    collate = " COLLATE NOCASE" if backend == "sqlite" else ""
+    cursor.execute(
+        f"""
+        SELECT a.artist_id, k.keep_id
+        FROM Artists a
+        JOIN (SELECT MIN(artist_id) AS keep_id, name FROM Artists
+              GROUP BY name{collate} HAVING COUNT(*) > 1) k
+          ON a.name = k.name{collate} AND a.artist_id <> k.keep_id
+        """
+    )
+    duplicates = cursor.fetchall()
+    if duplicates:
+        merges = [(keep_id, artist_id) for artist_id, keep_id in duplicates]
+        cursor.executemany("UPDATE Songs SET artist_id = %s WHERE artist_id = %s", merges)
+        cursor.executemany("UPDATE Albums SET artist_id = %s WHERE artist_id = %s", merges)
+        cursor.executemany("DELETE FROM Artists WHERE artist_id = %s", [(artist_id,) for artist_id, _ in duplicates])
+    return len(duplicates)
+
+def create_tables(cursor, backend, log=print):
+    """Create all tables and indexes for the given backend"""
+    for table, ddl in TABLES:
+        log(f"Creating {table} table...")
+        cursor.execute(sqlite_ddl(ddl) if backend == "sqlite" else ddl)
+
+    # Artist upserts rely on idx_artists_name being unique
+    merged = merge_duplicate_artists(cursor, backend)
+    if merged:
+        log(f"Merged {merged} duplicate artists")
+    for name, table, columns, unique, sqlite_columns in INDEXES:
+        create_index(cursor, backend, name, table, columns, unique, sqlite_columns)
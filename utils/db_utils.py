@@ -1,28 +1,278 @@
 import mysql.connector
+import mysql.connector.pooling
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from tkinter import messagebox
 import hashlib
 import os
-from config import DB_CONFIG
+from config import (DB_CONFIG, DB_BACKEND, SQLITE_PATH, QUERY_METRICS_ENABLED,
+                    DB_POOL_SIZE, USE_PREPARED_STATEMENTS, STATEMENT_CACHE_SIZE,
+                    DB_REPLICAS, REPLICA_MAX_LAG_SECONDS, REPLICA_LAG_CHECK_INTERVAL)
+from utils.sqlite_backend import connect_sqlite
+from utils.query_metrics import instrument, InstrumentedCursor, InstrumentedConnection
 
-def connect_db():
-    """Connect to the MySQL database"""
+# Errors raised by either database backend
+DB_ERRORS = (mysql.connector.Error, sqlite3.Error)
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+# Replica routing state
+_replica_state = {}
+_replica_cursor = 0
+_last_primary_use = 0.0
+
+def _get_pool(name, settings):
+    """Create a named MySQL connection pool on first use"""
+    with _pool_lock:
+        if name not in _pools:
+            # Sessions are not reset on return so prepared statements survive
+            _pools[name] = mysql.connector.pooling.MySQLConnectionPool(
+                pool_name=f"music_{name}",
+                pool_size=DB_POOL_SIZE,
+                pool_reset_session=False,
+                **settings
+            )
+        return _pools[name]
+
+class PooledConnection:
+    """Pooled connection that ends its transaction when returned to the pool
+
+    Sessions are not reset, so without this a connection closed after a
+    read would go back still inside its REPEATABLE READ transaction and the
+    next borrower would read that old snapshot. If the rollback fails
+    (e.g. unread rows), the session is dropped and reopened on next use.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def close(self):
+        raw = self._connection._cnx
+        try:
+            raw.rollback()
+        except mysql.connector.Error:
+            raw.__dict__.pop("_statement_cache", None)
+            try:
+                raw.disconnect()
+            except mysql.connector.Error:
+                pass
+        self._connection.close()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+def _connect_mysql(name="primary", settings=DB_CONFIG):
+    """Get a pooled MySQL connection, or a direct one if the pool is exhausted"""
+    if DB_POOL_SIZE:
+        try:
+            return PooledConnection(_get_pool(name, settings).get_connection())
+        except mysql.connector.errors.PoolError:
+            pass
+    return mysql.connector.connect(**settings)
+
+def _replication_lag(connection):
+    """Seconds a replica is behind its source (0 if it is not replicating)"""
+    cursor = connection.cursor(dictionary=True)
+    try:
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except mysql.connector.Error:
+            # MySQL before 8.0.22
+            cursor.execute("SHOW SLAVE STATUS")
+        status = cursor.fetchone()
+        cursor.fetchall()
+    finally:
+        cursor.close()
+
+    if not status:
+        # Standalone server holding a copy of the data
+        return 0
+    lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+    return float("inf") if lag is None else lag
+
+def _connect_replica():
+    """Connect to the next healthy read replica, or return None"""
+    global _replica_cursor
+    now = time.monotonic()
+
+    for _ in range(len(DB_REPLICAS)):
+        index = _replica_cursor % len(DB_REPLICAS)
+        _replica_cursor += 1
+        state = _replica_state.setdefault(index, {"checked_at": 0.0, "healthy": True})
+
+        # Skip replicas found lagging or down until the next check
+        recently_checked = now - state["checked_at"] < REPLICA_LAG_CHECK_INTERVAL
+        if recently_checked and not state["healthy"]:
+            continue
+
+        connection = None
+        try:
+            connection = _connect_mysql(f"replica{index}", {**DB_CONFIG, **DB_REPLICAS[index]})
+            if not recently_checked:
+                lag = _replication_lag(connection)
+                state["checked_at"] = now
+                state["healthy"] = lag <= REPLICA_MAX_LAG_SECONDS
+                if not state["healthy"]:
+                    print(f"Replica {index} is {lag} seconds behind, skipping it")
+                    connection.close()
+                    continue
+            return connection
+        except mysql.connector.Error as err:
+            print(f"Error connecting to replica {index}: {err}")
+            state["checked_at"] = now
+            state["healthy"] = False
+            if connection is not None:
+                # The lag check failed on an open connection
+                try:
+                    connection.close()
+                except mysql.connector.Error:
+                    pass
+
+    return None
+
+def connect_db(read_only=False, quiet=False):
+    """Connect to the configured database
+
+    Read-only helpers pass read_only=True to be routed to a read replica.
+    Reads shortly after this process used the primary stay on the primary
+    so they see their own writes. Background work passes quiet=True to log
+    connection errors instead of showing a dialog.
+    """
+    global _last_primary_use
+    try:
+        if DB_BACKEND == "sqlite":
+            connection = connect_sqlite(SQLITE_PATH)
+        else:
+            connection = None
+            recent_write = time.monotonic() - _last_primary_use < REPLICA_MAX_LAG_SECONDS
+            if read_only and DB_REPLICAS and not recent_write:
+                connection = _connect_replica()
+            if connection is None:
+                connection = _connect_mysql()
+                if not read_only:
+                    _last_primary_use = time.monotonic()
+
+        # Record per-statement latency, rows and bytes
+        if QUERY_METRICS_ENABLED:
+            connection = instrument(connection)
+        return connection
+    except DB_ERRORS as err:
+        if quiet:
+            print(f"Error connecting to database: {err}")
+        else:
+            messagebox.showerror("Database Connection Error",
+                                f"Failed to connect to database: {err}")
+        return None
+
+def connect_db_server():
+    """Connect to the database server without selecting a database"""
     try:
+        if DB_BACKEND == "sqlite":
+            # The database file is created on first connect
+            return connect_sqlite(SQLITE_PATH)
+
         connection = mysql.connector.connect(
             host=DB_CONFIG["host"],
             user=DB_CONFIG["user"],
-            password=DB_CONFIG["password"],
-            database=DB_CONFIG["database"]
+            password=DB_CONFIG["password"]
         )
         return connection
-    except mysql.connector.Error as err:
-        messagebox.showerror("Database Connection Error", 
-                            f"Failed to connect to database: {err}")
+    except DB_ERRORS as err:
+        print(f"Error connecting to database server: {err}")
         return None
 
+class CachedStatementCursor:
+    """Prepared cursor that stays open in its connection's statement cache"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def close(self):
+        # Drain unread rows so the next execute can reuse the statement
+        try:
+            self._cursor.fetchall()
+        except Exception:
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+def _physical_connection(connection):
+    """Unwrap instrumentation and pooling to reach the underlying connection"""
+    if isinstance(connection, InstrumentedConnection):
+        connection = connection._connection
+    return getattr(connection, "_cnx", connection)
+
+def prepared_cursor(connection, query, dictionary=False):
+    """Get a cursor that runs a hot query as a server-side prepared statement
+
+    Prepared cursors are cached per physical connection, so with pooling the
+    statement is parsed once per session instead of once per call.
+    """
+    if DB_BACKEND == "sqlite" or not USE_PREPARED_STATEMENTS:
+        # sqlite3 keeps its own compiled statement cache
+        return connection.cursor(dictionary=dictionary)
+
+    raw = _physical_connection(connection)
+    cache = getattr(raw, "_statement_cache", None)
+    if cache is None:
+        cache = raw._statement_cache = OrderedDict()
+
+    key = (query, dictionary)
+    cursor = cache.get(key)
+    if cursor is None:
+        if dictionary:
+            cursor = raw.cursor(prepared=True, dictionary=True)
+        else:
+            cursor = raw.cursor(prepared=True)
+        cache[key] = cursor
+
+        # Deallocate the least recently used statement
+        if len(cache) > STATEMENT_CACHE_SIZE:
+            _, evicted = cache.popitem(last=False)
+            evicted.close()
+    else:
+        cache.move_to_end(key)
+
+    cursor = CachedStatementCursor(cursor)
+    if QUERY_METRICS_ENABLED:
+        cursor = InstrumentedCursor(cursor)
+    return cursor
+
+def like_prefix(prefix):
+    """Build a LIKE pattern matching values that start with prefix (use ESCAPE '!')"""
+    escaped = prefix.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+    return f"{escaped}%"
+
 def hash_password(password):
     """Hash password using SHA-256"""
     return hashlib.sha256(password.encode()).hexdigest()
 
+def get_user(user_id):
+    """Get a user's information by ID"""
+    try:
+        connection = connect_db(read_only=True)
+        if not connection:
+            return None
+
+        query = "SELECT user_id, first_name, last_name, email, is_admin FROM Users WHERE user_id = %s"
+        cursor = prepared_cursor(connection, query, dictionary=True)
+        cursor.execute(query, (user_id,))
+
+        user = cursor.fetchone()
+        return user
+
+    except Exception as e:
+        print(f"Error getting user: {e}")
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
 def get_current_user():
     """Get the current logged-in user information"""
     try:
@@ -30,31 +280,16 @@ def get_current_user():
         if not os.path.exists("current_user.txt"):
             messagebox.showerror("Error", "You are not logged in!")
             return None
-            
+
         with open("current_user.txt", "r") as f:
             user_id = f.read().strip()
-            
+
         if not user_id:
             messagebox.showerror("Error", "User ID not found!")
             return None
-            
-        connection = connect_db()
-        if not connection:
-            return None
-            
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT user_id, first_name, last_name, email, is_admin FROM Users WHERE user_id = %s",
-            (user_id,)
-        )
-        
-        user = cursor.fetchone()
-        return user
-        
+
+        return get_user(user_id)
+
     except Exception as e:
         print(f"Error getting current user: {e}")
         return None
-    finally:
-        if 'connection' in locals() and connection and connection.is_connected():
-            cursor.close()
-            connection.close()
\ No newline at end of file
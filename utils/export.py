@@ -0,0 +1,204 @@
+"""
+Data export
+Streams listening history and catalog tables to CSV or Parquet. Rows are
+read from an unbuffered cursor in fetchmany batches and written as they
+arrive, so memory use is bounded by the batch size, not the table size.
+
+Parquet output needs pyarrow (optional); CSV works everywhere.
+
+Usage: python -m utils.export <dataset> <output file> [--format csv|parquet] [--batch-size N]
+"""
+import argparse
+import csv
+import os
+import time
+from config import DB_BACKEND, EXPORT_BATCH_SIZE
+from utils.db_utils import connect_db, DB_ERRORS
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet export is unavailable
+    pyarrow = None
+
+# Exportable datasets as name -> (query, [(column, type)]); types are
+# "int", "string" or "timestamp"
+DATASETS = {
+    "history": (
+        """
+        SELECT history_id, user_id, song_id, played_at
+        FROM Listening_History
+        ORDER BY history_id
+        """,
+        [("history_id", "int"), ("user_id", "int"), ("song_id", "int"), ("played_at", "timestamp")]
+    ),
+    "daily_song_plays": (
+        """
+        SELECT CAST(day AS CHAR) AS day, song_id, plays
+        FROM Song_Daily_Plays
+        ORDER BY day, song_id
+        """,
+        [("day", "string"), ("song_id", "int"), ("plays", "int")]
+    ),
+    "songs": (
+        """
+        SELECT s.song_id, s.title, a.name AS artist_name, al.title AS album_title,
+               g.name AS genre_name, s.duration, s.file_type, s.file_size, s.upload_date
+        FROM Songs s
+        LEFT JOIN Artists a ON s.artist_id = a.artist_id
+        LEFT JOIN Albums al ON s.album_id = al.album_id
+        LEFT JOIN Genres g ON s.genre_id = g.genre_id
+        ORDER BY s.song_id
+        """,
+        [("song_id", "int"), ("title", "string"), ("artist_name", "string"), ("album_title", "string"),
+         ("genre_name", "string"), ("duration", "int"), ("file_type", "string"), ("file_size", "int"),
+         ("upload_date", "timestamp")]
+    ),
+    "artists": (
+        "SELECT artist_id, name, bio, image_url FROM Artists ORDER BY artist_id",
+        [("artist_id", "int"), ("name", "string"), ("bio", "string"), ("image_url", "string")]
+    ),
+    "genres": (
+        "SELECT genre_id, name FROM Genres ORDER BY genre_id",
+        [("genre_id", "int"), ("name", "string")]
+    ),
+}
+
+FORMATS = ("csv", "parquet")
+
+def available_formats():
+    """Export formats usable with the installed packages"""
+    return FORMATS if pyarrow is not None else ("csv",)
+
+# ------------------- Writers -------------------
+class CSVExportWriter:
+    """Writes batches of rows to a CSV file with a header row"""
+
+    def __init__(self, path, columns):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([name for name, _ in columns])
+
+    def write_batch(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+class ParquetExportWriter:
+    """Writes batches of rows to a Parquet file, one row group per batch"""
+
+    _TYPES = {
+        "int": lambda: pyarrow.int64(),
+        "string": lambda: pyarrow.string(),
+        "timestamp": lambda: pyarrow.timestamp("s"),
+    }
+
+    def __init__(self, path, columns):
+        if pyarrow is None:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+        self._schema = pyarrow.schema([(name, self._TYPES[kind]()) for name, kind in columns])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema, compression="snappy")
+
+    def write_batch(self, rows):
+        columns = list(zip(*rows))
+        table = pyarrow.Table.from_arrays(
+            [pyarrow.array(values, type=field.type) for values, field in zip(columns, self._schema)],
+            schema=self._schema
+        )
+        self._writer.write_table(table)
+
+    def close(self):
+        self._writer.close()
+
+# ------------------- Export -------------------
+def export_dataset(dataset, path, file_format="csv", batch_size=EXPORT_BATCH_SIZE, on_progress=None):
+    """Stream a dataset to a file
+
+    on_progress is called after every batch with a dict of rows, bytes
+    (written so far), seconds and rows_per_second. Returns the final
+    progress dict, or None if the export failed.
+    """
+    query, columns = DATASETS[dataset]
+    writer_class = ParquetExportWriter if file_format == "parquet" else CSVExportWriter
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    part_path = f"{path}.part"
+    started = time.perf_counter()
+    progress = {"rows": 0, "bytes": 0, "seconds": 0.0, "rows_per_second": 0.0}
+
+    try:
+        connection = connect_db(read_only=True)
+        if not connection:
+            return None
+
+        # Unbuffered: the server streams rows as fetchmany asks for them
+        cursor = connection.cursor(buffered=False)
+        if DB_BACKEND != "sqlite":
+            # Give a slow writer time to keep up without the server dropping the stream
+            cursor.execute("SET SESSION net_write_timeout = 3600")
+        cursor.execute(query)
+
+        writer = writer_class(part_path, columns)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                writer.write_batch(rows)
+
+                elapsed = time.perf_counter() - started
+                progress["rows"] += len(rows)
+                progress["bytes"] = os.path.getsize(part_path)
+                progress["seconds"] = elapsed
+                progress["rows_per_second"] = progress["rows"] / elapsed if elapsed else 0.0
+                if on_progress:
+                    on_progress(dict(progress))
+        finally:
+            writer.close()
+
+        os.replace(part_path, path)
+        progress["bytes"] = os.path.getsize(path)
+        progress["seconds"] = time.perf_counter() - started
+        return progress
+
+    except DB_ERRORS + (OSError, ValueError, RuntimeError) as e:
+        print(f"Error exporting {dataset}: {e}")
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            if DB_BACKEND != "sqlite":
+                # Pooled sessions are reused: put the timeout back
+                try:
+                    cursor.execute("SET SESSION net_write_timeout = DEFAULT")
+                except DB_ERRORS:
+                    pass
+            cursor.close()
+            connection.close()
+
+def format_progress(progress):
+    """One-line summary of export progress"""
+    megabytes = progress["bytes"] / (1024 * 1024)
+    seconds = progress["seconds"] or 1e-9
+    return (f"{progress['rows']:,} rows • {megabytes:.1f} MB • "
+            f"{progress['rows'] / seconds:,.0f} rows/s • {megabytes / seconds:.1f} MB/s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export listening history or catalog data")
+    parser.add_argument("dataset", choices=sorted(DATASETS))
+    parser.add_argument("output")
+    parser.add_argument("--format", choices=FORMATS,
+                        help="default: from the output file extension, else csv")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    file_format = args.format or ("parquet" if args.output.endswith(".parquet") else "csv")
+    result = export_dataset(args.dataset, args.output, file_format, args.batch_size,
+                            on_progress=lambda p: print(f"\r{format_progress(p)}", end="", flush=True))
+    print()
+    if result is None:
+        print("Export failed.")
+    else:
+        print(f"Exported to {args.output}: {format_progress(result)}")
@@ -0,0 +1,277 @@
+"""
+Listening history retention
+Raw plays are kept for HISTORY_RETENTION_DAYS and then rolled up into daily
+per-song and per-user counts. On MySQL, Listening_History is range
+partitioned by month on played_at so rolled-up months are dropped whole;
+on SQLite the rolled-up rows are deleted.
+
+Play counts must combine both sources, so queries use the *_PLAYS_SQL
+derived tables below with the rollup watermark from get_history_watermark.
+
+Usage: python -m utils.history_retention [--days N]   (run daily, e.g. from cron)
+"""
+import argparse
+import datetime
+import time
+from collections import Counter
+from config import DB_BACKEND, HISTORY_RETENTION_DAYS, HISTORY_PARTITION_MONTHS_AHEAD
+from utils.db_utils import connect_db, DB_ERRORS
+
+# Raw plays before this point have been rolled up (nothing rolled up yet)
+EPOCH = "1970-01-01 00:00:00"
+
+# Plays per song: raw plays after the watermark plus the daily rollups
+# Parameters: (watermark,)
+SONG_PLAYS_SQL = """
+    SELECT song_id, SUM(plays) AS plays FROM (
+        SELECT song_id, COUNT(*) AS plays FROM Listening_History
+        WHERE played_at >= %s GROUP BY song_id
+        UNION ALL
+        SELECT song_id, SUM(plays) AS plays FROM Song_Daily_Plays GROUP BY song_id
+    ) combined_plays GROUP BY song_id
+"""
+
+# Plays per song by one user. Parameters: (user_id, watermark, user_id)
+USER_SONG_PLAYS_SQL = """
+    SELECT song_id, SUM(plays) AS plays FROM (
+        SELECT song_id, COUNT(*) AS plays FROM Listening_History
+        WHERE user_id = %s AND played_at >= %s GROUP BY song_id
+        UNION ALL
+        SELECT song_id, SUM(plays) AS plays FROM User_Daily_Plays
+        WHERE user_id = %s GROUP BY song_id
+    ) combined_plays GROUP BY song_id
+"""
+
+# Total plays. Parameters: (watermark,)
+TOTAL_PLAYS_SQL = """
+    SELECT (SELECT COUNT(*) FROM Listening_History WHERE played_at >= %s)
+         + (SELECT COALESCE(SUM(plays), 0) FROM Song_Daily_Plays)
+"""
+
+def get_history_watermark(connection):
+    """Get the time before which raw plays have been rolled up, as a string"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT rolled_until FROM History_Rollup_State WHERE name = %s", ("daily",))
+        row = cursor.fetchone()
+        return str(row[0]) if row else EPOCH
+    finally:
+        cursor.close()
+
+# ------------------- MySQL Partitions -------------------
+def _add_months(day, months):
+    """First day of the month months after day's month"""
+    month = day.month - 1 + months
+    return datetime.date(day.year + month // 12, month % 12 + 1, 1)
+
+def _partition_clause(first_month, last_month):
+    """Monthly partitions from first_month to last_month, then a catch-all"""
+    partitions = []
+    month = first_month
+    while month <= last_month:
+        bound = _add_months(month, 1)
+        partitions.append(
+            f"PARTITION p{month:%Y%m} VALUES LESS THAN (UNIX_TIMESTAMP('{bound:%Y-%m-%d}'))"
+        )
+        month = bound
+    partitions.append("PARTITION p_future VALUES LESS THAN MAXVALUE")
+    return ", ".join(partitions)
+
+def get_partitions(cursor):
+    """Monthly partitions of Listening_History as [(name, upper bound unix time)]"""
+    cursor.execute(
+        """
+        SELECT partition_name, partition_description FROM information_schema.partitions
+        WHERE table_schema = DATABASE() AND table_name = 'Listening_History'
+          AND partition_name IS NOT NULL
+        ORDER BY partition_ordinal_position
+        """
+    )
+    return [(name, int(bound)) for name, bound in cursor.fetchall() if bound != "MAXVALUE"]
+
+def partition_listening_history(cursor, months_ahead=HISTORY_PARTITION_MONTHS_AHEAD):
+    """Partition Listening_History by month (MySQL), or add upcoming months
+
+    Partitioned InnoDB tables cannot have foreign keys and every unique key
+    must include the partitioning column, so the foreign keys are dropped
+    and the primary key becomes (history_id, played_at). The first run
+    rebuilds the table.
+    """
+    cursor.execute(
+        """
+        SELECT COUNT(*) FROM information_schema.partitions
+        WHERE table_schema = DATABASE() AND table_name = 'Listening_History'
+          AND partition_name IS NOT NULL
+        """
+    )
+    last_month = _add_months(datetime.date.today(), months_ahead)
+
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(
+            """
+            SELECT constraint_name FROM information_schema.referential_constraints
+            WHERE constraint_schema = DATABASE() AND table_name = 'Listening_History'
+            """
+        )
+        for (constraint,) in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE Listening_History DROP FOREIGN KEY {constraint}")
+
+        cursor.execute(
+            """
+            ALTER TABLE Listening_History
+                MODIFY played_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                DROP PRIMARY KEY,
+                ADD PRIMARY KEY (history_id, played_at)
+            """
+        )
+
+        cursor.execute("SELECT MIN(played_at) FROM Listening_History")
+        oldest = cursor.fetchone()[0]
+        first_month = _add_months(oldest.date() if oldest else datetime.date.today(), 0)
+        cursor.execute(
+            "ALTER TABLE Listening_History PARTITION BY RANGE (UNIX_TIMESTAMP(played_at)) "
+            f"({_partition_clause(first_month, last_month)})"
+        )
+        return
+
+    # Split upcoming months out of the catch-all partition
+    partitions = get_partitions(cursor)
+    if partitions:
+        cursor.execute("SELECT FROM_UNIXTIME(%s)", (partitions[-1][1],))
+        next_month = cursor.fetchone()[0].date()
+    else:
+        next_month = datetime.date.today().replace(day=1)
+    if next_month <= last_month:
+        cursor.execute(
+            "ALTER TABLE Listening_History REORGANIZE PARTITION p_future INTO "
+            f"({_partition_clause(next_month, last_month)})"
+        )
+
+def drop_rolled_up_partitions(cursor, watermark):
+    """Drop the monthly partitions that hold only rolled-up plays (MySQL)"""
+    cursor.execute("SELECT UNIX_TIMESTAMP(%s)", (watermark,))
+    rolled_until = cursor.fetchone()[0]
+
+    dropped = [name for name, bound in get_partitions(cursor) if bound <= rolled_until]
+    if dropped:
+        cursor.execute(f"ALTER TABLE Listening_History DROP PARTITION {', '.join(dropped)}")
+    return dropped
+
+# ------------------- Rollup Job -------------------
+def _upsert_plays(key_columns):
+    """Upsert clause adding to existing daily counts"""
+    if DB_BACKEND == "sqlite":
+        return f"ON CONFLICT ({key_columns}) DO UPDATE SET plays = plays + excluded.plays"
+    return "ON DUPLICATE KEY UPDATE plays = plays + VALUES(plays)"
+
+def add_rolled_up_plays(cursor, plays):
+    """Add plays dated before the watermark straight to the daily tables
+
+    plays are (user_id, song_id, played_at) rows with played_at as
+    'YYYY-MM-DD HH:MM:SS'. As raw rows they would be neither counted nor
+    rolled up, and the next rollup would delete them. The caller commits.
+    """
+    song_days = Counter((played_at[:10], song_id) for _, song_id, played_at in plays)
+    user_days = Counter((played_at[:10], user_id, song_id) for user_id, song_id, played_at in plays)
+    cursor.executemany(
+        f"INSERT INTO Song_Daily_Plays (day, song_id, plays) VALUES (%s, %s, %s) {_upsert_plays('day, song_id')}",
+        [(day, song_id, count) for (day, song_id), count in song_days.items()]
+    )
+    cursor.executemany(
+        f"INSERT INTO User_Daily_Plays (day, user_id, song_id, plays) VALUES (%s, %s, %s, %s) "
+        f"{_upsert_plays('user_id, day, song_id')}",
+        [(day, user_id, song_id, count) for (day, user_id, song_id), count in user_days.items()]
+    )
+
+def roll_up_history(retention_days=HISTORY_RETENTION_DAYS):
+    """Roll raw plays older than retention_days into the daily tables
+
+    Whole days are rolled up from the watermark to midnight retention_days
+    ago, in one transaction with the watermark update, so a run can be
+    repeated or interrupted safely. Returns a summary dict.
+    """
+    cutoff_day = datetime.date.today() - datetime.timedelta(days=retention_days)
+    cutoff = f"{cutoff_day:%Y-%m-%d} 00:00:00"
+    summary = {"rolled_rows": 0, "deleted_rows": 0, "dropped_partitions": []}
+
+    try:
+        connection = connect_db()
+        if not connection:
+            return None
+
+        cursor = connection.cursor()
+        watermark = get_history_watermark(connection)
+
+        if watermark < cutoff:
+            cursor.execute(
+                "SELECT COUNT(*) FROM Listening_History WHERE played_at >= %s AND played_at < %s",
+                (watermark, cutoff)
+            )
+            summary["rolled_rows"] = cursor.fetchone()[0]
+
+            cursor.execute(
+                f"""
+                INSERT INTO Song_Daily_Plays (day, song_id, plays)
+                SELECT DATE(played_at), song_id, COUNT(*) FROM Listening_History
+                WHERE played_at >= %s AND played_at < %s
+                GROUP BY DATE(played_at), song_id
+                {_upsert_plays("day, song_id")}
+                """,
+                (watermark, cutoff)
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO User_Daily_Plays (day, user_id, song_id, plays)
+                SELECT DATE(played_at), user_id, song_id, COUNT(*) FROM Listening_History
+                WHERE played_at >= %s AND played_at < %s
+                GROUP BY DATE(played_at), user_id, song_id
+                {_upsert_plays("user_id, day, song_id")}
+                """,
+                (watermark, cutoff)
+            )
+
+            if DB_BACKEND == "sqlite":
+                cursor.execute("INSERT OR REPLACE INTO History_Rollup_State (name, rolled_until) VALUES (%s, %s)",
+                               ("daily", cutoff))
+                cursor.execute("DELETE FROM Listening_History WHERE played_at < %s", (cutoff,))
+                summary["deleted_rows"] = cursor.rowcount
+            else:
+                cursor.execute(
+                    "INSERT INTO History_Rollup_State (name, rolled_until) VALUES (%s, %s) "
+                    "ON DUPLICATE KEY UPDATE rolled_until = VALUES(rolled_until)",
+                    ("daily", cutoff)
+                )
+            connection.commit()
+            watermark = cutoff
+
+        # Partition DDL commits implicitly, so it runs after the rollup
+        if DB_BACKEND != "sqlite":
+            summary["dropped_partitions"] = drop_rolled_up_partitions(cursor, watermark)
+            partition_listening_history(cursor)
+
+        return summary
+
+    except DB_ERRORS as e:
+        print(f"Error rolling up listening history: {e}")
+        if 'connection' in locals() and connection:
+            connection.rollback()
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Roll up and expire old listening history")
+    parser.add_argument("--days", type=int, default=HISTORY_RETENTION_DAYS,
+                        help="keep raw plays for this many days")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = roll_up_history(args.days)
+    if summary is None:
+        print("Rollup failed.")
+    else:
+        print(f"Rolled up {summary['rolled_rows']} plays, deleted {summary['deleted_rows']} rows, "
+              f"dropped partitions: {', '.join(summary['dropped_partitions']) or 'none'} "
+              f"({time.perf_counter() - start:.1f}s)")
@@ -0,0 +1,185 @@
+"""
+Keyset pagination
+Pages through a listing by remembering the sort key of the last row shown
+and asking for rows after it ("seek" paging), instead of LIMIT/OFFSET.
+With an index on the sort key every page is one index range scan, so page
+1000 costs the same as page 1. The next page is prefetched on a background
+thread while the current one is displayed.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from config import LIST_PAGE_SIZE
+from utils.db_utils import connect_db, like_prefix, DB_ERRORS
+
+_prefetcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="page-prefetch")
+
+class KeysetPager:
+    """Pages through a query in the order of its sort keys
+
+    keys is a list of (SQL expression, result column) pairs that together
+    are unique and NOT NULL, normally ending with the primary key, e.g.
+    [("s.upload_date", "upload_date"), ("s.song_id", "song_id")]. All keys
+    sort in the same direction. select is the query up to (not including)
+    WHERE; filters go in where with their params.
+    """
+
+    def __init__(self, select, keys, where=None, params=(), descending=False, page_size=LIST_PAGE_SIZE):
+        self.select = select
+        self.keys = keys
+        self.where = where
+        self.params = tuple(params)
+        self.descending = descending
+        self.page_size = page_size
+
+        self.rows = []
+        self.page_number = 1
+        self.has_next = False
+        self._page_starts = [None]  # Key of the row before each visited page
+        self._prefetched = None     # (after key, future) for the next page
+
+    def _query(self, after):
+        """SQL and params for the page after the given key (None for the first page)"""
+        conditions = [f"({self.where})"] if self.where else []
+        params = list(self.params)
+
+        if after is not None:
+            # (k1, k2) > (v1, v2) spelled out as k1 > v1 OR (k1 = v1 AND k2 > v2),
+            # led by the redundant k1 >= v1 that lets both backends start an
+            # index range scan at the key instead of filtering from the start
+            op = "<" if self.descending else ">"
+            conditions.append(f"{self.keys[0][0]} {op}= %s")
+            params.append(after[0])
+            alternatives = []
+            for i, (expression, _) in enumerate(self.keys):
+                terms = [f"{earlier} = %s" for earlier, _ in self.keys[:i]] + [f"{expression} {op} %s"]
+                alternatives.append(f"({' AND '.join(terms)})")
+                params.extend(after[:i + 1])
+            conditions.append(f"({' OR '.join(alternatives)})")
+
+        direction = "DESC" if self.descending else "ASC"
+        query = self.select
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY " + ", ".join(f"{expression} {direction}" for expression, _ in self.keys)
+        query += " LIMIT %s"
+        # One extra row tells whether there is a next page
+        params.append(self.page_size + 1)
+        return query, tuple(params)
+
+    def fetch(self, after=None):
+        """Rows of the page after a key (page_size + 1 rows when there is a next page)"""
+        try:
+            connection = connect_db(read_only=True)
+            if not connection:
+                return []
+
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute(*self._query(after))
+            return cursor.fetchall()
+
+        except DB_ERRORS as e:
+            print(f"Error fetching page: {e}")
+            return []
+        finally:
+            if 'connection' in locals() and connection and connection.is_connected():
+                cursor.close()
+                connection.close()
+
+    def _key(self, row):
+        return tuple(row[column] for _, column in self.keys)
+
+    def _load(self, after):
+        """Show the page after a key, using the prefetched rows when they match"""
+        if self._prefetched and self._prefetched[0] == after:
+            rows = self._prefetched[1].result()
+        else:
+            rows = self.fetch(after)
+
+        self.has_next = len(rows) > self.page_size
+        self.rows = rows[:self.page_size]
+        self._prefetched = None
+        if self.has_next:
+            next_after = self._key(self.rows[-1])
+            self._prefetched = (next_after, _prefetcher.submit(self.fetch, next_after))
+        return self.rows
+
+    def first_page(self):
+        """Load the first page"""
+        self._page_starts = [None]
+        self.page_number = 1
+        return self._load(None)
+
+    def next_page(self):
+        """Load the next page (the current rows if this is the last page)"""
+        if not self.has_next:
+            return self.rows
+        del self._page_starts[self.page_number:]
+        self._page_starts.append(self._key(self.rows[-1]))
+        self.page_number += 1
+        return self._load(self._page_starts[-1])
+
+    def previous_page(self):
+        """Load the previous page (the current rows if this is the first page)"""
+        if self.page_number == 1:
+            return self.rows
+        self.page_number -= 1
+        return self._load(self._page_starts[self.page_number - 1])
+
+# ------------------- Listings -------------------
+USER_SORTS = {
+    "Newest": ([("u.created_at", "created_at"), ("u.user_id", "user_id")], True),
+    "Email": ([("u.email", "email"), ("u.user_id", "user_id")], False),
+}
+
+SONG_SORTS = {
+    "Newest": ([("s.upload_date", "upload_date"), ("s.song_id", "song_id")], True),
+    "Title": ([("s.title", "title"), ("s.song_id", "song_id")], False),
+}
+
+def users_pager(sort="Newest", email_prefix="", page_size=LIST_PAGE_SIZE):
+    """Pager over users, optionally only those whose email starts with a prefix"""
+    keys, descending = USER_SORTS[sort]
+    return KeysetPager(
+        """
+        SELECT u.user_id, u.first_name, u.last_name, u.email, u.created_at
+        FROM Users u
+        """,
+        keys,
+        where="u.email LIKE %s ESCAPE '!'" if email_prefix else None,
+        params=(like_prefix(email_prefix),) if email_prefix else (),
+        descending=descending,
+        page_size=page_size
+    )
+
+def songs_pager(sort="Newest", title_prefix="", page_size=LIST_PAGE_SIZE):
+    """Pager over songs, optionally only those whose title starts with a prefix"""
+    keys, descending = SONG_SORTS[sort]
+    return KeysetPager(
+        """
+        SELECT s.song_id, s.title, a.name AS artist_name, g.name AS genre_name,
+               s.file_size, s.file_type, s.duration, s.upload_date
+        FROM Songs s
+        LEFT JOIN Artists a ON s.artist_id = a.artist_id
+        LEFT JOIN Genres g ON s.genre_id = g.genre_id
+        """,
+        keys,
+        where="s.title LIKE %s ESCAPE '!'" if title_prefix else None,
+        params=(like_prefix(title_prefix),) if title_prefix else (),
+        descending=descending,
+        page_size=page_size
+    )
+
+def history_pager(user_id, page_size=LIST_PAGE_SIZE):
+    """Pager over a user's raw listening history, newest first"""
+    return KeysetPager(
+        """
+        SELECT lh.history_id, lh.played_at, s.song_id, s.title, a.name AS artist_name
+        FROM Listening_History lh
+        JOIN Songs s ON lh.song_id = s.song_id
+        LEFT JOIN Artists a ON s.artist_id = a.artist_id
+        """,
+        [("lh.played_at", "played_at"), ("lh.history_id", "history_id")],
+        where="lh.user_id = %s",
+        params=(user_id,),
+        descending=True,
+        page_size=page_size
+    )
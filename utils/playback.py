@@ -0,0 +1,144 @@
+"""
+Playback
+The player behind the pages' play controls: the current song, pause and
+seek state, and a play queue, on top of a pygame mixer.
+
+With PLAYBACK_SOCKET set, pages get a client for the playback daemon
+(playback_daemon.py), which runs a LocalPlayer for all of them, so music
+and queue survive navigating between pages. Otherwise each page plays in
+its own process as before.
+"""
+import socket
+import threading
+from collections import deque
+from config import PLAYBACK_SOCKET
+from utils.audio_utils import mixer, start_song, seek_song, get_play_position, record_listening_history
+
+class PlaybackError(Exception):
+    """A playback command failed"""
+
+def idle_status(queue=()):
+    """Status when no song is loaded"""
+    return {
+        "id": None,
+        "title": "No song playing",
+        "artist": "",
+        "playing": False,
+        "paused": False,
+        "position": 0,
+        "queue": list(queue)
+    }
+
+class LocalPlayer:
+    """Plays songs on a mixer in this process, with a play queue
+
+    Every command returns the player status: the current song's state as
+    returned by start_song plus its "position" in seconds and the queued
+    song IDs under "queue". A player in a process without a UI passes
+    quiet=True so database errors are logged instead of shown in a dialog.
+    """
+
+    def __init__(self, mixer=mixer, quiet=False):
+        self.mixer = mixer
+        self.quiet = quiet
+        self.song = None
+        self.queue = deque()  # (song_id, user_id) to play next
+        self._lock = threading.RLock()
+
+    def status(self):
+        with self._lock:
+            queue = [song_id for song_id, _ in self.queue]
+            if self.song is None:
+                return idle_status(queue)
+            return {**self.song, "position": get_play_position(self.song, self.mixer), "queue": queue}
+
+    def play(self, song_id, user_id=None):
+        """Play a song now; plays are recorded in user_id's listening history"""
+        with self._lock:
+            try:
+                song = start_song(song_id, self.mixer, self.quiet)
+            except Exception as e:
+                raise PlaybackError(f"Could not play song: {e}")
+            if song is None:
+                raise PlaybackError(f"Song {song_id} not found")
+            self.song = song
+        if user_id:
+            record_listening_history(user_id, song_id, self.quiet)
+        return self.status()
+
+    def pause(self):
+        with self._lock:
+            if self.song and self.song["playing"]:
+                self.mixer.music.pause()
+                self.song["playing"], self.song["paused"] = False, True
+            return self.status()
+
+    def resume(self):
+        with self._lock:
+            if self.song and self.song["paused"]:
+                self.mixer.music.unpause()
+                self.song["playing"], self.song["paused"] = True, False
+            return self.status()
+
+    def toggle(self):
+        """Pause if playing, otherwise resume"""
+        with self._lock:
+            return self.pause() if self.song and self.song["playing"] else self.resume()
+
+    def stop(self):
+        """Stop playback and forget the current song (the queue is kept)"""
+        with self._lock:
+            if self.song:
+                self.mixer.music.stop()
+                self.song = None
+            return self.status()
+
+    def seek(self, seconds, relative=False):
+        """Play the current song from a position, or from seconds after the current one"""
+        with self._lock:
+            if self.song is None:
+                raise PlaybackError("No song is playing")
+            if relative:
+                seconds += get_play_position(self.song, self.mixer)
+            if not seek_song(self.song, self.mixer, seconds, self.quiet):
+                raise PlaybackError("Could not seek")
+            return self.status()
+
+    def enqueue(self, song_ids, user_id=None):
+        """Add songs to the end of the queue"""
+        with self._lock:
+            self.queue.extend((int(song_id), user_id) for song_id in song_ids)
+            return self.status()
+
+    def clear_queue(self):
+        with self._lock:
+            self.queue.clear()
+            return self.status()
+
+    def next(self):
+        """Play the next queued song (stops if the queue is empty)"""
+        with self._lock:
+            while self.queue:
+                song_id, user_id = self.queue.popleft()
+                try:
+                    return self.play(song_id, user_id)
+                except PlaybackError as e:
+                    # Skip songs that were deleted or cannot be decoded
+                    print(f"Skipping song {song_id}: {e}")
+            return self.stop()
+
+    def tick(self):
+        """Move on to the next queued song when the current one has finished"""
+        with self._lock:
+            if self.song and self.song["playing"] and not self.mixer.music.get_busy():
+                if self.queue:
+                    self.next()
+                else:
+                    self.song["playing"] = False
+
+def get_player():
+    """The playback daemon's player when enabled, else one playing in this process"""
+    if PLAYBACK_SOCKET and hasattr(socket, "AF_UNIX"):
+        from utils.playback_client import PlaybackClient
+        return PlaybackClient()
+    return LocalPlayer()
@@ -0,0 +1,178 @@
+"""
+Client for the playback daemon
+Sends newline-delimited JSON commands over the daemon's Unix socket and
+starts the daemon if it is not running. PlaybackClient has the same methods
+as utils.playback.LocalPlayer, so pages use either one.
+
+Usage: python -m utils.playback_client <command> [arguments]
+    status | play <song_id> | pause | resume | toggle | stop | next
+    seek <seconds> | skip <seconds> | enqueue <song_id>... | clear | shutdown
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from config import PLAYBACK_SOCKET, PLAYBACK_TIMEOUT
+from utils.playback import PlaybackError, idle_status
+
+DAEMON_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "playback_daemon.py")
+# Seconds to wait for a freshly started daemon to listen
+DAEMON_START_TIMEOUT = 5
+
+class PlaybackClient:
+    """Controls the playback daemon, starting it on first use if needed"""
+
+    def __init__(self, path=PLAYBACK_SOCKET, timeout=PLAYBACK_TIMEOUT, start_daemon=True):
+        self.path = path
+        self.timeout = timeout
+        self.start_daemon = start_daemon
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self._file = sock.makefile("rwb")
+
+    def _start_daemon(self):
+        """Start the daemon in the background and wait until it listens"""
+        subprocess.Popen([sys.executable, DAEMON_SCRIPT], cwd=os.path.dirname(DAEMON_SCRIPT),
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         start_new_session=True)
+        deadline = time.monotonic() + DAEMON_START_TIMEOUT
+        while True:
+            try:
+                return self._connect()
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def _exchange(self, message):
+        if self._file is None:
+            try:
+                self._connect()
+            except (FileNotFoundError, ConnectionRefusedError):
+                if not self.start_daemon:
+                    raise
+                self._start_daemon()
+        self._file.write(message)
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionResetError("Playback daemon closed the connection")
+        return json.loads(line)
+
+    def _disconnect(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+    def request(self, command, **arguments):
+        """Send a command and return the player status it replies with"""
+        message = json.dumps({"command": command, **arguments}).encode() + b"\n"
+        with self._lock:
+            try:
+                try:
+                    reply = self._exchange(message)
+                except ConnectionError:
+                    # The daemon restarted since the last command: reconnect once
+                    self._disconnect()
+                    reply = self._exchange(message)
+            except (OSError, ValueError) as e:
+                self._disconnect()
+                raise PlaybackError(f"Playback daemon is not available: {e}")
+
+        if not reply.get("ok"):
+            raise PlaybackError(reply.get("error", "Unknown error"))
+        return reply.get("status")
+
+    def status(self):
+        """Player status; idle if the daemon is not running (it is not started just for this)"""
+        with self._lock:
+            if self._file is None:
+                try:
+                    self._connect()
+                except OSError:
+                    return idle_status()
+        return self.request("status")
+
+    def play(self, song_id, user_id=None):
+        return self.request("play", song_id=song_id, user_id=user_id)
+
+    def pause(self):
+        return self.request("pause")
+
+    def resume(self):
+        return self.request("resume")
+
+    def toggle(self):
+        return self.request("toggle")
+
+    def stop(self):
+        return self.request("stop")
+
+    def seek(self, seconds, relative=False):
+        return self.request("seek", seconds=seconds, relative=relative)
+
+    def enqueue(self, song_ids, user_id=None):
+        return self.request("enqueue", song_ids=list(song_ids), user_id=user_id)
+
+    def clear_queue(self):
+        return self.request("clear_queue")
+
+    def next(self):
+        return self.request("next")
+
+    def shutdown(self):
+        return self.request("shutdown")
+
+def format_status(status):
+    """One-line description of a player status"""
+    if status["id"] is None:
+        text = "Stopped"
+    else:
+        state = "Playing" if status["playing"] else "Paused" if status["paused"] else "Finished"
+        minutes, seconds = divmod(int(status["position"]), 60)
+        text = f"{state}: {status['artist']} - {status['title']} [{minutes}:{seconds:02d}]"
+    if status["queue"]:
+        text += f" • {len(status['queue'])} queued"
+    return text
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Control the playback daemon")
+    parser.add_argument("command", choices=["status", "play", "pause", "resume", "toggle", "stop", "next",
+                                            "seek", "skip", "enqueue", "clear", "shutdown"])
+    parser.add_argument("arguments", nargs="*", type=float)
+    parser.add_argument("--user-id", type=int, help="record plays in this user's listening history")
+    args = parser.parse_args()
+    if args.command in ("play", "seek", "skip", "enqueue") and not args.arguments:
+        parser.error(f"{args.command} needs an argument")
+
+    client = PlaybackClient(start_daemon=args.command != "shutdown")
+    commands = {
+        "play": lambda: client.play(int(args.arguments[0]), args.user_id),
+        "seek": lambda: client.seek(args.arguments[0]),
+        "skip": lambda: client.seek(args.arguments[0], relative=True),
+        "enqueue": lambda: client.enqueue([int(song_id) for song_id in args.arguments], args.user_id),
+        "clear": client.clear_queue,
+    }
+    try:
+        status = (commands.get(args.command) or getattr(client, args.command))()
+    except PlaybackError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print("Daemon stopped" if args.command == "shutdown" else format_status(status))
@@ -0,0 +1,360 @@
+"""
+Query instrumentation
+Per-statement call counts, latency histograms, rows and bytes, plus a slow-query log
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import hashlib
+from config import (SLOW_QUERY_MS, SLOW_QUERY_LOG, QUERY_METRICS_FILE,
+                    QUERY_METRICS_PROM_FILE)
+
+try:
+    import fcntl
+except ImportError:  # Windows: metrics dumps are not locked across processes
+    fcntl = None
+
+# Latency histogram bucket upper bounds in milliseconds (last bucket is +Inf)
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# Frames from these files belong to the data layer, not to the caller
+_DATA_LAYER_FILES = ("query_metrics.py", "sqlite_backend.py")
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RE = re.compile(r"%s|\?")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+_lock = threading.Lock()
+_stats = {}
+_caller_names = {}
+_slow_logger = None
+_dump_registered = False
+
+def normalize_query(query):
+    """Normalize a statement so calls that differ only in literals share a fingerprint"""
+    if isinstance(query, bytes):
+        query = query.decode(errors="replace")
+    text = _STRING_RE.sub("?", query)
+    text = _NUMBER_RE.sub("?", text)
+    text = _PLACEHOLDER_RE.sub("?", text)
+    text = _IN_LIST_RE.sub("(...)", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+def fingerprint(statement):
+    """Short stable ID for a normalized statement"""
+    return hashlib.sha1(statement.encode()).hexdigest()[:12]
+
+def _caller_name(code):
+    """Caller label (path:function) of a code object, or None if it belongs to the data layer"""
+    filename = code.co_filename
+    if os.path.basename(filename) in _DATA_LAYER_FILES or f"{os.sep}mysql{os.sep}" in filename:
+        return None
+    path = os.path.relpath(os.path.abspath(filename), _PROJECT_ROOT).replace(os.sep, "/")
+    return f"{path}:{code.co_name}"
+
+def _caller():
+    """Find the first page/helper function outside the data layer"""
+    frame = sys._getframe(2)
+    while frame:
+        code = frame.f_code
+        # Resolving paths on every statement is costly; code objects are few and long-lived
+        try:
+            name = _caller_names[code]
+        except KeyError:
+            name = _caller_names[code] = _caller_name(code)
+        if name is not None:
+            return name
+        frame = frame.f_back
+    return "unknown"
+
+def _payload_size(values):
+    """Approximate the bytes carried by a row or a parameter tuple"""
+    if values is None:
+        return 0
+    if isinstance(values, dict):
+        values = values.values()
+    size = 0
+    for value in values:
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            size += len(value)
+        elif isinstance(value, str):
+            size += len(value.encode(errors="replace"))
+        elif value is not None:
+            size += 8
+    return size
+
+def _new_entry(statement):
+    return {
+        "statement": statement,
+        "calls": 0,
+        "errors": 0,
+        "total_ms": 0.0,
+        "max_ms": 0.0,
+        "fetch_ms": 0.0,
+        "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+        "rows": 0,
+        "bytes_in": 0,
+        "bytes_out": 0,
+        "callers": {}
+    }
+
+def _get_slow_logger():
+    """Create the slow-query file logger on first use"""
+    global _slow_logger
+    if _slow_logger is None:
+        logger = logging.getLogger("music.slow_query")
+        logger.setLevel(logging.WARNING)
+        logger.propagate = False
+        try:
+            os.makedirs(os.path.dirname(SLOW_QUERY_LOG) or ".", exist_ok=True)
+            handler = logging.FileHandler(SLOW_QUERY_LOG, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s pid=%(process)d %(message)s"))
+            logger.addHandler(handler)
+        except OSError as e:
+            print(f"Error opening slow query log: {e}")
+        _slow_logger = logger
+    return _slow_logger
+
+def record_execute(query, params, elapsed_ms, error=False):
+    """Record one statement execution and return its fingerprint"""
+    statement = normalize_query(query)
+    key = fingerprint(statement)
+    caller = _caller()
+
+    with _lock:
+        entry = _stats.get(key)
+        if entry is None:
+            entry = _stats[key] = _new_entry(statement)
+        entry["calls"] += 1
+        entry["errors"] += 1 if error else 0
+        entry["total_ms"] += elapsed_ms
+        entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS_MS) and elapsed_ms > LATENCY_BUCKETS_MS[bucket]:
+            bucket += 1
+        entry["buckets"][bucket] += 1
+        entry["bytes_out"] += _payload_size(params) if isinstance(params, (tuple, list, dict)) else 0
+        entry["callers"][caller] = entry["callers"].get(caller, 0) + 1
+
+    if elapsed_ms >= SLOW_QUERY_MS:
+        _get_slow_logger().warning(f"{elapsed_ms:.1f} ms caller={caller} fingerprint={key} {statement}")
+
+    return key
+
+def record_fetch(key, rows, elapsed_ms):
+    """Record rows fetched for a previously executed statement"""
+    if key is None:
+        return
+    with _lock:
+        entry = _stats.get(key)
+        if entry is None:
+            return
+        entry["fetch_ms"] += elapsed_ms
+        entry["rows"] += len(rows)
+        entry["bytes_in"] += sum(_payload_size(row) for row in rows)
+
+class InstrumentedCursor:
+    """Cursor wrapper that records every execute and fetch"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._key = None
+
+    def execute(self, query, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            if params is None:
+                result = self._cursor.execute(query, *args, **kwargs)
+            else:
+                result = self._cursor.execute(query, params, *args, **kwargs)
+        except Exception:
+            self._key = record_execute(query, params, (time.perf_counter() - start) * 1000, error=True)
+            raise
+        self._key = record_execute(query, params, (time.perf_counter() - start) * 1000)
+        return result
+
+    def executemany(self, query, seq_params, *args, **kwargs):
+        seq_params = list(seq_params)
+        start = time.perf_counter()
+        try:
+            result = self._cursor.executemany(query, seq_params, *args, **kwargs)
+        except Exception:
+            self._key = record_execute(query, None, (time.perf_counter() - start) * 1000, error=True)
+            raise
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._key = record_execute(query, None, elapsed_ms)
+        with _lock:
+            _stats[self._key]["bytes_out"] += sum(_payload_size(params) for params in seq_params)
+        return result
+
+    def _timed_fetch(self, fetch, *args):
+        start = time.perf_counter()
+        rows = fetch(*args)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        record_fetch(self._key, rows if isinstance(rows, list) else ([rows] if rows is not None else []), elapsed_ms)
+        return rows
+
+    def fetchone(self):
+        return self._timed_fetch(self._cursor.fetchone)
+
+    def fetchmany(self, size=1):
+        return self._timed_fetch(self._cursor.fetchmany, size)
+
+    def fetchall(self):
+        return self._timed_fetch(self._cursor.fetchall)
+
+    def __iter__(self):
+        row = self.fetchone()
+        while row is not None:
+            yield row
+            row = self.fetchone()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class InstrumentedConnection:
+    """Connection wrapper that hands out instrumented cursors"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._connection.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+def instrument(connection):
+    """Wrap a connection so its queries are recorded"""
+    global _dump_registered
+    if not _dump_registered:
+        # Each page is its own process, so metrics are merged into the dump file on exit
+        atexit.register(dump_metrics)
+        _dump_registered = True
+    return InstrumentedConnection(connection)
+
+def get_metrics():
+    """Snapshot of the metrics recorded by this process"""
+    with _lock:
+        return json.loads(json.dumps(_stats))
+
+def reset_metrics():
+    """Clear the metrics recorded by this process"""
+    with _lock:
+        _stats.clear()
+
+def merge_metrics(target, source):
+    """Add the counters of one metrics snapshot into another"""
+    for key, entry in source.items():
+        if key not in target:
+            target[key] = _new_entry(entry["statement"])
+        merged = target[key]
+        for field in ("calls", "errors", "total_ms", "fetch_ms", "rows", "bytes_in", "bytes_out"):
+            merged[field] += entry[field]
+        merged["max_ms"] = max(merged["max_ms"], entry["max_ms"])
+        merged["buckets"] = [a + b for a, b in zip(merged["buckets"], entry["buckets"])]
+        for caller, calls in entry["callers"].items():
+            merged["callers"][caller] = merged["callers"].get(caller, 0) + calls
+    return target
+
+def format_prometheus(metrics):
+    """Render metrics in the Prometheus text exposition format"""
+    lines = [
+        "# HELP music_db_query_info Normalized statement text for each fingerprint",
+        "# TYPE music_db_query_info gauge"
+    ]
+    for key, entry in metrics.items():
+        statement = entry["statement"].replace("\\", "\\\\").replace('"', '\\"')
+        lines.append(f'music_db_query_info{{fingerprint="{key}",statement="{statement}"}} 1')
+
+    lines += [
+        "# HELP music_db_query_duration_seconds Statement execution latency",
+        "# TYPE music_db_query_duration_seconds histogram"
+    ]
+    for key, entry in metrics.items():
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS + ["+Inf"], entry["buckets"]):
+            cumulative += count
+            le = bound if bound == "+Inf" else bound / 1000
+            lines.append(f'music_db_query_duration_seconds_bucket{{fingerprint="{key}",le="{le}"}} {cumulative}')
+        lines.append(f'music_db_query_duration_seconds_sum{{fingerprint="{key}"}} {entry["total_ms"] / 1000:.6f}')
+        lines.append(f'music_db_query_duration_seconds_count{{fingerprint="{key}"}} {entry["calls"]}')
+
+    for name, field, help_text in (
+        ("music_db_query_errors_total", "errors", "Statements that raised an error"),
+        ("music_db_query_rows_total", "rows", "Rows fetched"),
+        ("music_db_query_bytes_received_total", "bytes_in", "Approximate bytes fetched"),
+        ("music_db_query_bytes_sent_total", "bytes_out", "Approximate parameter bytes sent")
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for key, entry in metrics.items():
+            lines.append(f'{name}{{fingerprint="{key}"}} {entry[field]}')
+
+    return "\n".join(lines) + "\n"
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def dump_metrics(path=QUERY_METRICS_FILE, prom_path=QUERY_METRICS_PROM_FILE):
+    """Merge this process's metrics into the JSON dump and rewrite the Prometheus file"""
+    snapshot = get_metrics()
+    if not snapshot or not path:
+        return False
+
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.lock", "w") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            merged = {}
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    merged = json.load(f)
+            merge_metrics(merged, snapshot)
+
+            _write_atomic(path, json.dumps(merged, indent=2))
+            if prom_path:
+                _write_atomic(prom_path, format_prometheus(merged))
+
+        # Counters now live in the dump file
+        reset_metrics()
+        return True
+
+    except (OSError, ValueError) as e:
+        print(f"Error dumping query metrics: {e}")
+        return False
+
+def format_summary(metrics=None, limit=10):
+    """Human-readable table of the most expensive statements"""
+    metrics = get_metrics() if metrics is None else metrics
+    entries = sorted(metrics.items(), key=lambda item: item[1]["total_ms"], reverse=True)[:limit]
+
+    lines = [f"{'fingerprint':<12} {'calls':>7} {'avg ms':>8} {'max ms':>8} {'rows':>8} {'bytes in':>10}  statement"]
+    for key, entry in entries:
+        avg_ms = entry["total_ms"] / entry["calls"] if entry["calls"] else 0
+        lines.append(
+            f"{key:<12} {entry['calls']:>7} {avg_ms:>8.2f} {entry['max_ms']:>8.2f} "
+            f"{entry['rows']:>8} {entry['bytes_in']:>10}  {entry['statement'][:80]}"
+        )
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    # Print the merged metrics collected by all page processes
+    if os.path.exists(QUERY_METRICS_FILE):
+        with open(QUERY_METRICS_FILE, "r", encoding="utf-8") as f:
+            print(format_summary(json.load(f), limit=25))
+    else:
+        print("No query metrics recorded yet.")
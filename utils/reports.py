@@ -0,0 +1,359 @@
+"""
+Reporting engine
+Maintains hourly and daily rollups of plays, active users and uploads, and
+builds admin reports from them with vectorized NumPy instead of GROUP BYs
+over the raw tables.
+
+Rollups are refreshed incrementally: each source table is read only past
+the last history_id/song_id aggregated, recorded in Report_State. IDs near
+the top that were missing when aggregated are kept in Report_Gaps and
+picked up if their transaction commits late (auto-increment order is not
+commit order). The refresh reads a lot of rows, so pages run it in the
+background.
+
+Usage: python -m utils.reports [--days N] [--no-refresh]
+"""
+import argparse
+import datetime
+import time
+import numpy as np
+from config import DB_BACKEND, REPORT_REFRESH_BATCH
+from utils.db_utils import connect_db, DB_ERRORS
+
+# Plays-per-user histogram bucket edges (last bucket is open-ended)
+PLAYS_PER_USER_BINS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+# Missing IDs are tracked among this many below the newest one...
+GAP_WINDOW = 1000
+# ...and re-read for this long (at least once) before they are given up on
+GAP_SECONDS = 300
+
+def _upsert_sum(keys, columns):
+    """Upsert clause adding the new values to an existing rollup row"""
+    if DB_BACKEND == "sqlite":
+        updates = ", ".join(f"{column} = {column} + excluded.{column}" for column in columns)
+        return f"ON CONFLICT ({keys}) DO UPDATE SET {updates}"
+    updates = ", ".join(f"{column} = {column} + VALUES({column})" for column in columns)
+    return f"ON DUPLICATE KEY UPDATE {updates}"
+
+def _hour_of(column):
+    """SQL expression truncating a timestamp to the hour"""
+    if DB_BACKEND == "sqlite":
+        return f"strftime('%%Y-%%m-%%d %%H:00:00', {column})"
+    return f"DATE_FORMAT({column}, '%%Y-%%m-%%d %%H:00:00')"
+
+def _hours_since(column):
+    """SQL expression for whole hours from a %s parameter to a DATETIME column"""
+    if DB_BACKEND == "sqlite":
+        return f"CAST(ROUND((julianday({column}) - julianday(%s)) * 24) AS INTEGER)"
+    return f"TIMESTAMPDIFF(HOUR, %s, {column})"
+
+def _days_since(column):
+    """SQL expression for whole days from a %s parameter to a DATE column"""
+    if DB_BACKEND == "sqlite":
+        return f"CAST(julianday({column}) - julianday(%s) AS INTEGER)"
+    return f"DATEDIFF({column}, %s)"
+
+# Rollup sources as (state name, source table, id column, statements over the {ids} rows)
+_ROLLUPS = [
+    ("plays", "Listening_History", "history_id", [
+        f"""
+        INSERT INTO Report_Hourly_Plays (hour, plays)
+        SELECT {_hour_of("played_at")} AS hour, COUNT(*) FROM Listening_History
+        WHERE {{ids}}
+        GROUP BY hour
+        {_upsert_sum("hour", ["plays"])}
+        """,
+        f"""
+        INSERT INTO Report_Daily_Song_Plays (day, song_id, plays)
+        SELECT DATE(played_at) AS day, song_id, COUNT(*) FROM Listening_History
+        WHERE {{ids}}
+        GROUP BY day, song_id
+        {_upsert_sum("day, song_id", ["plays"])}
+        """,
+        f"""
+        INSERT INTO Report_Daily_Users (day, user_id, plays)
+        SELECT DATE(played_at) AS day, user_id, COUNT(*) FROM Listening_History
+        WHERE {{ids}}
+        GROUP BY day, user_id
+        {_upsert_sum("day, user_id", ["plays"])}
+        """,
+    ]),
+    ("uploads", "Songs", "song_id", [
+        f"""
+        INSERT INTO Report_Daily_Uploads (day, uploads, bytes)
+        SELECT DATE(upload_date) AS day, COUNT(*), SUM(file_size) FROM Songs
+        WHERE {{ids}}
+        GROUP BY day
+        {_upsert_sum("day", ["uploads", "bytes"])}
+        """,
+    ]),
+]
+
+# ------------------- Rollup Refresh -------------------
+def _save_state(cursor, name, last_id):
+    if DB_BACKEND == "sqlite":
+        cursor.execute("INSERT OR REPLACE INTO Report_State (name, last_id) VALUES (%s, %s)", (name, last_id))
+    else:
+        cursor.execute(
+            "INSERT INTO Report_State (name, last_id) VALUES (%s, %s) "
+            "ON DUPLICATE KEY UPDATE last_id = VALUES(last_id)",
+            (name, last_id)
+        )
+
+def _aggregate(cursor, statements, condition, params):
+    for statement in statements:
+        cursor.execute(statement.replace("{ids}", condition), params)
+
+def _read_gaps(cursor, name, table, id_column, statements):
+    """Aggregate rows that committed under a skipped ID since the last refresh; returns how many"""
+    cursor.execute("SELECT id, missed_at FROM Report_Gaps WHERE name = %s", (name,))
+    gaps = dict(cursor.fetchall())
+    if not gaps:
+        return 0
+
+    placeholders = ", ".join(["%s"] * len(gaps))
+    cursor.execute(f"SELECT {id_column} FROM {table} WHERE {id_column} IN ({placeholders})", tuple(gaps))
+    found = [row[0] for row in cursor.fetchall()]
+    if found:
+        found_placeholders = ", ".join(["%s"] * len(found))
+        _aggregate(cursor, statements, f"{id_column} IN ({found_placeholders})", tuple(found))
+
+    # Every gap has been re-read at least once by now
+    cutoff = time.time() - GAP_SECONDS
+    done = found + [gap_id for gap_id, missed_at in gaps.items() if missed_at < cutoff and gap_id not in found]
+    cursor.executemany("DELETE FROM Report_Gaps WHERE name = %s AND id = %s", [(name, gap_id) for gap_id in done])
+    return len(found)
+
+def refresh_rollups(batch_size=REPORT_REFRESH_BATCH):
+    """Aggregate rows added since the last refresh; returns {source: rows read} or None
+
+    Each ID range is aggregated and its watermark saved in one transaction,
+    so an interrupted refresh never counts a row twice. Near the newest ID,
+    the rows present are listed first and only those are aggregated; the
+    missing IDs become gaps, so a row committing meanwhile is counted once,
+    by a later refresh.
+    """
+    try:
+        connection = connect_db()
+        if not connection:
+            return None
+
+        cursor = connection.cursor()
+        refreshed = {}
+        for name, table, id_column, statements in _ROLLUPS:
+            refreshed[name] = _read_gaps(cursor, name, table, id_column, statements)
+            connection.commit()
+
+            cursor.execute("SELECT last_id FROM Report_State WHERE name = %s", (name,))
+            row = cursor.fetchone()
+            last_id = row[0] if row else 0
+
+            cursor.execute(f"SELECT COALESCE(MAX({id_column}), 0) FROM {table}")
+            high = cursor.fetchone()[0]
+
+            while last_id < high:
+                upper = min(last_id + batch_size, high)
+                condition, params = f"{id_column} > %s AND {id_column} <= %s", (last_id, upper)
+
+                missing = []
+                tracked_from = max(last_id, high - GAP_WINDOW)
+                if upper > tracked_from:
+                    cursor.execute(f"SELECT {id_column} FROM {table} WHERE {id_column} > %s AND {id_column} <= %s",
+                                   (tracked_from, upper))
+                    present = {row[0] for row in cursor.fetchall()}
+                    missing = [row_id for row_id in range(tracked_from + 1, upper + 1) if row_id not in present]
+                if missing:
+                    condition += f" AND {id_column} NOT IN ({', '.join(['%s'] * len(missing))})"
+                    params += tuple(missing)
+                    now = time.time()
+                    cursor.executemany("INSERT INTO Report_Gaps (name, id, missed_at) VALUES (%s, %s, %s)",
+                                       [(name, row_id, now) for row_id in missing])
+
+                cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE {condition}", params)
+                refreshed[name] += cursor.fetchone()[0]
+                _aggregate(cursor, statements, condition, params)
+                _save_state(cursor, name, upper)
+                connection.commit()
+                last_id = upper
+        return refreshed
+
+    except DB_ERRORS as e:
+        print(f"Error refreshing report rollups: {e}")
+        if 'connection' in locals() and connection:
+            connection.rollback()
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+# ------------------- Reports -------------------
+def _fetch_array(cursor, query, params, columns):
+    """Run a query returning integers and load the rows into an (n, columns) array"""
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    if not rows:
+        return np.zeros((0, columns), dtype=np.int64)
+    return np.array(rows, dtype=np.int64)
+
+def _top(totals, limit):
+    """IDs and totals of the largest non-zero entries of a bincount, largest first"""
+    ids = np.flatnonzero(totals)
+    if ids.size > limit:
+        ids = ids[np.argpartition(totals[ids], -limit)[-limit:]]
+    ids = ids[np.argsort(-totals[ids], kind="stable")]
+    return ids, totals[ids]
+
+def _names(cursor, table, id_column, name_column, ids):
+    """Map IDs to names with one query"""
+    if len(ids) == 0:
+        return {}
+    placeholders = ", ".join(["%s"] * len(ids))
+    cursor.execute(f"SELECT {id_column}, {name_column} FROM {table} WHERE {id_column} IN ({placeholders})",
+                   tuple(int(i) for i in ids))
+    return dict(cursor.fetchall())
+
+def build_report(days=30, top=10):
+    """Build the admin report for the last days days, ending today
+
+    The rollups are first reduced to one row per hour, song, user or day
+    of the window; everything else is computed with NumPy. Returns a dict of
+    arrays and top lists, or None if the database is unreachable.
+    """
+    started = time.perf_counter()
+    end = datetime.date.today() + datetime.timedelta(days=1)
+    start = end - datetime.timedelta(days=days)
+    start_day, end_day = f"{start:%Y-%m-%d}", f"{end:%Y-%m-%d}"
+    start_hour, end_hour = f"{start_day} 00:00:00", f"{end_day} 00:00:00"
+
+    try:
+        connection = connect_db(read_only=True)
+        if not connection:
+            return None
+        cursor = connection.cursor()
+
+        # (hour offset, plays) for every hour with plays
+        hourly = _fetch_array(
+            cursor,
+            f"SELECT {_hours_since('hour')}, plays FROM Report_Hourly_Plays WHERE hour >= %s AND hour < %s",
+            (start_hour, start_hour, end_hour), 2
+        )
+        hours, hour_plays = hourly[:, 0], hourly[:, 1]
+
+        # (song_id, artist_id, genre_id, plays) for the songs played in the window
+        songs = _fetch_array(
+            cursor,
+            """
+            SELECT p.song_id, COALESCE(s.artist_id, 0), COALESCE(s.genre_id, 0), SUM(p.plays)
+            FROM Report_Daily_Song_Plays p
+            LEFT JOIN Songs s ON s.song_id = p.song_id
+            WHERE p.day >= %s AND p.day < %s
+            GROUP BY p.song_id, s.artist_id, s.genre_id
+            """,
+            (start_day, end_day), 4
+        )
+        song_ids, song_plays = songs[:, 0], songs[:, 3]
+
+        # Song -> artist and genre lookup arrays indexed by song_id (0 = none)
+        size = int(song_ids.max(initial=0)) + 1
+        artist_of = np.zeros(size, dtype=np.int64)
+        genre_of = np.zeros(size, dtype=np.int64)
+        artist_of[song_ids] = songs[:, 1]
+        genre_of[song_ids] = songs[:, 2]
+
+        song_totals = np.bincount(song_ids, weights=song_plays, minlength=size)
+        artist_totals = np.bincount(artist_of[song_ids], weights=song_plays, minlength=1)
+        genre_totals = np.bincount(genre_of[song_ids], weights=song_plays, minlength=1)
+        artist_totals[0] = 0  # songs without an artist
+        genre_totals[0] = 0   # songs without a genre
+
+        top_song_ids, top_song_plays = _top(song_totals, top)
+        top_artist_ids, top_artist_plays = _top(artist_totals, top)
+        top_genre_ids, top_genre_plays = _top(genre_totals, top)
+        song_titles = _names(cursor, "Songs", "song_id", "title", top_song_ids)
+        artist_names = _names(cursor, "Artists", "artist_id", "name",
+                              np.union1d(top_artist_ids, artist_of[top_song_ids]))
+        genre_names = _names(cursor, "Genres", "genre_id", "name", top_genre_ids)
+
+        # Plays of every user active in the window, and active users per day
+        user_plays = _fetch_array(
+            cursor,
+            "SELECT SUM(plays) FROM Report_Daily_Users WHERE day >= %s AND day < %s GROUP BY user_id",
+            (start_day, end_day), 1
+        )[:, 0]
+        user_histogram, _ = np.histogram(user_plays, bins=PLAYS_PER_USER_BINS + [np.inf])
+        active_days = _fetch_array(
+            cursor,
+            f"SELECT {_days_since('day')}, COUNT(*) FROM Report_Daily_Users "
+            "WHERE day >= %s AND day < %s GROUP BY day",
+            (start_day, start_day, end_day), 2
+        )
+
+        # (day offset, uploads, bytes) and the storage used before the window
+        uploads = _fetch_array(
+            cursor,
+            f"SELECT {_days_since('day')}, uploads, bytes FROM Report_Daily_Uploads "
+            "WHERE day >= %s AND day < %s",
+            (start_day, start_day, end_day), 3
+        )
+        cursor.execute("SELECT COALESCE(SUM(bytes), 0) FROM Report_Daily_Uploads WHERE day < %s", (start_day,))
+        storage_before = int(cursor.fetchone()[0])
+        bytes_per_day = np.bincount(uploads[:, 0], weights=uploads[:, 2], minlength=days)
+
+        return {
+            "start": start,
+            "days": days,
+            "total_plays": int(hour_plays.sum()),
+            "plays_per_day": np.bincount(hours // 24, weights=hour_plays, minlength=days).astype(np.int64),
+            "plays_by_hour": np.bincount(hours % 24, weights=hour_plays, minlength=24).astype(np.int64),
+            "top_songs": [(song_titles.get(i, "Unknown"), artist_names.get(artist_of[i], "Unknown"), int(n))
+                          for i, n in zip(top_song_ids, top_song_plays)],
+            "top_artists": [(artist_names.get(i, "Unknown"), int(n)) for i, n in zip(top_artist_ids, top_artist_plays)],
+            "top_genres": [(genre_names.get(i, "Unknown"), int(n)) for i, n in zip(top_genre_ids, top_genre_plays)],
+            "active_users": int(user_plays.size),
+            "active_users_per_day": np.bincount(active_days[:, 0], weights=active_days[:, 1],
+                                                minlength=days).astype(np.int64),
+            "plays_per_user_histogram": user_histogram,
+            "uploads": int(uploads[:, 1].sum()),
+            "uploads_per_day": np.bincount(uploads[:, 0], weights=uploads[:, 1], minlength=days).astype(np.int64),
+            "storage_bytes": storage_before + np.cumsum(bytes_per_day).astype(np.int64),
+            "elapsed_ms": (time.perf_counter() - started) * 1000
+        }
+
+    except DB_ERRORS as e:
+        print(f"Error building report: {e}")
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def format_report(report):
+    """Plain-text summary of a report"""
+    lines = [
+        f"Report for {report['days']} days from {report['start']} ({report['elapsed_ms']:.0f} ms)",
+        f"  Plays: {report['total_plays']}   Active users: {report['active_users']}   Uploads: {report['uploads']}",
+        f"  Storage: {int(report['storage_bytes'][-1]) if len(report['storage_bytes']) else 0} bytes",
+        "  Top songs:"
+    ]
+    lines += [f"    {plays:>8}  {title} - {artist}" for title, artist, plays in report["top_songs"]]
+    lines.append("  Top artists:")
+    lines += [f"    {plays:>8}  {name}" for name, plays in report["top_artists"]]
+    lines.append("  Top genres:")
+    lines += [f"    {plays:>8}  {name}" for name, plays in report["top_genres"]]
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh report rollups and print a report")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--no-refresh", action="store_true", help="skip the rollup refresh")
+    args = parser.parse_args()
+
+    if not args.no_refresh:
+        start = time.perf_counter()
+        refreshed = refresh_rollups()
+        print(f"Refreshed rollups: {refreshed} ({time.perf_counter() - start:.2f}s)")
+
+    report = build_report(args.days)
+    print(format_report(report) if report else "Could not build report.")
@@ -0,0 +1,498 @@
+"""
+Seek index
+Maps playback time to the byte offset of the audio frame playing at that
+time, for MP3 and FLAC. Indexes are built by parsing frame headers once, at
+upload or backfill time, and stored per song so a seek is a single array
+lookup followed by a read from that offset.
+
+Usage: python -m utils.seek_index [--rebuild]   (backfill missing indexes)
+"""
+import argparse
+import io
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from config import SEEK_INDEX_STEP_MS
+from utils.db_utils import connect_db, prepared_cursor, DB_ERRORS
+
+# File types whose frames can be indexed
+SEEKABLE_TYPES = ("mp3", "flac")
+
+# MP3 bitrates in kbps by (MPEG-1?, layer) and bitrate index
+_MP3_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+# MP3 sample rates by version bits (0 = MPEG-2.5, 2 = MPEG-2, 3 = MPEG-1)
+_MP3_SAMPLE_RATES = {
+    0: (11025, 12000, 8000),
+    2: (22050, 24000, 16000),
+    3: (44100, 48000, 32000),
+}
+
+# Longest possible FLAC frame header, in bytes
+_FLAC_MAX_HEADER = 16
+
+def _mp3_frame(buf, pos):
+    """Parse the MP3 frame header at pos into (length, samples, sample_rate), or None"""
+    b1, b2 = buf[pos + 1], buf[pos + 2]
+    if buf[pos] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 3
+    layer = 4 - ((b1 >> 1) & 3)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = _MP3_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+    if layer == 2:
+        return 144 * bitrate // sample_rate + padding, 1152, sample_rate
+    if mpeg1:
+        return 144 * bitrate // sample_rate + padding, 1152, sample_rate
+    return 72 * bitrate // sample_rate + padding, 576, sample_rate
+
+def _crc8(data):
+    """CRC-8 (polynomial 0x07) as used by FLAC frame headers"""
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+def _flac_frame(buf, pos):
+    """Parse the FLAC frame header at pos into (number, block_size), or None
+
+    number is the frame number for fixed-blocksize streams and the first
+    sample number for variable-blocksize streams. The header CRC is checked,
+    so sync codes inside audio data are rejected.
+    """
+    if buf[pos] != 0xFF or buf[pos + 1] & 0xFE != 0xF8:
+        return None
+
+    size_code = buf[pos + 2] >> 4
+    rate_code = buf[pos + 2] & 0x0F
+    if size_code == 0 or rate_code == 15 or buf[pos + 3] & 0x01:
+        return None
+
+    # UTF-8 style coded frame/sample number
+    first = buf[pos + 4]
+    if first < 0x80:
+        extra, number = 0, first
+    elif first >= 0xC0 and first != 0xFF:
+        extra = 1
+        while first & (0x40 >> extra):
+            extra += 1
+        if extra > 6:
+            return None
+        number = first & (0x3F >> extra)
+    else:
+        return None
+
+    end = pos + 5
+    for byte in buf[end:end + extra]:
+        if byte & 0xC0 != 0x80:
+            return None
+        number = (number << 6) | (byte & 0x3F)
+    end += extra
+
+    if size_code == 1:
+        block_size = 192
+    elif size_code <= 5:
+        block_size = 576 << (size_code - 2)
+    elif size_code == 6:
+        block_size = buf[end] + 1
+        end += 1
+    elif size_code == 7:
+        block_size = (buf[end] << 8 | buf[end + 1]) + 1
+        end += 2
+    else:
+        block_size = 256 << (size_code - 8)
+
+    if rate_code == 12:
+        end += 1
+    elif rate_code in (13, 14):
+        end += 2
+
+    if _crc8(buf[pos:end]) != buf[end]:
+        return None
+    return number, block_size
+
+class SeekIndex:
+    """Byte offsets of the frame playing at every step_ms of a song"""
+
+    def __init__(self, step_ms, offsets):
+        self.step_ms = step_ms
+        self.offsets = offsets
+
+    @property
+    def audio_start(self):
+        """Offset of the first audio frame (everything before it is headers)"""
+        return self.offsets[0]
+
+    def offset_for(self, seconds):
+        """Byte offset to start reading from to play at seconds"""
+        slot = int(seconds * 1000) // self.step_ms
+        return self.offsets[max(0, min(slot, len(self.offsets) - 1))]
+
+    def to_bytes(self):
+        offsets = array("I", self.offsets)
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        return offsets.tobytes()
+
+    @classmethod
+    def from_bytes(cls, step_ms, data):
+        offsets = array("I")
+        offsets.frombytes(data)
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        return cls(step_ms, offsets)
+
+class SeekIndexBuilder:
+    """Builds a seek index from a song's bytes, fed in chunks of any size
+
+    Only frame headers are parsed and consumed bytes are discarded, so a
+    song can be indexed while it is being read or uploaded.
+    """
+
+    def __init__(self, file_type, step_ms=SEEK_INDEX_STEP_MS):
+        if file_type not in SEEKABLE_TYPES:
+            raise ValueError(f"Cannot build a seek index for {file_type} files")
+        self.file_type = file_type
+        self.step_ms = step_ms
+        self.offsets = array("I")
+        self.sample_rate = None
+        self._samples = 0
+        self._buffer = bytearray()
+        self._buffer_start = 0  # stream offset of self._buffer[0]
+        self._skip = 0          # bytes still to discard before the next header
+        self._started = False
+
+        # FLAC state: still in the metadata blocks, blocking strategy, next frame number
+        self._in_metadata = False
+        self._variable = None
+        self._next_number = 0
+
+    @property
+    def seconds(self):
+        """Playing time of the frames parsed so far"""
+        return self._samples / self.sample_rate if self.sample_rate else 0
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        if self.file_type == "mp3":
+            self._parse_mp3(final=False)
+        else:
+            self._parse_flac(final=False)
+
+    def finish(self):
+        """Parse what is left and return the SeekIndex, or None if no frames were found"""
+        if self.file_type == "mp3":
+            self._parse_mp3(final=True)
+        else:
+            self._parse_flac(final=True)
+        if not self.offsets:
+            return None
+        return SeekIndex(self.step_ms, self.offsets)
+
+    def _add_frame(self, pos, samples):
+        """Record a frame starting at buffer position pos"""
+        self._samples += samples
+        end_ms = self._samples * 1000 / self.sample_rate
+        offset = self._buffer_start + pos
+        while len(self.offsets) * self.step_ms < end_ms:
+            self.offsets.append(offset)
+
+    def _consume(self, count):
+        del self._buffer[:count]
+        self._buffer_start += count
+
+    def _take_skip(self, pos):
+        """Skip as much of a pending skip as the buffer allows"""
+        count = min(self._skip, len(self._buffer) - pos)
+        self._skip -= count
+        return pos + count
+
+    def _parse_mp3(self, final):
+        buf = self._buffer
+        pos = 0
+        while True:
+            pos = self._take_skip(pos)
+            if self._skip or len(buf) - pos < 10:
+                break
+
+            # ID3v2 tag (possibly with cover art) before the first frame
+            if not self._started and buf[pos:pos + 3] == b"ID3":
+                size = (buf[pos + 6] << 21) | (buf[pos + 7] << 14) | (buf[pos + 8] << 7) | buf[pos + 9]
+                footer = 10 if buf[pos + 5] & 0x10 else 0
+                self._skip = 10 + size + footer
+                continue
+
+            frame = _mp3_frame(buf, pos)
+            if frame is None or (self.sample_rate and frame[2] != self.sample_rate):
+                # Resynchronise on the next possible frame sync
+                next_sync = buf.find(b"\xff", pos + 1)
+                pos = next_sync if next_sync != -1 else len(buf)
+                continue
+
+            length, samples, sample_rate = frame
+            if not self._started:
+                # A Xing/Info/VBRI header frame carries no audio
+                if len(buf) - pos < min(length, 64) and not final:
+                    break
+                self._started = True
+                self.sample_rate = sample_rate
+                head = bytes(buf[pos:pos + min(length, 64)])
+                if b"Xing" in head or b"Info" in head or b"VBRI" in head:
+                    self._skip = length
+                    continue
+
+            self._add_frame(pos, samples)
+            self._skip = length
+        self._consume(pos)
+
+    def _parse_flac(self, final):
+        buf = self._buffer
+        pos = 0
+        while True:
+            pos = self._take_skip(pos)
+            if self._skip:
+                break
+
+            if not self._started:
+                # "fLaC" then metadata blocks; STREAMINFO comes first
+                if len(buf) - pos < 4:
+                    break
+                if buf[pos:pos + 4] != b"fLaC":
+                    raise ValueError("Not a FLAC stream")
+                pos += 4
+                self._started = True
+                self._in_metadata = True
+
+            if self._in_metadata:
+                if len(buf) - pos < 4 + 18:
+                    break
+                last = buf[pos] & 0x80
+                block_type = buf[pos] & 0x7F
+                length = (buf[pos + 1] << 16) | (buf[pos + 2] << 8) | buf[pos + 3]
+                if block_type == 0:
+                    info = buf[pos + 14:pos + 17]
+                    self.sample_rate = (info[0] << 12) | (info[1] << 4) | (info[2] >> 4)
+                self._in_metadata = not last
+                self._skip = 4 + length
+                continue
+
+            if len(buf) - pos < _FLAC_MAX_HEADER and not final:
+                break
+            if len(buf) - pos < 6:
+                break
+
+            try:
+                frame = _flac_frame(buf, pos) if buf[pos] == 0xFF else None
+            except IndexError:  # truncated header at the end of the stream
+                frame = None
+            if frame is not None:
+                number, block_size = frame
+                variable = bool(buf[pos + 1] & 0x01)
+                if self._variable is None:
+                    self._variable = variable
+                expected = self._samples if variable else self._next_number
+                if variable == self._variable and number == expected:
+                    self._add_frame(pos, block_size)
+                    self._next_number += 1
+                    pos += 2
+                    continue
+
+            # Not a frame start: look for the next sync code
+            next_sync = buf.find(b"\xff", pos + 1)
+            pos = next_sync if next_sync != -1 else len(buf)
+
+        self._consume(pos)
+
+def build_seek_index(data, file_type, step_ms=SEEK_INDEX_STEP_MS):
+    """Build a seek index from a song's bytes, or None if it cannot be indexed"""
+    if file_type not in SEEKABLE_TYPES:
+        return None
+    try:
+        builder = SeekIndexBuilder(file_type, step_ms)
+        builder.feed(data)
+        return builder.finish()
+    except (ValueError, IndexError) as e:
+        print(f"Error building seek index: {e}")
+        return None
+
+class SeekedStream(io.RawIOBase):
+    """Read-only file that plays a song from a frame offset
+
+    Presents prefix (the FLAC metadata, empty for MP3) followed by the
+    source from offset onwards, so a decoder sees a stream that starts at
+    the seek position and only bytes from there are read.
+    """
+
+    def __init__(self, source, size, offset, prefix=b""):
+        self.source = source
+        self.prefix = prefix
+        self.offset = offset
+        self.size = len(prefix) + size - offset
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        self._position = max(0, self._position)
+        return self._position
+
+    def readinto(self, buffer):
+        if self._position >= self.size:
+            return 0
+        if self._position < len(self.prefix):
+            data = self.prefix[self._position:self._position + len(buffer)]
+        else:
+            self.source.seek(self.offset + self._position - len(self.prefix))
+            data = self.source.read(min(len(buffer), self.size - self._position))
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        self.source.close()
+        super().close()
+
+# ------------------- Storage -------------------
+# Indexes never change once built, so the most recently used ones are kept
+# for the process. Songs without one are looked up again: another process
+# may save their index later.
+MAX_LOADED_INDEXES = 256
+
+_loaded = OrderedDict()
+_loaded_lock = threading.Lock()
+
+def save_seek_index(cursor, song_id, index):
+    """Store a song's seek index using the caller's cursor (commit is left to the caller)"""
+    cursor.execute("DELETE FROM Song_Seek_Index WHERE song_id = %s", (song_id,))
+    cursor.execute(
+        "INSERT INTO Song_Seek_Index (song_id, step_ms, offsets) VALUES (%s, %s, %s)",
+        (song_id, index.step_ms, index.to_bytes())
+    )
+    with _loaded_lock:
+        _loaded.pop(song_id, None)
+
+def get_seek_index(song_id, quiet=False):
+    """Get a song's seek index, or None if it has none"""
+    with _loaded_lock:
+        index = _loaded.get(song_id)
+        if index is not None:
+            _loaded.move_to_end(song_id)
+            return index
+    try:
+        connection = connect_db(read_only=True, quiet=quiet)
+        if not connection:
+            return None
+
+        query = "SELECT step_ms, offsets FROM Song_Seek_Index WHERE song_id = %s"
+        cursor = prepared_cursor(connection, query)
+        cursor.execute(query, (song_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+
+        index = SeekIndex.from_bytes(row[0], bytes(row[1]))
+        with _loaded_lock:
+            _loaded[song_id] = index
+            if len(_loaded) > MAX_LOADED_INDEXES:
+                _loaded.popitem(last=False)
+        return index
+
+    except DB_ERRORS as e:
+        print(f"Error getting seek index: {e}")
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def backfill_seek_indexes(rebuild=False, step_ms=SEEK_INDEX_STEP_MS):
+    """Index MP3 and FLAC songs that have no seek index yet
+
+    Songs are streamed from the database in chunks, so memory use does not
+    grow with song size. Returns (indexed, failed).
+    """
+    from utils.audio_utils import read_song_chunks_from_db
+
+    connection = connect_db()
+    if not connection:
+        return 0, 0
+
+    indexed = failed = 0
+    try:
+        cursor = connection.cursor()
+        query = "SELECT s.song_id, s.file_type FROM Songs s WHERE s.file_type IN ('mp3', 'flac')"
+        if not rebuild:
+            query += " AND NOT EXISTS (SELECT 1 FROM Song_Seek_Index i WHERE i.song_id = s.song_id)"
+        cursor.execute(query + " ORDER BY s.song_id")
+        songs = cursor.fetchall()
+
+        for song_id, file_type in songs:
+            try:
+                builder = SeekIndexBuilder(file_type, step_ms)
+                for chunk in read_song_chunks_from_db(song_id):
+                    builder.feed(chunk)
+                index = builder.finish()
+            except (ValueError, IndexError, IOError) as e:
+                print(f"Song {song_id}: {e}")
+                index = None
+
+            if index is None:
+                failed += 1
+                continue
+            save_seek_index(cursor, song_id, index)
+            connection.commit()
+            indexed += 1
+        return indexed, failed
+
+    except DB_ERRORS as e:
+        print(f"Error backfilling seek indexes: {e}")
+        return indexed, failed
+    finally:
+        if connection.is_connected():
+            cursor.close()
+            connection.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build seek indexes for MP3 and FLAC songs")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild existing indexes too")
+    parser.add_argument("--step-ms", type=int, default=SEEK_INDEX_STEP_MS)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    indexed, failed = backfill_seek_indexes(args.rebuild, args.step_ms)
+    print(f"Indexed {indexed} songs ({failed} failed) in {time.perf_counter() - start:.1f}s")
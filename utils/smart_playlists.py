@@ -0,0 +1,515 @@
+"""
+Smart playlists
+Playlists defined by rules instead of a song list, e.g. "most played Jazz
+this month" or "unplayed uploads since last week". Rules are a JSON object:
+
+    genre                 genre name
+    artist                artist name
+    favorites             true: only the owner's favorites
+    played                "never" or "ever" (by the owner)
+    played_within_days    count only plays from the last N days ("ever" unless played is given)
+    uploaded_within_days  only songs uploaded in the last N days
+    order                 "plays" (default with played_within_days), "newest" (default) or "title"
+    limit                 number of songs (default SMART_PLAYLIST_SIZE)
+
+    {"genre": "Jazz", "played_within_days": 30}
+    {"uploaded_within_days": 7, "played": "never"}
+    {"favorites": true, "artist": "Miles Davis"}
+
+Rules compile to one SQL query over the indexed columns of Songs,
+Listening_History/User_Daily_Plays and User_Favorites, and the result is
+materialized in Smart_Playlist_Songs. Refreshes are incremental: only songs
+uploaded after last_song_id and songs the owner played after
+last_history_id are re-evaluated. Day-based windows move at midnight, so
+each playlist is recomputed in full once per day, and when the owner's
+favorites change for favorites rules.
+
+Usage: python -m utils.smart_playlists --refresh [--every SECONDS]   (scheduled batch refresh)
+       python -m utils.smart_playlists --create USER_ID NAME RULES | --show ID
+"""
+import argparse
+import datetime
+import json
+import time
+from config import (SMART_PLAYLIST_SIZE, SMART_PLAYLIST_MAX_SIZE, SMART_PLAYLIST_REFRESH_BATCH,
+                    SMART_PLAYLIST_REFRESH_PAUSE, SMART_PLAYLIST_INCREMENTAL_MAX)
+from utils.db_utils import connect_db, DB_ERRORS
+from utils.change_events import publish
+from utils.history_retention import get_history_watermark
+
+RULE_KEYS = {"genre", "artist", "favorites", "played", "played_within_days",
+             "uploaded_within_days", "order", "limit"}
+
+ORDERS = {
+    "plays": "plays DESC, s.upload_date DESC, s.song_id DESC",
+    "newest": "s.upload_date DESC, s.song_id DESC",
+    "title": "s.title ASC, s.song_id ASC",
+}
+
+# Plays per song by one user since a time, raw plays after the rollup
+# watermark plus the daily rollups; {songs} restricts the songs
+_PLAYS_SQL = """
+    SELECT song_id, SUM(plays) AS plays FROM (
+        SELECT song_id, COUNT(*) AS plays FROM Listening_History
+        WHERE user_id = %s AND played_at >= %s{songs} GROUP BY song_id
+        UNION ALL
+        SELECT song_id, SUM(plays) AS plays FROM User_Daily_Plays
+        WHERE user_id = %s AND day >= %s{songs} GROUP BY song_id
+    ) combined_plays GROUP BY song_id
+"""
+
+def _positive_int(rules, key):
+    value = rules[key]
+    if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+        raise ValueError(f"{key} must be a positive whole number")
+    return value
+
+def _day_start(today, days):
+    return f"{today - datetime.timedelta(days=days):%Y-%m-%d} 00:00:00"
+
+def check_rules(rules):
+    """Raise ValueError if rules are not a valid smart playlist definition"""
+    if not isinstance(rules, dict):
+        raise ValueError("Rules must be a JSON object")
+    unknown = set(rules) - RULE_KEYS
+    if unknown:
+        raise ValueError(f"Unknown rules: {', '.join(sorted(unknown))}")
+    for key in ("genre", "artist"):
+        if key in rules and not isinstance(rules[key], str):
+            raise ValueError(f"{key} must be a name")
+    for key in ("played_within_days", "uploaded_within_days", "limit"):
+        if key in rules:
+            _positive_int(rules, key)
+    if rules.get("limit", 0) > SMART_PLAYLIST_MAX_SIZE:
+        raise ValueError(f"limit can be at most {SMART_PLAYLIST_MAX_SIZE}")
+    if rules.get("played", "ever") not in ("never", "ever"):
+        raise ValueError('played must be "never" or "ever"')
+    if rules.get("order", "newest") not in ORDERS:
+        raise ValueError(f"order must be one of {', '.join(ORDERS)}")
+
+def compile_rules(rules, user_id, watermark, today, songs=None):
+    """SQL and params selecting (song_id, plays) of the songs matching rules, in playlist order
+
+    watermark is the history rollup watermark. songs optionally restricts
+    the evaluation to some songs: (SQL condition on {column}, params).
+    """
+    check_rules(rules)
+    window = rules.get("played_within_days")
+    since = _day_start(today, window) if window else "1970-01-01 00:00:00"
+    song_filter, song_params = "", []
+    if songs:
+        song_filter = " AND " + songs[0].format(column="song_id")
+        song_params = list(songs[1])
+
+    params = [user_id, max(since, watermark), *song_params, user_id, since[:10], *song_params]
+    conditions = []
+    if songs:
+        conditions.append(songs[0].format(column="s.song_id"))
+        params.extend(songs[1])
+    if "genre" in rules:
+        conditions.append("s.genre_id IN (SELECT genre_id FROM Genres WHERE name = %s)")
+        params.append(rules["genre"])
+    if "artist" in rules:
+        conditions.append("s.artist_id IN (SELECT artist_id FROM Artists WHERE name = %s)")
+        params.append(rules["artist"])
+    if rules.get("favorites"):
+        conditions.append("s.song_id IN (SELECT song_id FROM User_Favorites WHERE user_id = %s)")
+        params.append(user_id)
+    if "uploaded_within_days" in rules:
+        conditions.append("s.upload_date >= %s")
+        params.append(_day_start(today, rules["uploaded_within_days"]))
+
+    played = rules.get("played", "ever" if window else None)
+    if played == "never":
+        conditions.append("p.plays IS NULL")
+    elif played == "ever":
+        conditions.append("p.plays > 0")
+
+    order = rules.get("order", "plays" if window else "newest")
+    query = f"""
+        SELECT s.song_id, COALESCE(p.plays, 0) AS plays
+        FROM Songs s
+        LEFT JOIN ({_PLAYS_SQL.format(songs=song_filter)}) p ON p.song_id = s.song_id
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        ORDER BY {ORDERS[order]}
+        LIMIT %s
+    """
+    params.append(rules.get("limit", SMART_PLAYLIST_SIZE))
+    return query, tuple(params)
+
+# ------------------- Refresh -------------------
+def _favorites_key(cursor, user_id):
+    """Changes whenever the user's favorites do"""
+    cursor.execute("SELECT COUNT(*), MAX(added_at) FROM User_Favorites WHERE user_id = %s", (user_id,))
+    count, latest = cursor.fetchone()
+    return f"{count}:{latest}"
+
+def _ordered_song_ids(cursor, playlist_id, order):
+    cursor.execute(
+        f"""
+        SELECT sp.song_id, sp.plays AS plays FROM Smart_Playlist_Songs sp
+        JOIN Songs s ON sp.song_id = s.song_id
+        WHERE sp.smart_playlist_id = %s
+        ORDER BY {ORDERS[order]}
+        """,
+        (playlist_id,)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+def _materialize(cursor, playlist, watermark, today, songs=None):
+    """Insert the playlist's matching songs (only those in songs, if given)"""
+    query, params = compile_rules(playlist["rules"], playlist["user_id"], watermark, today, songs)
+    cursor.execute(
+        f"""
+        INSERT INTO Smart_Playlist_Songs (smart_playlist_id, song_id, plays)
+        SELECT %s, song_id, plays FROM ({query}) matching
+        """,
+        (playlist["smart_playlist_id"],) + params
+    )
+
+def refresh_playlist(cursor, playlist, watermark, max_song_id, favorites_key=None, today=None):
+    """Bring one playlist's materialized songs up to date
+
+    playlist is its Smart_Playlists row with rules parsed. Only songs up to
+    max_song_id are materialized, so a song uploaded since it was read is
+    left to the next refresh rather than inserted twice. Returns "full",
+    "incremental" or None if nothing had changed. The caller commits.
+    """
+    today = today or datetime.date.today()
+    playlist_id, user_id, rules = playlist["smart_playlist_id"], playlist["user_id"], playlist["rules"]
+    limit = rules.get("limit", SMART_PLAYLIST_SIZE)
+    order = rules.get("order", "plays" if "played_within_days" in rules else "newest")
+
+    cursor.execute("SELECT COALESCE(MAX(history_id), 0) FROM Listening_History WHERE user_id = %s", (user_id,))
+    last_history_id = cursor.fetchone()[0]
+
+    full = (str(playlist["refreshed_day"]) != str(today)
+            or (rules.get("favorites") and favorites_key != playlist["favorites_key"]))
+    if not full:
+        played = []
+        if last_history_id > playlist["last_history_id"]:
+            cursor.execute(
+                "SELECT DISTINCT song_id FROM Listening_History WHERE user_id = %s AND history_id > %s",
+                (user_id, playlist["last_history_id"])
+            )
+            played = [row[0] for row in cursor.fetchall()]
+        if not played and max_song_id <= playlist["last_song_id"]:
+            return None
+        # Too many changed songs to re-evaluate one by one
+        full = len(played) > SMART_PLAYLIST_INCREMENTAL_MAX
+
+    uploaded = ("{column} <= %s", [max_song_id])
+    if full:
+        cursor.execute("DELETE FROM Smart_Playlist_Songs WHERE smart_playlist_id = %s", (playlist_id,))
+        _materialize(cursor, playlist, watermark, today, uploaded)
+    else:
+        was_full = len(_ordered_song_ids(cursor, playlist_id, order)) >= limit
+        condition, params = "{column} > %s", [playlist["last_song_id"]]
+        if played:
+            placeholders = ", ".join(["%s"] * len(played))
+            cursor.execute(
+                f"DELETE FROM Smart_Playlist_Songs WHERE smart_playlist_id = %s AND song_id IN ({placeholders})",
+                (playlist_id, *played)
+            )
+            condition = f"({{column}} > %s OR {{column}} IN ({placeholders}))"
+            params += played
+        _materialize(cursor, playlist, watermark, today,
+                     (f"{condition} AND {{column}} <= %s", params + [max_song_id]))
+
+        # Keep the best limit songs; a song that stopped matching can leave
+        # room for one that was never materialized, so recompute then
+        song_ids = _ordered_song_ids(cursor, playlist_id, order)
+        if len(song_ids) > limit:
+            extra = song_ids[limit:]
+            cursor.execute(
+                f"DELETE FROM Smart_Playlist_Songs WHERE smart_playlist_id = %s "
+                f"AND song_id IN ({', '.join(['%s'] * len(extra))})",
+                (playlist_id, *extra)
+            )
+        elif was_full and len(song_ids) < limit:
+            cursor.execute("DELETE FROM Smart_Playlist_Songs WHERE smart_playlist_id = %s", (playlist_id,))
+            _materialize(cursor, playlist, watermark, today, uploaded)
+            full = True
+
+    cursor.execute(
+        """
+        UPDATE Smart_Playlists
+        SET last_history_id = %s, last_song_id = %s, favorites_key = %s, refreshed_day = %s, refreshed_at = %s
+        WHERE smart_playlist_id = %s
+        """,
+        (last_history_id, max_song_id, favorites_key, str(today),
+         f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S}", playlist_id)
+    )
+    return "full" if full else "incremental"
+
+def _load_playlist(row):
+    row["rules"] = json.loads(row["rules"])
+    return row
+
+def refresh_smart_playlists(batch_size=SMART_PLAYLIST_REFRESH_BATCH, pause=SMART_PLAYLIST_REFRESH_PAUSE):
+    """Refresh every smart playlist that has anything new; returns a summary dict or None
+
+    Playlists are read in batches of batch_size. Per batch, one grouped
+    query finds the owners with new plays, so playlists with nothing new
+    cost no further queries; each refreshed playlist is its own
+    transaction and the refresh sleeps pause seconds between batches to
+    leave the database to interactive queries.
+    """
+    started = time.perf_counter()
+    summary = {"playlists": 0, "full": 0, "incremental": 0, "unchanged": 0, "failed": 0}
+    try:
+        connection = connect_db()
+        if not connection:
+            return None
+
+        cursor = connection.cursor(dictionary=True)
+        today = datetime.date.today()
+        watermark = get_history_watermark(connection)
+        cursor.execute("SELECT COALESCE(MAX(song_id), 0) AS max_song_id FROM Songs")
+        max_song_id = cursor.fetchone()["max_song_id"]
+
+        after = 0
+        while True:
+            cursor.execute(
+                "SELECT * FROM Smart_Playlists WHERE smart_playlist_id > %s ORDER BY smart_playlist_id LIMIT %s",
+                (after, batch_size)
+            )
+            playlists = [_load_playlist(row) for row in cursor.fetchall()]
+            if not playlists:
+                break
+            after = playlists[-1]["smart_playlist_id"]
+            summary["playlists"] += len(playlists)
+
+            user_ids = sorted({playlist["user_id"] for playlist in playlists})
+            placeholders = ", ".join(["%s"] * len(user_ids))
+            cursor.execute(
+                f"""
+                SELECT user_id, MAX(history_id) AS last_history_id FROM Listening_History
+                WHERE history_id > %s AND user_id IN ({placeholders}) GROUP BY user_id
+                """,
+                (min(playlist["last_history_id"] for playlist in playlists), *user_ids)
+            )
+            last_plays = {row["user_id"]: row["last_history_id"] for row in cursor.fetchall()}
+
+            favorites_keys = {}
+            for playlist in playlists:
+                user_id = playlist["user_id"]
+                writer = connection.cursor()
+                try:
+                    key = None
+                    if playlist["rules"].get("favorites"):
+                        if user_id not in favorites_keys:
+                            favorites_keys[user_id] = _favorites_key(writer, user_id)
+                        key = favorites_keys[user_id]
+
+                    unchanged = (str(playlist["refreshed_day"]) == str(today)
+                                 and playlist["last_song_id"] >= max_song_id
+                                 and last_plays.get(user_id, 0) <= playlist["last_history_id"]
+                                 and key == playlist["favorites_key"])
+                    if unchanged:
+                        summary["unchanged"] += 1
+                        continue
+
+                    kind = refresh_playlist(writer, playlist, watermark, max_song_id, key, today)
+                    connection.commit()
+                    summary[kind or "unchanged"] += 1
+                except (DB_ERRORS + (ValueError,)) as e:
+                    connection.rollback()
+                    print(f"Error refreshing smart playlist {playlist['smart_playlist_id']}: {e}")
+                    summary["failed"] += 1
+                finally:
+                    writer.close()
+
+            if len(playlists) < batch_size:
+                break
+            time.sleep(pause)
+
+        summary["seconds"] = time.perf_counter() - started
+        return summary
+
+    except DB_ERRORS as e:
+        print(f"Error refreshing smart playlists: {e}")
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+# ------------------- Playlists -------------------
+def create_smart_playlist(user_id, name, rules):
+    """Create a smart playlist; returns its ID (ValueError for invalid rules)
+
+    Its songs are computed on its first read or scheduled refresh.
+    """
+    check_rules(rules)
+    try:
+        connection = connect_db()
+        if not connection:
+            return None
+
+        cursor = connection.cursor()
+        cursor.execute("INSERT INTO Smart_Playlists (user_id, name, rules) VALUES (%s, %s, %s)",
+                       (user_id, name, json.dumps(rules)))
+        playlist_id = cursor.lastrowid
+        publish(connection, "smart_playlist.created", playlist_id, user_id)
+        connection.commit()
+        return playlist_id
+
+    except DB_ERRORS as e:
+        print(f"Error creating smart playlist: {e}")
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def update_smart_playlist(playlist_id, name, rules):
+    """Rename a smart playlist and replace its rules; it is recomputed on its next read"""
+    check_rules(rules)
+    try:
+        connection = connect_db()
+        if not connection:
+            return False
+
+        cursor = connection.cursor()
+        cursor.execute(
+            "UPDATE Smart_Playlists SET name = %s, rules = %s, refreshed_day = NULL WHERE smart_playlist_id = %s",
+            (name, json.dumps(rules), playlist_id)
+        )
+        if cursor.rowcount > 0:
+            publish(connection, "smart_playlist.updated", playlist_id)
+        connection.commit()
+        return cursor.rowcount > 0
+
+    except DB_ERRORS as e:
+        print(f"Error updating smart playlist: {e}")
+        return False
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def delete_smart_playlist(playlist_id):
+    """Delete a smart playlist; returns True if it existed"""
+    try:
+        connection = connect_db()
+        if not connection:
+            return False
+
+        cursor = connection.cursor()
+        # Its materialized songs go with it (ON DELETE CASCADE)
+        cursor.execute("DELETE FROM Smart_Playlists WHERE smart_playlist_id = %s", (playlist_id,))
+        if cursor.rowcount > 0:
+            publish(connection, "smart_playlist.deleted", playlist_id)
+        connection.commit()
+        return cursor.rowcount > 0
+
+    except DB_ERRORS as e:
+        print(f"Error deleting smart playlist: {e}")
+        return False
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def get_user_smart_playlists(user_id):
+    """A user's smart playlists with their rules and song counts"""
+    try:
+        connection = connect_db(read_only=True)
+        if not connection:
+            return []
+
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(
+            """
+            SELECT sp.smart_playlist_id, sp.name, sp.rules, sp.refreshed_at,
+                   (SELECT COUNT(*) FROM Smart_Playlist_Songs s
+                    WHERE s.smart_playlist_id = sp.smart_playlist_id) AS song_count
+            FROM Smart_Playlists sp
+            WHERE sp.user_id = %s
+            ORDER BY sp.name
+            """,
+            (user_id,)
+        )
+        return [_load_playlist(row) for row in cursor.fetchall()]
+
+    except DB_ERRORS as e:
+        print(f"Error getting smart playlists: {e}")
+        return []
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def get_smart_playlist_songs(playlist_id):
+    """A smart playlist's songs in order, refreshed first if anything changed"""
+    try:
+        connection = connect_db()
+        if not connection:
+            return []
+
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM Smart_Playlists WHERE smart_playlist_id = %s", (playlist_id,))
+        row = cursor.fetchone()
+        if not row:
+            return []
+        playlist = _load_playlist(row)
+        rules = playlist["rules"]
+
+        writer = connection.cursor()
+        try:
+            writer.execute("SELECT COALESCE(MAX(song_id), 0) FROM Songs")
+            max_song_id = writer.fetchone()[0]
+            key = _favorites_key(writer, playlist["user_id"]) if rules.get("favorites") else None
+            if refresh_playlist(writer, playlist, get_history_watermark(connection), max_song_id, key):
+                connection.commit()
+        finally:
+            writer.close()
+
+        order = rules.get("order", "plays" if "played_within_days" in rules else "newest")
+        cursor.execute(
+            f"""
+            SELECT s.song_id, s.title, a.name AS artist_name, g.name AS genre_name,
+                   s.file_size, s.file_type, s.duration, s.upload_date, sp.plays AS plays
+            FROM Smart_Playlist_Songs sp
+            JOIN Songs s ON sp.song_id = s.song_id
+            LEFT JOIN Artists a ON s.artist_id = a.artist_id
+            LEFT JOIN Genres g ON s.genre_id = g.genre_id
+            WHERE sp.smart_playlist_id = %s
+            ORDER BY {ORDERS[order]}
+            """,
+            (playlist_id,)
+        )
+        return cursor.fetchall()
+
+    except DB_ERRORS as e:
+        print(f"Error getting smart playlist songs: {e}")
+        return []
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh, create or show smart playlists")
+    parser.add_argument("--refresh", action="store_true", help="refresh every playlist with new songs or plays")
+    parser.add_argument("--every", type=float, metavar="SECONDS", help="with --refresh: repeat forever")
+    parser.add_argument("--create", nargs=3, metavar=("USER_ID", "NAME", "RULES"))
+    parser.add_argument("--show", type=int, metavar="ID")
+    args = parser.parse_args()
+
+    if args.create:
+        try:
+            playlist_id = create_smart_playlist(int(args.create[0]), args.create[1], json.loads(args.create[2]))
+        except ValueError as e:
+            parser.error(f"invalid rules: {e}")
+        print(f"Created smart playlist {playlist_id}")
+    if args.refresh:
+        while True:
+            print(f"Refreshed smart playlists: {refresh_smart_playlists()}")
+            if not args.every:
+                break
+            time.sleep(args.every)
+    if args.show:
+        for position, song in enumerate(get_smart_playlist_songs(args.show), 1):
+            print(f"{position:>3}. {song['artist_name']} - {song['title']} ({song['plays']} plays)")
@@ -0,0 +1,245 @@
+"""
+Song sets
+Each user's favorite and played song IDs as sorted integer arrays, so a
+list of thousands of songs is marked up (♥, played) or a recommendation
+list filtered with one binary search per song instead of a query per row.
+
+The sets are loaded once per session and kept in a file per user in
+SONG_SETS_DIR, shared by the page processes and the playback daemon. On
+load, plays recorded since the file was written are caught up from
+Listening_History (by history_id) and favorites are re-read if their count
+no longer matches. Toggling a favorite or playing a song updates the file,
+read-modify-write under a file lock.
+"""
+import os
+import pickle
+import threading
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from config import DB_BACKEND, SONG_SETS_DIR
+from utils.db_utils import connect_db, DB_ERRORS
+from utils.change_events import publish
+
+try:
+    import fcntl
+except ImportError:  # Windows: song set updates are not locked across processes
+    fcntl = None
+
+class SongIdSet:
+    """A set of song IDs kept as a sorted array of unsigned ints"""
+
+    def __init__(self, song_ids=()):
+        self.ids = array("I", sorted(set(song_ids)))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __contains__(self, song_id):
+        i = bisect_left(self.ids, song_id)
+        return i < len(self.ids) and self.ids[i] == song_id
+
+    def add(self, song_id):
+        i = bisect_left(self.ids, song_id)
+        if i == len(self.ids) or self.ids[i] != song_id:
+            self.ids.insert(i, song_id)
+
+    def discard(self, song_id):
+        i = bisect_left(self.ids, song_id)
+        if i < len(self.ids) and self.ids[i] == song_id:
+            del self.ids[i]
+
+    def update(self, song_ids):
+        """Add many song IDs at once"""
+        new_ids = set(song_ids).difference(self.ids)
+        if new_ids:
+            self.ids = array("I", sorted(new_ids.union(self.ids)))
+
+class UserSongSets:
+    """One user's favorite and played songs, backed by a file shared between processes"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.path = os.path.join(SONG_SETS_DIR, f"user_{user_id}.pickle")
+        self.favorites = SongIdSet()
+        self.played = SongIdSet()
+        self.history_id = 0  # Plays up to this Listening_History row are in played
+        self._loaded_mtime = None
+        self._lock = threading.RLock()
+
+    def _sync_from_disk(self):
+        """Reload the file if another process changed it; False if there is none"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._loaded_mtime:
+            return True
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+            self.favorites.ids = state["favorites"]
+            self.played.ids = state["played"]
+            self.history_id = state["history_id"]
+            self._loaded_mtime = mtime
+            return True
+        except (OSError, pickle.PickleError, EOFError, KeyError) as e:
+            print(f"Error reading song sets: {e}")
+            return False
+
+    def _save_to_disk(self):
+        """Write the file atomically"""
+        try:
+            os.makedirs(SONG_SETS_DIR, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"favorites": self.favorites.ids, "played": self.played.ids,
+                             "history_id": self.history_id}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self._loaded_mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            print(f"Error writing song sets: {e}")
+
+    @contextmanager
+    def _file_lock(self):
+        """Hold the thread lock and the file lock for a read-modify-write; yields whether the file exists"""
+        with self._lock:
+            try:
+                os.makedirs(SONG_SETS_DIR, exist_ok=True)
+                lock_file = open(f"{self.path}.lock", "w")
+            except OSError as e:
+                print(f"Error locking song sets: {e}")
+                lock_file = None
+            try:
+                if lock_file and fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield self._sync_from_disk()
+            finally:
+                if lock_file:
+                    lock_file.close()
+
+    def load(self):
+        """Read the file and catch up with the database"""
+        with self._file_lock():
+            try:
+                connection = connect_db(read_only=True)
+                if not connection:
+                    return self
+
+                cursor = connection.cursor()
+                cursor.execute(
+                    "SELECT song_id, MAX(history_id) FROM Listening_History"
+                    " WHERE user_id = %s AND history_id > %s GROUP BY song_id",
+                    (self.user_id, self.history_id)
+                )
+                plays = cursor.fetchall()
+                if self.history_id == 0:
+                    # First load: plays already rolled up out of Listening_History
+                    cursor.execute("SELECT DISTINCT song_id FROM User_Daily_Plays WHERE user_id = %s",
+                                   (self.user_id,))
+                    self.played.update(row[0] for row in cursor.fetchall())
+                self.played.update(song_id for song_id, _ in plays)
+                self.history_id = max([self.history_id] + [history_id for _, history_id in plays])
+
+                cursor.execute("SELECT COUNT(*) FROM User_Favorites WHERE user_id = %s", (self.user_id,))
+                if cursor.fetchone()[0] != len(self.favorites):
+                    cursor.execute("SELECT song_id FROM User_Favorites WHERE user_id = %s", (self.user_id,))
+                    self.favorites = SongIdSet(row[0] for row in cursor.fetchall())
+
+                self._save_to_disk()
+
+            except DB_ERRORS as e:
+                print(f"Error loading song sets: {e}")
+            finally:
+                if 'connection' in locals() and connection and connection.is_connected():
+                    cursor.close()
+                    connection.close()
+        return self
+
+    def mark_songs(self, songs):
+        """Set "favorite" and "played" on song dicts (with a song_id) and return them"""
+        with self._lock:
+            self._sync_from_disk()
+            for song in songs:
+                song["favorite"] = song["song_id"] in self.favorites
+                song["played"] = song["song_id"] in self.played
+        return songs
+
+    def not_played(self, song_ids):
+        """The song IDs the user has never played, in the same order"""
+        with self._lock:
+            self._sync_from_disk()
+            return [song_id for song_id in song_ids if song_id not in self.played]
+
+    def is_favorite(self, song_id):
+        with self._lock:
+            self._sync_from_disk()
+            return song_id in self.favorites
+
+    def set_favorite(self, song_id, favorite=True):
+        """Add a song to or remove it from the user's favorites; returns True on success"""
+        try:
+            connection = connect_db()
+            if not connection:
+                return False
+
+            cursor = connection.cursor()
+            if favorite:
+                verb = "INSERT OR IGNORE" if DB_BACKEND == "sqlite" else "INSERT IGNORE"
+                cursor.execute(f"{verb} INTO User_Favorites (user_id, song_id) VALUES (%s, %s)",
+                               (self.user_id, song_id))
+            else:
+                cursor.execute("DELETE FROM User_Favorites WHERE user_id = %s AND song_id = %s",
+                               (self.user_id, song_id))
+            if cursor.rowcount > 0:
+                publish(connection, "favorite.added" if favorite else "favorite.removed", song_id, self.user_id)
+            connection.commit()
+
+        except DB_ERRORS as e:
+            print(f"Error updating favorites: {e}")
+            return False
+        finally:
+            if 'connection' in locals() and connection and connection.is_connected():
+                cursor.close()
+                connection.close()
+
+        with self._file_lock():
+            if favorite:
+                self.favorites.add(song_id)
+            else:
+                self.favorites.discard(song_id)
+            self._save_to_disk()
+        return True
+
+    def toggle_favorite(self, song_id):
+        """Flip a song's favorite status; returns the new status, or None on failure"""
+        favorite = not self.is_favorite(song_id)
+        return favorite if self.set_favorite(song_id, favorite) else None
+
+    def add_play(self, song_id):
+        """Record a play that was just written to Listening_History"""
+        with self._file_lock() as exists:
+            # Without a file yet, the next load reads the play from the database
+            if exists and song_id not in self.played:
+                self.played.add(song_id)
+                self._save_to_disk()
+
+_user_sets = {}
+_user_sets_lock = threading.Lock()
+
+def get_song_sets(user_id):
+    """The user's song sets, loaded on first use in this process"""
+    with _user_sets_lock:
+        sets = _user_sets.get(user_id)
+        if sets is None:
+            sets = _user_sets[user_id] = UserSongSets(user_id).load()
+        return sets
+
+def record_play(user_id, song_id):
+    """Add a song to the user's played set, without loading it from the database"""
+    with _user_sets_lock:
+        sets = _user_sets.get(user_id) or UserSongSets(user_id)
+    sets.add_play(song_id)
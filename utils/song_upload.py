@@ -0,0 +1,356 @@
+"""
+Chunked song uploads
+Sends a song to the database in UPLOAD_CHUNK_SIZE pieces instead of one
+INSERT holding the whole file, so client memory stays bounded and no
+packet comes near the server's max_allowed_packet. Each chunk is committed
+as it arrives; an interrupted or cancelled upload of the same file resumes
+after the last stored chunk. The SHA-256, duration and seek index are
+computed while the file is read, so it is read exactly once.
+
+Songs uploaded this way have an empty Songs.file_data; their audio lives
+in Upload_Chunks and is read back by read_uploaded_chunks. Unfinished
+uploads started more than UPLOAD_ABANDONED_DAYS ago are purged whenever a
+new upload starts.
+
+Usage: python -m utils.song_upload <file> --title T --artist-id N [--genre-id N]
+       python -m utils.song_upload --unfinished | --discard UPLOAD_ID | --purge [--days N]
+"""
+import argparse
+import datetime
+import hashlib
+import io
+import os
+import threading
+import time
+import wave
+from config import UPLOAD_CHUNK_SIZE, UPLOAD_ABANDONED_DAYS
+from utils.db_utils import connect_db, prepared_cursor, DB_ERRORS
+from utils.seek_index import SeekIndexBuilder, SEEKABLE_TYPES, save_seek_index
+from utils.cache import invalidate
+from utils.change_events import publish
+
+CHUNK_QUERY = "SELECT data FROM Upload_Chunks WHERE upload_id = %s AND chunk_index = %s"
+
+def read_uploaded_chunks(connection, song_id, offset=0):
+    """Yield the audio of a chunk-uploaded song from a byte offset, one stored chunk at a time"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT upload_id, chunk_size FROM Upload_Sessions WHERE song_id = %s", (song_id,))
+        row = cursor.fetchone()
+        cursor.fetchall()
+    finally:
+        cursor.close()
+    if row is None:
+        return
+
+    upload_id, chunk_size = row
+    index, skip = divmod(offset, chunk_size)
+    cursor = prepared_cursor(connection, CHUNK_QUERY)
+    while True:
+        cursor.execute(CHUNK_QUERY, (upload_id, index))
+        row = cursor.fetchone()
+        cursor.fetchall()
+        if row is None:
+            return
+        yield bytes(row[0][skip:])
+        skip = 0
+        index += 1
+
+def _find_session(cursor, file_path, file_size, file_mtime, chunk_size):
+    """(upload_id, chunks stored) of an unfinished upload of this file, or None"""
+    cursor.execute(
+        """
+        SELECT u.upload_id, COUNT(c.chunk_index)
+        FROM Upload_Sessions u
+        LEFT JOIN Upload_Chunks c ON c.upload_id = u.upload_id
+        WHERE u.song_id IS NULL AND u.file_path = %s AND u.file_size = %s
+          AND u.file_mtime = %s AND u.chunk_size = %s
+        GROUP BY u.upload_id
+        ORDER BY u.upload_id DESC
+        LIMIT 1
+        """,
+        (file_path, file_size, file_mtime, chunk_size)
+    )
+    return cursor.fetchone()
+
+def _purge_abandoned(cursor, days):
+    """Delete unfinished uploads started more than days ago; returns how many were deleted"""
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
+    # Chunks go with the session (ON DELETE CASCADE)
+    cursor.execute("DELETE FROM Upload_Sessions WHERE song_id IS NULL AND started_at < %s",
+                   (f"{cutoff:%Y-%m-%d %H:%M:%S}",))
+    return cursor.rowcount
+
+def _duration(file_path, file_type, builder, header):
+    """Song length in whole seconds from what the upload pass collected"""
+    if builder is not None and builder.sample_rate:
+        return int(builder.seconds)
+    if file_type in ("wav", "wave"):
+        try:
+            with wave.open(io.BytesIO(header)) as audio:
+                return int(audio.getnframes() / audio.getframerate())
+        except (wave.Error, EOFError, ZeroDivisionError):
+            pass
+    # Other formats: mutagen only reads the file's headers
+    from utils.audio_utils import get_audio_duration
+    return get_audio_duration(file_path)
+
+def upload_song_chunked(file_path, title, artist_id, genre_id=None, album_id=None,
+                        chunk_size=UPLOAD_CHUNK_SIZE, on_progress=None, cancel_event=None):
+    """Upload a song in chunks, resuming an earlier upload of the same file
+
+    on_progress is called after every chunk with bytes_done, bytes_total,
+    resumed_from (bytes already stored by an earlier attempt) and
+    bytes_per_second over this attempt. Setting cancel_event stops after
+    the current chunk and keeps the stored ones for a later resume.
+    Returns a result dict with the song_id, status ("uploaded",
+    "cancelled" or "failed") and SHA-256.
+    """
+    result = {"song_id": None, "status": "failed", "sha256": None, "bytes_per_second": 0.0}
+    try:
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        file_size = stat.st_size
+        file_type = os.path.splitext(file_path)[1][1:].lower()
+
+        connection = connect_db()
+        if not connection:
+            result["error"] = "Could not connect to database"
+            return result
+        cursor = connection.cursor()
+
+        session = _find_session(cursor, file_path, file_size, int(stat.st_mtime), chunk_size)
+        if session:
+            upload_id, stored = session
+        else:
+            _purge_abandoned(cursor, UPLOAD_ABANDONED_DAYS)
+            cursor.execute(
+                """
+                INSERT INTO Upload_Sessions (file_path, file_size, file_mtime, chunk_size)
+                VALUES (%s, %s, %s, %s)
+                """,
+                (file_path, file_size, int(stat.st_mtime), chunk_size)
+            )
+            upload_id, stored = cursor.lastrowid, 0
+            connection.commit()
+        result["upload_id"] = upload_id
+
+        digest = hashlib.sha256()
+        builder = SeekIndexBuilder(file_type) if file_type in SEEKABLE_TYPES else None
+        header = b""
+        progress = {
+            "bytes_done": min(stored * chunk_size, file_size),
+            "bytes_total": file_size,
+            "resumed_from": min(stored * chunk_size, file_size),
+            "bytes_per_second": 0.0
+        }
+        start = time.perf_counter()
+
+        # One pass over the file: chunks stored by an earlier attempt are
+        # only hashed and indexed, the rest are also sent
+        with open(file_path, "rb") as f:
+            index = 0
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                if index == 0:
+                    header = chunk
+                digest.update(chunk)
+                if builder is not None:
+                    try:
+                        builder.feed(chunk)
+                    except (ValueError, IndexError) as e:
+                        print(f"Error building seek index: {e}")
+                        builder = None
+
+                if index >= stored:
+                    if cancel_event is not None and cancel_event.is_set():
+                        result["status"] = "cancelled"
+                        return result
+                    cursor.execute(
+                        "INSERT INTO Upload_Chunks (upload_id, chunk_index, data) VALUES (%s, %s, %s)",
+                        (upload_id, index, chunk)
+                    )
+                    connection.commit()
+
+                    progress["bytes_done"] += len(chunk)
+                    elapsed = time.perf_counter() - start
+                    sent = progress["bytes_done"] - progress["resumed_from"]
+                    progress["bytes_per_second"] = sent / elapsed if elapsed else 0.0
+                    if on_progress:
+                        on_progress(dict(progress))
+                index += 1
+
+        seek_index = None
+        if builder is not None:
+            try:
+                seek_index = builder.finish()
+            except (ValueError, IndexError) as e:
+                print(f"Error building seek index: {e}")
+
+        # The song appears, with its chunks, in one transaction
+        cursor.execute(
+            """
+            INSERT INTO Songs (title, artist_id, album_id, genre_id, duration, file_data, file_type, file_size)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            (title, artist_id, album_id, genre_id, _duration(file_path, file_type, builder, header),
+             b"", file_type, file_size)
+        )
+        song_id = cursor.lastrowid
+        cursor.execute(
+            "UPDATE Upload_Sessions SET song_id = %s, sha256 = %s WHERE upload_id = %s",
+            (song_id, digest.hexdigest(), upload_id)
+        )
+        if seek_index:
+            save_seek_index(cursor, song_id, seek_index)
+        publish(connection, "song.uploaded", song_id)
+        connection.commit()
+
+        # Song lists now include the new song
+        invalidate("songs:")
+
+        result.update(song_id=song_id, status="uploaded", sha256=digest.hexdigest(),
+                      bytes_per_second=progress["bytes_per_second"])
+        return result
+
+    except DB_ERRORS + (OSError,) as e:
+        print(f"Error uploading song: {e}")
+        result["error"] = str(e)
+        return result
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def unfinished_uploads():
+    """Uploads that were cancelled or interrupted, with the bytes stored so far"""
+    try:
+        connection = connect_db(read_only=True)
+        if not connection:
+            return []
+
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(
+            """
+            SELECT u.upload_id, u.file_path, u.file_size, u.started_at,
+                   COALESCE(SUM(LENGTH(c.data)), 0) AS bytes_stored
+            FROM Upload_Sessions u
+            LEFT JOIN Upload_Chunks c ON c.upload_id = u.upload_id
+            WHERE u.song_id IS NULL
+            GROUP BY u.upload_id, u.file_path, u.file_size, u.started_at
+            ORDER BY u.upload_id
+            """
+        )
+        return cursor.fetchall()
+
+    except DB_ERRORS as e:
+        print(f"Error listing unfinished uploads: {e}")
+        return []
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def discard_upload(upload_id):
+    """Delete an unfinished upload and its chunks; returns True if one was deleted"""
+    try:
+        connection = connect_db()
+        if not connection:
+            return False
+
+        cursor = connection.cursor()
+        # Chunks go with the session (ON DELETE CASCADE)
+        cursor.execute("DELETE FROM Upload_Sessions WHERE upload_id = %s AND song_id IS NULL", (upload_id,))
+        connection.commit()
+        return cursor.rowcount > 0
+
+    except DB_ERRORS as e:
+        print(f"Error discarding upload: {e}")
+        return False
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def purge_abandoned_uploads(days=UPLOAD_ABANDONED_DAYS):
+    """Delete unfinished uploads started more than days ago; returns how many were deleted"""
+    try:
+        connection = connect_db()
+        if not connection:
+            return 0
+
+        cursor = connection.cursor()
+        purged = _purge_abandoned(cursor, days)
+        connection.commit()
+        return purged
+
+    except DB_ERRORS as e:
+        print(f"Error purging unfinished uploads: {e}")
+        return 0
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def format_progress(progress):
+    """One-line description of an upload's progress"""
+    # Imported here: audio_utils imports this module
+    from utils.audio_utils import format_file_size
+    text = (f"{format_file_size(progress['bytes_done'])} of {format_file_size(progress['bytes_total'])} • "
+            f"{format_file_size(progress['bytes_per_second'])}/s")
+    if progress["resumed_from"]:
+        text += f" • resumed at {format_file_size(progress['resumed_from'])}"
+    return text
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload a song in chunks (re-run to resume)")
+    parser.add_argument("file", nargs="?")
+    parser.add_argument("--title", help="defaults to the file name")
+    parser.add_argument("--artist-id", type=int)
+    parser.add_argument("--genre-id", type=int)
+    parser.add_argument("--unfinished", action="store_true", help="list cancelled or interrupted uploads")
+    parser.add_argument("--discard", type=int, metavar="UPLOAD_ID", help="delete an unfinished upload")
+    parser.add_argument("--purge", action="store_true", help="delete unfinished uploads older than --days")
+    parser.add_argument("--days", type=int, default=UPLOAD_ABANDONED_DAYS,
+                        help=f"age for --purge (default {UPLOAD_ABANDONED_DAYS})")
+    args = parser.parse_args()
+
+    if args.unfinished:
+        for upload in unfinished_uploads():
+            print(f"{upload['upload_id']}: {upload['file_path']} "
+                  f"({upload['bytes_stored']} of {upload['file_size']} bytes, started {upload['started_at']})")
+    elif args.discard is not None:
+        print("Discarded" if discard_upload(args.discard) else "No unfinished upload with that ID")
+    elif args.purge:
+        print(f"Deleted {purge_abandoned_uploads(args.days)} unfinished uploads")
+    else:
+        if not args.file or args.artist_id is None:
+            parser.error("a file and --artist-id are required to upload")
+        title = args.title or os.path.splitext(os.path.basename(args.file))[0]
+        cancel = threading.Event()
+        results = []
+        upload = threading.Thread(
+            target=lambda: results.append(upload_song_chunked(
+                args.file, title, args.artist_id, args.genre_id,
+                on_progress=lambda p: print(format_progress(p), end="\r", flush=True), cancel_event=cancel)),
+            daemon=True
+        )
+        upload.start()
+        try:
+            while upload.is_alive():
+                upload.join(0.2)
+        except KeyboardInterrupt:
+            # Let the current chunk finish so the upload can resume from it
+            cancel.set()
+            upload.join()
+
+        result = results[0]
+        print()
+        if result["status"] == "uploaded":
+            print(f"Uploaded song {result['song_id']} (SHA-256 {result['sha256']})")
+        elif result["status"] == "cancelled":
+            print("Cancelled; run the same command again to resume")
+        else:
+            print(f"Upload failed: {result.get('error')}")
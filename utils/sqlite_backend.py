@@ -0,0 +1,151 @@
+"""
+Embedded SQLite backend
+Wraps sqlite3 so it can be used wherever a mysql.connector connection is expected
+"""
+import datetime
+import re
+import sqlite3
+import zlib
+
+# MySQL-style "%s" placeholders, skipping escaped "%%"
+_PLACEHOLDER_RE = re.compile(r"(?<!%)%s")
+
+def _convert_timestamp(value):
+    """Convert a stored TIMESTAMP value into a datetime object"""
+    text = value.decode()
+    try:
+        return datetime.datetime.fromisoformat(text)
+    except ValueError:
+        return text
+
+def _concat(*args):
+    """SQL CONCAT() with MySQL semantics (NULL if any argument is NULL)"""
+    if any(arg is None for arg in args):
+        return None
+    return "".join(str(arg) for arg in args)
+
+def _concat_ws(separator, *args):
+    """SQL CONCAT_WS() with MySQL semantics (NULL arguments are skipped)"""
+    if separator is None:
+        return None
+    return separator.join(str(arg) for arg in args if arg is not None)
+
+def _crc32(value):
+    """SQL CRC32() with MySQL semantics (of the UTF-8 text)"""
+    if value is None:
+        return None
+    return zlib.crc32(str(value).encode())
+
+class _BitXor:
+    """SQL BIT_XOR() aggregate with MySQL semantics (0 for no rows)"""
+
+    def __init__(self):
+        self.value = 0
+
+    def step(self, value):
+        if value is not None:
+            self.value ^= value
+
+    def finalize(self):
+        return self.value
+
+sqlite3.register_converter("TIMESTAMP", _convert_timestamp)
+sqlite3.register_converter("DATETIME", _convert_timestamp)
+
+def translate_query(query):
+    """Translate a MySQL-flavoured query into SQLite syntax"""
+    return _PLACEHOLDER_RE.sub("?", query).replace("%%", "%")
+
+class SQLiteCursor:
+    """Cursor with the subset of the mysql.connector cursor API used by the app"""
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def _row(self, row):
+        """Convert a row to a dict when the cursor was opened with dictionary=True"""
+        if row is None or not self._dictionary:
+            return row
+        columns = [column[0] for column in self._cursor.description]
+        return dict(zip(columns, row))
+
+    def execute(self, query, params=()):
+        self._cursor.execute(translate_query(query), params or ())
+
+    def executemany(self, query, seq_params):
+        self._cursor.executemany(translate_query(query), seq_params)
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        row = self.fetchone()
+        while row is not None:
+            yield row
+            row = self.fetchone()
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+class SQLiteConnection:
+    """Connection with the subset of the mysql.connector connection API used by the app"""
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._open = True
+
+    def cursor(self, dictionary=False, **kwargs):
+        # buffered/prepared/raw only matter for MySQL; sqlite3 caches compiled statements itself
+        return SQLiteCursor(self._connection.cursor(), dictionary)
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def is_connected(self):
+        return self._open
+
+    def close(self):
+        if self._open:
+            self._connection.close()
+            self._open = False
+
+def connect_sqlite(path):
+    """Open an SQLite database in WAL mode"""
+    connection = sqlite3.connect(
+        path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        check_same_thread=False,
+        timeout=30
+    )
+    connection.create_function("CONCAT", -1, _concat, deterministic=True)
+    connection.create_function("CONCAT_WS", -1, _concat_ws, deterministic=True)
+    connection.create_function("CRC32", 1, _crc32, deterministic=True)
+    connection.create_aggregate("BIT_XOR", 1, _BitXor)
+
+    # WAL lets page processes read while another one writes
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA foreign_keys=ON")
+    return SQLiteConnection(connection)
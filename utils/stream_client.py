@@ -0,0 +1,98 @@
+"""
+Streaming service client
+Reads song audio from stream_server.py with HTTP Range requests
+"""
+import io
+import json
+import urllib.error
+import urllib.request
+from config import STREAM_SERVER_URL, STREAM_BLOCK_SIZE, DOWNLOAD_CHUNK_SIZE
+
+def song_url(song_id, suffix=""):
+    return f"{STREAM_SERVER_URL.rstrip('/')}/songs/{int(song_id)}{suffix}"
+
+def fetch_range(song_id, start, end):
+    """Fetch bytes start..end (inclusive) of a song"""
+    request = urllib.request.Request(song_url(song_id), headers={"Range": f"bytes={start}-{end}"})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.read()
+    except urllib.error.HTTPError as e:
+        if e.code == 416:  # start is past the end of the song
+            return b""
+        raise
+
+def get_song_info(song_id):
+    """Get a song's metadata from the streaming service"""
+    try:
+        with urllib.request.urlopen(song_url(song_id, "/info"), timeout=30) as response:
+            return json.load(response)
+    except (urllib.error.URLError, ValueError) as e:
+        print(f"Error getting song info from stream server: {e}")
+        return None
+
+def iter_song_chunks(song_id, offset=0, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """Yield a song's audio in chunks starting at a byte offset"""
+    while True:
+        chunk = fetch_range(song_id, offset, offset + chunk_size - 1)
+        if not chunk:
+            return
+        yield chunk
+        offset += len(chunk)
+        if len(chunk) < chunk_size:
+            return
+
+class HTTPRangeFile(io.RawIOBase):
+    """Seekable read-only file over a streamed song, fetched one block at a time
+
+    Only the blocks that are actually read are downloaded, so playback can
+    start after the first block and seeking skips the rest.
+    """
+
+    def __init__(self, song_id, size, block_size=STREAM_BLOCK_SIZE):
+        self.song_id = song_id
+        self.size = size
+        self.block_size = block_size
+        self._position = 0
+        self._block_start = -1
+        self._block = b""
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        self._position = max(0, self._position)
+        return self._position
+
+    def readinto(self, buffer):
+        if self._position >= self.size:
+            return 0
+
+        # Fetch the block containing the current position
+        block_start = self._position - self._position % self.block_size
+        if block_start != self._block_start:
+            block_end = min(block_start + self.block_size, self.size) - 1
+            self._block = fetch_range(self.song_id, block_start, block_end)
+            self._block_start = block_start
+
+        start = self._position - self._block_start
+        data = self._block[start:start + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+def open_song_stream(song_id, size):
+    """Open a buffered, seekable file object over a streamed song"""
+    return io.BufferedReader(HTTPRangeFile(song_id, size), buffer_size=STREAM_BLOCK_SIZE)
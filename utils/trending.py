@@ -0,0 +1,313 @@
+"""
+Trending charts
+Exponentially time-decayed play counts per song over TRENDING_WINDOWS (for
+example 1h/24h/7d), updated incrementally from Listening_History.
+
+Each play adds exp((played_at - landmark) / window) to a count-min sketch,
+so a song's decayed score at any time t is its sketch estimate times
+exp((landmark - t) / window) ("forward decay"). Scores never need to be
+decayed in place, and ranking by the stored values is ranking by the
+decayed scores. A top-k candidate list of heavy hitters is kept per
+window, so memory stays fixed however many songs and plays there are.
+
+New plays are read by history_id after a watermark; IDs skipped because
+their transaction had not committed yet are re-read for GAP_SECONDS. The
+state is pickled to TRENDING_STATE_FILE and shared by all pages; updates
+are serialised with a file lock and run on a background thread when pages
+ask for the charts.
+
+Usage: python -m utils.trending [--window 24h] [--limit 10]
+"""
+import argparse
+import datetime
+import heapq
+import math
+import os
+import pickle
+import threading
+import time
+import numpy as np
+from config import (TRENDING_WINDOWS, TRENDING_SKETCH_WIDTH, TRENDING_SKETCH_DEPTH, TRENDING_TOP_K,
+                    TRENDING_STATE_FILE, TRENDING_REFRESH_SECONDS)
+from utils.db_utils import connect_db, DB_ERRORS
+
+try:
+    import fcntl
+except ImportError:  # Windows: trending updates are not locked across processes
+    fcntl = None
+
+EVENT_BATCH_SIZE = 50000
+# Plays older than this many time constants of the longest window add nothing measurable
+HORIZON_WINDOWS = 5
+# Move the landmark forward before weights for new plays could reach exp(this)
+MAX_EXPONENT = 30
+# How long a skipped history_id may still commit; each is re-read at least once
+GAP_SECONDS = 60
+# Skipped history_ids tracked at most
+MAX_GAPS = 1000
+_PRIME = 2**31 - 1
+
+class DecayedSketch:
+    """Count-min sketch of forward-decayed counts for one window, with top-k candidates"""
+
+    def __init__(self, window_seconds, width, depth, top_k, landmark, seed=0):
+        self.window = float(window_seconds)
+        self.landmark = float(landmark)
+        self.top_k = top_k
+        self.counts = np.zeros((depth, width), dtype=np.float64)
+        rng = np.random.default_rng(seed)
+        self.hash_a = rng.integers(1, _PRIME, size=depth, dtype=np.int64)
+        self.hash_b = rng.integers(0, _PRIME, size=depth, dtype=np.int64)
+        self.candidates = {}  # song_id -> score in landmark units
+
+    def _buckets(self, song_ids):
+        keys = np.asarray(song_ids, dtype=np.int64) % _PRIME
+        return (self.hash_a[:, None] * keys[None, :] + self.hash_b[:, None]) % _PRIME % self.counts.shape[1]
+
+    def _move_landmark(self, landmark):
+        """Rescale everything to a later landmark so weights stay in floating-point range"""
+        scale = math.exp((self.landmark - landmark) / self.window)
+        self.counts *= scale
+        self.candidates = {song_id: score * scale for song_id, score in self.candidates.items()}
+        self.landmark = landmark
+
+    def estimate(self, song_ids):
+        """Stored (landmark unit) scores of songs, never underestimated"""
+        buckets = self._buckets(song_ids)
+        return self.counts[np.arange(self.counts.shape[0])[:, None], buckets].min(axis=0)
+
+    def add(self, song_ids, timestamps):
+        """Count a batch of plays (song IDs and unix times as arrays)"""
+        newest = float(timestamps.max())
+        if (newest - self.landmark) / self.window > MAX_EXPONENT:
+            self._move_landmark(newest)
+
+        weights = np.exp((timestamps - self.landmark) / self.window)
+        buckets = self._buckets(song_ids)
+        for row in range(self.counts.shape[0]):
+            np.add.at(self.counts[row], buckets[row], weights)
+
+        # Songs played in this batch may have become heavy hitters
+        played = np.unique(song_ids)
+        self.candidates.update(zip(played.tolist(), self.estimate(played).tolist()))
+        if len(self.candidates) > self.top_k:
+            self.candidates = dict(heapq.nlargest(self.top_k, self.candidates.items(), key=lambda item: item[1]))
+
+    def top(self, limit, now):
+        """Highest decayed scores at time now, as [(song_id, score)]"""
+        decay = math.exp((self.landmark - now) / self.window)
+        best = heapq.nlargest(limit, self.candidates.items(), key=lambda item: item[1])
+        return [(song_id, score * decay) for song_id, score in best]
+
+class TrendingState:
+    """Sketches for every window plus the history_id watermark"""
+
+    def __init__(self, now=None):
+        now = time.time() if now is None else now
+        self.settings = _settings()
+        self.last_id = None  # Not started: begins at the horizon
+        self.gaps = {}  # Skipped history_id -> unix time it was first missed
+        self.sketches = {
+            name: DecayedSketch(seconds, TRENDING_SKETCH_WIDTH, TRENDING_SKETCH_DEPTH, TRENDING_TOP_K, now, seed=i)
+            for i, (name, seconds) in enumerate(TRENDING_WINDOWS.items())
+        }
+        self.refreshed_at = 0.0
+
+    def add_events(self, song_ids, timestamps):
+        """Count a batch of plays in every window"""
+        song_ids = np.asarray(song_ids, dtype=np.int64)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if len(song_ids):
+            for sketch in self.sketches.values():
+                sketch.add(song_ids, timestamps)
+
+def _settings():
+    """Settings a saved state must match to be reused"""
+    return (tuple(TRENDING_WINDOWS.items()), TRENDING_SKETCH_WIDTH, TRENDING_SKETCH_DEPTH, TRENDING_TOP_K)
+
+# ------------------- State File -------------------
+def _load_state():
+    try:
+        with open(TRENDING_STATE_FILE, "rb") as f:
+            state = pickle.load(f)
+        if isinstance(state, TrendingState) and state.settings == _settings():
+            return state
+    except (OSError, pickle.PickleError, EOFError, AttributeError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Error reading trending state: {e}")
+    return TrendingState()
+
+def _save_state(state):
+    tmp_path = f"{TRENDING_STATE_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, TRENDING_STATE_FILE)
+
+# ------------------- Updating -------------------
+def _unix_time(played_at):
+    """A played_at value as unix time (text if the driver did not convert it)"""
+    if isinstance(played_at, str):
+        played_at = datetime.datetime.fromisoformat(played_at)
+    return played_at.timestamp()
+
+def _read_late_plays(state, cursor):
+    """Feed plays that committed under a skipped history_id; returns the number read"""
+    if not state.gaps:
+        return 0
+    cursor.execute(
+        f"SELECT history_id, song_id, played_at FROM Listening_History "
+        f"WHERE history_id IN ({', '.join(['%s'] * len(state.gaps))})",
+        tuple(state.gaps)
+    )
+    rows = cursor.fetchall()
+    state.add_events([row[1] for row in rows], [_unix_time(row[2]) for row in rows])
+    for row in rows:
+        del state.gaps[row[0]]
+
+    # Every gap has now been re-read at least once
+    now = time.time()
+    state.gaps = {history_id: missed for history_id, missed in state.gaps.items() if now - missed < GAP_SECONDS}
+    return len(rows)
+
+def _read_new_plays(state, cursor, batch_size):
+    """Feed plays after the watermark into the sketches; returns the number read"""
+    if state.last_id is None:
+        # First run: skip plays too old to affect any window
+        horizon = time.time() - HORIZON_WINDOWS * max(TRENDING_WINDOWS.values())
+        cursor.execute(
+            "SELECT MIN(history_id) FROM Listening_History WHERE played_at >= %s",
+            (time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(horizon)),)
+        )
+        first_id = cursor.fetchone()[0]
+        if first_id is None:
+            cursor.execute("SELECT COALESCE(MAX(history_id), 0) FROM Listening_History")
+            state.last_id = cursor.fetchone()[0]
+        else:
+            state.last_id = first_id - 1
+
+    read = _read_late_plays(state, cursor)
+    while True:
+        cursor.execute(
+            """
+            SELECT history_id, song_id, played_at FROM Listening_History
+            WHERE history_id > %s ORDER BY history_id LIMIT %s
+            """,
+            (state.last_id, batch_size)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return read
+        state.add_events([row[1] for row in rows], [_unix_time(row[2]) for row in rows])
+        now = time.time()
+        expected = state.last_id + 1
+        for row in rows:
+            for history_id in range(max(expected, row[0] - MAX_GAPS), row[0]):
+                state.gaps[history_id] = now
+            expected = row[0] + 1
+        if len(state.gaps) > MAX_GAPS:
+            for history_id in sorted(state.gaps)[:len(state.gaps) - MAX_GAPS]:
+                del state.gaps[history_id]
+        state.last_id = rows[-1][0]
+        read += len(rows)
+        if len(rows) < batch_size:
+            return read
+
+def refresh_trending(batch_size=EVENT_BATCH_SIZE):
+    """Count plays recorded since the last refresh; returns the number of new plays, or None on error"""
+    try:
+        os.makedirs(os.path.dirname(TRENDING_STATE_FILE) or ".", exist_ok=True)
+        with open(f"{TRENDING_STATE_FILE}.lock", "w") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            state = _load_state()
+            connection = connect_db(read_only=True)
+            if not connection:
+                return None
+            try:
+                cursor = connection.cursor()
+                read = _read_new_plays(state, cursor, batch_size)
+                cursor.close()
+            finally:
+                connection.close()
+
+            state.refreshed_at = time.time()
+            _save_state(state)
+            return read
+
+    except (DB_ERRORS + (OSError, pickle.PickleError, ValueError)) as e:
+        print(f"Error refreshing trending songs: {e}")
+        return None
+
+_refresh_thread = None
+_refresh_thread_lock = threading.Lock()
+
+def refresh_trending_async():
+    """Refresh on a daemon thread unless a refresh from this process is already running"""
+    global _refresh_thread
+    with _refresh_thread_lock:
+        if _refresh_thread is None or not _refresh_thread.is_alive():
+            _refresh_thread = threading.Thread(target=refresh_trending, daemon=True)
+            _refresh_thread.start()
+        return _refresh_thread
+
+def get_trending(window="24h", limit=10, max_age=TRENDING_REFRESH_SECONDS):
+    """Top songs by decayed play count in a window, as [(song_id, score)]
+
+    If the state is older than max_age seconds a refresh is started in the
+    background; the charts as of the last refresh are returned right away,
+    so pages never wait for a batch of plays to be counted.
+    """
+    state = _load_state()
+    if time.time() - state.refreshed_at > max_age:
+        refresh_trending_async()
+    return state.sketches[window].top(limit, time.time())
+
+def get_trending_songs(window="24h", limit=10):
+    """Trending songs with their details, best first"""
+    trending = get_trending(window, limit)
+    if not trending:
+        return []
+    try:
+        connection = connect_db(read_only=True)
+        if not connection:
+            return []
+
+        cursor = connection.cursor(dictionary=True)
+        placeholders = ", ".join(["%s"] * len(trending))
+        cursor.execute(
+            f"""
+            SELECT s.song_id, s.title, a.name as artist_name
+            FROM Songs s
+            JOIN Artists a ON s.artist_id = a.artist_id
+            WHERE s.song_id IN ({placeholders})
+            """,
+            tuple(song_id for song_id, _ in trending)
+        )
+        songs = {song['song_id']: song for song in cursor.fetchall()}
+        result = []
+        for song_id, score in trending:
+            if song_id in songs:
+                songs[song_id]['score'] = score
+                result.append(songs[song_id])
+        return result
+
+    except DB_ERRORS as e:
+        print(f"Error getting trending songs: {e}")
+        return []
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show trending songs")
+    parser.add_argument("--window", choices=list(TRENDING_WINDOWS), default="24h")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    read = refresh_trending()
+    print(f"Counted {read} new plays in {time.perf_counter() - start:.2f}s")
+    for rank, song in enumerate(get_trending_songs(args.window, args.limit), 1):
+        print(f"{rank:>3}. {song['artist_name']} - {song['title']} ({song['score']:.1f})")